@@ -39,7 +39,7 @@ class TreeSpeciesAdminForm(forms.ModelForm):
         instance = self.instance
         
         # If editing existing species and it already has an image
-        if instance and instance.pk and instance.image and image_file:
+        if instance and instance.pk and instance.has_image and image_file:
             raise forms.ValidationError(
                 f"Image already exists for {instance.common_name} ({instance.scientific_name}). "
                 "Please delete the existing image first or edit the species to replace it."
@@ -54,7 +54,7 @@ class TreeSpeciesAdminForm(forms.ModelForm):
         image_file = self.cleaned_data.get('image_upload')
         if image_file:
             # Check if species already has an image (double check)
-            if instance.pk and instance.image:
+            if instance.pk and instance.has_image:
                 # This shouldn't happen due to clean validation, but just in case
                 return instance
             
@@ -98,7 +98,7 @@ class TreeSpeciesAdmin(admin.ModelAdmin):
     
     def has_image(self, obj):
         """Check if species has an image"""
-        return bool(obj.image)
+        return obj.has_image
     has_image.boolean = True
     has_image.short_description = 'Has Image'
     
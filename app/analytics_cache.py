@@ -0,0 +1,80 @@
+"""
+Cache of computed analytics payloads.
+
+Entries are keyed by payload kind, data scope (one user, or ``all`` for the
+head app), the scope's current ``DatasetVersion`` and a hash of the filter
+set.  The version lives in the database and is bumped by the write signals in
+``models.py`` (trees, seeds, taxonomy, locations), so after a committed write
+every key of the scope misses in every worker process, whatever the cache
+backend, while an unchanged page costs one version lookup and one cache read.
+Entries of old versions are left to expire.
+
+Hit and miss counters per kind are kept in the cache as well, so with a
+shared backend (file, Redis) they cover every worker process.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache, caches
+
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+COUNTER_KEY = 'analytics-cache:{kind}:{outcome}'
+
+# Kinds reported by ``cache_statistics``
+KINDS = ('analytics', 'analytics-data', 'tree-stats', 'biodiversity', 'report-stats', 'growth', 'forecast', 'seed-cohorts')
+
+
+def _count(kind, outcome):
+    key = COUNTER_KEY.format(kind=kind, outcome=outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First count, or the counter was evicted
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cached_analytics(kind, scope, compute, params=None, timeout=CACHE_TIMEOUT):
+    """
+    Return the cached ``kind`` payload of ``scope`` for the filter set
+    ``params``, calling ``compute()`` to build it on a miss
+    """
+    variant = hashlib.md5(json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+    from .models import DatasetVersion
+    version = DatasetVersion.current(scope)[0]
+    key = f'analytics:{kind}:{scope}:{version}:{variant}'
+    payload = cache.get(key)
+    if payload is not None:
+        _count(kind, 'hits')
+        return payload
+    _count(kind, 'misses')
+    payload = compute()
+    cache.set(key, payload, timeout)
+    return payload
+
+
+def cache_statistics():
+    """Hit and miss counts per payload kind, plus the totals"""
+    counters = cache.get_many([
+        COUNTER_KEY.format(kind=kind, outcome=outcome) for kind in KINDS for outcome in ('hits', 'misses')
+    ])
+    kinds = {}
+    for kind in KINDS:
+        hits = counters.get(COUNTER_KEY.format(kind=kind, outcome='hits'), 0)
+        misses = counters.get(COUNTER_KEY.format(kind=kind, outcome='misses'), 0)
+        kinds[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    hits = sum(item['hits'] for item in kinds.values())
+    misses = sum(item['misses'] for item in kinds.values())
+    return {
+        'backend': type(caches['default']).__name__,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        'kinds': kinds,
+    }
@@ -0,0 +1,219 @@
+"""
+Aggregate statistics for the records inside a shape drawn on the GIS map.
+
+The shape's bounding box is used as an indexed range query on the location
+coordinates, so only the candidate rows near the shape are read.  The exact
+point-in-polygon (or distance from the circle centre) test then runs over
+all candidates at once with NumPy.
+"""
+import json
+import math
+
+import numpy as np
+from django.http import JsonResponse
+
+from .spatial import filter_bbox
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# Upper bound on polygon vertices accepted from the client
+MAX_VERTICES = 5000
+
+TREE_FIELDS = (
+    'location__latitude', 'location__longitude', 'location_id', 'species_id',
+    'species__common_name', 'population', 'health_status', 'hectares',
+)
+SEED_FIELDS = (
+    'location__latitude', 'location__longitude', 'species_id',
+    'quantity', 'germination_status',
+)
+
+# Species listed in the response, by population
+TOP_SPECIES = 10
+
+
+class Shape:
+    """A polygon (one or more rings, lng/lat) or a circle (centre and radius in metres)."""
+
+    def __init__(self, rings=None, center=None, radius=None):
+        self.rings = rings or []
+        self.center = center
+        self.radius = radius
+
+    @property
+    def is_circle(self):
+        return self.center is not None
+
+    def bbox(self):
+        """``(west, south, east, north)`` enclosing the shape."""
+        if self.is_circle:
+            lng, lat = self.center
+            dlat = math.degrees(self.radius / EARTH_RADIUS_M)
+            cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+            dlng = min(180.0, dlat / cos_lat)
+            return (max(-180.0, lng - dlng), max(-90.0, lat - dlat),
+                    min(180.0, lng + dlng), min(90.0, lat + dlat))
+        ring = self.rings[0]
+        return (ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max())
+
+    def contains(self, lat, lng):
+        """Boolean mask of the points (arrays of lat/lng) inside the shape."""
+        if self.is_circle:
+            return haversine(lat, lng, self.center[1], self.center[0]) <= self.radius
+        inside = _in_ring(self.rings[0], lat, lng)
+        for hole in self.rings[1:]:
+            inside &= ~_in_ring(hole, lat, lng)
+        return inside
+
+    def area_hectares(self):
+        """Approximate area of the shape in hectares."""
+        if self.is_circle:
+            return math.pi * self.radius ** 2 / 10000.0
+        area = _ring_area(self.rings[0]) - sum(_ring_area(hole) for hole in self.rings[1:])
+        return area / 10000.0
+
+
+def haversine(lat, lng, center_lat, center_lng):
+    """Great-circle distance in metres from arrays of points to one centre."""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = math.radians(center_lat), math.radians(center_lng)
+    a = np.sin((lat1 - lat2) / 2) ** 2 + np.cos(lat1) * math.cos(lat2) * np.sin((lng1 - lng2) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _in_ring(ring, lat, lng):
+    """Even-odd ray casting test of points against one closed ring."""
+    inside = np.zeros(len(lat), dtype=bool)
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        crosses = (ay > lat) != (by > lat)
+        if not crosses.any():
+            continue
+        x_at = ax + (lat - ay) * (bx - ax) / ((by - ay) or 1e-300)
+        inside ^= crosses & (lng < x_at)
+    return inside
+
+
+def _ring_area(ring):
+    """Planar area in square metres of a lng/lat ring, projected around its centre."""
+    lat0 = math.radians(ring[:, 1].mean())
+    x = np.radians(ring[:, 0]) * EARTH_RADIUS_M * math.cos(lat0)
+    y = np.radians(ring[:, 1]) * EARTH_RADIUS_M
+    return abs(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2.0
+
+
+def _ring(coordinates):
+    try:
+        ring = np.asarray(coordinates, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError('Polygon coordinates must be [longitude, latitude] pairs')
+    if ring.ndim != 2 or ring.shape[1] < 2 or len(ring) < 3:
+        raise ValueError('Polygon rings need at least three [longitude, latitude] points')
+    if len(ring) > MAX_VERTICES:
+        raise ValueError(f'Polygons may have at most {MAX_VERTICES} vertices')
+    ring = ring[:, :2]
+    if not (np.abs(ring[:, 0]) <= 180).all() or not (np.abs(ring[:, 1]) <= 90).all():
+        raise ValueError('Polygon coordinates are out of range')
+    if not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack([ring, ring[:1]])
+    return ring
+
+
+def parse_shape(data):
+    """
+    Parse the request body into a ``Shape``.
+
+    Accepts a GeoJSON ``Polygon`` geometry or a Feature wrapping one (what
+    Leaflet.draw produces for polygons and rectangles), or a circle given as
+    ``{"type": "Circle", "coordinates": [lng, lat], "radius": metres}``.
+    Raises ``ValueError`` for anything else.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a GeoJSON geometry')
+    radius = data.get('radius', (data.get('properties') or {}).get('radius'))
+    if data.get('type') == 'Feature':
+        data = data.get('geometry') or {}
+
+    shape_type = data.get('type')
+    coordinates = data.get('coordinates')
+    if shape_type == 'Polygon':
+        if not isinstance(coordinates, list) or not coordinates:
+            raise ValueError('Polygon has no coordinates')
+        return Shape(rings=[_ring(ring) for ring in coordinates])
+
+    if shape_type in ('Circle', 'Point'):
+        try:
+            lng, lat = (float(value) for value in coordinates[:2])
+            radius = float(radius)
+        except (TypeError, ValueError):
+            raise ValueError('Circle needs [longitude, latitude] coordinates and a radius in metres')
+        if radius <= 0 or abs(lng) > 180 or abs(lat) > 90:
+            raise ValueError('Circle centre or radius is out of range')
+        return Shape(center=(lng, lat), radius=radius)
+
+    raise ValueError('Shape must be a Polygon or a Circle')
+
+
+def _rows_inside(queryset, shape, fields):
+    west, south, east, north = shape.bbox()
+    rows = list(filter_bbox(queryset, (west, south, east, north)).order_by().values_list(*fields))
+    if not rows:
+        return []
+    coordinates = np.array([row[:2] for row in rows], dtype=np.float64)
+    mask = shape.contains(coordinates[:, 0], coordinates[:, 1])
+    return [row for row, inside in zip(rows, mask) if inside]
+
+
+def area_statistics(shape, trees, seeds):
+    """Aggregate the ``trees`` and ``seeds`` querysets over the records inside ``shape``."""
+    tree_rows = _rows_inside(trees, shape, TREE_FIELDS)
+    seed_rows = _rows_inside(seeds, shape, SEED_FIELDS)
+
+    species = {}
+    health = {}
+    for _, _, _, species_id, common_name, population, health_status, _ in tree_rows:
+        entry = species.setdefault(species_id, {'id': species_id, 'common_name': common_name, 'population': 0, 'records': 0})
+        entry['population'] += population or 0
+        entry['records'] += 1
+        health[health_status] = health.get(health_status, 0) + (population or 0)
+
+    germination = {}
+    for _, _, _, quantity, status in seed_rows:
+        germination[status] = germination.get(status, 0) + (quantity or 0)
+
+    return {
+        'area_hectares': round(shape.area_hectares(), 4),
+        'trees': {
+            'records': len(tree_rows),
+            'locations': len({row[2] for row in tree_rows}),
+            'population': sum(row[5] or 0 for row in tree_rows),
+            'hectares': round(sum(row[7] or 0 for row in tree_rows), 4),
+            'species_richness': len(species),
+            'health_distribution': health,
+            'top_species': sorted(species.values(), key=lambda entry: -entry['population'])[:TOP_SPECIES],
+        },
+        'seeds': {
+            'records': len(seed_rows),
+            'quantity': sum(row[3] or 0 for row in seed_rows),
+            'species_richness': len({row[2] for row in seed_rows}),
+            'germination_status': germination,
+        },
+    }
+
+
+def area_stats_response(request, trees, seeds):
+    """Answer an area statistics POST for the ``trees`` and ``seeds`` querysets."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+    try:
+        shape = parse_shape(json.loads(request.body or b'null'))
+        return JsonResponse(area_statistics(shape, trees, seeds))
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"Error in area stats API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
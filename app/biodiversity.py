@@ -0,0 +1,139 @@
+"""
+Biodiversity indices of the recorded tree populations.
+
+One grouped query over the tree records gives the population of every
+(year, species, location) combination (the rollups are not kept per
+location).  The rows are scattered into a dense
+``years x species x locations`` NumPy array and every index is computed for
+all years (or all locations) at once along the array axes:
+
+    richness  S  - number of species with a population
+    Shannon   H  - -sum(p * ln p) over the species proportions p
+    Simpson   D  - 1 - sum(p^2), the chance two trees are different species
+    evenness  J  - H / ln S (Pielou), 0 when S < 2
+    beta         - Whittaker's gamma / mean alpha: species richness of the
+                   whole year over the mean richness of its locations
+
+Results are cached per data scope until its data changes (see
+``analytics_cache``).
+"""
+import numpy as np
+from django.db.models import Sum
+
+from .analytics_cache import cached_analytics
+from .models import DatasetVersion, EndemicTree, Location
+
+
+def population_matrix(trees):
+    """
+    ``(years, species_ids, location_ids, matrix)`` where ``matrix[y, s, l]``
+    is the population of species ``s`` at location ``l`` in year ``y``.
+    """
+    rows = list(
+        trees.order_by().values_list('year', 'species_id', 'location_id').annotate(total=Sum('population'))
+    )
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.zeros((0, 0, 0))
+    data = np.array(rows, dtype=np.float64)
+    years, year_index = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    species_ids, species_index = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+    location_ids, location_index = np.unique(data[:, 2].astype(np.int64), return_inverse=True)
+    matrix = np.zeros((len(years), len(species_ids), len(location_ids)))
+    np.add.at(matrix, (year_index, species_index, location_index), data[:, 3])
+    return years, species_ids, location_ids, matrix
+
+
+def diversity_indices(counts):
+    """
+    Richness, Shannon, Simpson and evenness of each row of ``counts``
+    (communities x species), as arrays of one value per row.
+    """
+    counts = np.clip(np.asarray(counts, dtype=np.float64), 0, None)
+    totals = counts.sum(axis=1, keepdims=True)
+    proportions = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+    richness = (counts > 0).sum(axis=1)
+    logs = np.log(proportions, out=np.zeros_like(proportions), where=proportions > 0)
+    shannon = -(proportions * logs).sum(axis=1)
+    simpson = np.where(totals[:, 0] > 0, 1.0 - (proportions ** 2).sum(axis=1), 0.0)
+    log_richness = np.log(np.maximum(richness, 1))
+    evenness = np.divide(shannon, log_richness, out=np.zeros_like(shannon), where=richness > 1)
+    return richness, shannon, simpson, evenness
+
+
+def beta_diversity(matrix):
+    """Whittaker's beta diversity of each year of a ``years x species x locations`` matrix"""
+    present = matrix > 0
+    gamma = present.any(axis=2).sum(axis=1)
+    alpha_richness = present.sum(axis=1)
+    occupied = alpha_richness > 0
+    site_count = occupied.sum(axis=1)
+    mean_alpha = np.divide(
+        alpha_richness.sum(axis=1), site_count,
+        out=np.zeros(len(gamma)), where=site_count > 0,
+    )
+    return np.divide(gamma, mean_alpha, out=np.zeros(len(gamma)), where=mean_alpha > 0)
+
+
+def compute_biodiversity(user=None):
+    """Indices per year and per location for one user's trees, or all for None"""
+    trees = EndemicTree.objects.all()
+    if user is not None:
+        trees = trees.filter(user=user)
+    years, species_ids, location_ids, matrix = population_matrix(trees)
+
+    by_year = []
+    if len(years):
+        richness, shannon, simpson, evenness = diversity_indices(matrix.sum(axis=2))
+        beta = beta_diversity(matrix)
+        by_year = [
+            {
+                'year': int(year),
+                'richness': int(richness[i]),
+                'shannon_index': round(float(shannon[i]), 4),
+                'simpson_index': round(float(simpson[i]), 4),
+                'evenness': round(float(evenness[i]), 4),
+                'beta_diversity': round(float(beta[i]), 4),
+            }
+            for i, year in enumerate(years)
+        ]
+
+    by_location = []
+    if len(location_ids):
+        richness, shannon, simpson, evenness = diversity_indices(matrix.sum(axis=0).T)
+        locations = Location.objects.only('name', 'latitude', 'longitude').in_bulk(
+            [int(location_id) for location_id in location_ids]
+        )
+        for i, location_id in enumerate(location_ids):
+            location = locations.get(int(location_id))
+            if location is None:
+                continue
+            by_location.append({
+                'location_id': int(location_id),
+                'name': location.name,
+                'latitude': location.latitude,
+                'longitude': location.longitude,
+                'richness': int(richness[i]),
+                'shannon_index': round(float(shannon[i]), 4),
+                'simpson_index': round(float(simpson[i]), 4),
+                'evenness': round(float(evenness[i]), 4),
+            })
+        by_location.sort(key=lambda item: -item['shannon_index'])
+
+    overall = {'richness': 0, 'shannon_index': 0.0, 'simpson_index': 0.0, 'evenness': 0.0, 'beta_diversity': 0.0}
+    if len(species_ids):
+        richness, shannon, simpson, evenness = diversity_indices(matrix.sum(axis=(0, 2))[np.newaxis, :])
+        beta = beta_diversity(matrix.sum(axis=0)[np.newaxis])
+        overall = {
+            'richness': int(richness[0]),
+            'shannon_index': round(float(shannon[0]), 4),
+            'simpson_index': round(float(simpson[0]), 4),
+            'evenness': round(float(evenness[0]), 4),
+            'beta_diversity': round(float(beta[0]), 4),
+        }
+
+    return {'overall': overall, 'by_year': by_year, 'by_location': by_location}
+
+
+def biodiversity(user=None):
+    """``compute_biodiversity`` cached until the scope's data changes"""
+    return cached_analytics('biodiversity', DatasetVersion.scope_for(user), lambda: compute_biodiversity(user))
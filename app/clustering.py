@@ -0,0 +1,183 @@
+"""
+Server-side grid clustering for the tree and seed map feeds.
+
+At low zoom levels the GIS page receives cluster centroids instead of one
+feature per record.  Clusters for every zoom level are computed together in a
+single vectorized pass over the records (a grid pyramid) and cached per
+dataset version, so any write to the data makes the next request rebuild it.
+"""
+import numpy as np
+from django.core.cache import cache
+
+from .models import DatasetVersion
+
+
+# Zoom levels up to and including this one are served as clusters;
+# individual points are sent once the user zooms past it.
+CLUSTER_MAX_ZOOM = 12
+
+# Grid cells per 256px tile edge, i.e. a cell is roughly 64px on screen
+CELLS_PER_TILE = 4
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+TREE_FIELDS = (
+    'location__latitude', 'location__longitude', 'population',
+    'healthy_count', 'good_count', 'bad_count', 'deceased_count',
+)
+SEED_FIELDS = ('location__latitude', 'location__longitude', 'quantity', 'germination_status')
+
+GERMINATION_STATUSES = (
+    'not_germinated', 'germinating', 'partially_germinated', 'fully_germinated', 'failed',
+)
+
+
+def wants_clusters(request, zoom):
+    """Return True when the feed should answer with clusters for this request."""
+    if request.GET.get('cluster') in ('0', 'false', 'no'):
+        return False
+    return zoom is not None and zoom <= CLUSTER_MAX_ZOOM
+
+
+def cell_size(zoom):
+    """Grid cell edge in degrees for a zoom level."""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def _grid_clusters(lat, lng, sums, zoom):
+    """Group points into grid cells for one zoom level."""
+    size = cell_size(zoom)
+    ix = np.floor((lng + 180.0) / size).astype(np.int64)
+    iy = np.floor((lat + 90.0) / size).astype(np.int64)
+    keys = (ix << 32) | iy
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    centroid_lat = np.bincount(inverse, weights=lat) / counts
+    centroid_lng = np.bincount(inverse, weights=lng) / counts
+    totals = {name: np.bincount(inverse, weights=values, minlength=len(counts))
+              for name, values in sums.items()}
+
+    clusters = []
+    for i in range(len(counts)):
+        cluster = {
+            'latitude': round(float(centroid_lat[i]), 6),
+            'longitude': round(float(centroid_lng[i]), 6),
+            'point_count': int(counts[i]),
+        }
+        for name, values in totals.items():
+            cluster[name] = int(values[i])
+        clusters.append(cluster)
+    return clusters
+
+
+def build_cluster_pyramid(rows, kind):
+    """
+    Compute clusters for every zoom level up to ``CLUSTER_MAX_ZOOM``.
+
+    ``rows`` are tuples in ``TREE_FIELDS`` or ``SEED_FIELDS`` order.
+    Returns ``{zoom: [cluster, ...]}``.
+    """
+    if not rows:
+        return {zoom: [] for zoom in range(CLUSTER_MAX_ZOOM + 1)}
+
+    columns = list(zip(*rows))
+    lat = np.asarray(columns[0], dtype=np.float64)
+    lng = np.asarray(columns[1], dtype=np.float64)
+
+    if kind == 'trees':
+        sums = {
+            'population': np.asarray(columns[2], dtype=np.float64),
+            'healthy_count': np.asarray(columns[3], dtype=np.float64),
+            'good_count': np.asarray(columns[4], dtype=np.float64),
+            'bad_count': np.asarray(columns[5], dtype=np.float64),
+            'deceased_count': np.asarray(columns[6], dtype=np.float64),
+        }
+    else:
+        statuses = np.asarray(columns[3])
+        sums = {'quantity': np.asarray(columns[2], dtype=np.float64)}
+        for status in GERMINATION_STATUSES:
+            sums[status] = (statuses == status).astype(np.float64)
+
+    return {zoom: _grid_clusters(lat, lng, sums, zoom) for zoom in range(CLUSTER_MAX_ZOOM + 1)}
+
+
+def get_cluster_pyramid(queryset, kind, scope):
+    """
+    Return the cached cluster pyramid for ``queryset``, rebuilding it when the
+    dataset version of ``scope`` (a ``DatasetVersion`` scope covering the
+    queryset) has changed.
+    """
+    fields = TREE_FIELDS if kind == 'trees' else SEED_FIELDS
+    version = DatasetVersion.current(scope)[0]
+    cache_key = f'clusters:{kind}:{scope}:{version}'
+    pyramid = cache.get(cache_key)
+    if pyramid is None:
+        rows = list(queryset.order_by().values_list(*fields))
+        pyramid = build_cluster_pyramid(rows, kind)
+        cache.set(cache_key, pyramid, CACHE_TIMEOUT)
+    return pyramid
+
+
+def _pad_bbox(bbox, padding):
+    """
+    Grow ``bbox`` by ``padding`` degrees on every side.  A cluster's points
+    all lie in its grid cell, so a cluster with a visible point has its
+    centroid within one cell of the viewport.
+    """
+    west, south, east, north = bbox
+    south = max(-90.0, south - padding)
+    north = min(90.0, north + padding)
+    width = east - west if west <= east else east - west + 360.0
+    if width + 2 * padding >= 360.0:
+        return -180.0, south, 180.0, north
+    west = ((west - padding + 180.0) % 360.0) - 180.0
+    east = ((east + padding + 180.0) % 360.0) - 180.0
+    if east == -180.0 and west > east:
+        east = 180.0
+    return west, south, east, north
+
+
+def _in_bbox(cluster, bbox):
+    west, south, east, north = bbox
+    if not south <= cluster['latitude'] <= north:
+        return False
+    if west <= east:
+        return west <= cluster['longitude'] <= east
+    return cluster['longitude'] >= west or cluster['longitude'] <= east
+
+
+def cluster_feature_collection(queryset, kind, scope, zoom, bbox=None):
+    """Build a GeoJSON FeatureCollection of clusters for one zoom level."""
+    pyramid = get_cluster_pyramid(queryset, kind, scope)
+    level = min(zoom, CLUSTER_MAX_ZOOM)
+    clusters = pyramid.get(level, [])
+    # Keep clusters straddling the viewport edge
+    padded = _pad_bbox(bbox, cell_size(level)) if bbox is not None else None
+
+    features = []
+    for cluster in clusters:
+        if padded is not None and not _in_bbox(cluster, padded):
+            continue
+        properties = {key: value for key, value in cluster.items() if key not in ('latitude', 'longitude')}
+        properties['cluster'] = True
+        properties['entity_type'] = 'tree' if kind == 'trees' else 'seed'
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [cluster['longitude'], cluster['latitude']]
+            },
+            'properties': properties,
+        })
+
+    geojson = {
+        'type': 'FeatureCollection',
+        'features': features,
+        'clustered': True,
+        'zoom': zoom,
+        'cluster_max_zoom': CLUSTER_MAX_ZOOM,
+    }
+    if bbox is not None:
+        geojson['bbox'] = list(bbox)
+    return geojson
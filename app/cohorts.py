@@ -0,0 +1,222 @@
+"""
+Cohort analytics of seed plantings.
+
+Every ``TreeSeed`` record is a planting cohort.  The plantings in scope are
+read with one query of the needed columns into a pandas frame, and every
+table below is a grouped, vectorized pass over it:
+
+    summary             - plantings, seeds, germination and survival overall
+    germination_lag     - days from planting to first germination, as
+                          quartiles and a histogram
+    by_species          - germination and survival per species
+    by_location         - germination and survival per location
+    by_planting_month   - germination and survival per planting month
+    maturity_timeline   - plantings and surviving seeds per expected
+                          maturity year
+
+Survival rates are weighted by the quantity planted and only cover plantings
+whose survival has been assessed.  Results are cached per data scope until
+its data changes (see ``analytics_cache``).
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics_cache import cached_analytics
+from .growth import frame_records
+from .models import DatasetVersion, TreeSeed
+
+
+# Statuses counted as germinated
+GERMINATED_STATUSES = ('partially_germinated', 'fully_germinated')
+
+# Upper bounds (days, inclusive) of the germination lag histogram
+LAG_BINS = (7, 14, 30, 60, 90, 180)
+
+COLUMNS = (
+    'species_id', 'species__common_name', 'location_id', 'location__name', 'quantity',
+    'planting_date', 'germination_status', 'germination_date', 'survival_rate',
+    'expected_maturity_date',
+)
+
+
+def seed_frame(seeds):
+    """Frame of one row per planting with the derived cohort columns"""
+    frame = pd.DataFrame.from_records(list(seeds.order_by().values_list(*COLUMNS)), columns=COLUMNS)
+    frame = frame.rename(columns={'species__common_name': 'species', 'location__name': 'location'})
+    for column in ('planting_date', 'germination_date', 'expected_maturity_date'):
+        frame[column] = pd.to_datetime(frame[column])
+    frame['quantity'] = frame['quantity'].astype(np.int64)
+    frame['survival_rate'] = frame['survival_rate'].astype(np.float64)
+
+    lag = (frame['germination_date'] - frame['planting_date']).dt.days
+    # A germination date before planting is a data entry error
+    frame['lag_days'] = lag.where(lag >= 0)
+    frame['germinated'] = frame['germination_status'].isin(GERMINATED_STATUSES)
+    frame['failed'] = frame['germination_status'] == 'failed'
+    assessed = frame['survival_rate'].notna()
+    frame['assessed_seeds'] = frame['quantity'].where(assessed, 0)
+    frame['surviving_seeds'] = (frame['quantity'] * frame['survival_rate'] / 100).where(assessed, 0)
+    frame['planting_month'] = frame['planting_date'].dt.strftime('%Y-%m')
+    return frame
+
+
+def cohort_table(frame, keys):
+    """Germination and survival figures of ``frame`` grouped by ``keys``"""
+    table = frame.groupby(list(keys), sort=True).agg(
+        plantings=('quantity', 'size'),
+        seeds=('quantity', 'sum'),
+        germinated_plantings=('germinated', 'sum'),
+        failed_plantings=('failed', 'sum'),
+        assessed_seeds=('assessed_seeds', 'sum'),
+        surviving_seeds=('surviving_seeds', 'sum'),
+        median_lag_days=('lag_days', 'median'),
+    )
+    table['germination_rate'] = (table['germinated_plantings'] / table['plantings'] * 100).round(2)
+    table['survival_rate'] = (
+        table['surviving_seeds'] / table['assessed_seeds'].where(table['assessed_seeds'] > 0) * 100
+    ).round(2)
+    table['surviving_seeds'] = table['surviving_seeds'].round().astype(np.int64)
+    return table.drop(columns='assessed_seeds').reset_index()
+
+
+def germination_lag(frame):
+    """Quartiles and histogram of the days from planting to germination"""
+    lag = frame['lag_days'].dropna()
+    if lag.empty:
+        return {'observed': 0, 'mean_days': None, 'quartiles': None, 'histogram': []}
+    labels = [f'{low + 1}-{high}' for low, high in zip((-1,) + LAG_BINS, LAG_BINS)]
+    labels.append(f'>{LAG_BINS[-1]}')
+    bins = pd.cut(lag, (-1,) + LAG_BINS + (np.inf,), labels=labels)
+    seeds = frame.loc[lag.index, 'quantity']
+    histogram = pd.DataFrame({'bin': bins, 'seeds': seeds}).groupby('bin', observed=False).agg(
+        plantings=('seeds', 'size'), seeds=('seeds', 'sum'),
+    ).reset_index()
+    histogram['bin'] = histogram['bin'].astype(str)
+    quartiles = lag.quantile([0.25, 0.5, 0.75])
+    return {
+        'observed': int(len(lag)),
+        'mean_days': round(float(lag.mean()), 1),
+        'quartiles': {
+            'p25': float(quartiles[0.25]),
+            'median': float(quartiles[0.5]),
+            'p75': float(quartiles[0.75]),
+        },
+        'histogram': frame_records(histogram),
+    }
+
+
+def maturity_timeline(frame, today=None):
+    """Plantings and surviving seeds per expected maturity year"""
+    today = pd.Timestamp(today or timezone.localdate())
+    dated = frame[frame['expected_maturity_date'].notna()].copy()
+    if dated.empty:
+        return []
+    dated['year'] = dated['expected_maturity_date'].dt.year
+    dated['matured'] = dated['expected_maturity_date'] <= today
+    timeline = dated.groupby('year', sort=True).agg(
+        plantings=('quantity', 'size'),
+        seeds=('quantity', 'sum'),
+        surviving_seeds=('surviving_seeds', 'sum'),
+        matured_plantings=('matured', 'sum'),
+    ).reset_index()
+    timeline['surviving_seeds'] = timeline['surviving_seeds'].round().astype(np.int64)
+    return frame_records(timeline)
+
+
+def seed_filter_q(params):
+    """
+    ``Q`` over ``TreeSeed`` for the cohort filter parameters:
+
+        species, location - comma separated IDs
+        planted_from, planted_to - inclusive ISO planting dates
+
+    Raises ``ValueError`` for malformed values.
+    """
+    query = Q()
+    for name, field in (('species', 'species_id__in'), ('location', 'location_id__in')):
+        values = [value.strip() for value in str(params.get(name) or '').split(',') if value.strip()]
+        if not values:
+            continue
+        if not all(value.isdigit() for value in values):
+            raise ValueError(f'{name} must be a comma separated list of IDs')
+        query &= Q(**{field: [int(value) for value in values]})
+    for name, field in (('planted_from', 'planting_date__gte'), ('planted_to', 'planting_date__lte')):
+        value = params.get(name)
+        if not value:
+            continue
+        try:
+            query &= Q(**{field: datetime.date.fromisoformat(value)})
+        except ValueError:
+            raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+    return query
+
+
+def parse_cohort_params(params):
+    """The cohort filter parameters present in ``params``, validated"""
+    filters = {
+        name: params.get(name)
+        for name in ('species', 'location', 'planted_from', 'planted_to')
+        if params.get(name)
+    }
+    seed_filter_q(filters)
+    return filters
+
+
+def compute_seed_cohorts(user=None, filters=None, today=None):
+    """Cohort analytics of one user's plantings, or of all for None"""
+    seeds = TreeSeed.objects.filter(seed_filter_q(filters or {}))
+    if user is not None:
+        seeds = seeds.filter(user=user)
+    frame = seed_frame(seeds)
+
+    result = {
+        'filters': filters or {},
+        'summary': {
+            'plantings': 0, 'seeds': 0, 'germinated_plantings': 0, 'failed_plantings': 0,
+            'surviving_seeds': 0, 'germination_rate': None, 'survival_rate': None,
+        },
+        'germination_lag': germination_lag(frame),
+        'by_species': [],
+        'by_location': [],
+        'by_planting_month': [],
+        'maturity_timeline': [],
+    }
+    if frame.empty:
+        return result
+
+    overall = cohort_table(frame.assign(scope='all'), ['scope']).iloc[0]
+    result['summary'] = {
+        'plantings': int(overall['plantings']),
+        'seeds': int(overall['seeds']),
+        'germinated_plantings': int(overall['germinated_plantings']),
+        'failed_plantings': int(overall['failed_plantings']),
+        'surviving_seeds': int(overall['surviving_seeds']),
+        'germination_rate': float(overall['germination_rate']),
+        'survival_rate': None if pd.isna(overall['survival_rate']) else float(overall['survival_rate']),
+    }
+    result['by_species'] = frame_records(
+        cohort_table(frame, ['species_id', 'species']).sort_values('seeds', ascending=False, kind='stable')
+    )
+    result['by_location'] = frame_records(
+        cohort_table(frame, ['location_id', 'location']).sort_values('seeds', ascending=False, kind='stable')
+    )
+    result['by_planting_month'] = frame_records(cohort_table(frame, ['planting_month']))
+    result['maturity_timeline'] = maturity_timeline(frame, today)
+    return result
+
+
+def seed_cohorts(user=None, filters=None):
+    """
+    ``compute_seed_cohorts`` cached until the scope's data changes or the
+    day rolls over (plantings count as matured from today's date)
+    """
+    today = timezone.localdate()
+    return cached_analytics(
+        'seed-cohorts', DatasetVersion.scope_for(user),
+        lambda: compute_seed_cohorts(user, filters, today),
+        params={'filters': filters, 'today': today},
+    )
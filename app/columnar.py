@@ -0,0 +1,208 @@
+"""
+Columnar binary encoding of the tree feed (``?format=columnar``).
+
+GeoJSON repeats every property name and every taxonomy string for each
+feature.  The columnar body instead stores one typed array per numeric
+property and dictionary-encodes the repeated strings (species, genus, family,
+location, health status, notes, user), which shrinks the payload and lets the
+browser read the arrays without parsing JSON.
+
+Body layout (all integers little-endian)::
+
+    0      4 bytes   magic "ETMC"
+    4      1 byte    format version
+    5      3 bytes   reserved
+    8      uint32    header length H
+    12     H bytes   UTF-8 JSON header, space-padded so the data starts
+                     on an 8-byte boundary
+    12+H   ...       column data; each column starts on an 8-byte boundary
+
+The header lists ``count``, every column as ``{"type", "offset", "length"}``
+(offsets relative to the start of the column data), the dictionaries, and any
+extra top-level members of the equivalent GeoJSON response (bbox, zoom,
+sync_token, ...).
+"""
+import json
+import struct
+import uuid
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from .feeds import CHUNK_SIZE, TREE_ROW_FIELDS, species_image_urls
+
+
+CONTENT_TYPE = 'application/vnd.etm.columnar'
+
+MAGIC = b'ETMC'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+NUMERIC_COLUMNS = (
+    ('latitude', 'location__latitude', '<f8'),
+    ('longitude', 'location__longitude', '<f8'),
+    ('population', 'population', '<i4'),
+    ('year', 'year', '<i4'),
+    ('healthy_count', 'healthy_count', '<i4'),
+    ('good_count', 'good_count', '<i4'),
+    ('bad_count', 'bad_count', '<i4'),
+    ('deceased_count', 'deceased_count', '<i4'),
+    ('hectares', 'hectares', '<f8'),
+)
+
+# numpy dtype string -> type name understood by the client decoder
+TYPE_NAMES = {
+    '<f8': 'float64',
+    '<i4': 'int32',
+    '<u4': 'uint32',
+    '<u2': 'uint16',
+    'u1': 'uint8',
+}
+
+
+def wants_columnar(request):
+    """Return True when the client asked for the columnar body."""
+    return request.GET.get('format') == 'columnar'
+
+
+class Dictionary:
+    """Assigns consecutive integer codes to distinct values."""
+
+    def __init__(self):
+        self.codes = {}
+        self.entries = []
+
+    def code(self, key, entry=None):
+        """Return the code for ``key``, adding ``entry`` (default: key) if new."""
+        if key not in self.codes:
+            self.codes[key] = len(self.entries)
+            self.entries.append(key if entry is None else entry)
+        return self.codes[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _code_dtype(size):
+    """Smallest unsigned dtype able to hold codes for ``size`` entries."""
+    if size <= 0xFF:
+        return 'u1'
+    if size <= 0xFFFF:
+        return '<u2'
+    return '<u4'
+
+
+def _padding(length):
+    return -length % ALIGNMENT
+
+
+def encode_tree_columns(rows, image_url, **members):
+    """
+    Encode ``TREE_ROW_FIELDS`` values() rows into a columnar body.
+
+    ``image_url`` maps a species id to its image URL; ``members`` are added
+    to the header.
+    """
+    ids = bytearray()
+    numeric = {name: [] for name, _, _ in NUMERIC_COLUMNS}
+    coded = {name: [] for name in ('species', 'location', 'health_status', 'notes', 'user')}
+
+    families = Dictionary()
+    genera = Dictionary()
+    species = Dictionary()
+    locations = Dictionary()
+    statuses = Dictionary()
+    notes = Dictionary()
+    users = Dictionary()
+
+    for row in rows:
+        ids += uuid.UUID(str(row['id'])).bytes
+        for name, field, _ in NUMERIC_COLUMNS:
+            value = row[field]
+            numeric[name].append(np.nan if value is None else value)
+
+        family_code = families.code(row['species__genus__family__name'] or 'Unknown')
+        genus_code = genera.code(
+            (row['species__genus__name'], family_code),
+            {'name': row['species__genus__name'] or 'Unknown', 'family': family_code},
+        )
+        coded['species'].append(species.code(row['species_id'], {
+            'id': str(row['species_id']),
+            'common_name': row['species__common_name'],
+            'scientific_name': row['species__scientific_name'],
+            'genus': genus_code,
+            'image_url': image_url(row['species_id']) if row['species__has_image'] else None,
+        }))
+        coded['location'].append(locations.code(row['location_id'], {
+            'id': str(row['location_id']),
+            'name': row['location__name'],
+        }))
+        coded['health_status'].append(statuses.code(row['health_status']))
+        coded['notes'].append(notes.code(row['notes'] or ''))
+        coded['user'].append(users.code(row['user__username'] or 'Unknown'))
+
+    count = len(ids) // 16
+    dictionaries = {
+        'family': families.entries,
+        'genus': genera.entries,
+        'species': species.entries,
+        'location': locations.entries,
+        'health_status': statuses.entries,
+        'notes': notes.entries,
+        'user': users.entries,
+    }
+
+    buffers = [('id', 'uuid', bytes(ids))]
+    for name, _, dtype in NUMERIC_COLUMNS:
+        buffers.append((name, TYPE_NAMES[dtype], np.asarray(numeric[name], dtype=dtype).tobytes()))
+    for name, values in coded.items():
+        dtype = _code_dtype(len(dictionaries[name]))
+        buffers.append((name, TYPE_NAMES[dtype], np.asarray(values, dtype=dtype).tobytes()))
+
+    columns = {}
+    data = bytearray()
+    for name, type_name, buffer in buffers:
+        columns[name] = {'type': type_name, 'offset': len(data), 'length': count}
+        data += buffer
+        data += b'\0' * _padding(len(data))
+
+    header = dict(members, count=count, columns=columns, dictionaries=dictionaries)
+    header_bytes = json.dumps(header, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * _padding(12 + len(header_bytes))
+
+    return b''.join([
+        MAGIC,
+        struct.pack('<B3xI', FORMAT_VERSION, len(header_bytes)),
+        header_bytes,
+        bytes(data),
+    ])
+
+
+def decode_columnar(body):
+    """Decode a columnar body into ``(header, {column: numpy array})``."""
+    if body[:4] != MAGIC:
+        raise ValueError('Not a columnar tree feed body')
+    version, header_length = struct.unpack_from('<B3xI', body, 4)
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unsupported columnar format version {version}')
+    header = json.loads(body[12:12 + header_length])
+    data_start = 12 + header_length
+
+    dtypes = {type_name: dtype for dtype, type_name in TYPE_NAMES.items()}
+    columns = {}
+    for name, column in header['columns'].items():
+        start = data_start + column['offset']
+        if column['type'] == 'uuid':
+            raw = body[start:start + 16 * column['length']]
+            columns[name] = [str(uuid.UUID(bytes=raw[i:i + 16])) for i in range(0, len(raw), 16)]
+        else:
+            columns[name] = np.frombuffer(body, dtype=dtypes[column['type']], count=column['length'], offset=start)
+    return header, columns
+
+
+def columnar_tree_response(request, queryset, **members):
+    """Encode the trees of ``queryset`` as a columnar response."""
+    rows = queryset.order_by().values(*TREE_ROW_FIELDS)
+    body = encode_tree_columns(rows.iterator(chunk_size=CHUNK_SIZE), species_image_urls(request), **members)
+    return HttpResponse(body, content_type=CONTENT_TYPE)
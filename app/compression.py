@@ -0,0 +1,192 @@
+"""
+Compressed, cached bodies for the versioned API feeds.
+
+A feed's ETag already identifies the exact payload (dataset version, user and
+query string, see ``versioning``), so the compressed body can be cached under
+it.  Repeating a request for unchanged data then returns the stored bytes
+without running the view, serializing JSON or compressing again.
+
+Bodies are keyed on the ETag plus the normalized (sorted) query string.
+Viewport (``bbox``/zoom) bodies differ on nearly every map move, so they are
+kept only up to a smaller size and for a shorter time than the full feeds;
+``since=`` deltas are never stored.  A streamed body that failed part way (see
+``feeds.streaming_feature_collection``) is not stored either.
+
+gzip is always available; Brotli is used when the optional ``brotli`` package
+is installed and the client accepts it.
+"""
+import gzip
+import hashlib
+import re
+import zlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bodies smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 1024
+
+# Largest compressed body kept in the cache
+MAX_CACHED_SIZE = 20 * 1024 * 1024
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Limits for bodies of requests with parameters (map viewports)
+MAX_CACHED_PARAMS_SIZE = 1024 * 1024
+PARAMS_CACHE_TIMEOUT = 60 * 15
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _quality(value):
+    """q-value of an Accept-Encoding token; 1 when absent, 0 when malformed"""
+    if value is None:
+        return 1.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def accepted_encoding(request):
+    """Best encoding this module can produce that the client accepts, or None."""
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        match = re.match(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?', part)
+        if match and _quality(match.group(2)) > 0:
+            accepted.add(match.group(1).lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def normalized_query(request):
+    """Query string of ``request`` with its parameters in a fixed order"""
+    return urlencode(sorted((name, value) for name, values in request.GET.lists() for value in values))
+
+
+def cache_params(request):
+    """
+    Parameter string the compressed body of this feed request is cached
+    under ('' for the full feed), or None when it must not be cached.
+    """
+    if request.GET.get('since'):
+        return None
+    return normalized_query(request)
+
+
+def body_cache_key(etag, encoding, params=''):
+    return f"feed-body:{encoding}:{hashlib.md5(f'{etag}?{params}'.encode('utf-8')).hexdigest()}"
+
+
+def _cache_limits(params):
+    """``(max_size, timeout)`` for a body cached under ``params``"""
+    if params:
+        return MAX_CACHED_PARAMS_SIZE, PARAMS_CACHE_TIMEOUT
+    return MAX_CACHED_SIZE, CACHE_TIMEOUT
+
+
+def compress(data, encoding):
+    """Compress a complete body."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental compressor for streamed bodies."""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress = self._compressor.process
+            self._flush = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress = self._compressor.compress
+            self._flush = self._compressor.flush
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def flush(self):
+        return self._flush()
+
+
+def cached_response(etag, encoding, params=''):
+    """A response built from the cached compressed body, or None."""
+    entry = cache.get(body_cache_key(etag, encoding, params))
+    if entry is None:
+        return None
+    content_type, body = entry
+    response = HttpResponse(body, content_type=content_type)
+    response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _compressed_stream(response, chunks, encoding, key, content_type, max_size, timeout):
+    compressor = _StreamCompressor(encoding)
+    stored = [] if key else None
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            if stored is not None:
+                stored.append(data)
+                size += len(data)
+                if size > max_size:
+                    stored = None
+            yield data
+    data = compressor.flush()
+    yield data
+    if stored is not None and not getattr(response, 'stream_error', None):
+        stored.append(data)
+        cache.set(key, (content_type, b''.join(stored)), timeout)
+
+
+def compress_response(response, etag, encoding, params=''):
+    """
+    Compress a successful feed response and keep the compressed body under
+    ``etag`` and ``params`` (see ``cache_params``; None stores nothing).
+    Streaming responses are compressed chunk by chunk and stored once the
+    stream has completed without error.
+    """
+    if response.status_code != 200 or response.has_header('Content-Encoding'):
+        return response
+
+    key = body_cache_key(etag, encoding, params) if params is not None else None
+    max_size, timeout = _cache_limits(params)
+    content_type = response['Content-Type']
+    if response.streaming:
+        response.streaming_content = _compressed_stream(
+            response, response.streaming_content, encoding, key, content_type, max_size, timeout
+        )
+        if response.has_header('Content-Length'):
+            del response['Content-Length']
+    else:
+        if len(response.content) < MIN_COMPRESS_SIZE:
+            return response
+        body = compress(response.content, encoding)
+        if key and len(body) <= max_size:
+            cache.set(key, (content_type, body), timeout)
+        response.content = body
+        response['Content-Length'] = str(len(body))
+
+    response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,181 @@
+"""
+Server-side density grid for the GIS heatmap layer.
+
+Instead of sending every tree to the browser for leaflet.heat to bin, the
+population of the trees inside the viewport is binned into a grid here in one
+vectorized pass and only the non-empty cells are returned.  The grid is
+aligned to fixed cell boundaries for each zoom level, so panning over the same
+area hits the cache, and the cache key includes the dataset version so any
+write to the data is reflected on the next request.
+"""
+import numpy as np
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from .models import DatasetVersion
+from .spatial import filter_bbox, viewport_from_request
+
+
+# Grid cells per 256px tile edge; 32 gives 8px cells on screen
+DEFAULT_RESOLUTION = 32
+RESOLUTIONS = (8, 16, 32, 64)
+
+# Upper bound on cells along either grid axis
+MAX_GRID_SIZE = 512
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Coordinate precision of the returned cell centres
+COORDINATE_DECIMALS = 6
+
+
+def parse_resolution(value):
+    """Parse the ``resolution`` parameter (cells per tile edge)."""
+    if value is None or not str(value).strip():
+        return DEFAULT_RESOLUTION
+    try:
+        resolution = int(value)
+    except ValueError:
+        raise ValueError('resolution must be a number')
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(str(r) for r in RESOLUTIONS)}")
+    return resolution
+
+
+def cell_size(zoom, resolution=DEFAULT_RESOLUTION):
+    """Grid cell edge in degrees for a zoom level and resolution."""
+    return 360.0 / (2 ** zoom) / resolution
+
+
+def grid_window(bbox, zoom, resolution=DEFAULT_RESOLUTION):
+    """
+    Snap ``bbox`` outwards to cell boundaries.
+
+    Returns ``(col, row, cols, rows)``: the global index of the south-west
+    cell and the grid dimensions.  Raises ``ValueError`` when the grid would
+    exceed ``MAX_GRID_SIZE`` cells along an axis.
+    """
+    west, south, east, north = bbox
+    if east < west:
+        # Box crosses the antimeridian; continue the grid past 180
+        east += 360.0
+    size = cell_size(zoom, resolution)
+    col = int(np.floor((west + 180.0) / size))
+    row = int(np.floor((south + 90.0) / size))
+    cols = max(1, int(np.ceil((east + 180.0) / size)) - col)
+    rows = max(1, int(np.ceil((north + 90.0) / size)) - row)
+    if cols > MAX_GRID_SIZE or rows > MAX_GRID_SIZE:
+        raise ValueError('bbox is too large for this zoom level')
+    return col, row, cols, rows
+
+
+def _smooth(grid):
+    """Spread each cell over its neighbours with a 3x3 binomial kernel."""
+    kernel = np.array([0.25, 0.5, 0.25])
+    padded = np.pad(grid, 1)
+    grid = kernel[0] * padded[:-2] + kernel[1] * padded[1:-1] + kernel[2] * padded[2:]
+    return kernel[0] * grid[:, :-2] + kernel[1] * grid[:, 1:-1] + kernel[2] * grid[:, 2:]
+
+
+def density_grid(queryset, bbox, zoom, resolution=DEFAULT_RESOLUTION):
+    """
+    Bin the population of the trees in ``queryset`` inside ``bbox`` into a
+    smoothed grid.
+
+    Returns a dict with the snapped bbox, the grid dimensions, the largest
+    cell value and ``cells``: ``[lat, lng, value]`` for every non-empty cell,
+    where ``lat``/``lng`` are the cell centre.
+    """
+    col, row, cols, rows = grid_window(bbox, zoom, resolution)
+    size = cell_size(zoom, resolution)
+    west = col * size - 180.0
+    south = row * size - 90.0
+    east = west + cols * size
+    snapped = [west, south, east, south + rows * size]
+
+    # Query the snapped window so the cached grid does not depend on the exact
+    # viewport it was first requested for
+    if east - west >= 360.0:
+        window = (-180.0, south, 180.0, snapped[3])
+    elif east > 180.0:
+        window = (west, south, east - 360.0, snapped[3])
+    else:
+        window = (west, south, east, snapped[3])
+    points = np.array(
+        filter_bbox(queryset, window).order_by().values_list(
+            'location__latitude', 'location__longitude', 'population'
+        ),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    lat, lng, population = points[:, 0], points[:, 1], np.nan_to_num(points[:, 2])
+    lng = np.where(lng < west, lng + 360.0, lng)
+
+    ix = np.clip(np.floor((lng - west) / size).astype(np.int64), 0, cols - 1)
+    iy = np.clip(np.floor((lat - south) / size).astype(np.int64), 0, rows - 1)
+    grid = np.bincount(iy * cols + ix, weights=population, minlength=rows * cols).reshape(rows, cols)
+    grid = _smooth(grid)
+
+    cell_rows, cell_cols = np.nonzero(grid > 0)
+    values = grid[cell_rows, cell_cols]
+    centre_lat = np.round(south + (cell_rows + 0.5) * size, COORDINATE_DECIMALS)
+    centre_lng = (west + (cell_cols + 0.5) * size + 180.0) % 360.0 - 180.0
+    centre_lng = np.round(centre_lng, COORDINATE_DECIMALS)
+
+    return {
+        'bbox': snapped,
+        'zoom': zoom,
+        'resolution': resolution,
+        'cell_size': size,
+        'cols': cols,
+        'rows': rows,
+        'max': float(values.max()) if len(values) else 0.0,
+        'total': float(population.sum()),
+        'cells': np.column_stack([centre_lat, centre_lng, np.round(values, 3)]).tolist(),
+    }
+
+
+def cached_density_grid(queryset, scope, bbox, zoom, resolution=DEFAULT_RESOLUTION, variant=''):
+    """
+    ``density_grid`` cached per dataset version of ``scope``, zoom,
+    resolution and snapped window.  ``variant`` distinguishes differently
+    filtered querysets over the same scope.
+    """
+    col, row, cols, rows = grid_window(bbox, zoom, resolution)
+    version = DatasetVersion.current(scope)[0]
+    key = f'density:{scope}:{version}:{variant}:{zoom}:{resolution}:{col}:{row}:{cols}:{rows}'
+    grid = cache.get(key)
+    if grid is None:
+        grid = density_grid(queryset, bbox, zoom, resolution)
+        cache.set(key, grid, CACHE_TIMEOUT)
+    return grid
+
+
+def density_response(request, queryset, scope):
+    """
+    Answer a density request for the trees of ``queryset``, which belong to
+    dataset version ``scope``.
+
+    Reads ``bbox`` and ``zoom`` (both required), ``resolution`` and an
+    optional ``species_id`` filter from the query string.
+    """
+    try:
+        bbox, zoom = viewport_from_request(request)
+        if bbox is None or zoom is None:
+            raise ValueError('bbox and zoom are required')
+        resolution = parse_resolution(request.GET.get('resolution'))
+        variant = ''
+        species_id = request.GET.get('species_id')
+        if species_id:
+            try:
+                species_id = int(species_id)
+            except ValueError:
+                raise ValueError('species_id must be a number')
+            queryset = queryset.filter(species_id=species_id)
+            variant = f'species-{species_id}'
+        grid = cached_density_grid(queryset, scope, bbox, zoom, resolution, variant)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"Error in density API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse(grid)
@@ -0,0 +1,172 @@
+"""
+Row-based serialization of the GIS map feeds.
+
+The feeds read plain value rows from the database instead of model instances,
+so no related objects are loaded and image URLs come from the species'
+``has_image`` flag rather than the image blob.  Large feeds are streamed to
+the client feature by feature instead of being built as one list in memory.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
+
+# Rows fetched from the database per round trip while streaming
+CHUNK_SIZE = 2000
+
+# Features serialized into each chunk written to the client
+FEATURES_PER_CHUNK = 200
+
+# Tree feature properties and the values() fields each one is built from.
+# A ``fields=`` request parameter selects a subset, which also narrows the
+# columns read from the database.
+TREE_PROPERTIES = {
+    'id': ('id',),
+    'species_id': ('species_id',),
+    'location_id': ('location_id',),
+    'common_name': ('species__common_name',),
+    'scientific_name': ('species__scientific_name',),
+    'family': ('species__genus__family__name',),
+    'genus': ('species__genus__name',),
+    'location': ('location__name',),
+    'population': ('population',),
+    'year': ('year',),
+    'health_status': ('health_status',),
+    'healthy_count': ('healthy_count',),
+    'good_count': ('good_count',),
+    'bad_count': ('bad_count',),
+    'deceased_count': ('deceased_count',),
+    'hectares': ('hectares',),
+    'notes': ('notes',),
+    'image_url': ('species_id', 'species__has_image'),
+    'user': ('user__username',),
+}
+
+# Fields every feature needs for its geometry
+GEOMETRY_FIELDS = ('location__latitude', 'location__longitude')
+
+# Every property except the owner's username, which only the head feeds show
+APP_TREE_PROPERTIES = tuple(name for name in TREE_PROPERTIES if name != 'user')
+
+# All values() fields, used by the columnar encoder
+TREE_ROW_FIELDS = GEOMETRY_FIELDS + tuple(dict.fromkeys(
+    field for fields in TREE_PROPERTIES.values() for field in fields
+))
+
+
+def parse_fields(value):
+    """
+    Parse a comma separated ``fields`` parameter into a tuple of tree
+    properties.  ``id`` is always included since the map keys markers by it.
+
+    Returns ``None`` when no projection was requested and raises
+    ``ValueError`` for unknown property names.
+    """
+    if value is None or not str(value).strip():
+        return None
+    names = [name.strip() for name in str(value).split(',') if name.strip()]
+    unknown = [name for name in names if name not in TREE_PROPERTIES]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(['id'] + names))
+
+
+def species_image_urls(request):
+    """Return a memoized ``species_id -> absolute image URL`` function for a request."""
+    urls = {}
+
+    def image_url(species_id):
+        if species_id not in urls:
+            urls[species_id] = request.build_absolute_uri(reverse('app:species_image', args=[species_id]))
+        return urls[species_id]
+
+    return image_url
+
+
+def tree_rows(queryset, properties):
+    """values() rows holding only the columns needed for ``properties``."""
+    fields = GEOMETRY_FIELDS + tuple(dict.fromkeys(
+        field for name in properties for field in TREE_PROPERTIES[name]
+    ))
+    return queryset.order_by().values(*fields)
+
+
+def _property_value(name, row, image_url):
+    if name in ('id', 'species_id', 'location_id'):
+        return str(row[name])
+    if name == 'image_url':
+        return image_url(row['species_id']) if row['species__has_image'] else None
+    if name in ('family', 'genus', 'user'):
+        return row[TREE_PROPERTIES[name][0]] or 'Unknown'
+    if name == 'notes':
+        return row['notes'] or ''
+    return row[TREE_PROPERTIES[name][0]]
+
+
+def tree_feature(row, properties, image_url, extra=None):
+    """Build a GeoJSON feature with ``properties`` from a ``tree_rows`` row."""
+    feature_properties = {name: _property_value(name, row, image_url) for name in properties}
+    if extra:
+        feature_properties.update(extra)
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [row['location__longitude'], row['location__latitude']]
+        },
+        'properties': feature_properties
+    }
+
+
+def iter_tree_features(request, queryset, properties=None, extra=None):
+    """
+    Yield tree features while walking ``queryset`` in database chunks.
+
+    ``properties`` defaults to all of ``TREE_PROPERTIES``; ``extra`` holds
+    constant properties added to every feature.
+    """
+    properties = properties or tuple(TREE_PROPERTIES)
+    image_url = species_image_urls(request)
+    for row in tree_rows(queryset, properties).iterator(chunk_size=CHUNK_SIZE):
+        yield tree_feature(row, properties, image_url, extra)
+
+
+def _feature_collection_chunks(response, features, members):
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = ''
+    batch = []
+    try:
+        for feature in features:
+            batch.append(json.dumps(feature, cls=DjangoJSONEncoder))
+            if len(batch) >= FEATURES_PER_CHUNK:
+                yield separator + ', '.join(batch)
+                separator = ', '
+                batch = []
+    except Exception as e:
+        # Headers are already sent, so report the failure inside the document
+        print(f"Error while streaming features: {str(e)}")
+        members = dict(members, error=str(e))
+        response.stream_error = str(e)
+    if batch:
+        yield separator + ', '.join(batch)
+    yield ']'
+    for key, value in members.items():
+        yield f', {json.dumps(key)}: {json.dumps(value, cls=DjangoJSONEncoder)}'
+    yield '}'
+
+
+def streaming_feature_collection(features, **members):
+    """
+    Stream a GeoJSON FeatureCollection.
+
+    ``features`` may be any iterable (usually a generator over a queryset);
+    ``members`` are extra top-level keys written after the features.  If
+    the features fail part way, the error is added as an ``error`` member
+    and kept in the response's ``stream_error`` attribute.
+    """
+    response = StreamingHttpResponse(content_type='application/json')
+    response.stream_error = None
+    response.streaming_content = _feature_collection_chunks(response, features, members)
+    return response
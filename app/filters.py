@@ -0,0 +1,143 @@
+"""
+Composable tree filters for the query feed (``/api/tree-query/``).
+
+Every filter parameter becomes one condition of a single ``Q``, so a request
+combining several of them is answered by one SQL query over the indexed
+columns (species, location, year, coordinates) instead of the client
+downloading the whole feed and filtering it.
+
+List parameters take comma separated values; a parameter that is missing or
+empty does not filter.
+"""
+from django.db.models import Q
+
+from .models import EndemicTree, TreeRollup
+from .spatial import bbox_q, parse_bbox
+
+
+HEALTH_STATUSES = tuple(value for value, _ in EndemicTree._meta.get_field('health_status').choices)
+
+# Query parameters understood by ``tree_filter_q``
+FILTER_PARAMETERS = (
+    'species', 'family', 'genus', 'location', 'health_status', 'bbox',
+    'year_min', 'year_max', 'population_min', 'population_max',
+    'hectares_min', 'hectares_max',
+)
+
+# Filters the analytics endpoints apply to the rows of ``population_rows``
+# (no coordinates or per-record ranges)
+ROLLUP_FILTER_PARAMETERS = (
+    'species', 'family', 'genus', 'location', 'health_status', 'year_min', 'year_max',
+)
+
+
+def _values(params, name):
+    value = params.get(name)
+    if value is None:
+        return []
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+def _ids(params, name):
+    try:
+        return [int(value) for value in _values(params, name)]
+    except ValueError:
+        raise ValueError(f'{name} must be a comma separated list of IDs')
+
+
+def _number(params, name, cast):
+    value = params.get(name)
+    if value is None or not str(value).strip():
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def _ids_or_names(params, name, field):
+    """Filter a taxonomy level given either all IDs or all names."""
+    values = _values(params, name)
+    if not values:
+        return Q()
+    if all(value.isdigit() for value in values):
+        return Q(**{f'{field}_id__in': [int(value) for value in values]})
+    return Q(**{f'{field}__name__in': values})
+
+
+def tree_filter_q(params):
+    """
+    Build the ``Q`` for the filter parameters in ``params`` (a QueryDict or
+    dict):
+
+        species - species IDs
+        family, genus - family/genus IDs or names
+        location - location IDs
+        health_status - health statuses, e.g. "good,excellent"
+        bbox - "west,south,east,north"
+        year_min, year_max - inclusive year range
+        population_min, population_max - inclusive population range
+        hectares_min, hectares_max - inclusive hectares range
+
+    Raises ``ValueError`` for malformed values.
+    """
+    query = Q()
+
+    species = _ids(params, 'species')
+    if species:
+        query &= Q(species_id__in=species)
+    locations = _ids(params, 'location')
+    if locations:
+        query &= Q(location_id__in=locations)
+    query &= _ids_or_names(params, 'family', 'species__genus__family')
+    query &= _ids_or_names(params, 'genus', 'species__genus')
+
+    statuses = _values(params, 'health_status')
+    unknown = [status for status in statuses if status not in HEALTH_STATUSES]
+    if unknown:
+        raise ValueError(f"Unknown health_status: {', '.join(unknown)}")
+    if statuses:
+        query &= Q(health_status__in=statuses)
+
+    for name, field, cast in (
+        ('year_min', 'year__gte', int), ('year_max', 'year__lte', int),
+        ('population_min', 'population__gte', int), ('population_max', 'population__lte', int),
+        ('hectares_min', 'hectares__gte', float), ('hectares_max', 'hectares__lte', float),
+    ):
+        value = _number(params, name, cast)
+        if value is not None:
+            query &= Q(**{field: value})
+
+    bbox = parse_bbox(params.get('bbox'))
+    if bbox is not None:
+        query &= bbox_q(bbox)
+    return query
+
+
+def active_filters(params):
+    """The filter parameters present in ``params``, for echoing in responses."""
+    return {name: params.get(name) for name in FILTER_PARAMETERS if params.get(name)}
+
+
+def population_rows(filters=None, location=False):
+    """
+    Rows matching the rollup ``filters`` to sum populations from: the
+    ``TreeRollup`` rows, or the tree records themselves when the figures are
+    per location (``location``) or filtered by location, since the rollups
+    are not kept per location.  Both have the key and population columns.
+    """
+    filters = filters or {}
+    model = EndemicTree if location or filters.get('location') else TreeRollup
+    return model.objects.filter(tree_filter_q(filters))
+
+
+def rollup_filters(params):
+    """
+    The rollup filter parameters present in ``params`` as a plain dict, for
+    ``population_rows`` and for cache keys.
+
+    Raises ``ValueError`` for malformed values.
+    """
+    filters = {name: params.get(name) for name in ROLLUP_FILTER_PARAMETERS if params.get(name)}
+    tree_filter_q(filters)
+    return filters
@@ -0,0 +1,223 @@
+"""
+Population projections per species.
+
+One grouped query over the tree rollups (or the tree records when filtered
+by location, see ``filters.population_rows``) gives the population of every
+(species, year); the rows are scattered into a ``series x years`` NumPy
+matrix (NaN where a species was not recorded) with the population of all
+trees appended as one more row.  Every row is then fitted at once with
+closed-form least squares on its observed years:
+
+    linear      population = a + b * year
+    log_linear  ln(population) = a + b * year, i.e. constant percentage growth
+
+and projected ``horizon`` years past the last recorded year with a 95%
+prediction band.  Series with one observation get no projection, series
+with two get a projection without a band.
+
+Results are cached per data scope until its data changes (see
+``analytics_cache``).
+"""
+import numpy as np
+from django.db.models import Sum
+
+from .analytics_cache import cached_analytics
+from .filters import active_filters, population_rows, rollup_filters
+from .models import DatasetVersion, TreeSpecies
+
+
+MODELS = ('linear', 'log_linear')
+
+DEFAULT_HORIZON = 5
+MAX_HORIZON = 20
+
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom; the normal
+# quantile is used beyond
+T_QUANTILES = np.array([
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+])
+NORMAL_QUANTILE = 1.96
+
+
+def t_quantile(df):
+    """95% two-sided t quantile for each entry of ``df`` (NaN where df < 1)"""
+    df = np.asarray(df)
+    table = T_QUANTILES[np.clip(df, 1, len(T_QUANTILES)) - 1]
+    return np.where(df < 1, np.nan, np.where(df > len(T_QUANTILES), NORMAL_QUANTILE, table))
+
+
+def species_year_matrix(rollups):
+    """
+    ``(species_ids, years, matrix)`` where ``matrix[s, y]`` is the population
+    of species ``s`` in year ``y``, NaN where it was not recorded
+    """
+    rows = list(rollups.order_by().values_list('species_id', 'year').annotate(total=Sum('population')))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.full((0, 0), np.nan)
+    data = np.array(rows, dtype=np.float64)
+    species_ids, species_index = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    years, year_index = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+    matrix = np.full((len(species_ids), len(years)), np.nan)
+    matrix[species_index, year_index] = data[:, 2]
+    return species_ids, years, matrix
+
+
+def fit_trends(years, matrix, model='linear'):
+    """
+    Least-squares line through the observed values of each row of ``matrix``.
+
+    Returns a dict of per-row arrays: ``intercept`` and ``slope`` (on the
+    model scale, against years centred on ``origin``), ``n`` observations,
+    ``mean_t`` and ``sxx`` of the observed centred years, residual standard
+    error ``s`` and ``r_squared``.
+    """
+    values = matrix
+    if model == 'log_linear':
+        values = np.log(np.where(matrix > 0, matrix, np.nan))
+    observed = ~np.isnan(values)
+    y = np.where(observed, values, 0.0)
+    origin = years.mean() if len(years) else 0.0
+    t = np.broadcast_to(years - origin, y.shape)
+    w = observed.astype(np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = w.sum(axis=1)
+        mean_t = (w * t).sum(axis=1) / n
+        mean_y = (w * y).sum(axis=1) / n
+        dt = np.where(observed, t - mean_t[:, None], 0.0)
+        dy = np.where(observed, y - mean_y[:, None], 0.0)
+        sxx = (dt ** 2).sum(axis=1)
+        syy = (dy ** 2).sum(axis=1)
+        slope = np.where(sxx > 0, (dt * dy).sum(axis=1) / sxx, np.nan)
+        intercept = mean_y - slope * mean_t
+        residuals = np.where(observed, y - (intercept[:, None] + slope[:, None] * t), 0.0)
+        sse = (residuals ** 2).sum(axis=1)
+        s = np.where(n > 2, np.sqrt(sse / (n - 2)), np.nan)
+        r_squared = np.where(syy > 0, 1 - sse / syy, np.where(sxx > 0, 1.0, np.nan))
+
+    return {
+        'origin': origin, 'intercept': intercept, 'slope': slope, 'n': n.astype(np.int64),
+        'mean_t': mean_t, 'sxx': sxx, 's': s, 'r_squared': r_squared,
+    }
+
+
+def project(fit, future_years, model='linear'):
+    """``(mean, lower, upper)`` arrays of ``rows x len(future_years)``"""
+    t = np.asarray(future_years, dtype=np.float64)[None, :] - fit['origin']
+    mean = fit['intercept'][:, None] + fit['slope'][:, None] * t
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spread = fit['s'][:, None] * np.sqrt(
+            1 + 1 / fit['n'][:, None] + (t - fit['mean_t'][:, None]) ** 2 / fit['sxx'][:, None]
+        )
+    margin = t_quantile(fit['n'] - 2)[:, None] * spread
+    lower, upper = mean - margin, mean + margin
+    if model == 'log_linear':
+        return np.exp(mean), np.exp(lower), np.exp(upper)
+    # Populations can't go negative
+    return np.maximum(mean, 0), np.maximum(lower, 0), np.maximum(upper, 0)
+
+
+def _number(value, digits=1):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+def compute_forecast(user=None, model='linear', horizon=DEFAULT_HORIZON, filters=None):
+    """Projected population per species, and of all trees, ``horizon`` years ahead"""
+    rows = population_rows(filters)
+    if user is not None:
+        rows = rows.filter(user=user)
+    species_ids, years, matrix = species_year_matrix(rows)
+    result = {
+        'model': model, 'horizon': horizon, 'filters': active_filters(filters or {}),
+        'total': None, 'species': [],
+    }
+    if not len(years):
+        return result
+
+    # The population of all trees is fitted as one more row
+    total = np.where(np.isnan(matrix).all(axis=0), np.nan, np.nansum(matrix, axis=0))
+    matrix = np.vstack([matrix, total])
+    future_years = np.arange(years[-1] + 1, years[-1] + 1 + horizon)
+    fit = fit_trends(years, matrix, model)
+    mean, lower, upper = project(fit, future_years, model)
+
+    observed = ~np.isnan(matrix)
+    last_index = len(years) - 1 - np.argmax(observed[:, ::-1], axis=1)
+    last_population = matrix[np.arange(len(matrix)), last_index]
+    if model == 'log_linear':
+        annual_change = (np.exp(fit['slope']) - 1) * 100
+    else:
+        annual_change = fit['slope']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        projected_change = (mean[:, -1] - last_population) / last_population * 100
+
+    def series(i):
+        if fit['n'][i] < 2 or np.isnan(fit['slope'][i]):
+            return None
+        return {
+            'observations': int(fit['n'][i]),
+            'last_year': int(years[last_index[i]]),
+            'last_population': int(last_population[i]),
+            'annual_change': _number(annual_change[i], 2),
+            'projected_change': _number(projected_change[i], 2),
+            'r_squared': _number(fit['r_squared'][i], 4),
+            'history': [
+                {'year': int(year), 'population': int(value)}
+                for year, value in zip(years, matrix[i]) if not np.isnan(value)
+            ],
+            'forecast': [
+                {
+                    'year': int(year),
+                    'population': _number(mean[i, j]),
+                    'lower': _number(lower[i, j]),
+                    'upper': _number(upper[i, j]),
+                }
+                for j, year in enumerate(future_years)
+            ],
+        }
+
+    result['total'] = series(len(matrix) - 1)
+    names = TreeSpecies.objects.only('common_name', 'scientific_name').in_bulk([int(i) for i in species_ids])
+    for i, species_id in enumerate(species_ids):
+        item = series(i)
+        species = names.get(int(species_id))
+        if item is None or species is None:
+            continue
+        result['species'].append(dict(
+            species_id=int(species_id),
+            common_name=species.common_name,
+            scientific_name=species.scientific_name,
+            **item
+        ))
+    # Steepest projected decline first
+    result['species'].sort(key=lambda item: (item['projected_change'] is None, item['projected_change'] or 0))
+    return result
+
+
+def parse_forecast_params(params):
+    """
+    Validated ``(model, horizon, filters)`` from request parameters.
+
+    Raises ``ValueError`` for malformed values.
+    """
+    model = params.get('model') or 'linear'
+    if model not in MODELS:
+        raise ValueError(f"model must be one of: {', '.join(MODELS)}")
+    try:
+        horizon = int(params.get('years') or DEFAULT_HORIZON)
+    except ValueError:
+        raise ValueError('years must be a number')
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f'years must be between 1 and {MAX_HORIZON}')
+    return model, horizon, rollup_filters(params)
+
+
+def forecast(user, model='linear', horizon=DEFAULT_HORIZON, filters=None):
+    """``compute_forecast`` cached until the scope's data changes"""
+    return cached_analytics(
+        'forecast', DatasetVersion.scope_for(user),
+        lambda: compute_forecast(user, model, horizon, filters),
+        params={'model': model, 'horizon': horizon, 'filters': filters},
+    )
@@ -0,0 +1,104 @@
+"""
+Geohash cell keys for ``Location`` coordinates.
+
+A geohash is a hierarchical cell key: every prefix of a location's hash is
+the cell containing it at a coarser resolution.  Storing the full hash in one
+indexed column therefore serves every resolution at once, and a bounding box
+can be narrowed with a handful of ``LIKE 'prefix%'`` range scans on a plain
+B-tree index, without PostGIS.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Characters stored on Location (cells of roughly 3.7cm x 1.9cm)
+GEOHASH_PRECISION = 12
+
+# Most cells a bounding box may be split into for a prefix filter
+MAX_COVER_CELLS = 8
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a coordinate with ``precision`` characters."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(width, height)`` in degrees of a cell with ``precision`` characters."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 360.0 / 2 ** lng_bits, 180.0 / 2 ** lat_bits
+
+
+def covering_geohashes(bbox, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose cells together cover ``bbox``, at the finest
+    precision needing no more than ``max_cells`` cells.
+
+    Returns ``None`` when even the coarsest cells are too many or the box
+    crosses the antimeridian; callers then skip the prefix filter.
+    """
+    west, south, east, north = bbox
+    if west > east:
+        return None
+
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        width, height = cell_size(precision)
+        first_col = int((west + 180.0) // width)
+        last_col = min(int((east + 180.0) // width), int(360.0 / width) - 1)
+        first_row = int((south + 90.0) // height)
+        last_row = min(int((north + 90.0) // height), int(180.0 / height) - 1)
+        if (last_col - first_col + 1) * (last_row - first_row + 1) > max_cells:
+            break
+        best = (precision, width, height, first_col, last_col, first_row, last_row)
+
+    if best is None:
+        return None
+    precision, width, height, first_col, last_col, first_row, last_row = best
+    return sorted({
+        encode_geohash(-90.0 + (row + 0.5) * height, -180.0 + (col + 0.5) * width, precision)
+        for col in range(first_col, last_col + 1)
+        for row in range(first_row, last_row + 1)
+    })
+
+
+def geohash_q(bbox, prefix='location__'):
+    """
+    ``Q`` limiting ``<prefix>geohash`` to the cells covering ``bbox``, or
+    ``None`` when the box is too large for a useful prefix filter.
+
+    Locations without a geohash yet (written by ``update()`` or bulk paths
+    that skip ``save``, until ``backfill_geohash`` runs) are let through for
+    the coordinate filters to decide.
+    """
+    cells = covering_geohashes(bbox)
+    if not cells:
+        return None
+    missing = Q(**{f'{prefix}geohash': ''})
+    return reduce(or_, (Q(**{f'{prefix}geohash__startswith': cell}) for cell in cells), missing)
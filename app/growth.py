@@ -0,0 +1,173 @@
+"""
+Population growth per species, location and family.
+
+One query groups the tree rollups (the tree records for the location
+dimension, see ``filters.population_rows``) by (dimension key, year); the
+rows are then
+loaded into a pandas frame and every series is processed at once with
+grouped, vectorized operations:
+
+    growth_rate     - change from the previous recorded year, in percent
+    moving_average  - mean population over the last ``window`` recorded years
+    cagr            - compound annual growth rate between the first and last
+                      recorded year, in percent
+    trend           - declining / stable / growing, from the CAGR
+
+The ``total`` dimension is the population of all trees, as shown on the
+analytics pages.  Payloads are cached per data scope until its data changes
+(see ``analytics_cache``).
+"""
+import pandas as pd
+from django.db.models import F, Sum
+
+from .analytics_cache import cached_analytics
+from .filters import active_filters, population_rows, rollup_filters
+from .models import DatasetVersion
+
+
+# Key and display name of each series per dimension
+DIMENSIONS = {
+    'total': None,
+    'species': (F('species_id'), F('species__common_name')),
+    'location': (F('location_id'), F('location__name')),
+    'family': (F('species__genus__family_id'), F('species__genus__family__name')),
+}
+
+DEFAULT_WINDOW = 3
+MAX_WINDOW = 10
+
+# CAGR (percent) within which a series counts as stable
+STABLE_THRESHOLD = 1.0
+
+TRENDS = ('declining', 'stable', 'growing')
+
+
+def yearly_population(rollups, dimension='total'):
+    """
+    Frame of ``key, name, year, population`` with one row per series and year,
+    from rollup or tree rows
+    """
+    rollups = rollups.order_by()
+    if DIMENSIONS[dimension] is None:
+        rows = list(rollups.values('year').annotate(population_total=Sum('population')))
+        frame = pd.DataFrame(rows, columns=['year', 'population_total'])
+        frame.insert(0, 'key', 'total')
+        frame.insert(1, 'name', 'All trees')
+    else:
+        key, name = DIMENSIONS[dimension]
+        rows = list(rollups.values('year', key=key, name=name).annotate(population_total=Sum('population')))
+        frame = pd.DataFrame(rows, columns=['key', 'name', 'year', 'population_total'])
+    return frame.rename(columns={'population_total': 'population'})
+
+
+def add_growth_columns(frame, window=DEFAULT_WINDOW):
+    """
+    Sort ``frame`` by series and year and add ``previous_population``,
+    ``growth_rate`` and ``moving_average`` (NaN where undefined)
+    """
+    frame = frame.sort_values(['key', 'year'], kind='stable').reset_index(drop=True)
+    population = frame.groupby('key', sort=False)['population']
+    previous = population.shift(1)
+    frame['previous_population'] = previous.astype('Int64')
+    frame['growth_rate'] = ((frame['population'] - previous) / previous.where(previous > 0) * 100).round(2)
+    frame['moving_average'] = population.rolling(window, min_periods=1).mean().reset_index(level=0, drop=True).round(2)
+    return frame
+
+
+def summarize_growth(frame):
+    """One row per series: first and last year, CAGR, latest growth and trend"""
+    grouped = frame.groupby('key', sort=False)
+    summary = grouped.agg(
+        name=('name', 'first'),
+        first_year=('year', 'first'),
+        last_year=('year', 'last'),
+        first_population=('population', 'first'),
+        last_population=('population', 'last'),
+    )
+    summary['latest_growth_rate'] = grouped.tail(1).set_index('key')['growth_rate']
+    span = summary['last_year'] - summary['first_year']
+    first = summary['first_population'].where(summary['first_population'] > 0)
+    ratio = summary['last_population'] / first
+    summary['cagr'] = ((ratio ** (1 / span) - 1) * 100).where(span > 0).round(2)
+    summary['trend'] = pd.cut(
+        summary['cagr'],
+        [float('-inf'), -STABLE_THRESHOLD, STABLE_THRESHOLD, float('inf')],
+        labels=TRENDS,
+    ).astype(object)
+    return summary.reset_index().sort_values('cagr', kind='stable', na_position='last')
+
+
+def frame_records(frame):
+    """JSON-ready rows of ``frame`` with NaN as None"""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def growth_rate_by_year(population_by_year):
+    """
+    Year-over-year growth of the total population, given the
+    ``[{'year', 'total'}]`` series of the analytics pages
+    """
+    frame = pd.DataFrame(population_by_year, columns=['year', 'total']).rename(columns={'total': 'population'})
+    if len(frame) < 2:
+        return []
+    frame.insert(0, 'key', 'total')
+    frame = add_growth_columns(frame).iloc[1:]
+    frame['growth_rate'] = frame['growth_rate'].fillna(0)
+    return frame_records(frame[['year', 'growth_rate']])
+
+
+def parse_growth_params(params):
+    """
+    Validated ``(dimension, window, trend, filters)`` from request parameters.
+
+    Raises ``ValueError`` for malformed values.
+    """
+    dimension = params.get('dimension') or 'species'
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimension must be one of: {', '.join(DIMENSIONS)}")
+    try:
+        window = int(params.get('window') or DEFAULT_WINDOW)
+    except ValueError:
+        raise ValueError('window must be a number')
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f'window must be between 1 and {MAX_WINDOW}')
+    trend = params.get('trend') or None
+    if trend is not None and trend not in TRENDS:
+        raise ValueError(f"trend must be one of: {', '.join(TRENDS)}")
+    return dimension, window, trend, rollup_filters(params)
+
+
+def compute_growth(user=None, dimension='species', window=DEFAULT_WINDOW, trend=None, filters=None):
+    """Growth series and per-series summary for one user's trees, or all for None"""
+    rows = population_rows(filters, location=dimension == 'location')
+    if user is not None:
+        rows = rows.filter(user=user)
+
+    frame = yearly_population(rows, dimension)
+    series, summary = [], []
+    if len(frame):
+        frame = add_growth_columns(frame, window)
+        totals = summarize_growth(frame)
+        if trend is not None:
+            totals = totals[totals['trend'] == trend]
+            frame = frame[frame['key'].isin(totals['key'])]
+        series = frame_records(frame)
+        summary = frame_records(totals)
+
+    return {
+        'dimension': dimension,
+        'window': window,
+        'trend': trend,
+        'filters': active_filters(filters or {}),
+        'series': series,
+        'summary': summary,
+    }
+
+
+def growth(user, dimension='species', window=DEFAULT_WINDOW, trend=None, filters=None):
+    """``compute_growth`` cached until the scope's data changes"""
+    return cached_analytics(
+        'growth', DatasetVersion.scope_for(user),
+        lambda: compute_growth(user, dimension, window, trend, filters),
+        params={'dimension': dimension, 'window': window, 'trend': trend, 'filters': filters},
+    )
@@ -0,0 +1,288 @@
+"""
+CSV import of tree records, run as an ``import_trees`` background job.
+
+The upload view only checks the file's header and queues the job with the
+file as its input.  The worker imports the rows in chunks: each chunk is
+committed together with the job's progress and a checkpoint (the next row
+to import), so a retried job resumes after the last committed chunk instead
+of importing rows twice.
+
+A chunk takes a fixed number of queries whatever its size:
+
+    1. the rows are validated column-wise and the bad ones set aside
+    2. the families, genera, species and locations named by the chunk are
+       looked up with one ``IN`` query each
+    3. rows whose (species, location, year) already has a record, or
+       repeats an earlier row, are set aside
+    4. the missing taxonomy and locations are created with ``bulk_create``
+       and read back for their IDs
+    5. the trees are inserted with ``bulk_create``
+
+``bulk_create`` skips ``save()`` and the model signals, so the chunk then
+does their work itself: it fills in ``Location.geohash``, adds the new
+trees to the owner's rollups and marks the owner's feeds, tiles and
+analytics as changed.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .geohash import encode_geohash
+from .models import DatasetVersion, EndemicTree, Location, TreeFamily, TreeGenus, TreeRollup, TreeSpecies
+from .tiles import prune_tiles_on_commit
+
+
+REQUIRED_COLUMNS = [
+    'common_name', 'scientific_name', 'family', 'genus', 'population', 'hectares', 'latitude',
+    'longitude', 'year',
+]
+
+NAME_COLUMNS = ('common_name', 'scientific_name', 'family', 'genus')
+COUNT_COLUMNS = ('healthy_count', 'good_count', 'bad_count', 'deceased_count')
+
+# Rows committed per transaction and progress report
+CHUNK_SIZE = 5000
+
+# Rows per INSERT statement
+BATCH_SIZE = 1000
+
+# Row errors kept in the job result
+MAX_ERROR_MESSAGES = 20
+
+
+def missing_columns(csv_file):
+    """Required columns absent from the header of ``csv_file`` (read from the start)"""
+    columns = pd.read_csv(csv_file, nrows=0).columns
+    csv_file.seek(0)
+    return [column for column in REQUIRED_COLUMNS if column not in columns]
+
+
+def read_trees_csv(data):
+    """Frame of the CSV bytes ``data``, with the optional columns filled in"""
+    frame = pd.read_csv(io.BytesIO(data))
+    # Both "hectares" and "hectars" headers are accepted
+    if 'hectars' in frame.columns:
+        frame['hectares'] = frame['hectares'].fillna(frame['hectars']) if 'hectares' in frame.columns else frame['hectars']
+    for column in COUNT_COLUMNS:
+        if column not in frame.columns:
+            frame[column] = 0
+    for column in ('health_status', 'notes'):
+        if column not in frame.columns:
+            frame[column] = None
+    return frame
+
+
+def _whole_numbers(values):
+    """``values`` as floats, NaN where a value is not a whole number"""
+    numbers = pd.to_numeric(values, errors='coerce')
+    return numbers.where(numbers == np.floor(numbers))
+
+
+def validate_rows(chunk):
+    """
+    ``(rows, errors)``: the valid rows of ``chunk`` with clean typed values,
+    and a Series of error messages indexed by the rejected rows
+    """
+    rows = pd.DataFrame(index=chunk.index)
+    errors = pd.Series(None, index=chunk.index, dtype=object)
+
+    def reject(mask, message):
+        mask = mask & errors.isna()
+        errors[mask] = [f"Row {index + 1}: {message}" for index in chunk.index[mask]]
+
+    for column in NAME_COLUMNS:
+        rows[column] = chunk[column].astype(str).str.strip().where(chunk[column].notna(), '')
+        reject(rows[column] == '', f"{column} is required")
+    for column in ('latitude', 'longitude'):
+        rows[column] = pd.to_numeric(chunk[column], errors='coerce')
+        reject(rows[column].isna(), f"invalid {column} value")
+    for column in ('population', 'year'):
+        rows[column] = _whole_numbers(chunk[column])
+        reject(rows[column].isna(), f"invalid {column} value")
+
+    rows['hectares'] = pd.to_numeric(chunk['hectares'], errors='coerce')
+    blank = chunk['hectares'].isna() | (chunk['hectares'].astype(str).str.strip() == '')
+    reject(blank, "hectares (hectars) is required")
+    reject(rows['hectares'].isna(), "invalid hectares value")
+    reject(rows['hectares'] < 0, "hectares must be non-negative")
+
+    for column in COUNT_COLUMNS:
+        # Blank counts are zero
+        rows[column] = _whole_numbers(chunk[column].fillna(0))
+        reject(rows[column].isna(), f"invalid {column} value")
+
+    rows['health_status'] = chunk['health_status'].where(chunk['health_status'].notna(), 'good').astype(str)
+    rows['notes'] = chunk['notes'].where(chunk['notes'].notna(), '').astype(str)
+
+    valid = errors.isna()
+    rows = rows[valid]
+    for column in ('population', 'year') + COUNT_COLUMNS:
+        rows[column] = rows[column].astype(np.int64)
+    return rows, errors[~valid]
+
+
+def _name_ids(model, field, user, names):
+    return dict(model.objects.filter(user=user, **{f'{field}__in': list(names)}).values_list(field, 'id'))
+
+
+def _location_ids(user, rows):
+    """``{(latitude, longitude): id}`` of the user's locations at the rows' coordinates"""
+    locations = Location.objects.filter(
+        user=user,
+        latitude__in=[float(value) for value in rows['latitude'].unique()],
+        longitude__in=[float(value) for value in rows['longitude'].unique()],
+    ).order_by('id').values_list('latitude', 'longitude', 'id')
+    ids = {}
+    for latitude, longitude, location_id in locations:
+        # The oldest of duplicate locations wins
+        ids.setdefault((latitude, longitude), location_id)
+    return ids
+
+
+def resolve_taxonomy(user, rows):
+    """
+    Add ``species_id`` and ``location_id`` columns to ``rows``, creating the
+    families, genera, species and locations that do not exist yet.  A new
+    record takes its details from the first row naming it.
+    """
+    firsts = rows.drop_duplicates('family')
+    family_ids = _name_ids(TreeFamily, 'name', user, firsts['family'])
+    TreeFamily.objects.bulk_create([
+        TreeFamily(name=name, user=user) for name in firsts['family'] if name not in family_ids
+    ], batch_size=BATCH_SIZE)
+    family_ids = _name_ids(TreeFamily, 'name', user, firsts['family'])
+
+    firsts = rows.drop_duplicates('genus')
+    genus_ids = _name_ids(TreeGenus, 'name', user, firsts['genus'])
+    TreeGenus.objects.bulk_create([
+        TreeGenus(name=genus, family_id=family_ids[family], user=user)
+        for genus, family in zip(firsts['genus'], firsts['family']) if genus not in genus_ids
+    ], batch_size=BATCH_SIZE)
+    genus_ids = _name_ids(TreeGenus, 'name', user, firsts['genus'])
+
+    firsts = rows.drop_duplicates('scientific_name')
+    species_ids = _name_ids(TreeSpecies, 'scientific_name', user, firsts['scientific_name'])
+    TreeSpecies.objects.bulk_create([
+        TreeSpecies(scientific_name=name, common_name=common_name, genus_id=genus_ids[genus], user=user)
+        for name, common_name, genus in zip(firsts['scientific_name'], firsts['common_name'], firsts['genus'])
+        if name not in species_ids
+    ], batch_size=BATCH_SIZE)
+    species_ids = _name_ids(TreeSpecies, 'scientific_name', user, firsts['scientific_name'])
+
+    firsts = rows.drop_duplicates(['latitude', 'longitude'])
+    location_ids = _location_ids(user, firsts)
+    Location.objects.bulk_create([
+        Location(
+            name=f"{common_name} location", latitude=float(latitude), longitude=float(longitude),
+            geohash=encode_geohash(latitude, longitude), user=user,
+        )
+        for latitude, longitude, common_name in zip(firsts['latitude'], firsts['longitude'], firsts['common_name'])
+        if (latitude, longitude) not in location_ids
+    ], batch_size=BATCH_SIZE)
+    location_ids = _location_ids(user, firsts)
+
+    return rows.assign(
+        species_id=rows['scientific_name'].map(species_ids),
+        location_id=[location_ids[key] for key in zip(rows['latitude'], rows['longitude'])],
+    )
+
+
+def duplicate_errors(user, rows):
+    """
+    Error messages, indexed by row, for the rows repeating an earlier row's
+    (species, location, year) or one already recorded
+    """
+    repeated = rows.duplicated(['scientific_name', 'latitude', 'longitude', 'year'])
+    errors = pd.Series(
+        [f"Row {index + 1}: repeats an earlier row's species, location and year" for index in rows.index[repeated]],
+        index=rows.index[repeated], dtype=object,
+    )
+
+    # Only rows naming an existing species and location can clash with a record
+    species_ids = rows['scientific_name'].map(_name_ids(TreeSpecies, 'scientific_name', user, rows['scientific_name'].unique()))
+    location_ids = _location_ids(user, rows)
+    location_ids = pd.Series(
+        [location_ids.get(key) for key in zip(rows['latitude'], rows['longitude'])], index=rows.index, dtype=object,
+    )
+    known = species_ids.notna() & location_ids.notna() & ~repeated
+    if known.any():
+        existing = set(EndemicTree.objects.filter(
+            species_id__in=[int(i) for i in species_ids[known].unique()],
+            location_id__in=[int(i) for i in location_ids[known].unique()],
+            year__in=[int(year) for year in rows.loc[known, 'year'].unique()],
+        ).values_list('species_id', 'location_id', 'year'))
+        clashes = [
+            index for index, key in zip(
+                rows.index[known],
+                zip(species_ids[known].astype(int), location_ids[known].astype(int), rows.loc[known, 'year']),
+            )
+            if key in existing
+        ]
+        errors = pd.concat([errors, pd.Series(
+            [f"Row {index + 1}: a record for this species, location and year already exists" for index in clashes],
+            index=clashes, dtype=object,
+        )])
+    return errors
+
+
+def import_trees(user, chunk):
+    """
+    Import the rows of ``chunk`` for ``user`` in the current transaction.
+    Returns ``(imported, errors)`` with the messages of the rejected rows
+    in row order.
+    """
+    rows, errors = validate_rows(chunk)
+    duplicates = duplicate_errors(user, rows)
+    rows = rows.drop(index=duplicates.index)
+    errors = pd.concat([errors, duplicates]).sort_index()
+    if rows.empty:
+        return 0, list(errors)
+
+    rows = resolve_taxonomy(user, rows)
+    trees = EndemicTree.objects.bulk_create([
+        # Database adapters take Python numbers, not NumPy scalars
+        EndemicTree(
+            species_id=int(row.species_id), location_id=int(row.location_id), population=int(row.population),
+            year=int(row.year), health_status=row.health_status, healthy_count=int(row.healthy_count),
+            good_count=int(row.good_count), bad_count=int(row.bad_count), deceased_count=int(row.deceased_count),
+            hectares=float(row.hectares), notes=row.notes, user=user,
+        )
+        for row in rows.itertuples()
+    ], batch_size=BATCH_SIZE)
+
+    # What the save signals would have done for each record
+    TreeRollup.add(trees)
+    DatasetVersion.bump(user)
+    # Only once the chunk commits, or a tile rebuilt from pre-commit rows
+    # could be kept under the new version
+    prune_tiles_on_commit(user.pk)
+    return len(rows), list(errors)
+
+
+def import_trees_job(job):
+    """Job handler: import the CSV in ``job.data`` for ``job.user``"""
+    df = read_trees_csv(bytes(job.data))
+    state = job.result or {'next_row': 0, 'imported': 0, 'errors': 0, 'error_messages': []}
+    total = len(df)
+
+    for start in range(state['next_row'], total, CHUNK_SIZE):
+        with transaction.atomic():
+            imported, errors = import_trees(job.user, df.iloc[start:start + CHUNK_SIZE])
+            state['imported'] += imported
+            state['errors'] += len(errors)
+            state['error_messages'].extend(errors[:max(0, MAX_ERROR_MESSAGES - len(state['error_messages']))])
+            state['next_row'] = min(start + CHUNK_SIZE, total)
+            job.report_progress(
+                state['next_row'] * 100 // total,
+                f"Imported {state['imported']} of {total} rows",
+                result=state,
+            )
+
+    return {
+        'imported': state['imported'],
+        'errors': state['errors'],
+        'error_messages': state['error_messages'],
+        'rows': total,
+    }
@@ -0,0 +1,213 @@
+"""
+Database-backed job queue.
+
+Views hand long-running work to ``enqueue`` and answer straight away with
+the job's status URL; ``manage.py run_worker`` processes claim and run the
+queued jobs outside the web workers, so imports and reports are not cut off
+by the gunicorn timeout.
+
+A worker claims the oldest due job with a conditional update, so two
+workers never run the same job (``SELECT ... FOR UPDATE SKIP LOCKED``
+narrows the candidates where the database supports it).  A job that raises
+is retried up to ``max_attempts`` times with exponential backoff.  While a
+handler runs, ``run_job`` refreshes the job's lock every
+``HEARTBEAT_INTERVAL``; a worker that died mid-job leaves it ``running`` with
+a stale lock, and it is queued again once ``STALE_AFTER`` passes without a
+heartbeat or progress report.
+
+Handlers take the ``Job`` and return its JSON result.  They should be safe
+to run again after a failure, e.g. by committing their work together with
+a checkpoint through ``Job.report_progress``.
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+from .sync import prune_deletion_log
+
+
+# Job kind -> handler
+HANDLERS = {
+    'import_trees': 'app.imports.import_trees_job',
+    'generate_report': 'app.views.generate_report_job',
+    'head_report': 'head.views.generate_report_job',
+    'delete_all_trees': 'app.views.delete_all_trees_job',
+}
+
+# Seconds before the first retry; doubled for each further attempt
+RETRY_DELAY = 30
+
+# A running job without a heartbeat or progress report for this long is
+# presumed lost
+STALE_AFTER = timedelta(hours=1)
+
+# Seconds between lock refreshes of a running job
+HEARTBEAT_INTERVAL = 60
+
+POLL_INTERVAL = 2
+
+# Seconds between prunes of the delta-sync tombstones (``DeletionLog``)
+PRUNE_INTERVAL = 60 * 60
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(kind, user=None, params=None, data=None, max_attempts=3):
+    """Queue a ``kind`` job and return it"""
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(
+        kind=kind, user=user, params=params or {}, data=data, max_attempts=max_attempts,
+    )
+
+
+def job_accepted(job, **extra):
+    """``202 Accepted`` response pointing the client at the job's status"""
+    return JsonResponse(dict(
+        success=True,
+        job=job.as_dict(),
+        status_url=reverse('app:job_status', args=[job.id]),
+        **extra
+    ), status=202)
+
+
+def requeue_stale_jobs():
+    """Queue again the running jobs whose worker stopped reporting"""
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', locked_at__lt=now - STALE_AFTER)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', finished_at=now, message='Worker lost on the last attempt',
+    )
+    return stale.update(status='queued', locked_by='', run_after=now, message='Worker lost, retrying')
+
+
+def claim_job(worker=None):
+    """Mark the oldest due job as running for ``worker`` and return it, or None"""
+    worker = worker or worker_name()
+    while True:
+        with transaction.atomic():
+            candidates = Job.objects.filter(status='queued', run_after__lte=timezone.now())
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            job = candidates.order_by('run_after', 'created_at').first()
+            if job is None:
+                return None
+            now = timezone.now()
+            claimed = Job.objects.filter(pk=job.pk, status='queued').update(
+                status='running', locked_by=worker, locked_at=now,
+                started_at=now, attempts=job.attempts + 1,
+            )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker won the race; try the next job
+
+
+def refresh_lock(job):
+    """Mark ``job`` as still alive, unless another worker took it over"""
+    return Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        locked_at=timezone.now()
+    )
+
+
+@contextmanager
+def heartbeat(job):
+    """Call ``refresh_lock`` from a background thread until the block exits"""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(HEARTBEAT_INTERVAL):
+                try:
+                    refresh_lock(job)
+                except Exception as e:
+                    print(f"Heartbeat of job {job.id} failed: {str(e)}")
+        finally:
+            # The thread has its own database connection
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and record its result, or its error and any retry"""
+    try:
+        handler = import_string(HANDLERS[job.kind])
+        with heartbeat(job):
+            result = handler(job)
+    except Exception:
+        job.error = traceback.format_exc()
+        job.locked_by = ''
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+            job.message = f'Attempt {job.attempts} failed, retrying'
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+            job.message = f'Failed after {job.attempts} attempts'
+        print(f"Job {job.id} ({job.kind}) failed: {job.error}")
+        job.save(update_fields=['status', 'error', 'message', 'run_after', 'locked_by', 'finished_at'])
+        return job
+
+    job.status = 'succeeded'
+    job.result = result
+    job.progress = 100
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    # The input is not needed any more
+    job.data = None
+    job.save(update_fields=['status', 'result', 'progress', 'finished_at', 'locked_by', 'data'])
+    return job
+
+
+def run_next_job(worker=None):
+    """Claim and run one job; False when none is due"""
+    job = claim_job(worker)
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+
+def work(worker=None, should_stop=lambda: False, once=False, poll_interval=POLL_INTERVAL):
+    """
+    Run jobs until ``should_stop()``, or until none is due with ``once``,
+    pruning old delta-sync tombstones every ``PRUNE_INTERVAL``.
+    Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    count = 0
+    next_prune = time.monotonic()
+    while not should_stop():
+        requeue_stale_jobs()
+        if time.monotonic() >= next_prune:
+            prune_deletion_log()
+            next_prune = time.monotonic() + PRUNE_INTERVAL
+        if run_next_job(worker):
+            count += 1
+            continue
+        if once:
+            break
+        time.sleep(poll_interval)
+    return count
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from app.geohash import encode_geohash
+from app.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Fill in the geohash cell key of locations that are missing it or out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute the geohash of every location, not only those without one',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Locations written per UPDATE batch (default 2000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        locations = Location.objects.only('id', 'latitude', 'longitude', 'geohash').order_by()
+        if not options['all']:
+            locations = locations.filter(geohash='')
+
+        # Written with bulk_update, so no save signals or dataset version bumps;
+        # the cell key does not change anything the feeds show
+        batch = []
+        updated_count = 0
+        checked_count = 0
+        for location in locations.iterator(chunk_size=batch_size):
+            checked_count += 1
+            geohash = encode_geohash(location.latitude, location.longitude)
+            if geohash == location.geohash:
+                continue
+            location.geohash = geohash
+            batch.append(location)
+            if len(batch) >= batch_size:
+                Location.objects.bulk_update(batch, ['geohash'])
+                updated_count += len(batch)
+                batch = []
+                self.stdout.write(f'  Updated {updated_count} locations...')
+        if batch:
+            Location.objects.bulk_update(batch, ['geohash'])
+            updated_count += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Checked {checked_count} locations, updated {updated_count} geohashes')
+        )
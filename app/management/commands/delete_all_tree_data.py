@@ -3,10 +3,9 @@ Management command to delete all tree data from the database
 while preserving user accounts and user profiles.
 """
 from django.core.management.base import BaseCommand
-from django.db import transaction
 from app.models import (
     EndemicTree, TreeSeed, TreeSpecies, TreeGenus, 
-    TreeFamily, Location, User, UserProfile
+    TreeFamily, Location, User, UserProfile, bulk_write
 )
 
 
@@ -44,7 +43,7 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.WARNING('Starting deletion of all tree data...\n'))
 
-        with transaction.atomic():
+        with bulk_write():
             # Count records before deletion
             tree_count = EndemicTree.objects.count()
             seed_count = TreeSeed.objects.count()
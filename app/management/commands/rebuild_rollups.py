@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.models import TreeRollup, User
+
+
+class Command(BaseCommand):
+    help = 'Recompute the analytics rollup rows from the tree records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Username whose rollups are rebuilt (default: every user)',
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        row_count = TreeRollup.rebuild(user)
+        scope = f"user '{user.username}'" if user else 'all users'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {row_count} rollup rows for {scope}'))
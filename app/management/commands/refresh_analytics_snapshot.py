@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.snapshot import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the global analytics snapshot shown on the head analytics and report pages'
+
+    def handle(self, *args, **options):
+        snapshot = refresh_snapshot()
+        built_at = timezone.localtime(snapshot.built_at).strftime('%Y-%m-%d %H:%M:%S')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built analytics snapshot at {built_at} "
+                f"({snapshot.data['report']['total_trees']} tree records, dataset version {snapshot.dataset_version})"
+            )
+        )
@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.jobs import POLL_INTERVAL, work, worker_name
+
+
+def _stop_on_signals(stop):
+    """Set ``stop`` on SIGINT/SIGTERM; returns the previous handlers"""
+    return {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+
+def _run(stop, once, poll_interval):
+    """Worker process body; finishes the current job when ``stop`` is set"""
+    if not apps.ready:
+        # Started with the "spawn" method
+        django.setup()
+    _stop_on_signals(stop)
+    return work(worker_name(), should_stop=stop.is_set, once=once, poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (CSV imports, reports, bulk deletes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Worker processes to run in parallel (default: 1)',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due instead of waiting for more',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=POLL_INTERVAL,
+            help=f'Seconds between checks for new jobs (default: {POLL_INTERVAL})',
+        )
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        self.stdout.write(f"Starting {processes} worker process(es)")
+        stop = multiprocessing.Event()
+
+        if processes == 1:
+            previous = _stop_on_signals(stop)
+            try:
+                count = work(worker_name(), should_stop=stop.is_set, once=options['once'],
+                             poll_interval=options['poll_interval'])
+            finally:
+                for signum, handler in previous.items():
+                    signal.signal(signum, handler)
+            self.stdout.write(self.style.SUCCESS(f'Worker stopped after {count} job(s)'))
+            return
+
+        # Children open their own database connections
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(
+                target=_run, args=(stop, options['once'], options['poll_interval']), name=f'worker-{i}',
+            )
+            for i in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        _stop_on_signals(stop)
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_add_geojson_data_to_maplayer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='app_locatio_latitud_9b75f0_idx'),
+        ),
+    ]
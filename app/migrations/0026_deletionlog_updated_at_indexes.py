@@ -0,0 +1,38 @@
+# Generated by Django 4.2.26 on 2026-10-17 10:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app', '0025_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('tree', 'Tree'), ('seed', 'Seed')], max_length=10)),
+                ('record_id', models.CharField(max_length=36)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entity_type', 'deleted_at'], name='app_deletio_entity__84f2b8_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='endemictree',
+            index=models.Index(fields=['updated_at'], name='app_endemic_updated_16363f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treeseed',
+            index=models.Index(fields=['updated_at'], name='app_treesee_updated_f8af38_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.26 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+def set_has_image(apps, schema_editor):
+    TreeSpecies = apps.get_model('app', 'TreeSpecies')
+    TreeSpecies.objects.filter(image__isnull=False).exclude(image=b'').update(has_image=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_deletionlog_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='treespecies',
+            options={'base_manager_name': 'objects', 'verbose_name_plural': 'Tree Species'},
+        ),
+        migrations.AddField(
+            model_name='treespecies',
+            name='has_image',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(set_has_image, migrations.RunPython.noop),
+    ]
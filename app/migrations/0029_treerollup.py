@@ -0,0 +1,61 @@
+# Generated by Django 4.2.26 on 2026-10-17 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+KEY_FIELDS = ('user_id', 'year', 'species_id', 'location_id', 'health_status')
+SUM_FIELDS = ('population', 'healthy_count', 'good_count', 'bad_count', 'deceased_count', 'hectares')
+
+
+def fill_rollups(apps, schema_editor):
+    EndemicTree = apps.get_model('app', 'EndemicTree')
+    TreeRollup = apps.get_model('app', 'TreeRollup')
+    rows = EndemicTree.objects.order_by().values(*KEY_FIELDS).annotate(
+        record_count=Count('id'),
+        **{f'total_{field}': Sum(field) for field in SUM_FIELDS}
+    )
+    TreeRollup.objects.bulk_create([
+        TreeRollup(
+            record_count=row['record_count'],
+            **{field: row[field] for field in KEY_FIELDS},
+            **{field: row[f'total_{field}'] or 0 for field in SUM_FIELDS},
+        )
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app', '0028_location_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('health_status', models.CharField(max_length=20)),
+                ('record_count', models.IntegerField(default=0)),
+                ('population', models.BigIntegerField(default=0)),
+                ('healthy_count', models.BigIntegerField(default=0)),
+                ('good_count', models.BigIntegerField(default=0)),
+                ('bad_count', models.BigIntegerField(default=0)),
+                ('deceased_count', models.BigIntegerField(default=0)),
+                ('hectares', models.FloatField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='app.location')),
+                ('species', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='app.treespecies')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'year', 'species', 'location', 'health_status')},
+                'indexes': [models.Index(fields=['user', 'year'], name='app_treerol_user_id_4d55e6_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+KEY_FIELDS = ('user_id', 'year', 'species_id', 'health_status')
+SUM_FIELDS = ('population', 'healthy_count', 'good_count', 'bad_count', 'deceased_count', 'hectares')
+
+
+def clear_rollups(apps, schema_editor):
+    apps.get_model('app', 'TreeRollup').objects.all().delete()
+
+
+def fill_rollups(apps, schema_editor):
+    EndemicTree = apps.get_model('app', 'EndemicTree')
+    TreeRollup = apps.get_model('app', 'TreeRollup')
+    rows = EndemicTree.objects.order_by().values(*KEY_FIELDS).annotate(
+        record_count=Count('id'),
+        **{f'total_{field}': Sum(field) for field in SUM_FIELDS}
+    )
+    TreeRollup.objects.bulk_create([
+        TreeRollup(
+            record_count=row['record_count'],
+            **{field: row[field] for field in KEY_FIELDS},
+            **{field: row[f'total_{field}'] or 0 for field in SUM_FIELDS},
+        )
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0031_job'),
+    ]
+
+    operations = [
+        # Rows keyed per location cannot be merged in place; refill them below
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='treerollup',
+            unique_together={('user', 'year', 'species', 'health_status')},
+        ),
+        migrations.RemoveField(
+            model_name='treerollup',
+            name='location',
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
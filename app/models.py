@@ -1,10 +1,17 @@
-from django.db import models
+from contextlib import contextmanager
+import threading
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q, Sum, Count
 from django.utils import timezone
 import uuid
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
+from .geohash import GEOHASH_PRECISION, encode_geohash
+from .tiles import prune_tiles_on_commit
+
 
 class TreeFamily(models.Model):
     """Tree family classification"""
@@ -35,6 +42,13 @@ class TreeGenus(models.Model):
         unique_together = ['name', 'user']
 
 
+class TreeSpeciesManager(models.Manager):
+    """Leaves the image blob out of species queries; it loads on first access"""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('image')
+
+
 class TreeSpecies(models.Model):
     """Tree species classification"""
     scientific_name = models.CharField(max_length=100)
@@ -52,14 +66,30 @@ class TreeSpecies(models.Model):
         null=True,
         help_text="Format of the uploaded image"
     )
+    # Kept in sync with ``image`` on save so feeds can tell whether an image
+    # exists without reading the blob
+    has_image = models.BooleanField(default=False, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
+    objects = TreeSpeciesManager()
+
     def __str__(self):
         return f"{self.common_name} ({self.scientific_name})"
 
+    def save(self, *args, **kwargs):
+        # A deferred image was not touched, so the flag is still accurate
+        if 'image' not in self.get_deferred_fields():
+            self.has_image = bool(self.image)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'image' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'has_image'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name_plural = "Tree Species"
         unique_together = ['scientific_name', 'user']
+        # Related lookups (tree.species) skip the image blob as well
+        base_manager_name = 'objects'
 
 
 class Location(models.Model):
@@ -69,11 +99,28 @@ class Location(models.Model):
     longitude = models.FloatField()
     elevation = models.FloatField(null=True, blank=True)
     description = models.TextField(blank=True, null=True)
+    # Geohash of the coordinates, kept in sync on save; prefixes of it are
+    # the containing cells at coarser resolutions
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, blank=True, default='', db_index=True, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.latitude}, {self.longitude})"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Range lookups for viewport (bbox) queries on the GIS feeds
+            models.Index(fields=['latitude', 'longitude']),
+        ]
+
 
 class PinStyle(models.Model):
     """Custom pin styles for map markers"""
@@ -125,10 +172,17 @@ class EndemicTree(models.Model):
     def __str__(self):
         return f"{self.species.common_name} at {self.location.name} ({self.year})"
 
+    def save(self, *args, **kwargs):
+        # The rollup rows are adjusted by the save signals; commit them together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['species__common_name', '-year']
         indexes = [
             models.Index(fields=['year']),
+            # Delta sync (?since=) on the tree feeds
+            models.Index(fields=['updated_at']),
         ]
         unique_together = ['species', 'location', 'year']
 
@@ -163,6 +217,8 @@ class TreeSeed(models.Model):
         ordering = ['-planting_date']
         indexes = [
             models.Index(fields=['planting_date']),
+            # Delta sync (?since=) on the seed feeds
+            models.Index(fields=['updated_at']),
         ]
 
 
@@ -243,3 +299,477 @@ class UserSetting(models.Model):
 
     class Meta:
         unique_together = ['key', 'user']
+
+
+class DatasetVersion(models.Model):
+    """
+    Change counter for the map/analytics data of one user ("user-<id>") or of
+    all users ("all", used by the head app).  Bumped on every write so feeds
+    can answer conditional requests without recomputing their payload.
+    """
+    GLOBAL_SCOPE = 'all'
+    # Pin styles are shared by every feed, so they get a counter of their own
+    STYLE_SCOPE = 'pin-styles'
+
+    scope = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+    @classmethod
+    def scope_for(cls, user=None):
+        """Scope name for a user (instance or id), or the global scope for None"""
+        if user is None:
+            return cls.GLOBAL_SCOPE
+        user_id = user.pk if hasattr(user, 'pk') else user
+        return f'user-{user_id}'
+
+    @classmethod
+    def current(cls, *scopes):
+        """Return the current version numbers of ``scopes`` as a tuple"""
+        versions = dict(cls.objects.filter(scope__in=scopes).values_list('scope', 'version'))
+        return tuple(versions.get(scope, 0) for scope in scopes)
+
+    @classmethod
+    def increment(cls, scope):
+        """Increment one scope, creating its counter on first use"""
+        if not cls.objects.filter(scope=scope).update(version=F('version') + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(scope=scope, defaults={'version': 1})
+
+    @classmethod
+    def bump(cls, user=None):
+        """Increment the owner's version and the global version"""
+        if user is not None:
+            cls.increment(cls.scope_for(user))
+        cls.increment(cls.GLOBAL_SCOPE)
+
+    @classmethod
+    def bump_all(cls):
+        """Increment every user's version and the global version"""
+        cls.objects.exclude(scope__in=(cls.GLOBAL_SCOPE, cls.STYLE_SCOPE)).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        cls.increment(cls.GLOBAL_SCOPE)
+
+
+_bulk_writes = threading.local()
+
+
+def in_bulk_write():
+    """Whether the current thread is inside ``bulk_write``"""
+    return getattr(_bulk_writes, 'depth', 0) > 0
+
+
+def _defer_rollups_to_bulk_write():
+    """Inside ``bulk_write``, note that trees changed and return True"""
+    if not in_bulk_write():
+        return False
+    _bulk_writes.trees_changed = True
+    return True
+
+
+@contextmanager
+def bulk_write(user=None):
+    """
+    Run a bulk write of ``user``'s records (every user's for None) in one
+    transaction.  The save/delete signals skip their per-record dataset
+    version bump and rollup adjustment, which would otherwise update the same
+    hot rows once per record; when the block ends the versions are bumped
+    once and, if trees changed, the rollups are rebuilt once instead.
+    """
+    with transaction.atomic():
+        depth = getattr(_bulk_writes, 'depth', 0)
+        if not depth:
+            _bulk_writes.trees_changed = False
+        _bulk_writes.depth = depth + 1
+        try:
+            yield
+        finally:
+            _bulk_writes.depth -= 1
+        if user is None:
+            DatasetVersion.bump_all()
+        else:
+            DatasetVersion.bump(user)
+        if _bulk_writes.trees_changed:
+            TreeRollup.rebuild(user)
+
+
+class DeletionLog(models.Model):
+    """
+    Tombstone for a deleted tree or seed record, so delta-sync clients
+    (``?since=`` on the feeds) can drop it from their local copy.
+    """
+    ENTITY_TYPES = [
+        ('tree', 'Tree'),
+        ('seed', 'Seed'),
+    ]
+
+    entity_type = models.CharField(max_length=10, choices=ENTITY_TYPES)
+    record_id = models.CharField(max_length=36)
+    # No database constraint: tombstones are written while the owner itself
+    # may be in the middle of being deleted
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.entity_type} {self.record_id} deleted {self.deleted_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['entity_type', 'deleted_at']),
+        ]
+
+
+class TreeRollup(models.Model):
+    """
+    Running totals of the tree records sharing one (user, year, species,
+    health status) key, kept up to date by the tree save/delete signals.
+    Analytics read these narrow rows instead of grouping the tree table and
+    joining it to the taxonomy on every page load.  Trees are unique per
+    (species, location, year), so the key leaves the location out for the
+    rows to aggregate; figures per location group the tree table instead.
+
+    Paths that skip signals (``bulk_create``, ``QuerySet.update``) must call
+    ``add`` or ``rebuild`` for the affected user afterwards.
+    """
+    KEY_FIELDS = ('user_id', 'year', 'species_id', 'health_status')
+    SUM_FIELDS = ('population', 'healthy_count', 'good_count', 'bad_count', 'deceased_count', 'hectares')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    year = models.IntegerField()
+    species = models.ForeignKey(TreeSpecies, on_delete=models.CASCADE, related_name='rollups')
+    health_status = models.CharField(max_length=20)
+    record_count = models.IntegerField(default=0)
+    population = models.BigIntegerField(default=0)
+    healthy_count = models.BigIntegerField(default=0)
+    good_count = models.BigIntegerField(default=0)
+    bad_count = models.BigIntegerField(default=0)
+    deceased_count = models.BigIntegerField(default=0)
+    hectares = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.year} {self.health_status}: {self.record_count} records, population {self.population}"
+
+    class Meta:
+        unique_together = ['user', 'year', 'species', 'health_status']
+        indexes = [
+            models.Index(fields=['user', 'year']),
+        ]
+
+    @classmethod
+    def tree_values(cls, tree):
+        """Key and summed values one tree contributes"""
+        values = {field: getattr(tree, field) for field in cls.KEY_FIELDS}
+        values.update({field: getattr(tree, field) or 0 for field in cls.SUM_FIELDS})
+        return values
+
+    @classmethod
+    def _change(cls, values, sign, record_delta):
+        key = {field: values[field] for field in cls.KEY_FIELDS}
+        changes = {field: F(field) + sign * values[field] for field in cls.SUM_FIELDS}
+        if record_delta:
+            changes['record_count'] = F('record_count') + record_delta
+        if cls.objects.filter(**key).update(**changes):
+            if record_delta < 0:
+                cls.objects.filter(record_count__lte=0, **key).delete()
+        elif record_delta > 0:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        record_count=record_delta, **key, **{field: values[field] for field in cls.SUM_FIELDS}
+                    )
+            except IntegrityError:
+                # A concurrent writer created the row first
+                cls.objects.filter(**key).update(**changes)
+
+    @classmethod
+    def adjust(cls, previous=None, current=None):
+        """Move one tree's contribution from its ``previous`` to its ``current`` values"""
+        if previous and current and all(previous[field] == current[field] for field in cls.KEY_FIELDS):
+            difference = dict(current)
+            difference.update({field: current[field] - previous[field] for field in cls.SUM_FIELDS})
+            if any(difference[field] for field in cls.SUM_FIELDS):
+                cls._change(difference, 1, 0)
+            return
+        if previous:
+            cls._change(previous, -1, -1)
+        if current:
+            cls._change(current, 1, 1)
+
+    @classmethod
+    def add(cls, trees):
+        """
+        Add newly inserted ``trees`` to the rollups, e.g. after a
+        ``bulk_create``: their totals are summed per key, the existing rows
+        of those keys are updated in one batch and the missing ones created.
+        """
+        totals = {}
+        for tree in trees:
+            values = cls.tree_values(tree)
+            key = tuple(values[field] for field in cls.KEY_FIELDS)
+            row = totals.setdefault(key, dict.fromkeys(cls.SUM_FIELDS, 0))
+            row['record_count'] = row.get('record_count', 0) + 1
+            for field in cls.SUM_FIELDS:
+                row[field] += values[field]
+        if not totals:
+            return
+
+        users = {key[0] for key in totals}
+        owners = Q(user_id__in=users - {None})
+        if None in users:
+            owners |= Q(user__isnull=True)
+        existing = cls.objects.select_for_update().filter(
+            owners,
+            year__in={key[1] for key in totals},
+            species_id__in={key[2] for key in totals},
+        )
+        updated = []
+        for rollup in existing:
+            row = totals.pop(tuple(getattr(rollup, field) for field in cls.KEY_FIELDS), None)
+            if row is None:
+                continue
+            for field, value in row.items():
+                setattr(rollup, field, getattr(rollup, field) + value)
+            updated.append(rollup)
+        cls.objects.bulk_update(updated, ['record_count', *cls.SUM_FIELDS], batch_size=1000)
+        cls.objects.bulk_create([
+            cls(**dict(zip(cls.KEY_FIELDS, key)), **row) for key, row in totals.items()
+        ], batch_size=1000)
+
+    @classmethod
+    def rebuild(cls, user=None):
+        """
+        Recompute the rollup rows of one user (instance or id) from the tree
+        table, or of every user when ``user`` is None
+        """
+        trees = EndemicTree.objects.order_by()
+        rollups = cls.objects.all()
+        if user is not None:
+            user_id = user.pk if hasattr(user, 'pk') else user
+            trees = trees.filter(user_id=user_id)
+            rollups = rollups.filter(user_id=user_id)
+        rows = trees.values(*cls.KEY_FIELDS).annotate(
+            record_count=Count('id'),
+            **{f'total_{field}': Sum(field) for field in cls.SUM_FIELDS}
+        )
+        with transaction.atomic():
+            rollups.delete()
+            cls.objects.bulk_create([
+                cls(
+                    record_count=row['record_count'],
+                    **{field: row[field] for field in cls.KEY_FIELDS},
+                    **{field: row[f'total_{field}'] or 0 for field in cls.SUM_FIELDS},
+                )
+                for row in rows.iterator()
+            ], batch_size=1000)
+        return cls.objects.filter(user_id=user_id).count() if user is not None else cls.objects.count()
+
+
+class AnalyticsSnapshot(models.Model):
+    """
+    Pre-aggregated analytics over every user's data, read by the head app's
+    analytics and report pages instead of aggregating on each request.
+    ``dataset_version`` is the global dataset version the snapshot was built
+    from, so it is stale once that version moves on (see ``app.snapshot``).
+    """
+    scope = models.CharField(max_length=50, unique=True)
+    data = models.JSONField(default=dict)
+    dataset_version = models.PositiveBigIntegerField(default=0)
+    built_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.scope} snapshot v{self.dataset_version} ({self.built_at})"
+
+
+class Job(models.Model):
+    """
+    Long-running work (CSV imports, reports, bulk deletes) queued by a view
+    and run by ``manage.py run_worker`` outside the web workers.  ``kind``
+    names the handler (see ``app.jobs.HANDLERS``), ``params`` and ``data``
+    are its input and ``result`` its output, polled through the job status
+    API.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    FINISHED_STATUSES = ('succeeded', 'failed')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    params = models.JSONField(default=dict, blank=True)
+    data = models.BinaryField(null=True, blank=True, help_text="Input file of the job, e.g. an uploaded CSV")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent done")
+    message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers claim the oldest due job
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    def report_progress(self, progress, message='', result=None):
+        """
+        Record progress (percent) from a running handler.  It is written
+        straight away, so inside a handler's transaction it commits with the
+        work it describes.
+        """
+        self.progress = max(0, min(100, int(progress)))
+        self.message = message[:255]
+        self.locked_at = timezone.now()
+        fields = {'progress': self.progress, 'message': self.message, 'locked_at': self.locked_at}
+        if result is not None:
+            self.result = fields['result'] = result
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    def as_dict(self):
+        # The traceback stays server-side; clients get its last line
+        error = self.error.strip().splitlines()[-1] if self.error.strip() else ''
+        return {
+            'id': str(self.id),
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result if self.status == 'succeeded' else None,
+            'error': error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# Signals to bump the dataset version whenever map/analytics data changes
+@receiver(post_save, sender=EndemicTree)
+@receiver(post_delete, sender=EndemicTree)
+@receiver(post_save, sender=TreeSeed)
+@receiver(post_delete, sender=TreeSeed)
+@receiver(post_save, sender=TreeFamily)
+@receiver(post_delete, sender=TreeFamily)
+@receiver(post_save, sender=TreeGenus)
+@receiver(post_delete, sender=TreeGenus)
+@receiver(post_save, sender=TreeSpecies)
+@receiver(post_delete, sender=TreeSpecies)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=MapLayer)
+@receiver(post_delete, sender=MapLayer)
+def bump_dataset_version(sender, instance, **kwargs):
+    """Mark the record owner's data and the global data as changed"""
+    if not in_bulk_write():
+        DatasetVersion.bump(instance.user_id)
+
+
+@receiver(post_save, sender=PinStyle)
+@receiver(post_delete, sender=PinStyle)
+def bump_pin_style_version(sender, instance, **kwargs):
+    """The default pin style is embedded in the tree feeds of every user"""
+    DatasetVersion.increment(DatasetVersion.STYLE_SCOPE)
+
+
+# Signals keeping the analytics rollups in step with the tree records
+@receiver(pre_save, sender=EndemicTree)
+def remember_rollup_values(sender, instance, raw=False, **kwargs):
+    """Load the stored values of an existing tree before they are overwritten"""
+    instance._rollup_previous = None
+    if raw or instance._state.adding or in_bulk_write():
+        return
+    instance._rollup_previous = (
+        EndemicTree.objects.filter(pk=instance.pk)
+        .values(*TreeRollup.KEY_FIELDS, *TreeRollup.SUM_FIELDS)
+        .first()
+    )
+    if instance._rollup_previous:
+        for field in TreeRollup.SUM_FIELDS:
+            instance._rollup_previous[field] = instance._rollup_previous[field] or 0
+
+
+@receiver(post_save, sender=EndemicTree)
+def update_tree_rollup_on_save(sender, instance, raw=False, **kwargs):
+    """Move the tree's contribution from its old rollup values to the new ones"""
+    if raw or _defer_rollups_to_bulk_write():
+        return
+    TreeRollup.adjust(getattr(instance, '_rollup_previous', None), TreeRollup.tree_values(instance))
+    instance._rollup_previous = None
+
+
+@receiver(post_delete, sender=EndemicTree)
+def update_tree_rollup_on_delete(sender, instance, **kwargs):
+    """Remove the deleted tree's contribution"""
+    if not _defer_rollups_to_bulk_write():
+        TreeRollup.adjust(TreeRollup.tree_values(instance), None)
+
+
+# Signals to drop cached vector tiles of superseded dataset versions
+@receiver(post_save, sender=EndemicTree)
+@receiver(post_delete, sender=EndemicTree)
+@receiver(post_save, sender=TreeSeed)
+@receiver(post_delete, sender=TreeSeed)
+@receiver(post_save, sender=Location)
+def prune_stale_tiles(sender, instance, **kwargs):
+    """
+    Tiles are cached per dataset version, so the write has already moved
+    readers to new ones; remove the owner's and the head app's old tiles once
+    the bumped version is committed
+    """
+    prune_tiles_on_commit(instance.user_id)
+
+
+# Signals supporting delta sync (?since=) on the tree and seed feeds
+@receiver(post_delete, sender=EndemicTree)
+@receiver(post_delete, sender=TreeSeed)
+def log_deletion(sender, instance, **kwargs):
+    """Record a tombstone for every deleted tree or seed"""
+    DeletionLog.objects.create(
+        entity_type='tree' if sender is EndemicTree else 'seed',
+        record_id=str(instance.pk),
+        user_id=instance.user_id,
+    )
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=TreeSpecies)
+@receiver(post_save, sender=TreeGenus)
+@receiver(post_save, sender=TreeFamily)
+def touch_dependent_records(sender, instance, created, **kwargs):
+    """
+    Trees and seeds show their location and taxonomy, so editing those marks
+    the dependent records as updated for delta-sync clients
+    """
+    if created:
+        return
+    lookup = {
+        Location: 'location',
+        TreeSpecies: 'species',
+        TreeGenus: 'species__genus',
+        TreeFamily: 'species__genus__family',
+    }[sender]
+    now = timezone.now()
+    EndemicTree.objects.filter(**{lookup: instance}).update(updated_at=now)
+    TreeSeed.objects.filter(**{lookup: instance}).update(updated_at=now)
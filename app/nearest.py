@@ -0,0 +1,328 @@
+"""
+Nearest-neighbour lookups over tree and seed locations.
+
+Coordinates are mapped to unit vectors on the sphere, where straight-line
+(chord) distance orders points exactly like great-circle distance, and put in
+a KD-tree held in process memory.  One tree is kept per record kind and data
+scope (one user, or all users for the head app) and is rebuilt on the next
+lookup after the scope's dataset version changes.
+"""
+import heapq
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.http import JsonResponse
+
+from .models import DatasetVersion, EndemicTree, TreeSeed
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# Points per KD-tree leaf; leaves are scanned with one vectorized distance pass
+LEAF_SIZE = 32
+
+DEFAULT_K = 10
+MAX_K = 100
+
+# Largest radius accepted, and most records returned for a radius query
+MAX_RADIUS_M = 50000
+MAX_RADIUS_RESULTS = 500
+
+# Indexes kept in memory, least recently used dropped first
+MAX_INDEXES = 64
+
+KINDS = ('trees', 'seeds')
+
+TREE_FIELDS = (
+    'id', 'species_id', 'species__common_name', 'species__scientific_name',
+    'location__name', 'location__latitude', 'location__longitude',
+    'population', 'health_status', 'year',
+)
+SEED_FIELDS = (
+    'id', 'species_id', 'species__common_name', 'species__scientific_name',
+    'location__name', 'location__latitude', 'location__longitude',
+    'quantity', 'germination_status', 'planting_date',
+)
+
+
+def unit_vectors(lat, lng):
+    """``(n, 3)`` unit vectors for arrays of latitudes/longitudes in degrees."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
+
+
+def chord_to_metres(chord):
+    """Great-circle distance for a chord length on the unit sphere."""
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def metres_to_chord(metres):
+    """Chord length on the unit sphere for a great-circle distance."""
+    return 2 * math.sin(min(metres / EARTH_RADIUS_M, math.pi) / 2)
+
+
+class KDTree:
+    """
+    A static KD-tree over ``(n, 3)`` points.
+
+    Nodes are stored in flat lists; each keeps the bounding box of its points
+    so whole subtrees can be skipped, and leaves hold a contiguous slice of
+    the reordered points.
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.order = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        self.lower, self.upper = [], []
+        self.start, self.end = [], []
+        self.children = []
+        if len(self.points):
+            self._build(0, len(self.points))
+        self.points = self.points[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def _build(self, start, end):
+        node = len(self.start)
+        block = self.points[self.order[start:end]]
+        self.lower.append(block.min(axis=0))
+        self.upper.append(block.max(axis=0))
+        self.start.append(start)
+        self.end.append(end)
+        self.children.append(None)
+        if end - start > self.leaf_size:
+            axis = int(np.argmax(self.upper[node] - self.lower[node]))
+            middle = (end - start) // 2
+            split = np.argpartition(block[:, axis], middle)
+            self.order[start:end] = self.order[start:end][split]
+            left = self._build(start, start + middle)
+            right = self._build(start + middle, end)
+            self.children[node] = (left, right)
+        return node
+
+    def _box_distance(self, node, point):
+        gap = np.maximum(0.0, np.maximum(self.lower[node] - point, point - self.upper[node]))
+        return float(np.sqrt(np.dot(gap, gap)))
+
+    def query(self, point, k):
+        """The ``k`` nearest points as ``(distances, indexes)``, nearest first."""
+        if not len(self):
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        k = min(k, len(self))
+        best = []  # max-heap of (-distance, index)
+        queue = [(0.0, 0)]
+        while queue:
+            box_distance, node = heapq.heappop(queue)
+            if len(best) == k and box_distance > -best[0][0]:
+                break
+            children = self.children[node]
+            if children is None:
+                start, end = self.start[node], self.end[node]
+                distances = np.sqrt(((self.points[start:end] - point) ** 2).sum(axis=1))
+                for offset in np.argsort(distances)[:k]:
+                    item = (-float(distances[offset]), start + int(offset))
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item[0] > best[0][0]:
+                        heapq.heapreplace(best, item)
+                    else:
+                        break
+            else:
+                for child in children:
+                    heapq.heappush(queue, (self._box_distance(child, point), child))
+        best.sort(reverse=True)
+        distances = np.array([-distance for distance, _ in best])
+        return distances, self.order[[index for _, index in best]]
+
+    def query_radius(self, point, radius):
+        """All points within ``radius`` as ``(distances, indexes)``, nearest first."""
+        found_distances, found_indexes = [], []
+        stack = [0] if len(self) else []
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > radius:
+                continue
+            children = self.children[node]
+            if children is None:
+                start, end = self.start[node], self.end[node]
+                distances = np.sqrt(((self.points[start:end] - point) ** 2).sum(axis=1))
+                inside = np.nonzero(distances <= radius)[0]
+                found_distances.append(distances[inside])
+                found_indexes.append(start + inside)
+            else:
+                stack.extend(children)
+        if not found_distances:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        distances = np.concatenate(found_distances)
+        indexes = np.concatenate(found_indexes)
+        ranked = np.argsort(distances, kind='stable')
+        return distances[ranked], self.order[indexes[ranked]]
+
+
+class LocationIndex:
+    """A KD-tree over the locations of one kind of record, plus their IDs."""
+
+    def __init__(self, record_ids, lat, lng):
+        self.record_ids = list(record_ids)
+        self.tree = KDTree(unit_vectors(lat, lng))
+
+    @classmethod
+    def build(cls, queryset):
+        rows = list(queryset.order_by().values_list('id', 'location__latitude', 'location__longitude'))
+        if not rows:
+            return cls([], [], [])
+        record_ids, lat, lng = zip(*rows)
+        return cls(record_ids, lat, lng)
+
+    def nearest(self, lat, lng, k=DEFAULT_K, radius_m=None):
+        """``[(record_id, distance_m), ...]`` nearest first."""
+        point = unit_vectors([lat], [lng])[0]
+        if radius_m is None:
+            chords, indexes = self.tree.query(point, k)
+        else:
+            chords, indexes = self.tree.query_radius(point, metres_to_chord(radius_m))
+            chords, indexes = chords[:MAX_RADIUS_RESULTS], indexes[:MAX_RADIUS_RESULTS]
+        metres = chord_to_metres(chords)
+        return [(self.record_ids[index], float(distance)) for index, distance in zip(indexes, metres)]
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _queryset(kind, user):
+    model = EndemicTree if kind == 'trees' else TreeSeed
+    queryset = model.objects.all()
+    return queryset if user is None else queryset.filter(user=user)
+
+
+def location_index(kind, user=None):
+    """
+    The index of ``kind`` records for one user, or for all users when
+    ``user`` is None, rebuilt when the scope's dataset version has changed.
+    """
+    scope = DatasetVersion.scope_for(user)
+    version = DatasetVersion.current(scope)[0]
+    key = (kind, scope)
+    with _lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == version:
+            _indexes.move_to_end(key)
+            return cached[1]
+
+    index = LocationIndex.build(_queryset(kind, user))
+    with _lock:
+        _indexes[key] = (version, index)
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _tree_record(row, distance):
+    (record_id, species_id, common_name, scientific_name, location_name,
+     lat, lng, population, health_status, year) = row
+    return {
+        'id': str(record_id),
+        'species_id': species_id,
+        'common_name': common_name,
+        'scientific_name': scientific_name,
+        'location': location_name,
+        'latitude': lat,
+        'longitude': lng,
+        'population': population,
+        'health_status': health_status,
+        'year': year,
+        'distance_m': round(distance, 1),
+    }
+
+
+def _seed_record(row, distance):
+    (record_id, species_id, common_name, scientific_name, location_name,
+     lat, lng, quantity, germination_status, planting_date) = row
+    return {
+        'id': str(record_id),
+        'species_id': species_id,
+        'common_name': common_name,
+        'scientific_name': scientific_name,
+        'location': location_name,
+        'latitude': lat,
+        'longitude': lng,
+        'quantity': quantity,
+        'germination_status': germination_status,
+        'planting_date': planting_date.isoformat() if planting_date else None,
+        'distance_m': round(distance, 1),
+    }
+
+
+def nearby_records(kind, lat, lng, user=None, k=DEFAULT_K, radius_m=None):
+    """Nearest ``kind`` records to a coordinate with their great-circle distances."""
+    matches = location_index(kind, user).nearest(lat, lng, k=k, radius_m=radius_m)
+    if not matches:
+        return []
+    fields, record = (TREE_FIELDS, _tree_record) if kind == 'trees' else (SEED_FIELDS, _seed_record)
+    rows = {
+        row[0]: row
+        for row in _queryset(kind, user).filter(id__in=[record_id for record_id, _ in matches]).values_list(*fields)
+    }
+    # A record deleted since the index was built is simply left out
+    return [record(rows[record_id], distance) for record_id, distance in matches if record_id in rows]
+
+
+def _parse_float(request, name, low, high):
+    try:
+        value = float(request.GET[name])
+    except KeyError:
+        raise ValueError(f'{name} is required')
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+    if not low <= value <= high:
+        raise ValueError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def nearby_response(request, user=None):
+    """
+    Answer a nearby-records request for one user's data, or all data when
+    ``user`` is None.
+
+    Query parameters: ``lat`` and ``lng`` (required), ``k`` nearest records
+    (default 10) or ``radius`` in metres for every record within it, and
+    ``kind`` (``trees``, ``seeds``; both when omitted).
+    """
+    try:
+        lat = _parse_float(request, 'lat', -90, 90)
+        lng = _parse_float(request, 'lng', -180, 180)
+        radius_m = None
+        if request.GET.get('radius'):
+            radius_m = _parse_float(request, 'radius', 0, MAX_RADIUS_M)
+        try:
+            k = int(request.GET.get('k', DEFAULT_K))
+        except ValueError:
+            raise ValueError('k must be a number')
+        if not 1 <= k <= MAX_K:
+            raise ValueError(f'k must be between 1 and {MAX_K}')
+        kind = request.GET.get('kind')
+        if kind and kind not in KINDS:
+            raise ValueError('kind must be trees or seeds')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        response = {'latitude': lat, 'longitude': lng}
+        if radius_m is None:
+            response['k'] = k
+        else:
+            response['radius_m'] = radius_m
+        for name in ([kind] if kind else KINDS):
+            response[name] = nearby_records(name, lat, lng, user=user, k=k, radius_m=radius_m)
+        return JsonResponse(response)
+    except Exception as e:
+        print(f"Error in nearby API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,155 @@
+"""
+Global analytics snapshot for the head app.
+
+The head analytics and report pages summarize every user's trees.  Instead of
+aggregating on each load, they read one ``AnalyticsSnapshot`` row built from
+the tree rollups (and the tree table for the figures per location, which the
+rollups do not keep).  A snapshot whose global dataset version is behind is
+rebuilt by the next reader once it is ``REFRESH_INTERVAL`` seconds old, so a
+burst of writes costs at most one rebuild per interval and readers meanwhile
+get the previous snapshot.  ``manage.py refresh_analytics_snapshot`` rebuilds
+it on demand (e.g. from cron before reporting).
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .growth import growth_rate_by_year
+from .models import AnalyticsSnapshot, DatasetVersion, EndemicTree, Location, TreeRollup, TreeSpecies
+
+
+SCOPE = DatasetVersion.GLOBAL_SCOPE
+
+# Seconds a stale snapshot is served before a reader rebuilds it
+REFRESH_INTERVAL = 60
+
+# One rebuild at a time; others keep serving the current snapshot
+REFRESH_LOCK_KEY = 'analytics-snapshot:refreshing'
+REFRESH_LOCK_TIMEOUT = 300
+
+
+def report_statistics(rows, trees):
+    """
+    Report summary figures for a queryset of ``TreeRollup`` rows, or of tree
+    records when filtering by location; ``trees`` are the matching tree
+    records, for the location count
+    """
+    records = Sum('record_count') if rows.model is TreeRollup else Count('id')
+    totals = rows.aggregate(
+        records=records,
+        population=Sum('population'),
+        species=Count('species', distinct=True),
+        users=Count('user', distinct=True),
+    )
+    return {
+        'total_trees': totals['records'] or 0,
+        'total_population': totals['population'] or 0,
+        'unique_species': totals['species'],
+        'unique_locations': trees.order_by().values('location_id').distinct().count(),
+        'unique_users': totals['users'],
+        'health_distribution': list(rows.values('health_status').annotate(
+            count=records,
+            population=Sum('population')
+        ).order_by('health_status')),
+        'species_dist': list(rows.values('species__common_name', 'species__scientific_name').annotate(
+            count=records,
+            total_population=Sum('population')
+        ).order_by('-total_population')[:10]),
+        'year_dist': list(rows.values('year').annotate(
+            count=records,
+            population=Sum('population')
+        ).order_by('year')),
+        'user_contrib': list(rows.exclude(user__isnull=True).values('user__username').annotate(
+            count=records,
+            population=Sum('population')
+        ).order_by('-population')[:10]),
+    }
+
+
+def analytics_charts(rollups, trees):
+    """
+    Chart series of the analytics page for a queryset of ``TreeRollup`` rows
+    and the matching tree records (for the series per location)
+    """
+    population_by_year = list(rollups.values('year').annotate(
+        total=Sum('population')
+    ).order_by('year'))
+
+    return {
+        'population_data': population_by_year,
+        'health_status_data': list(rollups.values('health_status').annotate(
+            count=Sum('population')
+        ).order_by('health_status')),
+        'family_data': list(rollups.values(name=F('species__genus__family__name')).annotate(
+            total_population=Sum('population'),
+            species_count=Count('species', distinct=True)
+        ).order_by('-total_population')[:10]),
+        'genus_data': list(rollups.values(
+            name=F('species__genus__name'), family__name=F('species__genus__family__name')
+        ).annotate(
+            total_population=Sum('population'),
+            species_count=Count('species', distinct=True)
+        ).order_by('-total_population')[:10]),
+        'species_data': list(trees.values(
+            common_name=F('species__common_name'), scientific_name=F('species__scientific_name')
+        ).annotate(
+            total_population=Sum('population'),
+            locations_count=Count('location', distinct=True)
+        ).order_by('-total_population')[:10]),
+        'growth_rate_by_year': growth_rate_by_year(population_by_year),
+        'location_data': list(trees.values(
+            'location_id', name=F('location__name'),
+            latitude=F('location__latitude'), longitude=F('location__longitude')
+        ).annotate(
+            total_trees=Sum('population'),
+            species_count=Count('species', distinct=True)
+        ).order_by('-total_trees')),
+        'health_by_year': list(rollups.values('year', 'health_status').annotate(
+            population=Sum('population')
+        ).order_by('year', 'health_status')),
+    }
+
+
+def build_snapshot_data():
+    """Everything the head analytics and report pages show, as JSON-ready data"""
+    rollups = TreeRollup.objects.all()
+    trees = EndemicTree.objects.all()
+    return {
+        'analytics': analytics_charts(rollups, trees),
+        'report': report_statistics(rollups, trees),
+        'total_species': TreeSpecies.objects.count(),
+        'total_locations': Location.objects.count(),
+    }
+
+
+def refresh_snapshot():
+    """Rebuild the snapshot and return it"""
+    # Read the version first: writes landing during the build leave it stale
+    version = DatasetVersion.current(SCOPE)[0]
+    data = build_snapshot_data()
+    snapshot, _ = AnalyticsSnapshot.objects.update_or_create(
+        scope=SCOPE,
+        defaults={'data': data, 'dataset_version': version, 'built_at': timezone.now()},
+    )
+    return snapshot
+
+
+def is_stale(snapshot):
+    return snapshot.dataset_version != DatasetVersion.current(SCOPE)[0]
+
+
+def current_snapshot():
+    """
+    The snapshot to show, built on first use and rebuilt when it is stale and
+    older than ``REFRESH_INTERVAL``
+    """
+    snapshot = AnalyticsSnapshot.objects.filter(scope=SCOPE).first()
+    if snapshot is None:
+        return refresh_snapshot()
+    age = (timezone.now() - snapshot.built_at).total_seconds()
+    if age >= REFRESH_INTERVAL and is_stale(snapshot) and cache.add(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TIMEOUT):
+        try:
+            snapshot = refresh_snapshot()
+        finally:
+            cache.delete(REFRESH_LOCK_KEY)
+    return snapshot
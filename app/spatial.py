@@ -0,0 +1,105 @@
+"""
+Spatial helpers shared by the app and head GIS feeds.
+
+Locations are stored as plain latitude/longitude floats, so viewport queries
+are expressed as range filters on those (indexed) columns, narrowed further by
+the indexed geohash cell key when the box is small enough (see ``geohash``).
+"""
+from django.db.models import Q
+
+from .geohash import geohash_q
+
+
+MIN_ZOOM = 0
+MAX_ZOOM = 22
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def parse_bbox(value):
+    """
+    Parse a ``west,south,east,north`` bounding box string (Leaflet's
+    ``map.getBounds().toBBoxString()`` format).
+
+    Returns ``None`` when no bbox was supplied and raises ``ValueError``
+    when the value is malformed.
+    """
+    if value is None or not str(value).strip():
+        return None
+
+    parts = [part.strip() for part in str(value).split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must be "west,south,east,north"')
+
+    try:
+        west, south, east, north = (float(part) for part in parts)
+    except ValueError:
+        raise ValueError('bbox values must be numbers')
+
+    if south > north:
+        raise ValueError('bbox south must not be greater than north')
+
+    south = _clamp(south, -90.0, 90.0)
+    north = _clamp(north, -90.0, 90.0)
+
+    # Leaflet reports longitudes outside [-180, 180] once the world wraps;
+    # a box wider than the world simply means "every longitude".
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = ((west + 180.0) % 360.0) - 180.0
+        east = ((east + 180.0) % 360.0) - 180.0
+        if east == -180.0 and west > east:
+            east = 180.0
+
+    return west, south, east, north
+
+
+def parse_zoom(value, default=None):
+    """Parse a map zoom level, clamped to the range Leaflet supports."""
+    if value is None or not str(value).strip():
+        return default
+    try:
+        zoom = int(float(value))
+    except (ValueError, OverflowError):
+        # OverflowError: infinite values
+        raise ValueError('zoom must be a number')
+    return _clamp(zoom, MIN_ZOOM, MAX_ZOOM)
+
+
+def bbox_q(bbox, prefix='location__'):
+    """Build a ``Q`` restricting ``<prefix>latitude/longitude`` to ``bbox``."""
+    west, south, east, north = bbox
+    query = Q(**{f'{prefix}latitude__gte': south, f'{prefix}latitude__lte': north})
+
+    if west <= east:
+        query &= Q(**{f'{prefix}longitude__gte': west, f'{prefix}longitude__lte': east})
+    else:
+        # Box crosses the antimeridian
+        query &= Q(**{f'{prefix}longitude__gte': west}) | Q(**{f'{prefix}longitude__lte': east})
+
+    cells = geohash_q(bbox, prefix=prefix)
+    if cells is not None:
+        query &= cells
+    return query
+
+
+def filter_bbox(queryset, bbox, prefix='location__'):
+    """Restrict ``queryset`` to records whose location falls inside ``bbox``."""
+    if bbox is None:
+        return queryset
+    return queryset.filter(bbox_q(bbox, prefix=prefix))
+
+
+def viewport_from_request(request):
+    """
+    Read the ``bbox`` and ``zoom`` query parameters of a feed request.
+
+    Returns a ``(bbox, zoom)`` tuple; either may be ``None``.
+    Raises ``ValueError`` for malformed parameters.
+    """
+    bbox = parse_bbox(request.GET.get('bbox'))
+    zoom = parse_zoom(request.GET.get('zoom'))
+    return bbox, zoom
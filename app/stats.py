@@ -0,0 +1,101 @@
+"""
+Headline tree statistics shared by the dashboard, the report summary and the
+head analytics feed.
+
+Everything is read from the tree rollups in two passes: one aggregate using
+conditional sums for the totals and the health breakdown, and one query
+grouped by year and species that is folded into the yearly, family and
+species series.  The rollups are not kept per location, so the locations with
+trees are counted on the tree table.  The result is cached per data scope until its data changes
+(see ``analytics_cache``).
+"""
+from django.db.models import Count, Q, Sum
+
+from .analytics_cache import cached_analytics
+from .filters import HEALTH_STATUSES
+from .models import DatasetVersion, EndemicTree, Location, TreeRollup, TreeSpecies
+
+
+# Statuses counted as good health or better on the dashboard
+GOOD_HEALTH_STATUSES = ('good', 'very_good', 'excellent')
+
+TOP_FAMILIES = 10
+TOP_SPECIES = 10
+
+
+def compute_tree_statistics(user=None):
+    """Statistics of one user's trees, or of every user's for None"""
+    rollups = TreeRollup.objects.order_by()
+    trees = EndemicTree.objects.order_by()
+    species = TreeSpecies.objects.all()
+    locations = Location.objects.all()
+    if user is not None:
+        rollups = rollups.filter(user=user)
+        trees = trees.filter(user=user)
+        species = species.filter(user=user)
+        locations = locations.filter(user=user)
+
+    conditional = {}
+    for status in HEALTH_STATUSES:
+        conditional[f'records_{status}'] = Sum('record_count', filter=Q(health_status=status))
+        conditional[f'population_{status}'] = Sum('population', filter=Q(health_status=status))
+    totals = rollups.aggregate(
+        total_records=Sum('record_count'),
+        total_population=Sum('population'),
+        good_population=Sum('population', filter=Q(health_status__in=GOOD_HEALTH_STATUSES)),
+        species_recorded=Count('species', distinct=True),
+        **conditional
+    )
+
+    years = {}
+    families = {}
+    species_totals = {}
+    for row in rollups.values(
+        'year', 'species_id', 'species__common_name', 'species__scientific_name', 'species__genus__family__name'
+    ).annotate(total_records=Sum('record_count'), total_population=Sum('population')):
+        year = years.setdefault(row['year'], {'year': row['year'], 'count': 0, 'population': 0})
+        year['count'] += row['total_records']
+        year['population'] += row['total_population']
+        family = row['species__genus__family__name']
+        families[family] = families.get(family, 0) + row['total_population']
+        item = species_totals.setdefault(row['species_id'], {
+            'common_name': row['species__common_name'],
+            'scientific_name': row['species__scientific_name'],
+            'count': 0,
+            'total_population': 0,
+        })
+        item['count'] += row['total_records']
+        item['total_population'] += row['total_population']
+
+    total_population = totals['total_population'] or 0
+    good_population = totals['good_population'] or 0
+    return {
+        'total_trees': totals['total_records'] or 0,
+        'total_population': total_population,
+        'good_health_population': good_population,
+        'health_percentage': round(good_population / total_population * 100) if total_population else 0,
+        'species_recorded': totals['species_recorded'],
+        'locations_recorded': trees.values('location_id').distinct().count(),
+        'total_species': species.count(),
+        'total_locations': locations.count(),
+        'health_distribution': [
+            {
+                'health_status': status,
+                'count': totals[f'records_{status}'],
+                'population': totals[f'population_{status}'] or 0,
+            }
+            for status in sorted(HEALTH_STATUSES)
+            if totals[f'records_{status}']
+        ],
+        'population_by_year': [years[year] for year in sorted(years)],
+        'population_by_family': [
+            {'name': name, 'total_population': population}
+            for name, population in sorted(families.items(), key=lambda item: -item[1])[:TOP_FAMILIES]
+        ],
+        'top_species': sorted(species_totals.values(), key=lambda item: -item['total_population'])[:TOP_SPECIES],
+    }
+
+
+def tree_statistics(user=None):
+    """``compute_tree_statistics`` cached until the scope's data changes"""
+    return cached_analytics('tree-stats', DatasetVersion.scope_for(user), lambda: compute_tree_statistics(user))
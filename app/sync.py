@@ -0,0 +1,125 @@
+"""
+Delta sync for the tree and seed feeds.
+
+A client that already holds a copy of a feed passes the ``sync_token`` of its
+last response back as ``?since=``.  The feed then returns only the records
+created or updated after that moment plus the IDs of records deleted since
+(read from ``DeletionLog``), and a new token for the next round.
+
+Records committed by a transaction that was still open when a token was
+issued carry an older ``updated_at`` than the token, so the token is never
+later than the start of the oldest open writing transaction (PostgreSQL
+reports these in ``pg_stat_activity``; elsewhere it lags by
+``MAX_WRITE_DURATION``).  Re-sending a few records is harmless because
+clients replace records by ID.
+
+Tombstones are kept for ``DELETION_LOG_RETENTION`` (the job worker prunes
+older ones); a client whose ``since`` is older gets an empty collection with
+``"resync": true`` and must reload the full feed.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DeletionLog
+
+
+# Allowance for clock differences between the app servers and the database
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Longest a writer transaction (one import chunk, a bulk delete) stays open;
+# used where the database cannot report open transactions
+MAX_WRITE_DURATION = timedelta(minutes=5)
+
+DELETION_LOG_RETENTION = timedelta(days=30)
+
+
+def parse_since(value):
+    """
+    Parse a ``since`` value: an ISO 8601 timestamp (the ``sync_token`` of a
+    previous response) or Unix epoch seconds.
+
+    Returns ``None`` when no value was supplied and raises ``ValueError``
+    when it is malformed.
+    """
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip()
+
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+
+    # "+" in a UTC offset arrives as a space when the token is not URL-encoded
+    since = parse_datetime(value.replace(' ', '+'))
+    if since is None:
+        raise ValueError('since must be an ISO 8601 timestamp or Unix epoch seconds')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def since_from_request(request):
+    """Read the ``since`` query parameter of a feed request."""
+    return parse_since(request.GET.get('since'))
+
+
+def _oldest_open_write():
+    """
+    Start time of the oldest other transaction that has written and not yet
+    committed, or None when there is none.  Without a way to ask the
+    database, assume one started ``MAX_WRITE_DURATION`` ago.
+    """
+    if connection.vendor != 'postgresql':
+        return timezone.now() - MAX_WRITE_DURATION
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT min(xact_start) FROM pg_stat_activity "
+            "WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+        )
+        return cursor.fetchone()[0]
+
+
+def sync_token():
+    """Token for the client's next delta request; taken before querying."""
+    now = timezone.now()
+    oldest = _oldest_open_write()
+    return min(now, oldest).isoformat() if oldest is not None else now.isoformat()
+
+
+def resync_required(since):
+    """Whether tombstones after ``since`` may already have been pruned"""
+    return since < timezone.now() - DELETION_LOG_RETENTION
+
+
+def resync_collection(token):
+    """Response body telling a delta client to reload the full feed"""
+    return {'type': 'FeatureCollection', 'features': [], 'resync': True, 'sync_token': token}
+
+
+def prune_deletion_log():
+    """Delete tombstones older than ``DELETION_LOG_RETENTION``; returns the count"""
+    cutoff = timezone.now() - DELETION_LOG_RETENTION
+    deleted, _ = DeletionLog.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+def changed_since(queryset, since):
+    """Restrict ``queryset`` to records created or updated after ``since``."""
+    return queryset.filter(updated_at__gte=since - SYNC_OVERLAP)
+
+
+def deleted_since(entity_type, since, user=None):
+    """
+    IDs of ``entity_type`` ('tree' or 'seed') records deleted after ``since``,
+    limited to one user's records unless ``user`` is None.
+    """
+    tombstones = DeletionLog.objects.filter(
+        entity_type=entity_type, deleted_at__gte=since - SYNC_OVERLAP
+    )
+    if user is not None:
+        tombstones = tombstones.filter(user=user)
+    return list(tombstones.values_list('record_id', flat=True).distinct())
@@ -145,6 +145,47 @@ def pin_style(db):
     )
 
 
+@pytest.fixture
+def user_trees(test_user, tree_species):
+    """Create tree records owned by the test user at two distant locations"""
+    near = Location.objects.create(name='Dumaguete', latitude=9.30, longitude=123.30, user=test_user)
+    far = Location.objects.create(name='Baguio', latitude=16.41, longitude=120.59, user=test_user)
+    tree_species.user = test_user
+    tree_species.save()
+    return [
+        EndemicTree.objects.create(
+            species=tree_species, location=near, population=40, year=2023,
+            health_status='good', good_count=40, hectares=1.5, user=test_user
+        ),
+        EndemicTree.objects.create(
+            species=tree_species, location=far, population=60, year=2024,
+            health_status='excellent', healthy_count=60, hectares=2.0, user=test_user
+        ),
+    ]
+
+
+@pytest.fixture
+def head_client(db):
+    """Create an authenticated client for a head user"""
+    user = User.objects.create_user(username='headuser', password='headpass123')
+    user.profile.user_type = 'head_user'
+    user.profile.save()
+    client = Client()
+    client.login(username='headuser', password='headpass123')
+    return client
+
+
+
+def job_result(client, response):
+    """Run the job queued by ``response`` and return its result from the status API"""
+    from .jobs import work
+    assert response.status_code == 202
+    work(once=True)
+    job = client.get(response.json()['status_url']).json()
+    assert job['status'] == 'succeeded', job['error']
+    return job['result']
+
+
 # ============================================================================
 # MODEL TESTS
 # ============================================================================
@@ -500,6 +541,1732 @@ class TestTreeDataAPI:
             assert 'deceased_count' in feature['properties']
 
 
+class TestTreeDataViewport:
+    """Test bbox/zoom restriction of the tree feeds"""
+
+    @pytest.mark.django_db
+    def test_bbox_returns_only_trees_in_viewport(self, authenticated_client, user_trees):
+        """Only trees inside the bounding box are serialized"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'bbox': '122,9,124,11', 'zoom': '14'})
+        assert response.status_code == 200
+        data = json.loads(response.content)
+        assert [f['properties']['location'] for f in data['features']] == ['Dumaguete']
+        assert data['zoom'] == 14
+
+    @pytest.mark.django_db
+    def test_without_bbox_returns_all_trees(self, authenticated_client, user_trees):
+        """Omitting bbox keeps the full feed"""
+        response = authenticated_client.get(reverse('app:tree_data'))
+        data = json.loads(response.content)
+        assert len(data['features']) == 2
+
+    @pytest.mark.django_db
+    def test_invalid_bbox_is_rejected(self, authenticated_client, user_trees):
+        """A malformed bbox returns a 400 error"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'bbox': '1,2,3'})
+        assert response.status_code == 400
+
+    @pytest.mark.django_db
+    def test_invalid_zoom_is_rejected(self, authenticated_client, user_trees):
+        """Non-numeric and infinite zoom levels return a 400 error"""
+        for zoom in ('high', 'inf', '-inf', 'nan'):
+            response = authenticated_client.get(reverse('app:tree_data'), {'zoom': zoom})
+            assert response.status_code == 400
+
+    @pytest.mark.django_db
+    def test_head_feed_honours_bbox(self, head_client, user_trees):
+        """The all-users head feed is bounded the same way"""
+        response = head_client.get(reverse('head:tree_data'), {'bbox': '120,16,121,17'})
+        data = json.loads(b''.join(response.streaming_content))
+        assert [f['properties']['location'] for f in data['features']] == ['Baguio']
+
+    def test_parse_bbox_handles_wrapped_longitudes(self):
+        """World-wrapped Leaflet bounds are normalized"""
+        from .spatial import parse_bbox
+        assert parse_bbox('-200,-10,200,10') == (-180.0, -10.0, 180.0, 10.0)
+        assert parse_bbox('170,-10,190,10') == (170.0, -10.0, -170.0, 10.0)
+        assert parse_bbox('') is None
+
+
+class TestFeedClustering:
+    """Test server-side clustering of the tree and seed feeds"""
+
+    @pytest.mark.django_db
+    def test_low_zoom_returns_clusters(self, authenticated_client, user_trees):
+        """Nearby trees collapse into one cluster that sums their counts"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'zoom': '2'})
+        data = json.loads(response.content)
+        assert data['clustered'] is True
+        assert len(data['features']) == 1
+        properties = data['features'][0]['properties']
+        assert properties['cluster'] is True
+        assert properties['point_count'] == 2
+        assert properties['population'] == 100
+
+    @pytest.mark.django_db
+    def test_high_zoom_returns_individual_trees(self, authenticated_client, user_trees):
+        """Past the cluster zoom the feed returns one feature per tree"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'zoom': '15'})
+        data = json.loads(response.content)
+        assert 'clustered' not in data
+        assert len(data['features']) == 2
+
+    @pytest.mark.django_db
+    def test_cluster_straddling_viewport_edge_is_kept(self, authenticated_client, user_trees):
+        """A cluster with a visible point stays even when its centroid is off screen"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'zoom': '2', 'bbox': '123,9,124,10'})
+        data = json.loads(response.content)
+        assert [f['properties']['point_count'] for f in data['features']] == [2]
+        assert data['bbox'] == [123.0, 9.0, 124.0, 10.0]
+
+    def test_pad_bbox_wraps_longitudes(self):
+        """Padding crosses the antimeridian and saturates at the whole world"""
+        from .clustering import _pad_bbox
+        assert _pad_bbox((170.0, -10.0, 178.0, 10.0), 5.0) == (165.0, -15.0, -177.0, 15.0)
+        assert _pad_bbox((-180.0, -89.0, 180.0, 89.0), 1.0) == (-180.0, -90.0, 180.0, 90.0)
+
+    @pytest.mark.django_db
+    def test_cluster_can_be_disabled(self, authenticated_client, user_trees):
+        """cluster=0 forces individual features at any zoom"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'zoom': '2', 'cluster': '0'})
+        data = json.loads(response.content)
+        assert 'clustered' not in data
+        assert len(data['features']) == 2
+
+    @pytest.mark.django_db
+    def test_head_seed_clusters(self, head_client, user_trees):
+        """The head seed feed clusters across all users"""
+        for tree, status in zip(user_trees, ('germinating', 'failed')):
+            TreeSeed.objects.create(
+                species=tree.species, location=tree.location, quantity=25,
+                germination_status=status, hectares=1.0, user=tree.user
+            )
+        response = head_client.get(reverse('head:seed_data'), {'zoom': '3'})
+        data = json.loads(response.content)
+        assert data['clustered'] is True
+        seeds = [f['properties'] for f in data['features']]
+        assert all(p['entity_type'] == 'seed' for p in seeds)
+        assert sum(p['quantity'] for p in seeds) >= 50
+        assert sum(p['failed'] for p in seeds) >= 1
+
+    def test_build_cluster_pyramid(self):
+        """Clusters split apart as the zoom level increases"""
+        from .clustering import CLUSTER_MAX_ZOOM, build_cluster_pyramid
+        rows = [
+            (9.30, 123.30, 10, 5, 3, 1, 1),
+            (9.40, 123.40, 20, 10, 5, 5, 0),
+            (16.41, 120.59, 30, 30, 0, 0, 0),
+        ]
+        pyramid = build_cluster_pyramid(rows, 'trees')
+        assert sorted(pyramid) == list(range(CLUSTER_MAX_ZOOM + 1))
+        assert [c['point_count'] for c in pyramid[0]] == [3]
+        assert pyramid[0][0]['population'] == 60
+        assert len(pyramid[CLUSTER_MAX_ZOOM]) == 3
+
+
+class TestVectorTiles:
+    """Test the Mapbox Vector Tile endpoints"""
+
+    @pytest.fixture(autouse=True)
+    def tile_cache_dir(self, settings, tmp_path):
+        settings.TILE_CACHE_DIR = str(tmp_path)
+        return tmp_path
+
+    @pytest.mark.django_db
+    def test_tile_contains_trees_in_tile(self, authenticated_client, user_trees):
+        """The tile covering Dumaguete encodes its tree and properties"""
+        url = reverse('app:vector_tile', args=['trees', 8, 215, 121])
+        response = authenticated_client.get(url)
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/vnd.mapbox-vector-tile'
+        assert str(user_trees[0].id).encode() in response.content
+        assert str(user_trees[1].id).encode() not in response.content
+        assert b'health_status' in response.content
+
+    @pytest.mark.django_db
+    def test_tile_out_of_range(self, authenticated_client):
+        """Tiles outside the zoom pyramid or unknown kinds return 404"""
+        assert authenticated_client.get(reverse('app:vector_tile', args=['trees', 2, 4, 0])).status_code == 404
+        assert authenticated_client.get(reverse('app:vector_tile', args=['layers', 0, 0, 0])).status_code == 404
+
+    @pytest.mark.django_db(transaction=True)
+    def test_tile_cache_invalidated_on_change(self, authenticated_client, head_client, user_trees, tile_cache_dir):
+        """Saving a tree moves both scopes to a new version and prunes the old tiles"""
+        from .models import DatasetVersion
+        user_scope = f'user-{user_trees[0].user_id}'
+        user_version, head_version = DatasetVersion.current(user_scope, 'all')
+        url = reverse('app:vector_tile', args=['trees', 0, 0, 0])
+        authenticated_client.get(url)
+        head_client.get(reverse('head:vector_tile', args=['trees', 0, 0, 0]))
+        user_tile = tile_cache_dir / user_scope / str(user_version) / 'trees' / '0' / '0' / '0.pbf'
+        head_tile = tile_cache_dir / 'all' / str(head_version) / 'trees' / '0' / '0' / '0.pbf'
+        assert user_tile.exists() and head_tile.exists()
+
+        user_trees[0].population = 45
+        user_trees[0].save()
+        assert not user_tile.exists()
+        assert not head_tile.exists()
+
+        authenticated_client.get(url)
+        new_version = DatasetVersion.current(user_scope)[0]
+        assert new_version != user_version
+        assert (tile_cache_dir / user_scope / str(new_version) / 'trees' / '0' / '0' / '0.pbf').exists()
+
+    @pytest.mark.django_db
+    def test_tile_built_before_write_is_not_served(self, authenticated_client, user_trees, tile_cache_dir):
+        """A tile left behind by a build that raced a write is never read again"""
+        from .models import DatasetVersion
+        user_scope = f'user-{user_trees[0].user_id}'
+        version = DatasetVersion.current(user_scope)[0]
+        url = reverse('app:vector_tile', args=['trees', 8, 215, 121])
+        stale = authenticated_client.get(url).content
+        tree_id = str(user_trees[0].id).encode()
+        assert tree_id in stale
+
+        user_trees[0].delete()
+        # The racing build finishes its write after the deletion
+        stale_tile = tile_cache_dir / user_scope / str(version) / 'trees' / '8' / '215' / '121.pbf'
+        stale_tile.write_bytes(stale)
+        assert tree_id not in authenticated_client.get(url).content
+
+    @pytest.mark.django_db(transaction=True)
+    def test_bulk_delete_prunes_once(self, user_trees, monkeypatch):
+        """Deleting many records in one transaction runs a single prune on commit"""
+        from django.db import transaction
+        from . import tiles
+        pruned = []
+        monkeypatch.setattr(tiles, '_prune_scopes', pruned.append)
+        with transaction.atomic():
+            EndemicTree.objects.filter(user=user_trees[0].user).delete()
+            assert pruned == []
+        assert pruned == [{'all', f'user-{user_trees[0].user_id}'}]
+
+    def test_encode_layer_geometry(self):
+        """Points are encoded as a single MoveTo with zigzag coordinates"""
+        from .tiles import encode_layer, project
+        assert project(0.0, 0.0, 0, 0, 0) == (2048, 2048)
+        layer = encode_layer('trees', [((1, -1), {'year': 2024})])
+        # MoveTo(1), zigzag(1) = 2, zigzag(-1) = 1
+        assert bytes([0x22, 0x03, 0x09, 0x02, 0x01]) in layer
+        assert b'year' in layer
+
+
+class TestStreamingHeadFeed:
+    """Test the streamed all-users tree feed"""
+
+    @pytest.mark.django_db
+    def test_head_tree_feed_streams_geojson(self, head_client, user_trees):
+        """The head feed is streamed and parses as a FeatureCollection"""
+        response = head_client.get(reverse('head:tree_data'), {'bbox': '120,9,124,17', 'zoom': '14'})
+        assert response.streaming
+        data = json.loads(b''.join(response.streaming_content))
+        assert data['type'] == 'FeatureCollection'
+        assert data['zoom'] == 14
+        by_location = {f['properties']['location']: f['properties'] for f in data['features']}
+        assert by_location['Dumaguete']['population'] == 40
+        assert by_location['Baguio']['user'] == 'testuser'
+        assert by_location['Baguio']['image_url'] is None
+
+    def test_stream_is_written_in_chunks(self):
+        """Features are serialized in batches and trailing members are appended"""
+        from .feeds import FEATURES_PER_CHUNK, streaming_feature_collection
+        features = ({'type': 'Feature', 'properties': {'n': n}} for n in range(FEATURES_PER_CHUNK * 2 + 1))
+        chunks = list(streaming_feature_collection(features, zoom=3).streaming_content)
+        assert len(chunks) > 3
+        data = json.loads(b''.join(chunks))
+        assert [f['properties']['n'] for f in data['features']] == list(range(FEATURES_PER_CHUNK * 2 + 1))
+        assert data['zoom'] == 3
+
+    def test_stream_reports_errors_inline(self):
+        """A failure while streaming still produces valid JSON with an error"""
+        from .feeds import streaming_feature_collection
+
+        def failing():
+            yield {'type': 'Feature', 'properties': {}}
+            raise RuntimeError('database went away')
+
+        data = json.loads(b''.join(streaming_feature_collection(failing()).streaming_content))
+        assert len(data['features']) == 1
+        assert data['error'] == 'database went away'
+
+
+class TestConditionalFeeds:
+    """Test dataset version ETags and If-None-Match handling on the feeds"""
+
+    @pytest.mark.django_db
+    def test_unchanged_feed_returns_304(self, authenticated_client, user_trees):
+        """Repeating a request with the ETag returns 304 without a body"""
+        url = reverse('app:tree_data')
+        response = authenticated_client.get(url)
+        assert response.status_code == 200
+        etag = response['ETag']
+        assert 'no-cache' in response['Cache-Control']
+        assert 'private' in response['Cache-Control']
+
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b''
+
+    @pytest.mark.django_db
+    def test_write_changes_etag(self, authenticated_client, user_trees):
+        """Saving a record bumps the version so the feed is sent again"""
+        url = reverse('app:api_species_list')
+        etag = authenticated_client.get(url)['ETag']
+
+        user_trees[0].population = 41
+        user_trees[0].save()
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    @pytest.mark.django_db
+    def test_etag_varies_with_query(self, authenticated_client, user_trees):
+        """Different viewports of the same data get different ETags"""
+        url = reverse('app:tree_data')
+        first = authenticated_client.get(url, {'zoom': '14'})['ETag']
+        second = authenticated_client.get(url, {'zoom': '15'})['ETag']
+        assert first != second
+
+    @pytest.mark.django_db
+    def test_head_feed_tracks_all_users(self, head_client, user_trees):
+        """The head feed version changes when any user's data changes"""
+        url = reverse('head:seed_data')
+        etag = head_client.get(url)['ETag']
+        assert head_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        user_trees[1].location.name = 'Baguio City'
+        user_trees[1].location.save()
+        assert head_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    @pytest.mark.django_db
+    def test_bump_increments_owner_and_global(self, test_user):
+        """A write bumps the owner's scope and the global scope only"""
+        from .models import DatasetVersion
+        user_scope = DatasetVersion.scope_for(test_user)
+        before = DatasetVersion.current(user_scope, DatasetVersion.GLOBAL_SCOPE, 'user-0')
+        DatasetVersion.bump(test_user)
+        after = DatasetVersion.current(user_scope, DatasetVersion.GLOBAL_SCOPE, 'user-0')
+        assert after[0] == before[0] + 1
+        assert after[1] == before[1] + 1
+        assert after[2] == before[2]
+
+
+class TestDeltaSync:
+    """Test since= delta sync on the tree and seed feeds"""
+
+    @pytest.fixture
+    def synced_trees(self, user_trees):
+        """Trees last changed an hour ago, well before the client's last sync"""
+        from django.utils import timezone
+        EndemicTree.objects.filter(pk__in=[t.pk for t in user_trees]).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        return user_trees
+
+    @pytest.mark.django_db
+    def test_full_feed_includes_sync_token(self, authenticated_client, user_trees):
+        """Full responses carry the token for the next delta request"""
+        data = json.loads(authenticated_client.get(reverse('app:tree_data')).content)
+        assert data['sync_token']
+        assert 'deleted' not in data
+
+    @pytest.mark.django_db
+    def test_since_returns_changes_and_tombstones(self, authenticated_client, synced_trees):
+        """Only updated trees are returned, deleted ones are listed by ID"""
+        url = reverse('app:tree_data')
+        token = json.loads(authenticated_client.get(url).content)['sync_token']
+
+        changed, removed = synced_trees
+        changed.population = 42
+        changed.save()
+        removed_id = str(removed.id)
+        removed.delete()
+
+        data = json.loads(authenticated_client.get(url, {'since': token}).content)
+        assert [f['properties']['id'] for f in data['features']] == [str(changed.id)]
+        assert data['deleted'] == [removed_id]
+        assert data['sync_token'] >= token
+
+    @pytest.mark.django_db
+    def test_location_edit_marks_trees_changed(self, authenticated_client, synced_trees):
+        """Moving a location re-sends the trees planted there"""
+        url = reverse('app:tree_data')
+        token = json.loads(authenticated_client.get(url).content)['sync_token']
+
+        location = synced_trees[1].location
+        location.latitude = 16.5
+        location.save()
+
+        data = json.loads(authenticated_client.get(url, {'since': token}).content)
+        assert [f['properties']['location'] for f in data['features']] == ['Baguio']
+
+    @pytest.mark.django_db
+    def test_head_delta_is_streamed_with_tombstones(self, head_client, synced_trees):
+        """The head feed supports since= for every user's records"""
+        url = reverse('head:tree_data')
+        token = json.loads(b''.join(head_client.get(url, {'zoom': '14'}).streaming_content))['sync_token']
+        removed_id = str(synced_trees[0].id)
+        synced_trees[0].delete()
+
+        data = json.loads(b''.join(head_client.get(url, {'since': token}).streaming_content))
+        assert data['features'] == []
+        assert removed_id in data['deleted']
+
+    @pytest.mark.django_db
+    def test_invalid_since_is_rejected(self, authenticated_client):
+        """A malformed since value returns a 400 error"""
+        response = authenticated_client.get(reverse('app:seed_data'), {'since': 'yesterday'})
+        assert response.status_code == 400
+
+    @pytest.mark.django_db
+    def test_token_lags_open_writes(self):
+        """Without open-transaction info the token allows for the longest write"""
+        from django.utils import timezone
+        from .sync import MAX_WRITE_DURATION, parse_since, sync_token
+        assert parse_since(sync_token()) <= timezone.now() - MAX_WRITE_DURATION
+
+    @pytest.mark.django_db
+    def test_expired_since_requests_resync(self, authenticated_client, head_client, synced_trees):
+        """A since older than the tombstone retention asks for a full reload"""
+        for client, url in ((authenticated_client, reverse('app:tree_data')), (head_client, reverse('head:seed_data'))):
+            data = json.loads(client.get(url, {'since': '0'}).content)
+            assert data['resync'] is True
+            assert data['features'] == []
+            assert data['sync_token']
+
+    @pytest.mark.django_db
+    def test_worker_prunes_old_tombstones(self, synced_trees):
+        """The job worker drops tombstones past the retention period"""
+        from django.utils import timezone
+        from .jobs import work
+        from .models import DeletionLog
+        from .sync import DELETION_LOG_RETENTION
+        old_id = str(synced_trees[0].id)
+        synced_trees[0].delete()
+        synced_trees[1].delete()
+        DeletionLog.objects.filter(record_id=old_id).update(
+            deleted_at=timezone.now() - DELETION_LOG_RETENTION - timedelta(days=1)
+        )
+        work(once=True)
+        assert DeletionLog.objects.count() == 1
+
+    def test_parse_since_accepts_epoch_and_iso(self):
+        """since may be a sync_token or Unix epoch seconds"""
+        from .sync import parse_since
+        assert parse_since('0').year == 1970
+        assert parse_since('2026-01-02T03:04:05+00:00').day == 2
+        assert parse_since('2026-01-02T03:04:05 00:00').hour == 3
+        assert parse_since('') is None
+
+
+class TestColumnarTreeFeed:
+    """Test the format=columnar binary tree feed"""
+
+    @pytest.mark.django_db
+    def test_columnar_matches_geojson(self, authenticated_client, user_trees):
+        """The columnar body carries the same records as the GeoJSON feed"""
+        from .columnar import CONTENT_TYPE, decode_columnar
+        url = reverse('app:tree_data')
+        geojson = json.loads(authenticated_client.get(url, {'zoom': '14'}).content)
+        response = authenticated_client.get(url, {'zoom': '14', 'format': 'columnar'})
+        assert response['Content-Type'] == CONTENT_TYPE
+
+        header, columns = decode_columnar(response.content)
+        assert header['count'] == 2
+        assert header['zoom'] == 14
+        assert header['data_source'] == 'app'
+        expected = {f['properties']['id']: f['properties'] for f in geojson['features']}
+        for i, record_id in enumerate(columns['id']):
+            properties = expected[record_id]
+            assert columns['population'][i] == properties['population']
+            assert columns['hectares'][i] == properties['hectares']
+            species = header['dictionaries']['species'][columns['species'][i]]
+            assert species['common_name'] == properties['common_name']
+            location = header['dictionaries']['location'][columns['location'][i]]
+            assert location['name'] == properties['location']
+            assert header['dictionaries']['health_status'][columns['health_status'][i]] == properties['health_status']
+
+    @pytest.mark.django_db
+    def test_head_columnar_feed(self, head_client, user_trees):
+        """The head feed offers the same columnar body"""
+        from .columnar import decode_columnar
+        response = head_client.get(reverse('head:tree_data'), {'format': 'columnar', 'bbox': '120,16,121,17'})
+        header, columns = decode_columnar(response.content)
+        assert header['count'] == 1
+        assert header['dictionaries']['user'] == ['testuser']
+
+    def test_columns_are_aligned_and_dictionary_encoded(self):
+        """Repeated strings are stored once and columns start on 8-byte boundaries"""
+        import uuid
+        from .columnar import decode_columnar, encode_tree_columns
+        rows = [{
+            'id': uuid.uuid4(), 'species_id': 1, 'location_id': n % 3,
+            'species__common_name': 'Narra', 'species__scientific_name': 'Pterocarpus indicus',
+            'species__genus__name': 'Pterocarpus', 'species__genus__family__name': 'Fabaceae',
+            'location__name': f'Plot {n % 3}', 'location__latitude': 9.0 + n / 1000,
+            'location__longitude': 123.0, 'population': n, 'year': 2024, 'health_status': 'good',
+            'healthy_count': 0, 'good_count': n, 'bad_count': 0, 'deceased_count': 0,
+            'hectares': None, 'notes': '', 'species__has_image': False, 'user__username': 'a',
+        } for n in range(500)]
+        body = encode_tree_columns(rows, lambda species_id: None)
+        header, columns = decode_columnar(body)
+        assert len(header['dictionaries']['species']) == 1
+        assert len(header['dictionaries']['location']) == 3
+        assert all(column['offset'] % 8 == 0 for column in header['columns'].values())
+        assert list(columns['population']) == list(range(500))
+        assert columns['location'].dtype.itemsize == 1
+        assert len(body) < len(json.dumps(rows, default=str)) / 3
+
+
+class TestFieldProjection:
+    """Test fields= projection on the tree feeds"""
+
+    @pytest.mark.django_db
+    def test_fields_limit_properties(self, authenticated_client, user_trees):
+        """Only the requested properties (plus id) are emitted"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'zoom': '14', 'fields': 'species_id,population'})
+        data = json.loads(response.content)
+        assert len(data['features']) == 2
+        for feature in data['features']:
+            assert set(feature['properties']) == {'id', 'species_id', 'population'}
+            assert len(feature['geometry']['coordinates']) == 2
+
+    @pytest.mark.django_db
+    def test_default_properties_unchanged(self, authenticated_client, user_trees):
+        """Without fields the full property set is returned"""
+        data = json.loads(authenticated_client.get(reverse('app:tree_data'), {'zoom': '14'}).content)
+        properties = data['features'][0]['properties']
+        assert properties['data_source'] == 'app'
+        assert {'notes', 'hectares', 'image_url', 'healthy_count', 'family'} <= set(properties)
+
+    @pytest.mark.django_db
+    def test_unknown_field_is_rejected(self, authenticated_client, user_trees):
+        """Unknown property names return a 400 error"""
+        response = authenticated_client.get(reverse('app:tree_data'), {'fields': 'population,password'})
+        assert response.status_code == 400
+        assert 'password' in json.loads(response.content)['error']
+
+    @pytest.mark.django_db
+    def test_filter_trees_projection(self, authenticated_client, head_client, user_trees):
+        """filter_trees accepts the same projection in app and head"""
+        species_id = user_trees[0].species_id
+        data = json.loads(authenticated_client.get(
+            reverse('app:filter_trees', args=[species_id]), {'fields': 'year'}
+        ).content)
+        assert sorted(f['properties']['year'] for f in data['features']) == [2023, 2024]
+        assert all(set(f['properties']) == {'id', 'year'} for f in data['features'])
+
+        data = json.loads(head_client.get(
+            reverse('head:filter_trees', args=[species_id]), {'fields': 'user'}
+        ).content)
+        assert {f['properties']['user'] for f in data['features']} == {'testuser'}
+
+    def test_projection_narrows_query_columns(self):
+        """The SQL only selects the columns the properties need"""
+        from .feeds import tree_rows
+        sql = str(tree_rows(EndemicTree.objects.all(), ('id', 'population')).query)
+        assert '"notes"' not in sql
+        assert '"image"' not in sql
+        assert '"population"' in sql
+
+
+class TestSpeciesImageFlag:
+    """Test the has_image flag that keeps image blobs out of the feeds"""
+
+    @pytest.mark.django_db
+    def test_flag_follows_image(self, tree_species):
+        """Saving the species keeps has_image in sync with the image"""
+        assert not tree_species.has_image
+        tree_species.image = b'\x89PNG'
+        tree_species.save()
+        assert TreeSpecies.objects.get(pk=tree_species.pk).has_image
+
+        species = TreeSpecies.objects.get(pk=tree_species.pk)
+        species.common_name = 'Renamed'
+        species.save()
+        assert TreeSpecies.objects.get(pk=tree_species.pk).has_image
+
+        species.image = None
+        species.save(update_fields=['image'])
+        assert not TreeSpecies.objects.get(pk=tree_species.pk).has_image
+
+    @pytest.mark.django_db
+    def test_image_deferred_on_related_access(self, user_trees):
+        """Loading a tree's species does not load the image"""
+        tree = EndemicTree.objects.get(pk=user_trees[0].pk)
+        assert 'image' in tree.species.get_deferred_fields()
+
+    @pytest.mark.django_db
+    def test_feed_queries_are_constant(self, authenticated_client, user_trees):
+        """The tree feed runs the same queries however many trees exist, none reading the blob"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        species = user_trees[0].species
+        species.image = b'\xff\xd8\xff'
+        species.image_format = 'JPEG'
+        species.save()
+
+        def feed_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = authenticated_client.get(reverse('app:tree_data'), {'zoom': '14'})
+            return response, [query['sql'] for query in context.captured_queries]
+
+        response, before = feed_queries()
+        for tree in user_trees:
+            EndemicTree.objects.create(
+                species=species, location=tree.location, population=5, year=2022,
+                health_status='good', hectares=1.0, user=tree.user
+            )
+        response, after = feed_queries()
+
+        assert len(before) == len(after)
+        assert not any('"image"' in sql for sql in after)
+        features = json.loads(response.content)['features']
+        assert len(features) == 4
+        assert all(feature['properties']['image_url'] for feature in features)
+
+    @pytest.mark.django_db
+    def test_species_image_serves_blob(self, authenticated_client, test_user, tree_species):
+        """The image view still returns the stored bytes"""
+        tree_species.user = test_user
+        tree_species.image = b'\x89PNG-data'
+        tree_species.image_format = 'PNG'
+        tree_species.save()
+        response = authenticated_client.get(reverse('app:species_image', args=[tree_species.pk]))
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'image/png'
+        assert response.content == b'\x89PNG-data'
+
+
+class TestDensityGrid:
+    """Test the server-side density grid behind the heatmap layer"""
+
+    VIEWPORT = {'bbox': '118,5,127,20', 'zoom': '6'}
+
+    @pytest.mark.django_db
+    def test_grid_weights_population(self, authenticated_client, user_trees):
+        """Cells are weighted by population and centred near the trees"""
+        response = authenticated_client.get(reverse('app:tree_density'), self.VIEWPORT)
+        assert response.status_code == 200
+        grid = json.loads(response.content)
+        assert grid['total'] == 100
+        assert grid['max'] > 0
+        assert grid['bbox'][0] <= 118 and grid['bbox'][2] >= 127
+        peak = max(grid['cells'], key=lambda cell: cell[2])
+        assert abs(peak[0] - 16.41) < grid['cell_size']
+        assert abs(peak[1] - 120.59) < grid['cell_size']
+
+    @pytest.mark.django_db
+    def test_grid_is_refreshed_after_writes(self, authenticated_client, user_trees):
+        """A cached grid is replaced once the dataset version changes"""
+        url = reverse('app:tree_density')
+        assert json.loads(authenticated_client.get(url, self.VIEWPORT).content)['total'] == 100
+        tree = user_trees[0]
+        EndemicTree.objects.create(
+            species=tree.species, location=tree.location, population=25, year=2024,
+            health_status='good', hectares=1.0, user=tree.user
+        )
+        assert json.loads(authenticated_client.get(url, self.VIEWPORT).content)['total'] == 125
+
+    @pytest.mark.django_db
+    def test_species_filter_and_head_scope(self, authenticated_client, head_client, user_trees):
+        """species_id restricts the grid; the head endpoint covers all users"""
+        url = reverse('app:tree_density')
+        other = json.loads(authenticated_client.get(url, dict(self.VIEWPORT, species_id='999999')).content)
+        assert other['cells'] == []
+        grid = json.loads(head_client.get(reverse('head:tree_density'), self.VIEWPORT).content)
+        assert grid['total'] == 100
+
+    @pytest.mark.django_db
+    def test_invalid_parameters(self, authenticated_client, user_trees):
+        """Missing viewport, unknown resolution and huge grids are rejected"""
+        url = reverse('app:tree_density')
+        assert authenticated_client.get(url).status_code == 400
+        assert authenticated_client.get(url, dict(self.VIEWPORT, resolution='7')).status_code == 400
+        assert authenticated_client.get(url, {'bbox': '-180,-85,180,85', 'zoom': '12'}).status_code == 400
+
+    def test_antimeridian_window(self):
+        """A viewport crossing the antimeridian is gridded as one window"""
+        from .density import grid_window
+        col, row, cols, rows = grid_window((170.0, -10.0, -170.0, 10.0), 4, 8)
+        assert cols == 8 and rows == 8
+
+
+class TestAreaStats:
+    """Test the area statistics API behind the draw tool"""
+
+    # Square around Dumaguete (9.30, 123.30) that excludes Baguio
+    SQUARE = {'type': 'Polygon', 'coordinates': [[[123.0, 9.0], [123.5, 9.0], [123.5, 9.5], [123.0, 9.5], [123.0, 9.0]]]}
+
+    def post(self, client, url, shape):
+        return client.post(url, data=json.dumps(shape), content_type='application/json')
+
+    @pytest.mark.django_db
+    def test_polygon_statistics(self, authenticated_client, user_trees):
+        """Only records inside the polygon are aggregated"""
+        TreeSeed.objects.create(
+            species=user_trees[0].species, location=user_trees[0].location, quantity=30,
+            planting_date=date.today(), germination_status='germinating',
+            hectares=1.0, user=user_trees[0].user
+        )
+        response = self.post(authenticated_client, reverse('app:area_stats'), self.SQUARE)
+        assert response.status_code == 200
+        stats = json.loads(response.content)
+        assert stats['trees']['records'] == 1
+        assert stats['trees']['population'] == 40
+        assert stats['trees']['species_richness'] == 1
+        assert stats['trees']['health_distribution'] == {'good': 40}
+        assert stats['trees']['hectares'] == 1.5
+        assert stats['seeds']['germination_status'] == {'germinating': 30}
+        # 0.5 x 0.5 degrees near the equator is roughly 305,000 ha
+        assert 290000 < stats['area_hectares'] < 320000
+
+    @pytest.mark.django_db
+    def test_circle_and_feature(self, authenticated_client, head_client, user_trees):
+        """Circles use great-circle distance; Features wrapping polygons are accepted"""
+        url = reverse('app:area_stats')
+        near = {'type': 'Circle', 'coordinates': [120.60, 16.41], 'radius': 5000}
+        assert json.loads(self.post(authenticated_client, url, near).content)['trees']['population'] == 60
+        tight = dict(near, radius=500)
+        assert json.loads(self.post(authenticated_client, url, tight).content)['trees']['records'] == 0
+
+        feature = {'type': 'Feature', 'properties': {}, 'geometry': self.SQUARE}
+        stats = json.loads(self.post(head_client, reverse('head:area_stats'), feature).content)
+        assert stats['trees']['population'] == 40
+
+    @pytest.mark.django_db
+    def test_invalid_shapes(self, authenticated_client):
+        """Malformed bodies and unsupported geometries are rejected"""
+        url = reverse('app:area_stats')
+        assert authenticated_client.get(url).status_code == 405
+        assert authenticated_client.post(url, data='not json', content_type='application/json').status_code == 400
+        assert self.post(authenticated_client, url, {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]}).status_code == 400
+        assert self.post(authenticated_client, url, {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1]]]}).status_code == 400
+        assert self.post(authenticated_client, url, {'type': 'Circle', 'coordinates': [0, 0]}).status_code == 400
+
+    def test_polygon_with_hole(self):
+        """Points inside an inner ring are outside the polygon"""
+        import numpy as np
+        from .areas import parse_shape
+        shape = parse_shape({'type': 'Polygon', 'coordinates': [
+            [[0, 0], [10, 0], [10, 10], [0, 10]],
+            [[4, 4], [6, 4], [6, 6], [4, 6]],
+        ]})
+        mask = shape.contains(np.array([1.0, 5.0, 11.0]), np.array([1.0, 5.0, 5.0]))
+        assert list(mask) == [True, False, False]
+
+
+class TestLocationGeohash:
+    """Test the geohash cell key stored on Location"""
+
+    def test_encode_known_value(self):
+        """Encoding matches the reference geohash"""
+        from .geohash import encode_geohash
+        assert encode_geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+        assert encode_geohash(57.64911, 10.40744).startswith('u4pruydqqvj')
+
+    def test_cover_contains_box(self):
+        """The covering cells include every corner of the box"""
+        from .geohash import covering_geohashes, encode_geohash
+        bbox = (123.0, 9.0, 123.5, 9.5)
+        cells = covering_geohashes(bbox)
+        assert 0 < len(cells) <= 8
+        for lat, lng in [(9.0, 123.0), (9.5, 123.5), (9.25, 123.25)]:
+            assert any(encode_geohash(lat, lng).startswith(cell) for cell in cells)
+        assert covering_geohashes((-180, -90, 180, 90)) is None
+        assert covering_geohashes((170, 0, -170, 10)) is None
+
+    @pytest.mark.django_db
+    def test_geohash_kept_in_sync(self, test_user):
+        """Saving a location recomputes its geohash, including partial saves"""
+        from .geohash import encode_geohash
+        location = Location.objects.create(name='Plot', latitude=9.3, longitude=123.3, user=test_user)
+        assert location.geohash == encode_geohash(9.3, 123.3)
+        location.latitude = 10.1
+        location.save(update_fields=['latitude'])
+        assert Location.objects.get(pk=location.pk).geohash == encode_geohash(10.1, 123.3)
+
+    @pytest.mark.django_db
+    def test_backfill_command(self, test_user):
+        """The backfill command fills in missing geohashes"""
+        from django.core.management import call_command
+        from io import StringIO
+        location = Location.objects.create(name='Plot', latitude=9.3, longitude=123.3, user=test_user)
+        Location.objects.filter(pk=location.pk).update(geohash='')
+        out = StringIO()
+        call_command('backfill_geohash', stdout=out)
+        assert 'updated 1 geohashes' in out.getvalue()
+        assert Location.objects.get(pk=location.pk).geohash == location.geohash
+
+    @pytest.mark.django_db
+    def test_bbox_filter_uses_geohash(self, user_trees):
+        """Viewport filters add the geohash prefix and still match exactly"""
+        from .spatial import filter_bbox
+        trees = filter_bbox(EndemicTree.objects.all(), (123.0, 9.0, 123.5, 9.5))
+        assert 'geohash' in str(trees.query)
+        assert [tree.population for tree in trees] == [40]
+
+    @pytest.mark.django_db
+    def test_bbox_filter_keeps_missing_geohash(self, user_trees):
+        """Locations whose geohash is not filled in yet are not dropped"""
+        from .spatial import filter_bbox
+        Location.objects.update(geohash='')
+        trees = filter_bbox(EndemicTree.objects.all(), (123.0, 9.0, 123.5, 9.5))
+        assert [tree.population for tree in trees] == [40]
+
+
+class TestNearbyRecords:
+    """Test the nearest-neighbour API"""
+
+    @pytest.mark.django_db
+    def test_k_nearest_with_distances(self, authenticated_client, user_trees):
+        """Records come back nearest first with great-circle distances"""
+        response = authenticated_client.get(reverse('app:nearby_records'), {'lat': '9.31', 'lng': '123.30', 'k': '2'})
+        assert response.status_code == 200
+        data = json.loads(response.content)
+        assert [tree['location'] for tree in data['trees']] == ['Dumaguete', 'Baguio']
+        # 0.01 degrees of latitude is about 1.1 km
+        assert 1100 < data['trees'][0]['distance_m'] < 1125
+        assert data['trees'][1]['distance_m'] > 700000
+        assert data['seeds'] == []
+
+    @pytest.mark.django_db
+    def test_radius_and_rebuild(self, authenticated_client, user_trees):
+        """A radius query returns only close records; new records appear once added"""
+        url = reverse('app:nearby_records')
+        params = {'lat': '16.41', 'lng': '120.59', 'radius': '5000', 'kind': 'trees'}
+        data = json.loads(authenticated_client.get(url, params).content)
+        assert [tree['population'] for tree in data['trees']] == [60]
+        assert 'seeds' not in data
+
+        EndemicTree.objects.create(
+            species=user_trees[1].species, location=user_trees[1].location, population=7,
+            year=2020, health_status='good', hectares=1.0, user=user_trees[1].user
+        )
+        data = json.loads(authenticated_client.get(url, params).content)
+        assert sorted(tree['population'] for tree in data['trees']) == [7, 60]
+
+    @pytest.mark.django_db
+    def test_scopes_and_validation(self, authenticated_client, head_client, user_trees):
+        """Head users search every user's records; bad parameters are rejected"""
+        data = json.loads(head_client.get(reverse('head:nearby_records'), {'lat': '9.3', 'lng': '123.3'}).content)
+        assert len(data['trees']) == 2
+        url = reverse('app:nearby_records')
+        assert authenticated_client.get(url, {'lat': '9.3'}).status_code == 400
+        assert authenticated_client.get(url, {'lat': '95', 'lng': '0'}).status_code == 400
+        assert authenticated_client.get(url, {'lat': '9', 'lng': '0', 'k': '0'}).status_code == 400
+        assert authenticated_client.get(url, {'lat': '9', 'lng': '0', 'kind': 'rocks'}).status_code == 400
+
+    def test_kdtree_matches_brute_force(self):
+        """KD-tree queries agree with an exhaustive search"""
+        import numpy as np
+        from .nearest import KDTree, unit_vectors
+        rng = np.random.default_rng(7)
+        points = unit_vectors(rng.uniform(-60, 60, 2000), rng.uniform(-180, 180, 2000))
+        tree = KDTree(points, leaf_size=16)
+        query = unit_vectors([10.0], [120.0])[0]
+        exact = np.sqrt(((points - query) ** 2).sum(axis=1))
+
+        distances, indexes = tree.query(query, 15)
+        assert list(indexes) == list(np.argsort(exact)[:15])
+        assert np.allclose(distances, np.sort(exact)[:15])
+
+        distances, indexes = tree.query_radius(query, 0.3)
+        assert sorted(indexes) == sorted(np.nonzero(exact <= 0.3)[0])
+        assert list(distances) == sorted(distances)
+
+
+class TestTreeQuery:
+    """Test the multi-criteria tree query endpoint"""
+
+    def populations(self, client, url, params):
+        response = client.get(url, params)
+        assert response.status_code == 200
+        data = json.loads(b''.join(response.streaming_content))
+        return sorted(feature['properties']['population'] for feature in data['features']), data
+
+    @pytest.mark.django_db
+    def test_combined_filters(self, authenticated_client, user_trees):
+        """Each filter narrows the same query"""
+        url = reverse('app:query_trees')
+        species_id = str(user_trees[0].species_id)
+        assert self.populations(authenticated_client, url, {})[0] == [40, 60]
+        assert self.populations(authenticated_client, url, {'species': species_id, 'year_min': '2024'})[0] == [60]
+        assert self.populations(authenticated_client, url, {'health_status': 'good,very_good'})[0] == [40]
+        assert self.populations(authenticated_client, url, {'population_min': '50', 'hectares_max': '2'})[0] == [60]
+        assert self.populations(authenticated_client, url, {'location': str(user_trees[0].location_id)})[0] == [40]
+        assert self.populations(authenticated_client, url, {'bbox': '123,9,124,10'})[0] == [40]
+        family = user_trees[0].species.genus.family
+        assert self.populations(authenticated_client, url, {'family': family.name})[0] == [40, 60]
+        assert self.populations(authenticated_client, url, {'family': str(family.pk + 1000)})[0] == []
+
+    @pytest.mark.django_db
+    def test_projection_and_filters_echoed(self, authenticated_client, user_trees):
+        """fields narrows properties and the active filters are echoed"""
+        _, data = self.populations(authenticated_client, reverse('app:query_trees'), {'year_max': '2023', 'fields': 'population'})
+        assert data['filters'] == {'year_max': '2023'}
+        assert set(data['features'][0]['properties']) == {'id', 'population'}
+
+    @pytest.mark.django_db
+    def test_head_scope(self, head_client, user_trees):
+        """The head endpoint queries every user's trees"""
+        populations, data = self.populations(head_client, reverse('head:query_trees'), {'year_min': '2023'})
+        assert populations == [40, 60]
+        assert data['features'][0]['properties']['user'] == 'testuser'
+
+    @pytest.mark.django_db
+    def test_invalid_filters(self, authenticated_client, user_trees):
+        """Malformed filter values are rejected"""
+        url = reverse('app:query_trees')
+        for params in ({'species': 'abc'}, {'health_status': 'dead'}, {'year_min': 'soon'}, {'bbox': '1,2,3'}):
+            assert authenticated_client.get(url, params).status_code == 400
+
+
+class TestCompressedFeeds:
+    """Test compressed feed bodies cached under the dataset version ETag"""
+
+    def body(self, response):
+        import gzip
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        data = json.loads(content)
+        # Generation times are not part of the compared payload
+        return {key: value for key, value in data.items() if key not in ('timestamp', 'sync_token')}
+
+    @pytest.mark.django_db
+    def test_gzip_body_cached(self, authenticated_client, user_trees):
+        """A gzip response is stored under its ETag and served from the cache"""
+        from django.core.cache import cache
+        from .compression import body_cache_key
+        url = reverse('app:tree_data')
+        plain = authenticated_client.get(url)
+        assert not plain.has_header('Content-Encoding')
+
+        response = authenticated_client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert self.body(response) == self.body(plain)
+        assert cache.get(body_cache_key(response['ETag'].strip('"'), 'gzip')) is not None
+
+        again = authenticated_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert not again.streaming
+        assert again['ETag'] == response['ETag']
+        assert self.body(again) == self.body(plain)
+
+    @pytest.mark.django_db
+    def test_viewport_body_cached(self, authenticated_client, user_trees, monkeypatch):
+        """Viewport bodies are stored under the normalized query string"""
+        from django.core.cache import cache
+        from . import compression
+        from .compression import body_cache_key
+        monkeypatch.setattr(compression, 'MIN_COMPRESS_SIZE', 0)
+        url = reverse('app:tree_data')
+        response = authenticated_client.get(f'{url}?zoom=8&bbox=120,10,126,16', HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        params = 'bbox=120%2C10%2C126%2C16&zoom=8'
+        assert cache.get(body_cache_key(response['ETag'].strip('"'), 'gzip', params)) is not None
+
+        again = authenticated_client.get(f'{url}?bbox=120,10,126,16&zoom=8', HTTP_ACCEPT_ENCODING='gzip')
+        assert not again.streaming
+        assert again['ETag'] == response['ETag']
+        assert self.body(again) == self.body(response)
+
+    @pytest.mark.django_db
+    def test_delta_body_not_cached(self, authenticated_client, user_trees, monkeypatch):
+        """Delta requests are compressed but never stored"""
+        from django.core.cache import cache
+        from . import compression
+        from .compression import body_cache_key
+        monkeypatch.setattr(compression, 'MIN_COMPRESS_SIZE', 0)
+        import time
+        since = str(int(time.time()) - 60)
+        response = authenticated_client.get(reverse('app:tree_data'), {'since': since}, HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert self.body(response)['since']
+        assert cache.get(body_cache_key(response['ETag'].strip('"'), 'gzip', f'since={since}')) is None
+
+    @pytest.mark.django_db
+    def test_failed_stream_not_cached(self, head_client, user_trees, monkeypatch):
+        """A streamed body that ended with an error member is not stored"""
+        from django.core.cache import cache
+        from head import views
+        from .compression import body_cache_key
+
+        def failing_features(*args, **kwargs):
+            raise RuntimeError('database went away')
+            yield
+
+        monkeypatch.setattr(views, 'iter_tree_features', failing_features)
+        response = head_client.get(reverse('head:tree_data'), HTTP_ACCEPT_ENCODING='gzip')
+        assert self.body(response)['error'] == 'database went away'
+        assert cache.get(body_cache_key(response['ETag'].strip('"'), 'gzip')) is None
+
+    @pytest.mark.django_db
+    def test_write_invalidates_cached_body(self, authenticated_client, user_trees):
+        """After a write the feed is rebuilt rather than served from the old body"""
+        url = reverse('app:analytics_data')
+        first = self.body(authenticated_client.get(url, HTTP_ACCEPT_ENCODING='gzip'))
+        user_trees[0].population = 400
+        user_trees[0].save()
+        second = self.body(authenticated_client.get(url, HTTP_ACCEPT_ENCODING='gzip'))
+        assert first != second
+
+    @pytest.mark.django_db
+    def test_unsupported_encoding_not_compressed(self, head_client, user_trees):
+        """Clients not accepting gzip get the plain body"""
+        response = head_client.get(reverse('head:tree_data'), HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        assert response.status_code == 200
+        assert not response.has_header('Content-Encoding')
+
+    @pytest.mark.django_db
+    def test_malformed_quality_ignored(self, head_client, user_trees):
+        """A malformed q-value disables that encoding instead of failing"""
+        response = head_client.get(reverse('head:tree_data'), HTTP_ACCEPT_ENCODING='gzip;q=1.0.0')
+        assert response.status_code == 200
+        assert not response.has_header('Content-Encoding')
+
+
+class TestTreeRollups:
+    """Test the incrementally maintained analytics rollups"""
+
+    def rows(self):
+        from .models import TreeRollup
+        return sorted(
+            TreeRollup.objects.values_list('user_id', 'year', 'species_id', 'health_status',
+                                           'record_count', 'population', 'good_count', 'healthy_count', 'hectares')
+        )
+
+    @pytest.mark.django_db
+    def test_writes_match_rebuild(self, user_trees):
+        """Create, update and delete keep the rollups equal to a full rebuild"""
+        from .models import TreeRollup
+        assert [row[4:6] for row in self.rows()] == [(1, 40), (1, 60)]
+
+        tree = user_trees[0]
+        tree.population = 55
+        tree.save()
+        user_trees[1].health_status = 'poor'
+        user_trees[1].year = 2025
+        user_trees[1].save()
+        EndemicTree.objects.create(
+            species=tree.species, location=tree.location, population=5, year=2020,
+            health_status='good', good_count=5, hectares=0.5, user=tree.user
+        )
+        tree.delete()
+        incremental = self.rows()
+
+        TreeRollup.rebuild()
+        assert self.rows() == incremental
+        assert [row[3:6] for row in incremental] == [('good', 1, 5), ('poor', 1, 60)]
+
+    @pytest.mark.django_db
+    def test_cascade_delete_clears_rollups(self, user_trees):
+        """Deleting a location removes the rollups of its trees"""
+        user_trees[0].location.delete()
+        assert [row[5] for row in self.rows()] == [60]
+
+    @pytest.mark.django_db
+    def test_locations_share_a_row(self, user_trees):
+        """Trees of one species, year and status at different locations sum into one row"""
+        from .models import TreeRollup
+        tree = user_trees[0]
+        other = Location.objects.create(name='Valencia', latitude=9.28, longitude=123.24, user=tree.user)
+        EndemicTree.objects.create(
+            species=tree.species, location=other, population=15, year=tree.year,
+            health_status=tree.health_status, hectares=1.0, user=tree.user
+        )
+        assert [row[4:6] for row in self.rows()] == [(2, 55), (1, 60)]
+
+        third = Location.objects.create(name='Sibulan', latitude=9.35, longitude=123.28, user=tree.user)
+        added = EndemicTree.objects.bulk_create([
+            EndemicTree(species=tree.species, location=tree.location, population=7, year=2010,
+                        health_status='good', hectares=1.0, user=tree.user),
+            EndemicTree(species=tree.species, location=third, population=3, year=tree.year,
+                        health_status=tree.health_status, hectares=1.0, user=tree.user),
+        ])
+        TreeRollup.add(added)
+        incremental = self.rows()
+        TreeRollup.rebuild()
+        assert self.rows() == incremental
+        assert [row[4:6] for row in incremental] == [(1, 7), (3, 58), (1, 60)]
+
+    @pytest.mark.django_db
+    def test_bulk_delete_rebuilds_once(self, user_trees, monkeypatch):
+        """A bulk write skips the per-tree adjustments and rebuilds the rollups at the end"""
+        from .models import TreeRollup, bulk_write
+        adjusted = []
+        monkeypatch.setattr(TreeRollup, 'adjust', classmethod(lambda cls, *args: adjusted.append(args)))
+        with bulk_write(user_trees[0].user):
+            EndemicTree.objects.filter(pk=user_trees[0].pk).delete()
+        assert adjusted == []
+        assert [row[5] for row in self.rows()] == [60]
+
+    @pytest.mark.django_db
+    def test_rebuild_command(self, user_trees):
+        """The command restores rollups written around the signals"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import TreeRollup
+        expected = self.rows()
+        TreeRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', '--user', 'testuser', stdout=out)
+        assert 'Rebuilt 2 rollup rows' in out.getvalue()
+        assert self.rows() == expected
+
+    @pytest.mark.django_db
+    def test_analytics_read_rollups(self, authenticated_client, user_trees):
+        """Analytics totals follow the rollup rows"""
+        data = authenticated_client.get(reverse('app:analytics_data')).json()
+        assert data['population_by_year'] == [{'year': 2023, 'total': 40}, {'year': 2024, 'total': 60}]
+        assert data['species_richness_by_year'] == [{'year': 2023, 'richness': 1}, {'year': 2024, 'richness': 1}]
+        assert sum(item['count'] for item in data['health_status_data']) == 2
+        assert data['population_by_family'][0]['total'] == 100
+
+        response = authenticated_client.get(reverse('app:analytics'))
+        genus = json.loads(response.context['genus_data'])[0]
+        assert genus['total_population'] == 100
+        assert genus['family__name'] == user_trees[0].species.genus.family.name
+        assert json.loads(response.context['location_data'])[0]['total_trees'] == 60
+
+        report = job_result(authenticated_client, authenticated_client.post(reverse('app:generate_report'), {'report_type': 'population_trends'}))
+        assert report['yearData'] == [{'year': 2023, 'count': 1, 'population': 40}, {'year': 2024, 'count': 1, 'population': 60}]
+        location = str(user_trees[0].location_id)
+        report = job_result(authenticated_client, authenticated_client.post(reverse('app:generate_report'), {'report_type': 'population_trends', 'location_filter': location}))
+        assert report['yearData'] == [{'year': 2023, 'count': 1, 'population': 40}]
+
+
+class TestAnalyticsSnapshot:
+    """Test the global analytics snapshot behind the head analytics pages"""
+
+    @pytest.mark.django_db
+    def test_head_analytics_reads_snapshot(self, head_client, user_trees):
+        """The page shows the snapshot figures and when they were built"""
+        response = head_client.get(reverse('head:analytics'))
+        assert json.loads(response.context['population_data']) == [
+            {'year': 2023, 'total': 40}, {'year': 2024, 'total': 60}
+        ]
+        assert response.context['snapshot_built_at'] is not None
+        assert b'figures as of' in response.content
+
+    @pytest.mark.django_db
+    def test_stale_snapshot_refreshed_after_interval(self, head_client, user_trees, monkeypatch):
+        """Writes mark the snapshot stale; it is rebuilt once the interval passes"""
+        from . import snapshot
+        assert snapshot.current_snapshot().data['report']['total_population'] == 100
+
+        user_trees[0].population = 140
+        user_trees[0].save()
+        assert snapshot.is_stale(snapshot.current_snapshot())
+        assert snapshot.current_snapshot().data['report']['total_population'] == 100
+
+        monkeypatch.setattr(snapshot, 'REFRESH_INTERVAL', 0)
+        refreshed = snapshot.current_snapshot()
+        assert not snapshot.is_stale(refreshed)
+        assert refreshed.data['report']['total_population'] == 200
+
+    @pytest.mark.django_db
+    def test_head_report_statistics(self, head_client, user_trees):
+        """Unfiltered reports use the snapshot, filtered ones the matching rollups"""
+        url = reverse('head:generate_report')
+        report = job_result(head_client, head_client.post(url, {'report_type': 'population_trends'}))
+        assert 'Statistics as of' in report['reportContent']
+        assert [item['population'] for item in report['yearData']] == [40, 60]
+
+        location = str(user_trees[1].location_id)
+        report = job_result(head_client, head_client.post(url, {'report_type': 'population_trends', 'location_filter': location}))
+        assert 'Statistics as of' not in report['reportContent']
+        assert [item['population'] for item in report['yearData']] == [60]
+
+    @pytest.mark.django_db
+    def test_refresh_command(self, user_trees):
+        """The command rebuilds the snapshot on demand"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import AnalyticsSnapshot
+        out = StringIO()
+        call_command('refresh_analytics_snapshot', stdout=out)
+        assert '2 tree records' in out.getvalue()
+        assert AnalyticsSnapshot.objects.get().data['report']['unique_users'] == 1
+
+
+class TestTreeStatistics:
+    """Test the shared single-pass tree statistics service"""
+
+    @pytest.mark.django_db
+    def test_statistics(self, test_user, user_trees):
+        """Totals, health breakdown and series come out of the rollups"""
+        from .stats import compute_tree_statistics
+        stats = compute_tree_statistics(test_user)
+        assert stats['total_trees'] == 2
+        assert stats['total_population'] == 100
+        assert stats['health_percentage'] == 100
+        assert stats['locations_recorded'] == 2
+        assert [(item['health_status'], item['count'], item['population']) for item in stats['health_distribution']] == [
+            ('excellent', 1, 60), ('good', 1, 40)
+        ]
+        assert stats['population_by_year'] == [
+            {'year': 2023, 'count': 1, 'population': 40}, {'year': 2024, 'count': 1, 'population': 60}
+        ]
+        assert stats['top_species'][0]['total_population'] == 100
+
+    @pytest.mark.django_db
+    def test_cached_per_version(self, test_user, user_trees, django_assert_num_queries):
+        """Repeat calls hit the cache until a write bumps the dataset version"""
+        from .stats import tree_statistics
+        assert tree_statistics(test_user)['total_population'] == 100
+        with django_assert_num_queries(1):
+            tree_statistics(test_user)
+        user_trees[0].population = 10
+        user_trees[0].save()
+        assert tree_statistics(test_user)['total_population'] == 70
+
+    @pytest.mark.django_db
+    def test_dashboard_and_head_feed(self, authenticated_client, head_client, user_trees):
+        """The dashboard and the head analytics feed show the same figures"""
+        response = authenticated_client.get(reverse('app:dashboard'))
+        assert response.context['tree_population'] == 100
+        assert response.context['total_trees'] == 2
+        data = head_client.get(reverse('head:analytics_data')).json()
+        assert data['total_population'] == 100
+        assert data['total_trees'] == 2
+
+
+class TestBiodiversity:
+    """Test the vectorized biodiversity indices"""
+
+    def test_indices(self):
+        """Known values for even and single-species communities"""
+        import math
+        import numpy as np
+        from .biodiversity import beta_diversity, diversity_indices
+        richness, shannon, simpson, evenness = diversity_indices([[50, 50, 0], [10, 0, 0], [0, 0, 0]])
+        assert list(richness) == [2, 1, 0]
+        assert shannon[0] == pytest.approx(math.log(2))
+        assert list(simpson) == [pytest.approx(0.5), 0.0, 0.0]
+        assert list(evenness) == [pytest.approx(1.0), 0.0, 0.0]
+
+        # One year, two locations sharing no species
+        matrix = np.array([[[5, 0], [0, 7]]])
+        assert beta_diversity(matrix)[0] == pytest.approx(2.0)
+
+    @pytest.mark.django_db
+    def test_analytics_data_indices(self, authenticated_client, user_trees, tree_genus):
+        """analytics_data reports computed indices per year and location"""
+        other = TreeSpecies.objects.create(
+            scientific_name='Diospyros blancoi', common_name='Kamagong', genus=tree_genus,
+            conservation_status='Vulnerable', user=user_trees[0].user
+        )
+        EndemicTree.objects.create(
+            species=other, location=user_trees[0].location, population=40, year=2023,
+            health_status='good', good_count=40, hectares=1.0, user=user_trees[0].user
+        )
+        data = authenticated_client.get(reverse('app:analytics_data')).json()
+        first_year = data['biodiversity_indices'][0]
+        assert first_year['year'] == 2023
+        assert first_year['richness'] == 2
+        assert first_year['shannon_index'] == pytest.approx(0.6931, abs=1e-4)
+        assert first_year['beta_diversity'] == pytest.approx(1.0)
+        assert data['biodiversity_indices'][1]['shannon_index'] == 0
+        assert data['species_richness_by_year'] == [{'year': 2023, 'richness': 2}, {'year': 2024, 'richness': 1}]
+        assert data['biodiversity_by_location'][0]['name'] == 'Dumaguete'
+        assert {item['status'] for item in data['conservation_status']} >= {'Vulnerable'}
+
+
+class TestGrowthRates:
+    """Test growth rates, moving averages and CAGR per species and location"""
+
+    @pytest.mark.django_db
+    def test_species_growth(self, authenticated_client, user_trees):
+        """The species series carries year-over-year growth and its CAGR"""
+        data = authenticated_client.get(reverse('app:growth_rates')).json()
+        assert data['dimension'] == 'species'
+        assert [(row['year'], row['population'], row['growth_rate']) for row in data['series']] == [
+            (2023, 40, None), (2024, 60, 50.0)
+        ]
+        assert data['series'][1]['moving_average'] == 50.0
+        summary = data['summary'][0]
+        assert summary['name'] == user_trees[0].species.common_name
+        assert summary['cagr'] == 50.0
+        assert summary['trend'] == 'growing'
+
+    @pytest.mark.django_db
+    def test_declining_locations(self, authenticated_client, user_trees, test_user):
+        """trend=declining keeps only the series that lost population"""
+        EndemicTree.objects.create(
+            species=user_trees[0].species, location=user_trees[0].location, population=10, year=2025,
+            health_status='bad', bad_count=10, hectares=1.0, user=test_user
+        )
+        data = authenticated_client.get(
+            reverse('app:growth_rates'), {'dimension': 'location', 'trend': 'declining'}
+        ).json()
+        assert [item['name'] for item in data['summary']] == ['Dumaguete']
+        assert data['summary'][0]['cagr'] == -50.0
+        assert {row['name'] for row in data['series']} == {'Dumaguete'}
+
+    @pytest.mark.django_db
+    def test_filters_and_errors(self, authenticated_client, head_client, user_trees):
+        """Tree filters narrow the series; bad parameters are rejected"""
+        url = reverse('app:growth_rates')
+        data = authenticated_client.get(url, {'dimension': 'total', 'year_min': 2024}).json()
+        assert [row['year'] for row in data['series']] == [2024]
+        assert data['filters'] == {'year_min': '2024'}
+        assert authenticated_client.get(url, {'dimension': 'genus'}).status_code == 400
+        assert authenticated_client.get(url, {'window': 0}).status_code == 400
+
+        head_data = head_client.get(reverse('head:growth_rates'), {'dimension': 'family'}).json()
+        assert head_data['summary'][0]['cagr'] == 50.0
+
+    @pytest.mark.django_db
+    def test_analytics_growth_rate_by_year(self, authenticated_client, user_trees):
+        """The analytics feed keeps its total growth series"""
+        data = authenticated_client.get(reverse('app:analytics_data')).json()
+        assert data['growth_rate_by_year'] == [{'year': 2024, 'growth_rate': 50.0}]
+
+
+class TestPopulationForecast:
+    """Test batched per-species population projections"""
+
+    @pytest.fixture
+    def yearly_trees(self, user_trees, test_user):
+        """A third year for the species: 40, 60, 80 over 2023-2025"""
+        EndemicTree.objects.create(
+            species=user_trees[0].species, location=user_trees[0].location, population=80, year=2025,
+            health_status='good', good_count=80, hectares=1.0, user=test_user
+        )
+        return user_trees
+
+    def test_fit_trends_matches_least_squares(self):
+        """Every row is fitted at once, ignoring the years it was not recorded"""
+        import numpy as np
+        from .forecast import fit_trends
+        years = np.array([2020, 2021, 2022, 2023])
+        matrix = np.array([[100, np.nan, 80, 70], [10, 20, 40, 80]], dtype=float)
+        fit = fit_trends(years, matrix)
+        expected = np.polyfit([2020, 2022, 2023], [100, 80, 70], 1)
+        assert fit['slope'][0] == pytest.approx(expected[0])
+        assert fit['n'].tolist() == [3, 4]
+        log_fit = fit_trends(years, matrix, 'log_linear')
+        assert np.exp(log_fit['slope'][1]) == pytest.approx(2.0)
+
+    @pytest.mark.django_db
+    def test_forecast_endpoint(self, authenticated_client, yearly_trees):
+        """A perfectly linear series projects exactly, with a zero-width band"""
+        data = authenticated_client.get(reverse('app:population_forecast'), {'years': 2}).json()
+        species = data['species'][0]
+        assert species['annual_change'] == 20.0
+        assert species['forecast'] == [
+            {'year': 2026, 'population': 100.0, 'lower': 100.0, 'upper': 100.0},
+            {'year': 2027, 'population': 120.0, 'lower': 120.0, 'upper': 120.0},
+        ]
+        assert data['total']['last_population'] == 80
+
+        log_data = authenticated_client.get(reverse('app:population_forecast'), {'model': 'log_linear'}).json()
+        assert log_data['species'][0]['forecast'][0]['population'] > 80
+        assert authenticated_client.get(reverse('app:population_forecast'), {'years': 50}).status_code == 400
+
+    @pytest.mark.django_db
+    def test_two_years_have_no_band(self, head_client, user_trees):
+        """Two recorded years give a projection but no prediction band"""
+        data = head_client.get(reverse('head:population_forecast'), {'years': 1}).json()
+        assert data['total']['forecast'] == [{'year': 2025, 'population': 80.0, 'lower': None, 'upper': None}]
+
+    @pytest.mark.django_db
+    def test_analytics_and_report(self, authenticated_client, yearly_trees):
+        """The analytics page and trend reports include the projection"""
+        response = authenticated_client.get(reverse('app:analytics'))
+        assert json.loads(response.context['forecast_data'])['forecast'][0]['population'] == 100.0
+        report = job_result(authenticated_client, authenticated_client.post(
+            reverse('app:generate_report'), {'report_type': 'population_trends'}
+        ))
+        assert 'Population Forecast' in report['reportContent']
+
+
+class TestSeedCohorts:
+    """Test germination and survival analytics of seed plantings"""
+
+    @pytest.fixture
+    def plantings(self, user_trees, test_user):
+        species = user_trees[0].species
+        near, far = user_trees[0].location, user_trees[1].location
+        return [
+            TreeSeed.objects.create(
+                species=species, location=near, quantity=100, planting_date=date(2025, 1, 10),
+                germination_status='fully_germinated', germination_date=date(2025, 1, 20),
+                survival_rate=80, expected_maturity_date=date(2030, 1, 1), hectares=1.0, user=test_user
+            ),
+            TreeSeed.objects.create(
+                species=species, location=far, quantity=50, planting_date=date(2025, 2, 5),
+                germination_status='failed', survival_rate=0, hectares=1.0, user=test_user
+            ),
+            TreeSeed.objects.create(
+                species=species, location=near, quantity=50, planting_date=date(2025, 2, 15),
+                germination_status='partially_germinated', germination_date=date(2025, 3, 17),
+                hectares=1.0, user=test_user
+            ),
+        ]
+
+    @pytest.mark.django_db
+    def test_cohort_tables(self, authenticated_client, plantings):
+        """Germination, quantity-weighted survival, lag and maturity per cohort"""
+        data = authenticated_client.get(reverse('app:seed_cohorts')).json()
+        summary = data['summary']
+        assert (summary['plantings'], summary['seeds'], summary['germinated_plantings']) == (3, 200, 2)
+        assert summary['germination_rate'] == 66.67
+        # 80 surviving out of the 150 seeds whose survival was assessed
+        assert summary['survival_rate'] == 53.33
+
+        lag = data['germination_lag']
+        assert lag['observed'] == 2
+        assert lag['quartiles']['median'] == 20.0
+        assert {row['bin']: row['seeds'] for row in lag['histogram'] if row['plantings']} == {'8-14': 100, '15-30': 50}
+
+        assert [row['planting_month'] for row in data['by_planting_month']] == ['2025-01', '2025-02']
+        assert {row['location']: row['survival_rate'] for row in data['by_location']} == {
+            'Dumaguete': 80.0, 'Baguio': 0.0
+        }
+        assert data['maturity_timeline'] == [
+            {'year': 2030, 'plantings': 1, 'seeds': 100, 'surviving_seeds': 80, 'matured_plantings': 0}
+        ]
+
+    @pytest.mark.django_db
+    def test_filters(self, authenticated_client, head_client, plantings):
+        """Cohorts can be narrowed by location and planting date"""
+        url = reverse('app:seed_cohorts')
+        data = authenticated_client.get(url, {'planted_from': '2025-02-01'}).json()
+        assert data['summary']['plantings'] == 2
+        data = authenticated_client.get(url, {'location': plantings[1].location_id}).json()
+        assert data['summary']['failed_plantings'] == 1
+        assert authenticated_client.get(url, {'planted_to': 'soon'}).status_code == 400
+
+        head_data = head_client.get(reverse('head:seed_cohorts')).json()
+        assert head_data['summary']['seeds'] == 200
+
+    @pytest.mark.django_db
+    def test_new_planting_refreshes_cohorts(self, authenticated_client, plantings):
+        """A new planting is reflected in the cached cohorts and analytics feed"""
+        url = reverse('app:seed_cohorts')
+        assert authenticated_client.get(url).json()['summary']['plantings'] == 3
+        TreeSeed.objects.create(
+            species=plantings[0].species, location=plantings[0].location, quantity=10,
+            hectares=1.0, user=plantings[0].user
+        )
+        assert authenticated_client.get(url).json()['summary']['plantings'] == 4
+        feed = authenticated_client.get(reverse('app:analytics_data')).json()
+        assert feed['seed_summary']['seeds'] == 210
+
+    @pytest.mark.django_db
+    def test_maturity_rolls_over_with_the_date(self, authenticated_client, plantings, monkeypatch):
+        """Cached cohorts are not reused once the date passes a maturity date"""
+        from . import cohorts
+        url = reverse('app:seed_cohorts')
+        assert authenticated_client.get(url).json()['maturity_timeline'][0]['matured_plantings'] == 0
+        monkeypatch.setattr(cohorts.timezone, 'localdate', lambda: date(2030, 6, 1))
+        assert authenticated_client.get(url).json()['maturity_timeline'][0]['matured_plantings'] == 1
+
+
+def slow_job(job):
+    """Job handler that outlasts a few heartbeats without reporting progress"""
+    import time
+    time.sleep(0.5)
+    return {}
+
+
+class TestJobQueue:
+    """Test the background job queue and the views that use it"""
+
+    CSV = (
+        'common_name,scientific_name,family,genus,population,hectares,latitude,longitude,year\n'
+        'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,10,1.5,10.1,123.1,2023\n'
+        'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,20,2.0,10.2,123.2,2024\n'
+        'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,30,,10.3,123.3,2024\n'
+    )
+
+    def upload(self, client):
+        csv_file = SimpleUploadedFile('trees.csv', self.CSV.encode(), content_type='text/csv')
+        return client.post(reverse('app:upload'), {'submit_csv': '1', 'csv_file': csv_file})
+
+    @pytest.mark.django_db
+    def test_csv_upload_queued_and_imported(self, authenticated_client, test_user):
+        """The upload returns before importing; the worker imports the rows"""
+        from .jobs import work
+        from .models import Job
+        response = self.upload(authenticated_client)
+        assert response.status_code == 302
+        job = Job.objects.get(user=test_user)
+        assert job.kind == 'import_trees' and job.status == 'queued'
+        assert not EndemicTree.objects.exists()
+
+        assert work(once=True) == 1
+        assert EndemicTree.objects.filter(user=test_user).count() == 2
+        status = authenticated_client.get(reverse('app:job_status', args=[job.id])).json()
+        assert status['status'] == 'succeeded' and status['progress'] == 100
+        assert status['result']['imported'] == 2
+        assert status['result']['errors'] == 1
+        assert 'hectares' in status['result']['error_messages'][0]
+        # The uploaded file is dropped once imported
+        job.refresh_from_db()
+        assert job.data is None
+
+        listed = authenticated_client.get(reverse('app:job_list'), {'kind': 'import_trees'}).json()
+        assert [item['id'] for item in listed['jobs']] == [str(job.id)]
+
+    @pytest.mark.django_db
+    def test_import_resumes_from_checkpoint(self, test_user, monkeypatch):
+        """A retried import skips the rows of the chunks already committed"""
+        from . import imports
+        from .jobs import enqueue, work
+        monkeypatch.setattr(imports, 'CHUNK_SIZE', 1)
+        job = enqueue('import_trees', user=test_user, data=self.CSV.encode())
+        job.result = {'next_row': 1, 'imported': 1, 'errors': 0, 'error_messages': []}
+        job.save()
+
+        work(once=True)
+        job.refresh_from_db()
+        assert job.result == {'imported': 2, 'errors': 1, 'error_messages': job.result['error_messages'], 'rows': 3}
+        assert list(EndemicTree.objects.values_list('population', flat=True)) == [20]
+
+    @pytest.mark.django_db
+    def test_failed_job_retried_then_failed(self, authenticated_client, test_user):
+        """A failing job is retried with backoff until it runs out of attempts"""
+        from django.utils import timezone
+        from .jobs import enqueue, work
+        from .models import Job
+        # No input file makes the import raise
+        job = enqueue('import_trees', user=test_user, max_attempts=2)
+
+        work(once=True)
+        job.refresh_from_db()
+        assert job.status == 'queued' and job.attempts == 1
+        assert job.run_after > timezone.now()
+        assert work(once=True) == 0
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        work(once=True)
+        job.refresh_from_db()
+        assert job.status == 'failed' and job.attempts == 2
+        assert 'Traceback' in job.error
+        status = authenticated_client.get(reverse('app:job_status', args=[job.id])).json()
+        assert status['error'].startswith('TypeError')
+
+    @pytest.mark.django_db
+    def test_stale_job_requeued(self, test_user):
+        """A job whose worker stopped reporting is queued again"""
+        from django.utils import timezone
+        from .jobs import STALE_AFTER, claim_job, requeue_stale_jobs
+        from .jobs import enqueue
+        job = enqueue('delete_all_trees', user=test_user)
+        claimed = claim_job('worker-1')
+        assert claimed.pk == job.pk and claimed.locked_by == 'worker-1'
+        assert claim_job('worker-2') is None
+
+        type(job).objects.filter(pk=job.pk).update(locked_at=timezone.now() - STALE_AFTER * 2)
+        assert requeue_stale_jobs() == 1
+        assert claim_job('worker-2').attempts == 2
+
+    @pytest.mark.django_db
+    def test_heartbeat_keeps_running_job_fresh(self, test_user, monkeypatch):
+        """A handler that never reports progress still refreshes the lock"""
+        from django.utils import timezone
+        from . import jobs
+        monkeypatch.setitem(jobs.HANDLERS, 'delete_all_trees', 'app.tests.slow_job')
+        monkeypatch.setattr(jobs, 'HEARTBEAT_INTERVAL', 0.05)
+        beats = []
+        # The heartbeat thread cannot reach the test database's connection
+        monkeypatch.setattr(jobs, 'refresh_lock', beats.append)
+        jobs.enqueue('delete_all_trees', user=test_user)
+        claimed = jobs.claim_job('worker-1')
+
+        assert jobs.run_job(claimed).status == 'succeeded'
+        assert len(beats) >= 3
+        count = len(beats)
+        import time
+        time.sleep(0.2)
+        assert len(beats) == count
+
+        # The refresh itself only touches the lock the worker still holds
+        job = jobs.enqueue('delete_all_trees', user=test_user)
+        claimed = jobs.claim_job('worker-1')
+        type(job).objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.STALE_AFTER * 2)
+        monkeypatch.undo()
+        assert jobs.refresh_lock(claimed) == 1
+        assert jobs.requeue_stale_jobs() == 0
+
+    @pytest.mark.django_db
+    def test_job_status_owner_only(self, authenticated_client, head_client):
+        """Jobs are only visible to the user who queued them"""
+        from .jobs import enqueue
+        job = enqueue('delete_all_trees', user=User.objects.get(username='headuser'))
+        assert authenticated_client.get(reverse('app:job_status', args=[job.id])).status_code == 404
+        assert head_client.get(reverse('app:job_status', args=[job.id])).json()['status'] == 'queued'
+        with pytest.raises(ValueError):
+            enqueue('unknown')
+
+    @pytest.mark.django_db
+    def test_delete_all_trees_job(self, authenticated_client, user_trees):
+        """Deleting all trees is queued and reports the deleted count"""
+        from .models import DatasetVersion
+        scopes = (DatasetVersion.scope_for(user_trees[0].user), DatasetVersion.GLOBAL_SCOPE)
+        before = DatasetVersion.current(*scopes)
+        response = authenticated_client.post(reverse('app:delete_all_trees'))
+        assert EndemicTree.objects.count() == 2
+        assert job_result(authenticated_client, response) == {'deleted_count': 2}
+        assert not EndemicTree.objects.exists()
+        assert not Location.objects.exists()
+        # One bump for the whole delete, not one per tree, location and species
+        assert DatasetVersion.current(*scopes) == tuple(version + 1 for version in before)
+
+    @pytest.mark.django_db
+    def test_run_worker_command(self, test_user):
+        """The command runs the due jobs and exits with --once"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .jobs import enqueue
+        job = enqueue('delete_all_trees', user=test_user)
+        out = StringIO()
+        call_command('run_worker', '--once', stdout=out)
+        job.refresh_from_db()
+        assert job.status == 'succeeded'
+        assert '1 job' in out.getvalue()
+
+
+class TestBulkTreeImport:
+    """Test the set-based CSV import"""
+
+    HEADER = 'common_name,scientific_name,family,genus,population,hectares,latitude,longitude,year,health_status\n'
+
+    def frame(self, lines):
+        from .imports import read_trees_csv
+        return read_trees_csv((self.HEADER + ''.join(lines)).encode())
+
+    @pytest.mark.django_db
+    def test_rows_resolved_and_inserted_in_bulk(self, test_user, user_trees):
+        """Existing taxonomy and locations are reused, missing ones created once"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .geohash import encode_geohash
+        from .imports import import_trees
+        from .models import DatasetVersion, TreeRollup
+        version = DatasetVersion.current(DatasetVersion.scope_for(test_user))
+        with CaptureQueriesContext(connection) as small:
+            import_trees(test_user, self.frame([
+                'Philippine Ebony,Diospyros philippinensis,Ebenaceae,Diospyros,70,1.0,9.3,123.3,2025,good\n',
+                'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,10,1.0,11.0,124.0,2025,poor\n',
+            ]))
+        lines = [
+            f'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,{year},1.0,{11 + year % 3},124.0,{year},good\n'
+            for year in range(2000, 2020)
+        ]
+        with CaptureQueriesContext(connection) as large:
+            imported, errors = import_trees(test_user, self.frame(lines))
+        assert (imported, errors) == (20, [])
+        # The query count does not grow with the rows
+        assert len(large) <= len(small)
+
+        assert TreeSpecies.objects.filter(user=test_user).count() == 2
+        assert TreeFamily.objects.filter(user=test_user, name='Fabaceae').count() == 1
+        assert Location.objects.filter(user=test_user).count() == 5
+        assert EndemicTree.objects.get(year=2025, population=70).location == user_trees[0].location
+        for location in Location.objects.filter(user=test_user):
+            assert location.geohash == encode_geohash(location.latitude, location.longitude)
+
+        rollups = sorted(TreeRollup.objects.filter(user=test_user).values_list(*TreeRollup.KEY_FIELDS, 'population'))
+        TreeRollup.rebuild(test_user)
+        assert rollups == sorted(TreeRollup.objects.filter(user=test_user).values_list(*TreeRollup.KEY_FIELDS, 'population'))
+        assert DatasetVersion.current(DatasetVersion.scope_for(test_user))[0] > version[0]
+
+    @pytest.mark.django_db
+    def test_tiles_pruned_after_commit(self, test_user, monkeypatch, django_capture_on_commit_callbacks):
+        """Stale tiles are only removed once the chunk's transaction commits"""
+        from . import tiles
+        from .imports import import_trees
+        pruned = []
+        monkeypatch.setattr(tiles, '_prune_scopes', pruned.append)
+        with django_capture_on_commit_callbacks() as callbacks:
+            import_trees(test_user, self.frame([
+                'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,10,1.0,11.0,124.0,2025,good\n',
+            ]))
+            assert pruned == []
+        for callback in callbacks:
+            callback()
+        assert pruned == [{'all', f'user-{test_user.pk}'}]
+
+    @pytest.mark.django_db
+    def test_bad_and_duplicate_rows_rejected(self, test_user, user_trees):
+        """Invalid rows and rows clashing with a record or an earlier row are reported"""
+        from .imports import import_trees
+        imported, errors = import_trees(test_user, self.frame([
+            'Philippine Ebony,Diospyros philippinensis,Ebenaceae,Diospyros,70,1.0,9.3,123.3,2023,good\n',
+            'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,10,1.0,11.0,124.0,2025,good\n',
+            'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,12,1.0,11.0,124.0,2025,good\n',
+            'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,many,1.0,11.0,124.0,2026,good\n',
+            'Narra,Pterocarpus indicus,Fabaceae,Pterocarpus,10,-1,11.0,124.0,2027,good\n',
+            ',Pterocarpus indicus,Fabaceae,Pterocarpus,10,1.0,11.0,124.0,2028,\n',
+        ]))
+        assert imported == 1
+        assert errors == [
+            'Row 1: a record for this species, location and year already exists',
+            "Row 3: repeats an earlier row's species, location and year",
+            'Row 4: invalid population value',
+            'Row 5: hectares must be non-negative',
+            'Row 6: common_name is required',
+        ]
+        assert EndemicTree.objects.get(year=2025).population == 10
+        assert EndemicTree.objects.get(year=2023).population == 40
+
+
+class TestAnalyticsCache:
+    """Test the analytics payload cache and its write-driven invalidation"""
+
+    @pytest.mark.django_db
+    def test_hits_misses_and_invalidation(self, test_user, user_trees):
+        """Writes to trees or taxonomy bump the scope's dataset version"""
+        from .analytics_cache import cache_statistics, cached_analytics
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {'value': len(calls)}
+
+        scope = f'user-{test_user.pk}'
+        assert cached_analytics('analytics', scope, compute) == {'value': 1}
+        assert cached_analytics('analytics', scope, compute) == {'value': 1}
+        assert cached_analytics('analytics', scope, compute, params={'species': 1}) == {'value': 2}
+
+        user_trees[0].species.description = 'Edited'
+        user_trees[0].species.save()
+        assert cached_analytics('analytics', scope, compute) == {'value': 3}
+        assert cached_analytics('analytics', 'all', compute) == {'value': 4}
+
+        stats = cache_statistics()['kinds']['analytics']
+        assert (stats['hits'], stats['misses']) == (1, 4)
+        assert stats['hit_rate'] == 0.2
+
+    @pytest.mark.django_db
+    def test_unchanged_analytics_page_skips_aggregates(self, authenticated_client, user_trees, django_assert_max_num_queries):
+        """Reopening the analytics page only costs the session, user and theme lookups and one version lookup per payload"""
+        url = reverse('app:analytics')
+        first = authenticated_client.get(url)
+        with django_assert_max_num_queries(5):
+            second = authenticated_client.get(url)
+        assert second.context['population_data'] == first.context['population_data']
+
+        user_trees[0].population = 90
+        user_trees[0].save()
+        data = json.loads(authenticated_client.get(url).context['population_data'])
+        assert data[0]['total'] == 90
+
+    @pytest.mark.django_db
+    def test_head_cache_stats_endpoint(self, head_client, authenticated_client, user_trees):
+        """Head users can read the hit and miss counters"""
+        authenticated_client.get(reverse('app:analytics_data'))
+        data = head_client.get(reverse('head:analytics_cache_stats')).json()
+        assert data['backend'] == 'LocMemCache'
+        assert data['kinds']['analytics-data']['misses'] == 1
+        assert data['misses'] >= 1
+
+
 class TestSeedDataAPI:
     """Test seed data API endpoint"""
 
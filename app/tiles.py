@@ -0,0 +1,341 @@
+"""
+Mapbox Vector Tile (MVT) encoding of the tree and seed points.
+
+Tiles are addressed with the usual web-mercator ``z/x/y`` scheme.  Only point
+geometries are needed, so the protobuf encoding is written out by hand rather
+than pulling in a vector tile library.  Encoded tiles are cached on disk per
+data scope (one user, or ``all`` for the head app) and dataset version, as
+``<scope>/<version>/<kind>/z/x/y.pbf``.  The version is read before the tile's
+records, so a write always moves readers to a new directory and a build that
+raced with it can only leave its tile under the old version.  Directories of
+superseded versions are pruned after each write commits (see the signals in
+``models.py``).
+"""
+import math
+import os
+import shutil
+import struct
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+
+from .spatial import bbox_q
+
+
+EXTENT = 4096
+
+# Extra margin (in tile pixels) queried around each tile so markers drawn
+# across a tile edge are not clipped by the renderer.
+BUFFER = 64
+
+MAX_TILE_ZOOM = 22
+
+CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# Browsers may reuse a tile this long (seconds) before asking again
+BROWSER_MAX_AGE = 60
+
+TILE_KINDS = ('trees', 'seeds')
+
+TREE_TILE_FIELDS = (
+    'id', 'location__latitude', 'location__longitude',
+    'species_id', 'population', 'health_status', 'year',
+)
+SEED_TILE_FIELDS = (
+    'id', 'location__latitude', 'location__longitude',
+    'species_id', 'quantity', 'germination_status', 'planting_date',
+)
+
+# Web mercator cannot represent the poles
+MAX_LATITUDE = 85.0511287798
+
+
+# ---------------------------------------------------------------------------
+# Tile geometry
+# ---------------------------------------------------------------------------
+
+def valid_tile(z, x, y):
+    """Return True when ``z/x/y`` addresses an existing tile."""
+    if not 0 <= z <= MAX_TILE_ZOOM:
+        return False
+    size = 2 ** z
+    return 0 <= x < size and 0 <= y < size
+
+
+def _tile_x(lng, z):
+    return (lng + 180.0) / 360.0 * (2 ** z)
+
+
+def _tile_y(lat, z):
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    lat_rad = math.radians(lat)
+    return (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * (2 ** z)
+
+
+def _tile_lng(x, z):
+    return x / (2 ** z) * 360.0 - 180.0
+
+
+def _tile_lat(y, z):
+    n = math.pi - 2.0 * math.pi * y / (2 ** z)
+    return math.degrees(math.atan(math.sinh(n)))
+
+
+def tile_bbox(z, x, y, buffer=BUFFER):
+    """Return the ``(west, south, east, north)`` bounds of a tile plus buffer."""
+    margin = buffer / EXTENT
+    west = max(-180.0, _tile_lng(x - margin, z))
+    east = min(180.0, _tile_lng(x + 1 + margin, z))
+    north = _tile_lat(max(0.0, y - margin), z)
+    south = _tile_lat(min(2 ** z, y + 1 + margin), z)
+    return west, south, east, north
+
+
+def project(lat, lng, z, x, y):
+    """Project a coordinate to integer pixel coordinates inside tile ``z/x/y``."""
+    px = int(round((_tile_x(lng, z) - x) * EXTENT))
+    py = int(round((_tile_y(lat, z) - y) * EXTENT))
+    return px, py
+
+
+# ---------------------------------------------------------------------------
+# Protobuf encoding (vector_tile.proto, version 2)
+# ---------------------------------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _length_delimited(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field, values):
+    return _length_delimited(field, b''.join(_varint(value) for value in values))
+
+
+def _encode_value(value):
+    """Encode a property value as a ``Tile.Value`` message."""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _key(5, 0) + _varint(value)
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+def encode_layer(name, features):
+    """
+    Encode one layer.
+
+    ``features`` is an iterable of ``((px, py), properties)`` pairs in tile
+    pixel coordinates.
+    """
+    keys, key_index = [], {}
+    values, value_index = [], {}
+    encoded_features = []
+
+    for (px, py), properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            value_key = (type(value).__name__, value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags.extend((key_index[key], value_index[value_key]))
+
+        # MoveTo(1) with a single point, relative to the tile origin
+        geometry = (9, _zigzag(px), _zigzag(py))
+        feature = _packed(2, tags) + _key(3, 0) + _varint(1) + _packed(4, geometry)
+        encoded_features.append(_length_delimited(2, feature))
+
+    layer = bytearray()
+    layer += _key(15, 0) + _varint(2)
+    layer += _length_delimited(1, name.encode('utf-8'))
+    for feature in encoded_features:
+        layer += feature
+    for key in keys:
+        layer += _length_delimited(3, key.encode('utf-8'))
+    for value in values:
+        layer += _length_delimited(4, _encode_value(value))
+    layer += _key(5, 0) + _varint(EXTENT)
+    return bytes(layer)
+
+
+def encode_tile(layers):
+    """Encode ``{layer_name: features}`` into a complete tile."""
+    return b''.join(
+        _length_delimited(3, encode_layer(name, features))
+        for name, features in layers.items()
+    )
+
+
+# ---------------------------------------------------------------------------
+# Building tiles from querysets
+# ---------------------------------------------------------------------------
+
+def _tree_properties(row):
+    record_id, _, _, species_id, population, health_status, year = row
+    return {
+        'id': str(record_id),
+        'species_id': species_id,
+        'population': population,
+        'health_status': health_status,
+        'year': year,
+    }
+
+
+def _seed_properties(row):
+    record_id, _, _, species_id, quantity, germination_status, planting_date = row
+    return {
+        'id': str(record_id),
+        'species_id': species_id,
+        'quantity': quantity,
+        'germination_status': germination_status,
+        'year': planting_date.year if planting_date else None,
+    }
+
+
+def build_tile(queryset, kind, z, x, y):
+    """Query the records falling in tile ``z/x/y`` and encode them."""
+    if kind == 'trees':
+        fields, properties = TREE_TILE_FIELDS, _tree_properties
+    else:
+        fields, properties = SEED_TILE_FIELDS, _seed_properties
+
+    rows = queryset.filter(bbox_q(tile_bbox(z, x, y))).order_by().values_list(*fields)
+    features = [
+        (project(row[1], row[2], z, x, y), properties(row))
+        for row in rows
+    ]
+    return encode_tile({kind: features})
+
+
+# ---------------------------------------------------------------------------
+# On-disk cache
+# ---------------------------------------------------------------------------
+
+def tile_scope(user=None):
+    """Cache scope name for one user's data, or for all data when ``user`` is None."""
+    if user is None:
+        return 'all'
+    user_id = user.pk if hasattr(user, 'pk') else user
+    return f'user-{user_id}'
+
+
+def _cache_root():
+    return getattr(settings, 'TILE_CACHE_DIR', os.path.join(settings.BASE_DIR, 'tile_cache'))
+
+
+def _tile_path(scope, version, kind, z, x, y):
+    return os.path.join(_cache_root(), scope, str(version), kind, str(z), str(x), f'{y}.pbf')
+
+
+def _scope_version(scope):
+    from .models import DatasetVersion
+    return DatasetVersion.current(scope)[0]
+
+
+def get_tile(queryset, kind, scope, z, x, y):
+    """Return the encoded tile, reading it from or writing it to the disk cache."""
+    version = _scope_version(scope)
+    path = _tile_path(scope, version, kind, z, x, y)
+    try:
+        with open(path, 'rb') as tile_file:
+            return tile_file.read()
+    except OSError:
+        pass
+
+    data = build_tile(queryset, kind, z, x, y)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial tile
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not cache tile {scope}/{version}/{kind}/{z}/{x}/{y}: {e}")
+    return data
+
+
+def _tile_scopes(user=None):
+    """The owner's scope and the global (head) scope, both of which include its records"""
+    scopes = {tile_scope(None)}
+    if user is not None:
+        scopes.add(tile_scope(user))
+    return scopes
+
+
+def _prune_scopes(scopes):
+    for scope in scopes:
+        current = str(_scope_version(scope))
+        try:
+            versions = os.listdir(os.path.join(_cache_root(), scope))
+        except OSError:
+            continue
+        for version in versions:
+            if version != current:
+                shutil.rmtree(os.path.join(_cache_root(), scope, version), ignore_errors=True)
+
+
+def prune_tiles(user=None):
+    """
+    Remove cached tiles of superseded dataset versions for the owner's scope
+    and for the global (head) scope.
+    """
+    _prune_scopes(_tile_scopes(user))
+
+
+class _PendingPrune:
+    """Commit hook pruning every scope written during one transaction"""
+
+    def __init__(self):
+        self.scopes = set()
+
+    def __call__(self):
+        _prune_scopes(self.scopes)
+
+
+def prune_tiles_on_commit(user=None):
+    """
+    Prune the owner's and the head app's tiles once the current transaction
+    commits (right away outside one).  However many records the transaction
+    writes, it runs a single prune per scope.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        prune_tiles(user)
+        return
+    pending = getattr(connection, '_pending_tile_prune', None)
+    # A rollback or an earlier commit drops the hook from the queue
+    if pending is None or not any(entry[1] is pending for entry in connection.run_on_commit):
+        pending = _PendingPrune()
+        connection._pending_tile_prune = pending
+        transaction.on_commit(pending)
+    pending.scopes.update(_tile_scopes(user))
@@ -24,7 +24,17 @@ urlpatterns = [
     path('api/tree-data/', views.tree_data, name='tree_data'),
     path('api/seed-data/', views.seed_data, name='seed_data'),
     path('api/filter-trees/<int:species_id>/', views.filter_trees, name='filter_trees'),
+    path('api/tree-query/', views.query_trees, name='query_trees'),
+    path('api/tiles/<str:kind>/<int:z>/<int:x>/<int:y>.pbf', views.vector_tile, name='vector_tile'),
+    path('api/density/', views.tree_density, name='tree_density'),
+    path('api/area-stats/', views.area_stats, name='area_stats'),
+    path('api/nearby/', views.nearby_records, name='nearby_records'),
     path('api/analytics-data/', views.analytics_data, name='analytics_data'),
+    path('api/growth/', views.growth_rates, name='growth_rates'),
+    path('api/forecast/', views.population_forecast, name='population_forecast'),
+    path('api/seed-cohorts/', views.seed_cohorts_data, name='seed_cohorts'),
+    path('api/jobs/', views.job_list, name='job_list'),
+    path('api/jobs/<uuid:job_id>/', views.job_status, name='job_status'),
     # Map layer APIs
     path('api/layers/', views.api_layers, name='api_layers'),
     path('api/layers/<int:layer_id>/', views.api_layers_detail, name='api_layers_detail'),
@@ -0,0 +1,83 @@
+"""
+Conditional GET support for the JSON feeds.
+
+Every feed response carries an ETag derived from the dataset version of the
+data it shows (see ``DatasetVersion``).  A client repeating a request with
+``If-None-Match`` gets a ``304 Not Modified`` straight after one small
+version lookup, without running the feed's queries.  The compressed body of
+a response is cached under the same tag (see ``compression``), so a repeated
+request without a validator is answered from the stored bytes.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .compression import accepted_encoding, cache_params, cached_response, compress_response, normalized_query
+from .models import DatasetVersion
+
+
+def dataset_version(user=None):
+    """Current version number of one user's data, or of all data for None"""
+    return DatasetVersion.current(DatasetVersion.scope_for(user))[0]
+
+
+def feed_etag(request, scope):
+    """
+    Build the ETag for a feed request in ``scope``.
+
+    The tag changes with the scope's version and the pin style version, and
+    differs per user and per query string since both shape the payload.
+    """
+    version, style_version = DatasetVersion.current(scope, DatasetVersion.STYLE_SCOPE)
+    path = f'{request.path}?{normalized_query(request)}'
+    variant = hashlib.md5(f'{request.user.pk}:{path}'.encode('utf-8')).hexdigest()[:12]
+    return f'{scope}.{version}.{style_version}.{variant}'
+
+
+def versioned_feed(all_users=False):
+    """
+    Decorate a feed view to emit an ETag and answer ``If-None-Match`` with 304.
+
+    ``all_users`` selects the global (head) dataset version instead of the
+    requesting user's.  Responses may be stored by the browser but must be
+    revalidated, which is what makes the 304 path useful.
+
+    GET responses are compressed for clients accepting gzip (or Brotli); the
+    compressed body is cached under the ETag and query string, except for
+    ``since=`` deltas (see ``compression.cache_params``).
+    """
+    def etag_func(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return None
+        scope = DatasetVersion.scope_for(None if all_users else request.user)
+        request.feed_etag = feed_etag(request, scope)
+        return request.feed_etag
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def compressing_view(request, *args, **kwargs):
+            etag = getattr(request, 'feed_etag', None)
+            encoding = accepted_encoding(request) if request.method == 'GET' and etag else None
+            if encoding is None:
+                return view_func(request, *args, **kwargs)
+            params = cache_params(request)
+            response = cached_response(etag, encoding, params) if params is not None else None
+            if response is not None:
+                return response
+            return compress_response(view_func(request, *args, **kwargs), etag, encoding, params)
+
+        conditional_view = condition(etag_func=etag_func)(compressing_view)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if response.status_code not in (200, 304) and response.has_header('ETag'):
+                    # Never let clients revalidate against an error body
+                    del response['ETag']
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
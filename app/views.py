@@ -16,21 +16,47 @@ from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.core.serializers import serialize
 from django.db.models import Count, Sum, F, Q, Case, When, Value, IntegerField, Avg
+from django.db.models.functions import Coalesce, NullIf
 from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_protect
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 
 from .models import (
     EndemicTree, MapLayer, UserSetting, TreeFamily,
-    TreeGenus, TreeSpecies, Location, PinStyle, TreeSeed, UserProfile
+    TreeGenus, TreeSpecies, Location, PinStyle, TreeSeed, UserProfile,
+    DatasetVersion, TreeRollup, Job, bulk_write
 )
 from .forms import (
     EndemicTreeForm, CSVUploadForm, ThemeSettingsForm,
     PinStyleForm, LocationForm
 )
+from .spatial import filter_bbox, viewport_from_request
+from .clustering import wants_clusters, cluster_feature_collection
+from .versioning import versioned_feed
+from .sync import (
+    changed_since, deleted_since, resync_collection,
+    resync_required, since_from_request, sync_token
+)
+from .columnar import columnar_tree_response, wants_columnar
+from .feeds import APP_TREE_PROPERTIES, iter_tree_features, parse_fields, streaming_feature_collection
+from .density import density_response
+from .areas import area_stats_response
+from .nearest import nearby_response
+from .filters import active_filters, tree_filter_q
+from .snapshot import analytics_charts, report_statistics
+from .analytics_cache import cached_analytics
+from .stats import tree_statistics
+from .biodiversity import biodiversity
+from .growth import growth, growth_rate_by_year, parse_growth_params
+from .forecast import forecast, parse_forecast_params
+from .cohorts import parse_cohort_params, seed_cohorts
+from .imports import missing_columns
+from .jobs import enqueue, job_accepted
+from . import tiles
 
 
 def get_setting(user, key, default=None):
@@ -125,60 +151,32 @@ def dashboard(request):
             return redirect('app:login')
     
     try:
-        # Get basic stats for dashboard with proper null checks
-        total_trees = EndemicTree.objects.filter(user=request.user).count()
-        unique_species = TreeSpecies.objects.filter(user=request.user).count()
-        tree_population = EndemicTree.objects.filter(user=request.user).aggregate(total_population=Sum('population'))['total_population'] or 0
-
-        # Calculate health percentage (trees in good health or better)
-        total_population = tree_population or 0  # Avoid division by zero
-        if total_population > 0:
-            good_health_population = EndemicTree.objects.filter(
-                user=request.user,
-                health_status__in=['good', 'very_good', 'excellent']
-            ).aggregate(total=Sum('population'))['total'] or 0
-            health_percentage = round((good_health_population / total_population) * 100)
-        else:
-            health_percentage = 0
-
-        # Get health status distribution for chart
-        health_data = list(EndemicTree.objects.filter(user=request.user).values('health_status').annotate(
-            count=Sum('population')  # Changed from Count('id') to Sum('population')
-        ).order_by('health_status'))
+        # Headline numbers and chart series, cached until the user's data changes
+        stats = tree_statistics(request.user)
 
         # Get most recent data
-        recent_trees = EndemicTree.objects.filter(user=request.user).select_related('species', 'location').all().order_by('-created_at')[:5]
-
-        # Get species by family for chart with null checks
-        species_by_family = list(TreeFamily.objects.filter(user=request.user).annotate(
-            total_population=Sum('genera__species__trees__population')
-        ).values('name', 'total_population').order_by('-total_population')[:10])
-
-        # Get population by year with proper aggregation and null checks
-        population_by_year = list(EndemicTree.objects.filter(user=request.user).values('year')
-            .annotate(total=Sum('population'))
-            .order_by('year'))
+        recent_trees = EndemicTree.objects.filter(user=request.user).select_related('species', 'location').defer('species__image').all().order_by('-created_at')[:5]
 
         # Prepare context with empty data handling
         context = {
             'active_page': 'dashboard',
-            'total_trees': total_trees or 0,
-            'unique_species': unique_species or 0,
-            'tree_population': tree_population or 0,
-            'health_percentage': health_percentage,
+            'total_trees': stats['total_trees'],
+            'unique_species': stats['total_species'],
+            'tree_population': stats['total_population'],
+            'health_percentage': stats['health_percentage'],
             'recent_trees': recent_trees,
             'species_by_family': json.dumps([{
                 'name': item['name'],
-                'count': item['total_population'] or 0
-            } for item in (species_by_family or [])]),
+                'count': item['total_population']
+            } for item in stats['population_by_family']]),
             'population_by_year': json.dumps([{
                 'year': item['year'],
-                'total': item['total'] or 0
-            } for item in (population_by_year or [])]),
+                'total': item['population']
+            } for item in stats['population_by_year']]),
             'health_data': json.dumps([{
                 'status': item['health_status'],
-                'count': item['count'] or 0
-            } for item in (health_data or [])])
+                'count': item['population']
+            } for item in stats['health_distribution']])
         }
 
         return render(request, 'app/dashboard.html', context)
@@ -234,8 +232,16 @@ def analytics(request):
     Analytics and visualization view
     """
     try:
+        # Chart series from the rollup rows, computed the same way as the head
+        # analytics snapshot and cached until the user's data changes
+        rollups = TreeRollup.objects.filter(user=request.user)
+        trees = EndemicTree.objects.filter(user=request.user)
+        charts = cached_analytics(
+            'analytics', DatasetVersion.scope_for(request.user), lambda: analytics_charts(rollups, trees)
+        )
+
         # Check if there's any data in the database
-        if not EndemicTree.objects.filter(user=request.user).exists():
+        if not charts['population_data']:
             return render(request, 'app/analytics.html', {
                 'active_page': 'analytics',
                 'population_data': '[]',
@@ -245,69 +251,18 @@ def analytics(request):
                 'species_data': '[]',
                 'growth_rate_by_year': '[]',
                 'location_data': '[]',
-                'health_by_year': '[]'
+                'health_by_year': '[]',
+                'forecast_data': 'null'
             })
 
-        # Population by year with proper aggregation
-        population_by_year = list(EndemicTree.objects.filter(user=request.user).values('year')
-            .annotate(total=Sum('population'))
-            .order_by('year'))
-
-        # Health status distribution with population counts
-        health_status_data = list(EndemicTree.objects.filter(user=request.user).values('health_status')
-            .annotate(count=Sum('population'))
-            .order_by('health_status'))
-
-        # Family distribution data
-        family_data = list(TreeFamily.objects.filter(user=request.user).annotate(
-            total_population=Sum('genera__species__trees__population'),
-            species_count=Count('genera__species', distinct=True)
-        ).values('name', 'total_population', 'species_count')
-        .order_by('-total_population')[:10])
-
-        # Species distribution by genus
-        genus_data = list(TreeGenus.objects.filter(user=request.user).annotate(
-            total_population=Sum('species__trees__population'),
-            species_count=Count('species', distinct=True)
-        ).values('name', 'family__name', 'total_population', 'species_count')
-        .order_by('-total_population')[:10])
-
-        # Species data with population
-        species_data = list(TreeSpecies.objects.filter(user=request.user).annotate(
-            total_population=Sum('trees__population'),
-            locations_count=Count('trees__location', distinct=True)
-        ).values('common_name', 'scientific_name', 'total_population', 'locations_count')
-        .order_by('-total_population')[:10])
-
-        # Calculate growth rate
-        growth_rate_by_year = []
-        if len(population_by_year) > 1:
-            for i in range(1, len(population_by_year)):
-                current_year = population_by_year[i]
-                prev_year = population_by_year[i - 1]
-                
-                if prev_year['total'] and prev_year['total'] > 0:
-                    growth_rate = ((current_year['total'] - prev_year['total']) / prev_year['total']) * 100
-                else:
-                    growth_rate = 0
-                
-                growth_rate_by_year.append({
-                    'year': current_year['year'],
-                    'growth_rate': round(growth_rate, 2)
-                })
-
-        # Location-based distribution
-        location_data = list(Location.objects.filter(user=request.user).annotate(
-            total_trees=Sum('trees__population'),
-            species_count=Count('trees__species', distinct=True)
-        ).values('name', 'latitude', 'longitude', 'total_trees', 'species_count')
-        .exclude(total_trees__isnull=True)
-        .order_by('-total_trees'))
-
-        # Health status by year
-        health_by_year = list(EndemicTree.objects.filter(user=request.user).values('year', 'health_status')
-            .annotate(population=Sum('population'))
-            .order_by('year', 'health_status'))
+        population_by_year = charts['population_data']
+        health_status_data = charts['health_status_data']
+        family_data = charts['family_data']
+        genus_data = charts['genus_data']
+        species_data = charts['species_data']
+        growth_rate_by_year = charts['growth_rate_by_year']
+        location_data = charts['location_data']
+        health_by_year = charts['health_by_year']
 
         # Handle None values and convert Decimal to float for JSON serialization
         def clean_data(data):
@@ -329,6 +284,9 @@ def analytics(request):
         location_data = clean_data(location_data or [])
         health_by_year = clean_data(health_by_year or [])
 
+        # Projected total population with its prediction band
+        population_forecast = forecast(request.user)['total']
+
         context = {
             'active_page': 'analytics',
             'population_data': json.dumps(population_by_year),
@@ -338,7 +296,8 @@ def analytics(request):
             'species_data': json.dumps(species_data),
             'growth_rate_by_year': json.dumps(growth_rate_by_year),
             'location_data': json.dumps(location_data),
-            'health_by_year': json.dumps(health_by_year)
+            'health_by_year': json.dumps(health_by_year),
+            'forecast_data': json.dumps(population_forecast)
         }
 
         return render(request, 'app/analytics.html', context)
@@ -355,7 +314,8 @@ def analytics(request):
             'species_data': '[]',
             'growth_rate_by_year': '[]',
             'location_data': '[]',
-            'health_by_year': '[]'
+            'health_by_year': '[]',
+            'forecast_data': 'null'
         }
         return render(request, 'app/analytics.html', context)
 
@@ -380,8 +340,8 @@ def datasets(request):
     Display and manage datasets
     Includes user's data and all public submissions
     """
-    trees = EndemicTree.objects.filter(user=request.user).select_related('species', 'location').all()
-    seeds = TreeSeed.objects.filter(user=request.user).select_related('species', 'location').all()
+    trees = EndemicTree.objects.filter(user=request.user).select_related('species', 'location').defer('species__image').all()
+    seeds = TreeSeed.objects.filter(user=request.user).select_related('species', 'location').defer('species__image').all()
     species_list = TreeSpecies.objects.filter(user=request.user).all().order_by('common_name')
     
     # Get all public submissions (available to all app users)
@@ -472,7 +432,7 @@ def upload_species_image_api(request):
             return JsonResponse({'success': False, 'error': 'Species not found'}, status=404)
         
         # Check if species already has an image
-        if species.image:
+        if species.has_image:
             return JsonResponse({
                 'success': False,
                 'error': f'Image already exists for {species.common_name} ({species.scientific_name})'
@@ -509,7 +469,9 @@ def upload_species_image_api(request):
             scientific_name=species.scientific_name,
             user=request.user,
             image__isnull=True
-        ).update(image=image_data, image_format=species.image_format)
+        ).update(image=image_data, image_format=species.image_format, has_image=True)
+        # Queryset updates skip model signals, so mark the data changed here
+        DatasetVersion.bump(request.user)
         
         return JsonResponse({
             'success': True,
@@ -541,105 +503,16 @@ def upload_data(request):
                     messages.error(request, 'File must be a CSV file')
                     return redirect('app:upload')
 
-                # Process CSV file
+                # Check the header now; the rows are imported by a background job
                 try:
-                    df = pd.read_csv(csv_file)
-                    required_columns = ['common_name', 'scientific_name', 'family', 'genus', 'population', 'hectares', 'latitude',
-                                        'longitude', 'year']
-
-                    # Check if all required columns exist
-                    missing_columns = [col for col in required_columns if col not in df.columns]
-                    if missing_columns:
-                        messages.error(request, f'Missing required columns: {", ".join(missing_columns)}')
+                    missing = missing_columns(csv_file)
+                    if missing:
+                        messages.error(request, f'Missing required columns: {", ".join(missing)}')
                         return redirect('app:upload')
 
-                    # Process each row and save to database
-                    success_count = 0
-                    error_count = 0
-
-                    for _, row in df.iterrows():
-                        try:
-                            # Get or create family
-                            family, _ = TreeFamily.objects.get_or_create(
-                                name=row['family'],
-                                user=request.user
-                            )
-
-                            # Get or create genus
-                            genus, _ = TreeGenus.objects.get_or_create(
-                                name=row['genus'],
-                                user=request.user,
-                                defaults={'family': family}
-                            )
-
-                            # Get or create species
-                            species, _ = TreeSpecies.objects.get_or_create(
-                                scientific_name=row['scientific_name'],
-                                user=request.user,
-                                defaults={
-                                    'common_name': row['common_name'],
-                                    'genus': genus
-                                }
-                            )
-
-                            # Get or create location
-                            location, created = Location.objects.get_or_create(
-                                latitude=row['latitude'],
-                                longitude=row['longitude'],
-                                user=request.user,
-                                defaults={'name': f"{row['common_name']} location"}
-                            )
-                            
-                            # Note: CSV upload doesn't support images - images must be uploaded via manual entry
-
-                            # Create tree record
-                            notes = row.get('notes', '')
-                            health_status = row.get('health_status', 'good')
-                            
-                            # Get health distribution counts from CSV
-                            healthy_count = int(row.get('healthy_count', 0))
-                            good_count = int(row.get('good_count', 0))
-                            bad_count = int(row.get('bad_count', 0))
-                            deceased_count = int(row.get('deceased_count', 0))
-
-                            # Get hectares from CSV (required). Accept both "hectares" and "hectars" headers.
-                            hectares_value = row.get('hectares')
-                            if hectares_value is None or pd.isna(hectares_value):
-                                hectares_value = row.get('hectars')
-                            if hectares_value is None or (isinstance(hectares_value, str) and not hectares_value.strip()) or pd.isna(hectares_value):
-                                raise ValueError(f"Row {_ + 1}: hectares (hectars) is required")
-                            try:
-                                hectares = float(hectares_value)
-                                if hectares < 0:
-                                    raise ValueError(f"Row {_ + 1}: hectares must be non-negative")
-                            except (ValueError, TypeError) as e:
-                                if isinstance(e, ValueError) and "must be non-negative" in str(e):
-                                    raise
-                                raise ValueError(f"Row {_ + 1}: invalid hectares value: {hectares_value}")
-                            
-                            tree = EndemicTree(
-                                species=species,
-                                location=location,
-                                population=row['population'],
-                                year=row['year'],
-                                health_status=health_status,
-                                healthy_count=healthy_count,
-                                good_count=good_count,
-                                bad_count=bad_count,
-                                deceased_count=deceased_count,
-                                hectares=hectares,
-                                notes=notes,
-                                user=request.user
-                            )
-                            tree.save()
-                            success_count += 1
-                        except Exception as e:
-                            error_count += 1
-                            print(f"Error processing row: {str(e)}")
-
-                    messages.success(request, f'Successfully imported {success_count} trees. {error_count} errors.')
-                    # Redirect to GIS page to see the newly added data
-                    return redirect('app:gis')
+                    enqueue('import_trees', user=request.user, params={'filename': csv_file.name}, data=csv_file.read())
+                    messages.success(request, f'{csv_file.name} was queued for import. Its progress is shown under CSV Upload.')
+                    return redirect('app:upload')
                 except Exception as e:
                     messages.error(request, f'Error processing CSV file: {str(e)}')
                     return redirect('app:upload')
@@ -751,7 +624,7 @@ def upload_data(request):
                 # Handle image upload - save to species level (shared by all trees with same common_name and scientific_name)
                 if image_file:
                     # Check if species already has an image
-                    if species.image:
+                    if species.has_image:
                         messages.warning(request, f"Image already exists for {common_name} ({scientific_name}). The existing image will be used. To update the image, please edit the species in the admin panel.")
                     else:
                         # Read image as binary
@@ -887,12 +760,16 @@ def upload_data(request):
     families = TreeFamily.objects.filter(user=request.user).all()
     genera = TreeGenus.objects.filter(user=request.user).all()
 
+    # Recent CSV imports, polled by the page while they run
+    import_jobs = Job.objects.filter(user=request.user, kind='import_trees').defer('data')[:5]
+
     context = {
         'active_page': 'upload',
         'tree_form': tree_form,
         'csv_form': csv_form,
         'families': families,
         'genera': genera,
+        'import_jobs': import_jobs,
     }
     return render(request, 'app/upload.html', context)
 
@@ -1032,6 +909,7 @@ def reports(request):
 
 
 @login_required(login_url='app:login')
+@versioned_feed()
 def api_species_list(request):
     """API endpoint to get current list of species for dropdown updates."""
     try:
@@ -1046,15 +924,12 @@ def api_species_list(request):
             for species in species_list
         ]
         
-        # Add timestamp to prevent caching
+        # Revalidation is handled by the dataset version ETag (versioned_feed)
         response = JsonResponse({
             'success': True,
             'species': species_data,
             'timestamp': timezone.now().isoformat()
         })
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
         return response
     except Exception as e:
         return JsonResponse({
@@ -1064,6 +939,7 @@ def api_species_list(request):
 
 
 @login_required(login_url='app:login')
+@versioned_feed()
 def api_locations_list(request):
     """API endpoint to get current list of locations for dropdown updates."""
     try:
@@ -1079,15 +955,12 @@ def api_locations_list(request):
             for location in location_list
         ]
         
-        # Add timestamp to prevent caching
+        # Revalidation is handled by the dataset version ETag (versioned_feed)
         response = JsonResponse({
             'success': True,
             'locations': location_data,
             'timestamp': timezone.now().isoformat()
         })
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
         return response
     except Exception as e:
         return JsonResponse({
@@ -1170,440 +1043,512 @@ def new_data(request):
 @login_required(login_url='app:login')
 @csrf_protect
 def generate_report(request):
-    """View for generating reports based on form data."""
+    """
+    Queue a report for the submitted form; the client polls the returned job
+    for the report HTML and chart data
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST method is allowed'}, status=405)
 
+    job = enqueue('generate_report', user=request.user, params=request.POST.dict())
+    return job_accepted(job)
+
+
+def generate_report_job(job):
+    """Job handler for ``generate_report``"""
+    return build_report(job.user, job.params)
+
+
+def build_report(user, form):
+    """Report HTML and chart data for the submitted report ``form``"""
+    # Get form data
+    report_type = form.get('report_type')
+    time_range = form.get('time_range')
+    species_filter = form.get('species_filter')
+    location_filter = form.get('location_filter')
+    include_charts = form.get('include_charts') == 'on'
+    include_map = form.get('include_map') == 'on'
+    include_table = form.get('include_table') == 'on'
+
+    # Get the current date and time
+    now = timezone.now()
+    date_str = now.strftime('%B %d, %Y')
+    time_str = now.strftime('%I:%M %p')
+
+    # Get report title based on type
+    report_titles = {
+        'species_distribution': 'Species Distribution Report',
+        'population_trends': 'Population Trends Report',
+        'health_analysis': 'Health Status Analysis Report',
+        'conservation_status': 'Conservation Status Report',
+        'spatial_density': 'Spatial Density Report'
+    }
+    report_title = report_titles.get(report_type, 'Endemic Trees Report')
+
+    # Get actual data statistics (only current user's data). The
+    # unfiltered summary is the cached dashboard statistics; a filtered
+    # one groups the matching rollup rows, or the tree records when filtered
+    # by location (the rollups are not kept per location).
     try:
-        # Get form data
-        report_type = request.POST.get('report_type')
-        time_range = request.POST.get('time_range')
-        species_filter = request.POST.get('species_filter')
-        location_filter = request.POST.get('location_filter')
-        include_charts = request.POST.get('include_charts') == 'on'
-        include_map = request.POST.get('include_map') == 'on'
-        include_table = request.POST.get('include_table') == 'on'
-
-        # Get the current date and time
-        now = timezone.now()
-        date_str = now.strftime('%B %d, %Y')
-        time_str = now.strftime('%I:%M %p')
-
-        # Get report title based on type
-        report_titles = {
-            'species_distribution': 'Species Distribution Report',
-            'population_trends': 'Population Trends Report',
-            'health_analysis': 'Health Status Analysis Report',
-            'conservation_status': 'Conservation Status Report',
-            'spatial_density': 'Spatial Density Report'
-        }
-        report_title = report_titles.get(report_type, 'Endemic Trees Report')
+        rollups_query = TreeRollup.objects.filter(user=user)
+        trees_query = EndemicTree.objects.filter(user=user)
+        filtered = False
+        by_location = False
 
-        # Get actual data statistics (only current user's data)
-        try:
-            trees_query = EndemicTree.objects.filter(user=request.user).select_related('species', 'location')
-            
-            # Apply filters for statistics
-            if species_filter and species_filter != 'all':
-                try:
-                    trees_query = trees_query.filter(species_id=int(species_filter))
-                except (ValueError, TypeError):
-                    pass
-            if location_filter and location_filter != 'all':
-                try:
-                    trees_query = trees_query.filter(location_id=int(location_filter))
-                except (ValueError, TypeError):
-                    pass
-            
-            # Calculate actual statistics with error handling
-            total_trees = trees_query.count()
-            total_population = trees_query.aggregate(total=Sum('population'))['total'] or 0
-            
-            # Get unique counts safely
-            try:
-                unique_species = trees_query.exclude(species__isnull=True).values('species').distinct().count()
-            except:
-                unique_species = 0
-            
+        # Apply filters for statistics
+        if species_filter and species_filter != 'all':
             try:
-                unique_locations = trees_query.exclude(location__isnull=True).values('location').distinct().count()
-            except:
-                unique_locations = 0
-            
-            # Health status distribution
-            try:
-                health_distribution = list(trees_query.exclude(health_status__isnull=True).values('health_status').annotate(
-                    count=Count('id'),
-                    population=Sum('population')
-                ).order_by('health_status'))
-            except:
-                health_distribution = []
-            
-            # Species distribution
-            try:
-                species_dist = list(trees_query.exclude(species__isnull=True).values('species__common_name', 'species__scientific_name').annotate(
-                    count=Count('id'),
-                    total_population=Sum('population')
-                ).order_by('-total_population')[:10])
-            except:
-                species_dist = []
-            
-            # Year distribution
+                rollups_query = rollups_query.filter(species_id=int(species_filter))
+                trees_query = trees_query.filter(species_id=int(species_filter))
+                filtered = True
+            except (ValueError, TypeError):
+                pass
+        if location_filter and location_filter != 'all':
             try:
-                year_dist = list(trees_query.exclude(year__isnull=True).values('year').annotate(
-                    count=Count('id'),
-                    population=Sum('population')
-                ).order_by('year'))
-            except:
-                year_dist = []
-        except Exception as e:
-            # If statistics fail, use defaults
-            import traceback
-            traceback.print_exc()
-            total_trees = 0
-            total_population = 0
-            unique_species = 0
-            unique_locations = 0
-            health_distribution = []
-            species_dist = []
-            year_dist = []
-
-        # Build the report HTML - ensure all values are safe for f-string
-        total_trees = int(total_trees) if total_trees else 0
-        total_population = int(total_population) if total_population else 0
-        unique_species = int(unique_species) if unique_species else 0
-        unique_locations = int(unique_locations) if unique_locations else 0
-        
-        html = f'''
-        <div class="report-document">
-            <div class="report-header">
-                <h1 class="report-title">{report_title}</h1>
-                <p class="report-subtitle">Endemic Trees Monitoring System - User Account Report</p>
-                <p class="report-date">Generated on {date_str} at {time_str}</p>
-                <p class="report-note"><strong>Note:</strong> This report includes data from your account only.</p>
-            </div>
+                trees_query = trees_query.filter(location_id=int(location_filter))
+                filtered = by_location = True
+            except (ValueError, TypeError):
+                pass
+
+        if not filtered:
+            stats = tree_statistics(user)
+            unique_species = stats['species_recorded']
+            unique_locations = stats['locations_recorded']
+            species_dist = [{
+                'species__common_name': item['common_name'],
+                'species__scientific_name': item['scientific_name'],
+                'count': item['count'],
+                'total_population': item['total_population'],
+            } for item in stats['top_species']]
+            year_dist = stats['population_by_year']
+        else:
+            # Filtered statistics are cached per filter set
+            stats = cached_analytics(
+                'report-stats', DatasetVersion.scope_for(user),
+                lambda: report_statistics(trees_query if by_location else rollups_query, trees_query),
+                params={'species': species_filter, 'location': location_filter},
+            )
+            unique_species = stats['unique_species']
+            unique_locations = stats['unique_locations']
+            species_dist = stats['species_dist']
+            year_dist = stats['year_dist']
+        total_trees = stats['total_trees']
+        total_population = stats['total_population']
+        health_distribution = stats['health_distribution']
+    except Exception as e:
+        # If statistics fail, use defaults
+        import traceback
+        traceback.print_exc()
+        total_trees = 0
+        total_population = 0
+        unique_species = 0
+        unique_locations = 0
+        health_distribution = []
+        species_dist = []
+        year_dist = []
+
+    # Build the report HTML - ensure all values are safe for f-string
+    total_trees = int(total_trees) if total_trees else 0
+    total_population = int(total_population) if total_population else 0
+    unique_species = int(unique_species) if unique_species else 0
+    unique_locations = int(unique_locations) if unique_locations else 0
+
+    html = f'''
+    <div class="report-document">
+        <div class="report-header">
+            <h1 class="report-title">{report_title}</h1>
+            <p class="report-subtitle">Endemic Trees Monitoring System - User Account Report</p>
+            <p class="report-date">Generated on {date_str} at {time_str}</p>
+            <p class="report-note"><strong>Note:</strong> This report includes data from your account only.</p>
+        </div>
 
-            <div class="report-section">
-                <h2 class="report-section-title">Executive Summary</h2>
-                <div class="report-stats-grid" style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem; margin: 1rem 0;">
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Tree Records</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #007bff;">{total_trees}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Population</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #28a745;">{total_population:,}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Species</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #ffc107;">{unique_species}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Locations</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #dc3545;">{unique_locations}</p>
-                    </div>
+        <div class="report-section">
+            <h2 class="report-section-title">Executive Summary</h2>
+            <div class="report-stats-grid" style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem; margin: 1rem 0;">
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Tree Records</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #007bff;">{total_trees}</p>
                 </div>
-                <p style="margin-top: 1.5rem;">This report provides an analysis of endemic tree data from your account. 
-                   The data includes {total_trees} tree records with a total population of {total_population:,} trees across {unique_species} unique species and {unique_locations} locations.</p>
-            </div>
-        '''
-
-        # Add charts section if included
-        if include_charts:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Data Visualization</h2>
-                <div class="report-chart-container">
-                    <canvas id="reportChart1"></canvas>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Population</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #28a745;">{total_population:,}</p>
+                </div>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Species</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #ffc107;">{unique_species}</p>
                 </div>
-                <div class="report-chart-container">
-                    <canvas id="reportChart2"></canvas>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Locations</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #dc3545;">{unique_locations}</p>
                 </div>
             </div>
-            '''
+            <p style="margin-top: 1.5rem;">This report provides an analysis of endemic tree data from your account. 
+               The data includes {total_trees} tree records with a total population of {total_population:,} trees across {unique_species} unique species and {unique_locations} locations.</p>
+        </div>
+    '''
 
-        # Add map section if included
-        if include_map:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Spatial Distribution</h2>
-                <div class="report-map-container" id="reportMap"></div>
+    # Add charts section if included
+    if include_charts:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Data Visualization</h2>
+            <div class="report-chart-container">
+                <canvas id="reportChart1"></canvas>
             </div>
-            '''
-
-        # Add data table if included
-        if include_table:
-            # Query the database for tree data (only current user's data)
-            # Use select_related to avoid N+1 queries and handle potential None values
-            trees = EndemicTree.objects.filter(user=request.user).select_related('species', 'location', 'species__genus', 'species__genus__family')
-            
-            # Apply filters
-            if species_filter and species_filter != 'all':
-                try:
-                    trees = trees.filter(species_id=int(species_filter))
-                except (ValueError, TypeError):
-                    pass  # Invalid filter, ignore
-            if location_filter and location_filter != 'all':
-                try:
-                    trees = trees.filter(location_id=int(location_filter))
-                except (ValueError, TypeError):
-                    pass  # Invalid filter, ignore
-            
-            # Generate table HTML
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Data Table</h2>
-                <div class="report-table-container">
-                    <table class="report-table">
-                        <thead>
-                            <tr>
-                                <th>Species</th>
-                                <th>Location</th>
-                                <th>Population</th>
-                                <th>Health Status</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-            '''
-            
-            # Add table rows with proper error handling
-            tree_count = 0
-            for tree in trees[:10]:  # Limit to 10 rows for performance
-                try:
-                    common_name = tree.species.common_name if tree.species else 'Unknown'
-                    scientific_name = tree.species.scientific_name if tree.species else 'Unknown'
-                    location_name = tree.location.name if tree.location else 'Unknown'
-                    health_status = tree.health_status or 'Unknown'
-                    population = tree.population or 0
-                    
-                    html += f'''
-                    <tr>
-                        <td>{common_name} ({scientific_name})</td>
-                        <td>{location_name}</td>
-                        <td>{population}</td>
-                        <td>{health_status}</td>
-                    </tr>
-                    '''
-                    tree_count += 1
-                except Exception as e:
-                    # Skip trees with errors, log but continue
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            
-            if tree_count == 0:
-                html += '''
-                    <tr>
-                        <td colspan="4" style="text-align: center; padding: 20px;">No tree data available for the selected filters.</td>
-                    </tr>
-                '''
-            
-            html += '''
-                        </tbody>
-                    </table>
-                </div>
+            <div class="report-chart-container">
+                <canvas id="reportChart2"></canvas>
             </div>
-            '''
+        </div>
+        '''
 
-        # Add data analysis sections
-        if health_distribution:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Health Status Distribution</h2>
-                <table class="report-table" style="width: 100%; border-collapse: collapse;">
+    # Add map section if included
+    if include_map:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Spatial Distribution</h2>
+            <div class="report-map-container" id="reportMap"></div>
+        </div>
+        '''
+
+    # Add data table if included
+    if include_table:
+        # Query the database for tree data (only current user's data)
+        # Use select_related to avoid N+1 queries and handle potential None values
+        trees = EndemicTree.objects.filter(user=user).select_related('species', 'location', 'species__genus', 'species__genus__family').defer('species__image')
+
+        # Apply filters
+        if species_filter and species_filter != 'all':
+            try:
+                trees = trees.filter(species_id=int(species_filter))
+            except (ValueError, TypeError):
+                pass  # Invalid filter, ignore
+        if location_filter and location_filter != 'all':
+            try:
+                trees = trees.filter(location_id=int(location_filter))
+            except (ValueError, TypeError):
+                pass  # Invalid filter, ignore
+
+        # Generate table HTML
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Data Table</h2>
+            <div class="report-table-container">
+                <table class="report-table">
                     <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Health Status</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Number of Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            '''
-            for health in health_distribution:
-                try:
-                    status_display = health.get('health_status', 'Unknown')
-                    if status_display:
-                        status_display = str(status_display).replace('_', ' ').title()
-                    else:
-                        status_display = 'Unknown'
-                    count = health.get('count', 0) or 0
-                    population = health.get('population', 0) or 0
-                    html += f'''
                         <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{status_display}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
-                        </tr>
-                    '''
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            html += '''
-                    </tbody>
-                </table>
-            </div>
-            '''
-        
-        if species_dist:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Top Species by Population</h2>
-                <table class="report-table" style="width: 100%; border-collapse: collapse;">
-                    <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Common Name</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Scientific Name</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                            <th>Species</th>
+                            <th>Location</th>
+                            <th>Population</th>
+                            <th>Health Status</th>
                         </tr>
                     </thead>
                     <tbody>
-            '''
-            for species in species_dist:
-                try:
-                    common_name = species.get('species__common_name') or 'Unknown'
-                    scientific_name = species.get('species__scientific_name') or 'Unknown'
-                    count = species.get('count', 0) or 0
-                    total_pop = species.get('total_population', 0) or 0
-                    html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{common_name}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;"><em>{scientific_name}</em></td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{total_pop:,}</td>
-                        </tr>
-                    '''
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            html += '''
-                    </tbody>
-                </table>
-            </div>
-            '''
-        
-        if year_dist:
+        '''
+
+        # Add table rows with proper error handling
+        tree_count = 0
+        for tree in trees[:10]:  # Limit to 10 rows for performance
+            try:
+                common_name = tree.species.common_name if tree.species else 'Unknown'
+                scientific_name = tree.species.scientific_name if tree.species else 'Unknown'
+                location_name = tree.location.name if tree.location else 'Unknown'
+                health_status = tree.health_status or 'Unknown'
+                population = tree.population or 0
+
+                html += f'''
+                <tr>
+                    <td>{common_name} ({scientific_name})</td>
+                    <td>{location_name}</td>
+                    <td>{population}</td>
+                    <td>{health_status}</td>
+                </tr>
+                '''
+                tree_count += 1
+            except Exception as e:
+                # Skip trees with errors, log but continue
+                import traceback
+                traceback.print_exc()
+                continue
+
+        if tree_count == 0:
             html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Population Trends by Year</h2>
-                <table class="report-table" style="width: 100%; border-collapse: collapse;">
-                    <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Year</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
-                        </tr>
-                    </thead>
-                    <tbody>
+                <tr>
+                    <td colspan="4" style="text-align: center; padding: 20px;">No tree data available for the selected filters.</td>
+                </tr>
             '''
-            for year_data in year_dist:
-                try:
-                    year = year_data.get('year', 'Unknown') or 'Unknown'
-                    count = year_data.get('count', 0) or 0
-                    population = year_data.get('population', 0) or 0
-                    html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{year}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
-                        </tr>
-                    '''
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            html += '''
+
+        html += '''
                     </tbody>
                 </table>
             </div>
-            '''
+        </div>
+        '''
 
-        # Add conclusions based on actual data
-        conclusions = []
-        if total_trees == 0:
-            conclusions.append("No tree data is available in your account. Please add tree records to generate meaningful reports.")
-        else:
-            if unique_species > 0:
-                conclusions.append(f"Your account contains data for {unique_species} unique species, indicating good species diversity.")
-            if unique_locations > 0:
-                conclusions.append(f"Trees are distributed across {unique_locations} different locations, showing geographic diversity.")
-            if health_distribution:
-                try:
-                    excellent_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') == 'excellent'), 0)
-                    poor_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') in ['poor', 'very_poor']), 0)
-                    if excellent_count > poor_count:
-                        conclusions.append("The majority of trees are in good to excellent health, indicating successful conservation efforts.")
-                    elif poor_count > excellent_count:
-                        conclusions.append("A significant number of trees require attention due to poor health status.")
-                except:
-                    pass
-        
-        html += f'''
-            <div class="report-section">
-                <h2 class="report-section-title">Conclusions and Recommendations</h2>
-                <p>Based on the actual data analysis from your account, the following conclusions can be drawn:</p>
-                <ul>
+    # Add data analysis sections
+    if health_distribution:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Health Status Distribution</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Health Status</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Number of Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
         '''
-        for conclusion in conclusions:
-            # Escape HTML to prevent issues
-            from django.utils.html import escape
-            escaped_conclusion = escape(str(conclusion))
-            html += f'<li>{escaped_conclusion}</li>'
-        
-        if not conclusions:
-            html += '<li>Continue monitoring and collecting data to build a comprehensive dataset.</li>'
-        
+        for health in health_distribution:
+            try:
+                status_display = health.get('health_status', 'Unknown')
+                if status_display:
+                    status_display = str(status_display).replace('_', ' ').title()
+                else:
+                    status_display = 'Unknown'
+                count = health.get('count', 0) or 0
+                population = health.get('population', 0) or 0
+                html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{status_display}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
+                    </tr>
+                '''
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
         html += '''
-                </ul>
-            </div>
+                </tbody>
+            </table>
+        </div>
+        '''
+
+    if species_dist:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Top Species by Population</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Common Name</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Scientific Name</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for species in species_dist:
+            try:
+                common_name = species.get('species__common_name') or 'Unknown'
+                scientific_name = species.get('species__scientific_name') or 'Unknown'
+                count = species.get('count', 0) or 0
+                total_pop = species.get('total_population', 0) or 0
+                html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{common_name}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;"><em>{scientific_name}</em></td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{total_pop:,}</td>
+                    </tr>
+                '''
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
+        html += '''
+                </tbody>
+            </table>
         </div>
         '''
 
+    if year_dist:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Population Trends by Year</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Year</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for year_data in year_dist:
+            try:
+                year = year_data.get('year', 'Unknown') or 'Unknown'
+                count = year_data.get('count', 0) or 0
+                population = year_data.get('population', 0) or 0
+                html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{year}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
+                    </tr>
+                '''
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
+        html += '''
+                </tbody>
+            </table>
+        </div>
+        '''
+
+    # Projected population for trend reports, fitted for every species
+    # in one batch
+    projection = None
+    if report_type == 'population_trends':
         try:
-            return JsonResponse({
-                'reportContent': html,
-                'success': True,
-                'yearData': year_dist,  # Include year distribution data for charts
-                'healthData': health_distribution,  # Include health distribution data
-                'speciesData': species_dist  # Include species distribution data
-            })
-        except Exception as json_error:
-            # If JSON encoding fails, try to return a simpler error
+            forecast_filters = {
+                name: value for name, value in (('species', species_filter), ('location', location_filter))
+                if value and value != 'all' and str(value).isdigit()
+            }
+            projection = forecast(user, filters=forecast_filters)
+        except Exception as e:
             import traceback
-            error_trace = traceback.format_exc()
-            print(f"Error encoding JSON response: {error_trace}")
-            print(f"HTML length: {len(html)}")
-            return JsonResponse({
-                'error': f'Error encoding report: {str(json_error)}. Report HTML length: {len(html)} characters.',
-                'success': False
-            }, status=500)
+            traceback.print_exc()
 
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error generating report: {error_trace}")
-        # Return more detailed error in development, generic message in production
-        error_message = str(e)
-        if hasattr(request, 'user') and request.user.is_superuser:
-            error_message = f"{str(e)}\n\nTraceback:\n{error_trace}"
-        return JsonResponse({
-            'error': error_message,
-            'success': False
-        }, status=500)
+    if projection and projection['total']:
+        html += f'''
+        <div class="report-section">
+            <h2 class="report-section-title">Population Forecast</h2>
+            <p>Linear trend of the recorded yearly population ({projection['total']['observations']} years of data), with 95% prediction bounds.</p>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Year</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Projected Population</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">95% Range</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for row in projection['total']['forecast']:
+            lower = f"{row['lower']:,.0f}" if row['lower'] is not None else '-'
+            upper = f"{row['upper']:,.0f}" if row['upper'] is not None else '-'
+            html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{row['year']}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{row['population']:,.0f}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{lower} - {upper}</td>
+                    </tr>
+            '''
+        html += '''
+                </tbody>
+            </table>
+        '''
+        declining = [item for item in projection['species'] if (item['projected_change'] or 0) < 0][:5]
+        if declining:
+            from django.utils.html import escape
+            html += '<p style="margin-top: 1rem;"><strong>Species projected to decline:</strong></p><ul>'
+            for item in declining:
+                html += f"<li>{escape(item['common_name'])} (<em>{escape(item['scientific_name'])}</em>): {item['projected_change']}% by {item['forecast'][-1]['year']}</li>"
+            html += '</ul>'
+        html += '''
+        </div>
+        '''
+
+    # Add conclusions based on actual data
+    conclusions = []
+    if total_trees == 0:
+        conclusions.append("No tree data is available in your account. Please add tree records to generate meaningful reports.")
+    else:
+        if unique_species > 0:
+            conclusions.append(f"Your account contains data for {unique_species} unique species, indicating good species diversity.")
+        if unique_locations > 0:
+            conclusions.append(f"Trees are distributed across {unique_locations} different locations, showing geographic diversity.")
+        if health_distribution:
+            try:
+                excellent_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') == 'excellent'), 0)
+                poor_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') in ['poor', 'very_poor']), 0)
+                if excellent_count > poor_count:
+                    conclusions.append("The majority of trees are in good to excellent health, indicating successful conservation efforts.")
+                elif poor_count > excellent_count:
+                    conclusions.append("A significant number of trees require attention due to poor health status.")
+            except:
+                pass
+
+    html += f'''
+        <div class="report-section">
+            <h2 class="report-section-title">Conclusions and Recommendations</h2>
+            <p>Based on the actual data analysis from your account, the following conclusions can be drawn:</p>
+            <ul>
+    '''
+    for conclusion in conclusions:
+        # Escape HTML to prevent issues
+        from django.utils.html import escape
+        escaped_conclusion = escape(str(conclusion))
+        html += f'<li>{escaped_conclusion}</li>'
+
+    if not conclusions:
+        html += '<li>Continue monitoring and collecting data to build a comprehensive dataset.</li>'
+
+    html += '''
+            </ul>
+        </div>
+    </div>
+    '''
+
+    return {
+        'reportContent': html,
+        'success': True,
+        'yearData': year_dist,  # Include year distribution data for charts
+        'healthData': health_distribution,  # Include health distribution data
+        'speciesData': species_dist  # Include species distribution data
+    }
 
 
 # API Views
 @login_required(login_url='app:login')
+@versioned_feed()
 def tree_data(request):
     """
     API endpoint for tree data in GeoJSON format
     Includes both user's trees and public submissions
+
+    Optional query parameters:
+        bbox - "west,south,east,north"; only trees inside the viewport are returned
+        zoom - current map zoom level; at low zoom clusters are returned instead of trees
+        cluster - "0" to always return individual trees
+        since - sync_token of a previous response; only trees changed since then are
+                returned (ignoring bbox/zoom), with the IDs of deleted trees in "deleted";
+                a token older than the tombstone retention gets "resync": true instead
+        format - "columnar" for the compact binary body described in app/columnar.py
+        fields - comma separated feature properties to return, e.g. "species_id,population";
+                 only the columns they need are read (GeoJSON responses only)
     """
     try:
-        trees = EndemicTree.objects.filter(user=request.user).select_related('species', 'location').all()
+        bbox, zoom = viewport_from_request(request)
+        since = since_from_request(request)
+        fields = parse_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
+
+    try:
+        token = sync_token()
+        if since is not None and resync_required(since):
+            return JsonResponse(resync_collection(token))
+        if since is None and wants_clusters(request, zoom):
+            return JsonResponse(cluster_feature_collection(
+                EndemicTree.objects.filter(user=request.user), 'trees',
+                DatasetVersion.scope_for(request.user), zoom, bbox
+            ))
+
+        trees = EndemicTree.objects.filter(user=request.user)
+        if since is not None:
+            trees = changed_since(trees, since)
+        else:
+            trees = filter_bbox(trees, bbox)
 
         # No species-wide aggregation here. For the popup we return per-record distribution
         # derived strictly from the current row's health_status and population.
@@ -1618,55 +1563,20 @@ def tree_data(request):
         except PinStyle.DoesNotExist:
             pin_style = None
 
-        # Convert to GeoJSON format
-        features = []
-        for tree in trees:
-
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [tree.location.longitude, tree.location.latitude]
-                },
-                'properties': {
-                    'id': str(tree.id),
-                    'species_id': str(tree.species.id),  # Add species_id for filtering
-                    'location_id': str(tree.location.id),  # Add location_id for filtering
-                    'common_name': tree.species.common_name,
-                    'scientific_name': tree.species.scientific_name,
-                    'family': tree.species.genus.family.name,
-                    'genus': tree.species.genus.name,
-                    'population': tree.population,
-                    'health_status': tree.health_status,
-                    'year': tree.year,
-                    'location': tree.location.name,
-                    'notes': tree.notes or '',
-                    # Use actual stored health distribution
-                    'healthy_count': tree.healthy_count,
-                    'good_count': tree.good_count,
-                    'bad_count': tree.bad_count,
-                    'deceased_count': tree.deceased_count,
-                    'hectares': tree.hectares,
-                    # Include species image URL if available (shared by all trees with same common_name and scientific_name)
-                    'image_url': request.build_absolute_uri(reverse('app:species_image', args=[tree.species.id])) if tree.species.image else None,
-                    'data_source': 'app',  # Mark as app data
-                }
-            }
-            features.append(feature)
-
-        # Note: Public submissions that have been imported are already included in the trees query above
-        # as EndemicTree records, so we don't need to add them separately here.
-        # The imported trees will have the proper species information (common_name, scientific_name, etc.)
-        # from when they were imported.
-
-        geojson = {
-            'type': 'FeatureCollection',
-            'features': features
-        }
+        # Top-level members shared by the GeoJSON and columnar responses
+        members = {'sync_token': token}
+        if since is not None:
+            members['since'] = since.isoformat()
+            members['deleted'] = deleted_since('tree', since, request.user)
+        else:
+            if bbox is not None:
+                members['bbox'] = list(bbox)
+            if zoom is not None:
+                members['zoom'] = zoom
 
         # Add pin style to response
         if pin_style:
-            geojson['pin_style'] = {
+            members['pin_style'] = {
                 'icon_class': pin_style.icon_class,
                 'color': pin_style.color,
                 'size': pin_style.size,
@@ -1675,6 +1585,29 @@ def tree_data(request):
                 'background_color': pin_style.background_color
             }
 
+        if wants_columnar(request):
+            return columnar_tree_response(request, trees, data_source='app', **members)
+
+        # Convert to GeoJSON format, reading only the columns the requested
+        # properties need
+        if fields:
+            features = list(iter_tree_features(request, trees, fields))
+        else:
+            features = list(iter_tree_features(
+                request, trees, APP_TREE_PROPERTIES, extra={'data_source': 'app'}
+            ))
+
+        # Note: Public submissions that have been imported are already included in the trees query above
+        # as EndemicTree records, so we don't need to add them separately here.
+        # The imported trees will have the proper species information (common_name, scientific_name, etc.)
+        # from when they were imported.
+
+        geojson = {
+            'type': 'FeatureCollection',
+            'features': features,
+            **members
+        }
+
         return JsonResponse(geojson)
     except Exception as e:
         print(f"Error in tree_data API: {str(e)}")
@@ -1686,12 +1619,38 @@ def tree_data(request):
 
 
 @login_required(login_url='app:login')
+@versioned_feed()
 def seed_data(request):
     """
     API endpoint for seed data in GeoJSON format
+
+    Accepts the same bbox, zoom, cluster and since parameters as tree_data.
     """
     try:
-        seeds = TreeSeed.objects.filter(user=request.user).select_related('species', 'location').all()
+        bbox, zoom = viewport_from_request(request)
+        since = since_from_request(request)
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
+
+    try:
+        token = sync_token()
+        if since is not None and resync_required(since):
+            return JsonResponse(resync_collection(token))
+        if since is None and wants_clusters(request, zoom):
+            return JsonResponse(cluster_feature_collection(
+                TreeSeed.objects.filter(user=request.user), 'seeds',
+                DatasetVersion.scope_for(request.user), zoom, bbox
+            ))
+
+        seeds = TreeSeed.objects.filter(user=request.user).select_related('species', 'location').defer('species__image').all()
+        if since is not None:
+            seeds = changed_since(seeds, since)
+        else:
+            seeds = filter_bbox(seeds, bbox)
 
         # Log the count of seeds for debugging
         seed_count = seeds.count()
@@ -1737,8 +1696,12 @@ def seed_data(request):
 
         geojson = {
             'type': 'FeatureCollection',
-            'features': features
+            'features': features,
+            'sync_token': token
         }
+        if since is not None:
+            geojson['since'] = since.isoformat()
+            geojson['deleted'] = deleted_since('seed', since, request.user)
 
         print(f"Returning {len(features)} seed features")
         return JsonResponse(geojson)
@@ -1752,16 +1715,147 @@ def seed_data(request):
 
 
 @login_required(login_url='app:login')
+@versioned_feed()
+def tree_density(request):
+    """
+    API endpoint returning the population density grid of the user's trees
+    for the heatmap layer.
+
+    Query parameters:
+        bbox - west,south,east,north viewport (required)
+        zoom - map zoom level (required)
+        resolution - grid cells per 256px tile edge: 8, 16, 32 (default) or 64
+        species_id - only count trees of this species
+    """
+    return density_response(request, EndemicTree.objects.filter(user=request.user), DatasetVersion.scope_for(request.user))
+
+
+@login_required(login_url='app:login')
+def area_stats(request):
+    """
+    API endpoint aggregating the user's trees and seeds inside a shape drawn on
+    the map.
+
+    POST body: a GeoJSON Polygon (or Feature) for polygons and rectangles, or
+    ``{"type": "Circle", "coordinates": [lng, lat], "radius": metres}``.
+    """
+    return area_stats_response(
+        request,
+        EndemicTree.objects.filter(user=request.user),
+        TreeSeed.objects.filter(user=request.user)
+    )
+
+
+@login_required(login_url='app:login')
+@versioned_feed()
+def nearby_records(request):
+    """
+    API endpoint returning the user's trees and seeds nearest to a coordinate,
+    with great-circle distances in metres.
+
+    Query parameters:
+        lat, lng - the coordinate (required)
+        k - number of nearest records per kind (default 10, at most 100)
+        radius - return every record within this many metres instead of k
+        kind - trees or seeds (default both)
+    """
+    return nearby_response(request, request.user)
+
+
+@login_required(login_url='app:login')
+def vector_tile(request, kind, z, x, y):
+    """
+    API endpoint serving the user's trees or seeds as a Mapbox Vector Tile.
+
+    ``kind`` is ``trees`` or ``seeds``; each point carries species_id,
+    population/quantity, health/germination status and year.
+    """
+    if kind not in tiles.TILE_KINDS or not tiles.valid_tile(z, x, y):
+        return JsonResponse({'error': 'Tile out of range'}, status=404)
+
+    if kind == 'trees':
+        queryset = EndemicTree.objects.filter(user=request.user)
+    else:
+        queryset = TreeSeed.objects.filter(user=request.user)
+
+    try:
+        data = tiles.get_tile(queryset, kind, tiles.tile_scope(request.user), z, x, y)
+    except Exception as e:
+        print(f"Error in vector_tile API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    response = HttpResponse(data, content_type=tiles.CONTENT_TYPE)
+    patch_cache_control(response, private=True, max_age=tiles.BROWSER_MAX_AGE)
+    return response
+
+
+@login_required(login_url='app:login')
+@versioned_feed()
+def query_trees(request):
+    """
+    API endpoint returning the user's trees that match a combination of filters,
+    as GeoJSON.
+
+    Query parameters (all optional, lists are comma separated):
+        species, location - IDs
+        family, genus - IDs or names
+        health_status - e.g. "good,excellent"
+        bbox - "west,south,east,north"
+        year_min/year_max, population_min/population_max,
+        hectares_min/hectares_max - inclusive ranges
+        fields - comma separated feature properties to return (see tree_data)
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+        query = tree_filter_q(request.GET)
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
+
+    try:
+        trees = EndemicTree.objects.filter(query, user=request.user)
+        return streaming_feature_collection(
+            iter_tree_features(request, trees, fields or APP_TREE_PROPERTIES),
+            filters=active_filters(request.GET)
+        )
+    except Exception as e:
+        print(f"Error in query_trees API: {str(e)}")
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=500)
+
+
+@login_required(login_url='app:login')
+@versioned_feed()
 def filter_trees(request, species_id):
     """
     API endpoint for filtered tree data
+
+    Kept for existing clients; query_trees (?species=) covers this and more.
+
+    Optional query parameters:
+        fields - comma separated feature properties to return (see tree_data)
     """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
+
     try:
         # Check if the species exists first
         species = get_object_or_404(TreeSpecies, id=species_id, user=request.user)
 
         # Get trees for this species
-        trees = EndemicTree.objects.filter(species_id=species_id, user=request.user).select_related('species', 'location')
+        trees = EndemicTree.objects.filter(species_id=species_id, user=request.user)
 
         # For filtered endpoint, still return per-record distribution (not species aggregate)
 
@@ -1772,38 +1866,7 @@ def filter_trees(request, species_id):
             pin_style = None
 
         # Convert to GeoJSON format
-        features = []
-        for tree in trees:
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [tree.location.longitude, tree.location.latitude]
-                },
-                'properties': {
-                    'id': str(tree.id),
-                    'species_id': str(tree.species.id),
-                    'location_id': str(tree.location.id),  # Add location_id for filtering
-                    'common_name': tree.species.common_name,
-                    'scientific_name': tree.species.scientific_name,
-                    'family': tree.species.genus.family.name,
-                    'genus': tree.species.genus.name,
-                    'population': tree.population,
-                    'health_status': tree.health_status,
-                    'year': tree.year,
-                    'location': tree.location.name,
-                    'notes': tree.notes or '',
-                    # Use actual stored health distribution
-                    'healthy_count': tree.healthy_count,
-                    'good_count': tree.good_count,
-                    'bad_count': tree.bad_count,
-                    'deceased_count': tree.deceased_count,
-                    'hectares': tree.hectares,
-                    # Include species image URL if available (shared by all trees with same common_name and scientific_name)
-                    'image_url': request.build_absolute_uri(reverse('app:species_image', args=[tree.species.id])) if tree.species.image else None,
-                }
-            }
-            features.append(feature)
+        features = list(iter_tree_features(request, trees, fields or APP_TREE_PROPERTIES))
 
         geojson = {
             'type': 'FeatureCollection',
@@ -1831,28 +1894,29 @@ def filter_trees(request, species_id):
         })
 
 
-def analytics_data(request):
-    """
-    API endpoint for analytics data
-    """
+def _analytics_data_payload(user):
+    """Everything ``analytics_data`` returns for one user's data"""
+    # Aggregates are read from the rollup rows rather than the tree table
+    rollups = TreeRollup.objects.filter(user=user)
+
     # Species count
-    species_count = list(TreeSpecies.objects.filter(user=request.user).annotate(
-        count=Count('trees')
-    ).values('common_name', 'count').order_by('-count')[:10])
+    species_count = list(rollups.values('species_id', common_name=F('species__common_name')).annotate(
+        count=Sum('record_count')
+    ).order_by('-count')[:10])
 
     # Population by year
-    population_by_year = list(EndemicTree.objects.filter(user=request.user).values('year').annotate(
+    population_by_year = list(rollups.values('year').annotate(
         total=Sum('population')
     ).order_by('year'))
 
     # Population by family
-    population_by_family = list(TreeFamily.objects.filter(user=request.user).annotate(
-        total=Sum('genera__species__trees__population')
-    ).values('name', 'total').order_by('-total')[:10])
+    population_by_family = list(rollups.values(name=F('species__genus__family__name')).annotate(
+        total=Sum('population')
+    ).order_by('-total')[:10])
 
     # Health status distribution with detailed counts
-    health_status_data = list(EndemicTree.objects.filter(user=request.user).values('health_status').annotate(
-        count=Count('id'),
+    health_status_data = list(rollups.values('health_status').annotate(
+        count=Sum('record_count'),
         total_healthy=Sum('healthy_count'),
         total_good=Sum('good_count'),
         total_bad=Sum('bad_count'),
@@ -1860,8 +1924,8 @@ def analytics_data(request):
     ).order_by('health_status'))
 
     # Health status by year with detailed counts
-    health_by_year_data = list(EndemicTree.objects.filter(user=request.user).values('year', 'health_status').annotate(
-        count=Count('id'),
+    health_by_year_data = list(rollups.values('year', 'health_status').annotate(
+        count=Sum('record_count'),
         total_healthy=Sum('healthy_count'),
         total_good=Sum('good_count'),
         total_bad=Sum('bad_count'),
@@ -1869,7 +1933,7 @@ def analytics_data(request):
     ).order_by('year', 'health_status'))
 
     # Calculate overall health metrics
-    total_trees = EndemicTree.objects.filter(user=request.user).aggregate(
+    total_trees = rollups.aggregate(
         total_healthy=Sum('healthy_count'),
         total_good=Sum('good_count'),
         total_bad=Sum('bad_count'),
@@ -1893,61 +1957,29 @@ def analytics_data(request):
             'deceased_percentage': 0,
         }
 
-    # Historical data analytics based on year
-    # Get unique years
-    years = EndemicTree.objects.filter(user=request.user).values('year').distinct().order_by('year')
-    year_list = [item['year'] for item in years]
-
-    # Species richness by year
-    species_richness_by_year = []
-    for year in year_list:
-        species_count = TreeSpecies.objects.filter(user=request.user, trees__year=year).distinct().count()
-        species_richness_by_year.append({
-            'year': year,
-            'richness': species_count
-        })
-
-    # Growth rate calculation between years
-    growth_rate_by_year = []
-    for i in range(1, len(population_by_year)):
-        current_year = population_by_year[i]
-        prev_year = population_by_year[i - 1]
-
-        if prev_year['total'] > 0:  # Avoid division by zero
-            growth_rate = ((current_year['total'] - prev_year['total']) / prev_year['total']) * 100
-        else:
-            growth_rate = 0
-
-        growth_rate_by_year.append({
-            'year': current_year['year'],
-            'growth_rate': round(growth_rate, 2)
-        })
-
-    # Environmental metrics (simulated data)
-    # In a real app, these would be calculated from actual data
-    ecological_zones = [
-        {'zone': 'Primary Forest', 'count': 45},
-        {'zone': 'Secondary Forest', 'count': 27},
-        {'zone': 'Riparian Zones', 'count': 15},
-        {'zone': 'Forest Edge', 'count': 8},
-        {'zone': 'Mountainous', 'count': 5},
+    # Biodiversity indices per year and location, computed from one
+    # population matrix and cached until the user's data changes
+    diversity = biodiversity(user)
+    species_richness_by_year = [
+        {'year': item['year'], 'richness': item['richness']} for item in diversity['by_year']
     ]
 
-    # Biodiversity indices (simulated data)
-    biodiversity_indices = []
-    for year in year_list:
-        biodiversity_indices.append({
-            'year': year,
-            'shannon_index': round(3.0 + (year - min(year_list)) * 0.1, 2),  # Simulated data
-            'simpson_index': round(0.8 + (year - min(year_list)) * 0.02, 2),  # Simulated data
-        })
-
-    # Top species by population (for charts fallback)
-    species_population = list(TreeSpecies.objects.filter(user=request.user).annotate(
-        total_population=Sum('trees__population'),
-        locations_count=Count('trees__location', distinct=True)
-    ).values('common_name', 'scientific_name', 'total_population', 'locations_count')
-    .order_by('-total_population')[:10])
+    # Recorded species and population per IUCN conservation status
+    conservation_status = list(rollups.values(
+        status=Coalesce(NullIf('species__conservation_status', Value('')), Value('Not assessed'))
+    ).annotate(
+        species_count=Count('species', distinct=True),
+        population=Sum('population')
+    ).order_by('-population'))
+
+    # Top species by population (for charts fallback); the rollups are not
+    # kept per location, so this one groups the tree records
+    species_population = list(EndemicTree.objects.filter(user=user).values(
+        common_name=F('species__common_name'), scientific_name=F('species__scientific_name')
+    ).annotate(
+        total_population=Sum('population'),
+        locations_count=Count('location', distinct=True)
+    ).order_by('-total_population')[:10])
 
     # Add health metrics to the response
     data = {
@@ -1955,18 +1987,120 @@ def analytics_data(request):
         'population_by_year': population_by_year,
         'population_by_family': population_by_family,
         'species_richness_by_year': species_richness_by_year,
-        'growth_rate_by_year': growth_rate_by_year,
-        'conservation_status': ecological_zones,
-        'biodiversity_indices': biodiversity_indices,
+        'growth_rate_by_year': growth_rate_by_year(population_by_year),
+        'population_forecast': forecast(user)['total'],
+        'seed_summary': seed_cohorts(user)['summary'],
+        'conservation_status': conservation_status,
+        'biodiversity_indices': diversity['by_year'],
+        'biodiversity_by_location': diversity['by_location'],
+        'biodiversity_overall': diversity['overall'],
         'health_status_data': health_status_data,
         'health_by_year_data': health_by_year_data,
         'health_metrics': health_metrics,
         'species_data': species_population,
     }
 
+    return data
+
+
+@login_required(login_url='app:login')
+@versioned_feed()
+def analytics_data(request):
+    """
+    API endpoint for analytics data, cached until the user's data changes
+    """
+    data = cached_analytics(
+        'analytics-data', DatasetVersion.scope_for(request.user),
+        lambda: _analytics_data_payload(request.user)
+    )
     return JsonResponse(data)
 
 
+@login_required(login_url='app:login')
+@versioned_feed()
+def growth_rates(request):
+    """
+    API endpoint for population growth of the user's trees per species,
+    location, family or in total
+
+    Query parameters (all optional):
+        dimension - species (default), location, family or total
+        window - years in the moving average (default 3)
+        trend - only series that are declining, stable or growing
+        species, location, family, genus, health_status, year_min, year_max -
+        tree filters as in query_trees
+    """
+    try:
+        dimension, window, trend, filters = parse_growth_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(growth(request.user, dimension, window, trend, filters))
+
+
+@login_required(login_url='app:login')
+@versioned_feed()
+def population_forecast(request):
+    """
+    API endpoint projecting the population of each of the user's species,
+    and of all their trees, with 95% prediction bands
+
+    Query parameters (all optional):
+        model - linear (default) or log_linear
+        years - years to project past the last recorded year (default 5)
+        species, location, family, genus, health_status, year_min, year_max -
+        tree filters as in query_trees
+    """
+    try:
+        model, horizon, filters = parse_forecast_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(forecast(request.user, model, horizon, filters))
+
+
+@login_required(login_url='app:login')
+@versioned_feed()
+def seed_cohorts_data(request):
+    """
+    API endpoint for cohort analytics of the user's seed plantings:
+    germination lag, survival by species, location and planting month, and
+    the expected maturity timeline
+
+    Query parameters (all optional):
+        species, location - comma separated IDs
+        planted_from, planted_to - inclusive planting dates (YYYY-MM-DD)
+    """
+    try:
+        filters = parse_cohort_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(seed_cohorts(request.user, filters))
+
+
+@login_required(login_url='app:login')
+def job_list(request):
+    """
+    API endpoint listing the user's recent background jobs
+
+    Query parameters (optional):
+        kind - only jobs of this kind
+    """
+    jobs = Job.objects.filter(user=request.user).defer('data')
+    kind = request.GET.get('kind')
+    if kind:
+        jobs = jobs.filter(kind=kind)
+    return JsonResponse({'jobs': [job.as_dict() for job in jobs[:20]]})
+
+
+@login_required(login_url='app:login')
+def job_status(request, job_id):
+    """
+    API endpoint for the status, progress and, once it has succeeded, the
+    result of one of the user's background jobs
+    """
+    job = get_object_or_404(Job.objects.defer('data'), id=job_id, user=request.user)
+    return JsonResponse(job.as_dict())
+
+
 @require_POST
 def set_theme(request):
     """
@@ -2103,7 +2237,7 @@ def edit_tree(request, tree_id):
                     image_file = request.FILES['tree_image']
                     
                     # Check if species already has an image
-                    if tree.species.image:
+                    if tree.species.has_image:
                         return JsonResponse({
                             'success': False,
                             'error': f"Image already exists for {tree.species.common_name} ({tree.species.scientific_name}). To update the image, please edit the species in the admin panel."
@@ -2152,7 +2286,7 @@ def edit_tree(request, tree_id):
                 'latitude': tree.location.latitude,
                 'longitude': tree.location.longitude,
                 'notes': tree.notes or '',
-                'image_url': request.build_absolute_uri(reverse('app:species_image', args=[tree.species.id])) if tree.species.image else None
+                'image_url': request.build_absolute_uri(reverse('app:species_image', args=[tree.species.id])) if tree.species.has_image else None
             })
 
     except Exception as e:
@@ -2242,23 +2376,24 @@ def delete_trees_bulk(request):
         locations_to_check = []
         species_to_check = set()  # Use set to avoid duplicates
         
-        for tree in trees:
-            location = tree.location
-            species = tree.species
-            locations_to_check.append(location)
-            if species:
-                species_to_check.add(species)
-            tree.delete()
-            deleted_count += 1
-        
-        # Delete locations that are no longer used
-        for location in locations_to_check:
-            if location and not location.trees.exists():
-                location.delete()
-        
-        # Clean up orphaned taxonomy records
-        for species in species_to_check:
-            cleanup_orphaned_taxonomy(species)
+        with bulk_write(request.user):
+            for tree in trees:
+                location = tree.location
+                species = tree.species
+                locations_to_check.append(location)
+                if species:
+                    species_to_check.add(species)
+                tree.delete()
+                deleted_count += 1
+
+            # Delete locations that are no longer used
+            for location in locations_to_check:
+                if location and not location.trees.exists():
+                    location.delete()
+
+            # Clean up orphaned taxonomy records
+            for species in species_to_check:
+                cleanup_orphaned_taxonomy(species)
         
         return JsonResponse({
             'success': True,
@@ -2274,36 +2409,35 @@ def delete_trees_bulk(request):
 @login_required(login_url='app:login')
 @require_POST
 def delete_all_trees(request):
-    """View for deleting all tree records."""
-    try:
-        # Get count before deletion
-        total_count = EndemicTree.objects.filter(user=request.user).count()
-        
-        # Get all locations and species to check after deletion
-        locations_to_check = list(Location.objects.filter(user=request.user, trees__isnull=False).distinct())
-        species_to_check = set(TreeSpecies.objects.filter(user=request.user, trees__isnull=False).distinct())
-        
+    """View for queueing the deletion of all tree records."""
+    job = enqueue('delete_all_trees', user=request.user)
+    return job_accepted(job)
+
+
+def delete_all_trees_job(job):
+    """Job handler for ``delete_all_trees``"""
+    user = job.user
+    # Get count before deletion
+    total_count = EndemicTree.objects.filter(user=user).count()
+
+    # Get all locations and species to check after deletion
+    locations_to_check = list(Location.objects.filter(user=user, trees__isnull=False).distinct())
+    species_to_check = set(TreeSpecies.objects.filter(user=user, trees__isnull=False).distinct())
+
+    with bulk_write(user):
         # Delete all trees
-        EndemicTree.objects.filter(user=request.user).delete()
-        
+        EndemicTree.objects.filter(user=user).delete()
+
         # Delete locations that are no longer used
         for location in locations_to_check:
             if not location.trees.exists():
                 location.delete()
-        
+
         # Clean up all orphaned taxonomy records
         for species in species_to_check:
             cleanup_orphaned_taxonomy(species)
-        
-        return JsonResponse({
-            'success': True,
-            'deleted_count': total_count
-        })
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        }, status=500)
+
+    return {'deleted_count': total_count}
 
 
 @login_required(login_url='app:login')
@@ -2356,23 +2490,24 @@ def delete_seeds_bulk(request):
         locations_to_check = []
         species_to_check = set()
         
-        for seed in seeds:
-            location = seed.location
-            species = seed.species
-            locations_to_check.append(location)
-            if species:
-                species_to_check.add(species)
-            seed.delete()
-            deleted_count += 1
-        
-        # Delete locations that are no longer used
-        for location in locations_to_check:
-            if location and not location.trees.exists() and not location.seeds.exists():
-                location.delete()
-        
-        # Clean up orphaned taxonomy records
-        for species in species_to_check:
-            cleanup_orphaned_taxonomy(species)
+        with bulk_write(request.user):
+            for seed in seeds:
+                location = seed.location
+                species = seed.species
+                locations_to_check.append(location)
+                if species:
+                    species_to_check.add(species)
+                seed.delete()
+                deleted_count += 1
+
+            # Delete locations that are no longer used
+            for location in locations_to_check:
+                if location and not location.trees.exists() and not location.seeds.exists():
+                    location.delete()
+
+            # Clean up orphaned taxonomy records
+            for species in species_to_check:
+                cleanup_orphaned_taxonomy(species)
         
         return JsonResponse({
             'success': True,
@@ -2397,17 +2532,18 @@ def delete_all_seeds(request):
         locations_to_check = list(Location.objects.filter(user=request.user, seeds__isnull=False).distinct())
         species_to_check = set(TreeSpecies.objects.filter(user=request.user, seeds__isnull=False).distinct())
         
-        # Delete all seeds
-        TreeSeed.objects.filter(user=request.user).delete()
-        
-        # Delete locations that are no longer used
-        for location in locations_to_check:
-            if not location.trees.exists() and not location.seeds.exists():
-                location.delete()
-        
-        # Clean up all orphaned taxonomy records
-        for species in species_to_check:
-            cleanup_orphaned_taxonomy(species)
+        with bulk_write(request.user):
+            # Delete all seeds
+            TreeSeed.objects.filter(user=request.user).delete()
+
+            # Delete locations that are no longer used
+            for location in locations_to_check:
+                if not location.trees.exists() and not location.seeds.exists():
+                    location.delete()
+
+            # Clean up all orphaned taxonomy records
+            for species in species_to_check:
+                cleanup_orphaned_taxonomy(species)
         
         return JsonResponse({
             'success': True,
@@ -2516,6 +2652,7 @@ def edit_seed(request, seed_id):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
+@versioned_feed()
 def api_layers(request):
     """API endpoint for managing map layers."""
     # Only require authentication for POST requests (creating/editing layers)
@@ -2853,7 +2990,7 @@ def api_supabase_data(request):
                         print(f"Warning: Submission {submission_id} has empty image data")
                     else:
                         # Check if species already has an image
-                        if species.image:
+                        if species.has_image:
                             print(f"Warning: Species {species.id} ({species.common_name}) already has an image. Skipping image import from submission {submission_id}.")
                         else:
                             # Store binary data in species (shared by all trees with same common_name and scientific_name)
@@ -2979,7 +3116,8 @@ def public_submission_image(request, submission_id):
 def species_image(request, species_id):
     """Serve image from TreeSpecies as HTTP response."""
     try:
-        species = TreeSpecies.objects.get(id=species_id, user=request.user)
+        # The only view that needs the blob, so load it with the row
+        species = TreeSpecies.objects.defer(None).get(id=species_id, user=request.user)
         
         # Check if image exists
         if not species.image:
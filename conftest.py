@@ -75,6 +75,12 @@ def clear_database(db):
     UserSetting.objects.all().delete()
     User.objects.all().delete()
 
+    # Drop cached feed data computed from the previous test's records
+    from django.core.cache import cache
+    cache.clear()
+    from app import nearest
+    nearest._indexes.clear()
+
 
 @pytest.fixture
 def api_client():
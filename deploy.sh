@@ -66,8 +66,8 @@ echo ""
 echo "Next steps:"
 echo "1. Create superuser: python manage.py createsuperuser"
 echo "2. Test Gunicorn: gunicorn --config gunicorn_config.py endemic_trees.wsgi:application"
-echo "3. Configure systemd service (see DEPLOYMENT.md)"
+echo "3. Configure systemd services for the app and the job worker (see DEPLOYMENT.md)"
 echo "4. Configure Nginx (see DEPLOYMENT.md)"
-echo "5. Start services: sudo systemctl start endemic_trees && sudo systemctl start nginx"
+echo "5. Start services: sudo systemctl start endemic_trees endemic_trees_worker && sudo systemctl start nginx"
 echo ""
 
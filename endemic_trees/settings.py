@@ -177,6 +177,41 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# On-disk cache of encoded map vector tiles (see app/tiles.py)
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(BASE_DIR, 'tile_cache'))
+
+# Cache for computed analytics, compressed feed bodies and density grids.
+# CACHE_BACKEND selects where entries live:
+#   locmem - memory of each process (default; nothing to set up)
+#   file   - a directory shared by the processes of one server (CACHE_LOCATION)
+#   redis  - a Redis server shared by every server (CACHE_LOCATION, e.g.
+#            redis://localhost:6379/1; needs the redis package)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').lower()
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', 'redis://localhost:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'endemic-trees',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000'))},
+        }
+    }
+CACHES['default']['KEY_PREFIX'] = os.getenv('CACHE_KEY_PREFIX', 'etm')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -1,19 +1,42 @@
 import json
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_protect
 from django.db.models import Count, Sum, Q
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.urls import reverse
 from django.contrib.auth.models import User
 
 from app.models import (
     EndemicTree, MapLayer, UserSetting, TreeFamily,
-    TreeGenus, TreeSpecies, Location, PinStyle, TreeSeed, UserProfile
+    TreeGenus, TreeSpecies, Location, PinStyle, TreeSeed, UserProfile,
+    DatasetVersion, TreeRollup
 )
+from app.spatial import filter_bbox, viewport_from_request
+from app.clustering import wants_clusters, cluster_feature_collection
+from app.versioning import versioned_feed
+from app.sync import (
+    changed_since, deleted_since, resync_collection,
+    resync_required, since_from_request, sync_token
+)
+from app.columnar import columnar_tree_response, wants_columnar
+from app import tiles
+from app.feeds import iter_tree_features, parse_fields, streaming_feature_collection
+from app.density import density_response
+from app.areas import area_stats_response
+from app.nearest import nearby_response
+from app.filters import active_filters, tree_filter_q
+from app.snapshot import current_snapshot, report_statistics
+from app.stats import tree_statistics
+from app.analytics_cache import cache_statistics
+from app.growth import growth, parse_growth_params
+from app.forecast import forecast, parse_forecast_params
+from app.cohorts import parse_cohort_params, seed_cohorts
+from app.jobs import enqueue, job_accepted
 
 
 def get_setting(user, key, default=None):
@@ -160,131 +183,38 @@ def gis(request):
 def analytics(request):
     """
     Analytics and visualization view - shows all data from all users
+
+    The figures come from the global analytics snapshot, so the page shows
+    when it was last built.
     """
+    empty_context = {
+        'active_page': 'analytics',
+        'population_data': '[]',
+        'health_status_data': '[]',
+        'family_data': '[]',
+        'genus_data': '[]',
+        'species_data': '[]',
+        'growth_rate_by_year': '[]',
+        'location_data': '[]',
+        'health_by_year': '[]',
+        'forecast_data': 'null'
+    }
     try:
-        # Check if there's any data in the database
-        if not EndemicTree.objects.exists():
-            return render(request, 'head/analytics.html', {
-                'active_page': 'analytics',
-                'population_data': '[]',
-                'health_status_data': '[]',
-                'family_data': '[]',
-                'genus_data': '[]',
-                'species_data': '[]',
-                'growth_rate_by_year': '[]',
-                'location_data': '[]',
-                'health_by_year': '[]'
-            })
-
-        # Population by year - ALL USERS DATA
-        population_by_year = list(EndemicTree.objects.values('year')
-            .annotate(total=Sum('population'))
-            .order_by('year'))
-
-        # Health status distribution - ALL USERS DATA
-        health_status_data = list(EndemicTree.objects.values('health_status')
-            .annotate(count=Sum('population'))
-            .order_by('health_status'))
-
-        # Family distribution data - ALL USERS DATA
-        family_data = list(TreeFamily.objects.annotate(
-            total_population=Sum('genera__species__trees__population'),
-            species_count=Count('genera__species', distinct=True)
-        ).values('name', 'total_population', 'species_count')
-        .order_by('-total_population')[:10])
-
-        # Species distribution by genus - ALL USERS DATA
-        genus_data = list(TreeGenus.objects.annotate(
-            total_population=Sum('species__trees__population'),
-            species_count=Count('species', distinct=True)
-        ).values('name', 'family__name', 'total_population', 'species_count')
-        .order_by('-total_population')[:10])
-
-        # Species data with population - ALL USERS DATA
-        species_data = list(TreeSpecies.objects.annotate(
-            total_population=Sum('trees__population'),
-            locations_count=Count('trees__location', distinct=True)
-        ).values('common_name', 'scientific_name', 'total_population', 'locations_count')
-        .order_by('-total_population')[:10])
-
-        # Calculate growth rate
-        growth_rate_by_year = []
-        if len(population_by_year) > 1:
-            for i in range(1, len(population_by_year)):
-                current_year = population_by_year[i]
-                prev_year = population_by_year[i - 1]
-                
-                if prev_year['total'] and prev_year['total'] > 0:
-                    growth_rate = ((current_year['total'] - prev_year['total']) / prev_year['total']) * 100
-                else:
-                    growth_rate = 0
-                
-                growth_rate_by_year.append({
-                    'year': current_year['year'],
-                    'growth_rate': round(growth_rate, 2)
-                })
+        snapshot = current_snapshot()
+        context = dict(empty_context, snapshot_built_at=snapshot.built_at)
 
-        # Location-based distribution - ALL USERS DATA
-        location_data = list(Location.objects.annotate(
-            total_trees=Sum('trees__population'),
-            species_count=Count('trees__species', distinct=True)
-        ).values('name', 'latitude', 'longitude', 'total_trees', 'species_count')
-        .exclude(total_trees__isnull=True)
-        .order_by('-total_trees'))
-
-        # Health status by year - ALL USERS DATA
-        health_by_year = list(EndemicTree.objects.values('year', 'health_status')
-            .annotate(population=Sum('population'))
-            .order_by('year', 'health_status'))
-
-        # Handle None values and convert Decimal to float for JSON serialization
-        def clean_data(data):
-            if isinstance(data, list):
-                return [clean_data(item) for item in data]
-            elif isinstance(data, dict):
-                return {k: clean_data(v) if v is not None else 0 for k, v in data.items()}
-            elif str(type(data)) == "<class 'decimal.Decimal'>":
-                return float(data)
-            return data
-
-        # Clean and prepare all data for JSON serialization
-        population_by_year = clean_data(population_by_year or [])
-        health_status_data = clean_data(health_status_data or [])
-        family_data = clean_data(family_data or [])
-        genus_data = clean_data(genus_data or [])
-        species_data = clean_data(species_data or [])
-        growth_rate_by_year = clean_data(growth_rate_by_year or [])
-        location_data = clean_data(location_data or [])
-        health_by_year = clean_data(health_by_year or [])
-
-        context = {
-            'active_page': 'analytics',
-            'population_data': json.dumps(population_by_year),
-            'health_status_data': json.dumps(health_status_data),
-            'family_data': json.dumps(family_data),
-            'genus_data': json.dumps(genus_data),
-            'species_data': json.dumps(species_data),
-            'growth_rate_by_year': json.dumps(growth_rate_by_year),
-            'location_data': json.dumps(location_data),
-            'health_by_year': json.dumps(health_by_year)
-        }
+        # Check if there's any data in the database
+        if not snapshot.data['report']['total_trees']:
+            return render(request, 'head/analytics.html', context)
 
+        for key, series in snapshot.data['analytics'].items():
+            context[key] = json.dumps(series)
+        context['forecast_data'] = json.dumps(forecast(None)['total'])
         return render(request, 'head/analytics.html', context)
 
     except Exception as e:
         print(f"Analytics Error: {str(e)}")
-        context = {
-            'active_page': 'analytics',
-            'population_data': '[]',
-            'health_status_data': '[]',
-            'family_data': '[]',
-            'genus_data': '[]',
-            'species_data': '[]',
-            'growth_rate_by_year': '[]',
-            'location_data': '[]',
-            'health_by_year': '[]'
-        }
-        return render(request, 'head/analytics.html', context)
+        return render(request, 'head/analytics.html', empty_context)
 
 
 @login_required(login_url='head:login')
@@ -341,64 +271,60 @@ def about(request):
 
 # API Views for head app - showing all users data
 @login_required(login_url='head:login')
+@versioned_feed(all_users=True)
 def tree_data(request):
     """
     API endpoint for tree data in GeoJSON format - ALL USERS DATA
+
+    Optional query parameters:
+        bbox - "west,south,east,north"; only trees inside the viewport are returned
+        zoom - current map zoom level; at low zoom clusters are returned instead of trees
+        cluster - "0" to always return individual trees
+        since - sync_token of a previous response; only trees changed since then are
+                returned (ignoring bbox/zoom), with the IDs of deleted trees in "deleted";
+                a token older than the tombstone retention gets "resync": true instead
+        format - "columnar" for the compact binary body described in app/columnar.py
+        fields - comma separated feature properties to return, e.g. "species_id,population";
+                 only the columns they need are read (GeoJSON responses only)
     """
     try:
-        trees = EndemicTree.objects.select_related('species', 'species__genus', 'species__genus__family', 'location').all()
+        bbox, zoom = viewport_from_request(request)
+        since = since_from_request(request)
+        fields = parse_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
 
-        # Get pin style
-        try:
-            pin_style = PinStyle.objects.get(user=request.user, is_default=True)
-        except PinStyle.DoesNotExist:
-            try:
-                pin_style = PinStyle.objects.filter(is_default=True).first()
-            except:
-                pin_style = None
+    try:
+        token = sync_token()
+        if since is not None and resync_required(since):
+            return JsonResponse(resync_collection(token))
+        if since is None and wants_clusters(request, zoom):
+            return JsonResponse(cluster_feature_collection(
+                EndemicTree.objects.all(), 'trees', DatasetVersion.GLOBAL_SCOPE, zoom, bbox
+            ))
+
+        # Stream features straight from the database so memory use stays flat
+        # however many trees exist
+        members = {'sync_token': token}
+        if since is not None:
+            trees = changed_since(EndemicTree.objects.all(), since)
+            members['since'] = since.isoformat()
+            members['deleted'] = deleted_since('tree', since)
+        else:
+            trees = filter_bbox(EndemicTree.objects.all(), bbox)
+            if bbox is not None:
+                members['bbox'] = list(bbox)
+            if zoom is not None:
+                members['zoom'] = zoom
 
-        # Convert to GeoJSON format
-        features = []
-        for tree in trees:
-            # Get image URL from species (shared by all trees with same common_name and scientific_name)
-            image_url = None
-            if tree.species.image:
-                image_url = request.build_absolute_uri(reverse('app:species_image', args=[tree.species.id]))
-            
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [tree.location.longitude, tree.location.latitude]
-                },
-                'properties': {
-                    'id': str(tree.id),
-                    'species_id': str(tree.species.id),  # Add species_id for filtering
-                    'location_id': str(tree.location.id),  # Add location_id for filtering
-                    'common_name': tree.species.common_name,
-                    'scientific_name': tree.species.scientific_name,
-                    'family': tree.species.genus.family.name if tree.species.genus and tree.species.genus.family else 'Unknown',
-                    'genus': tree.species.genus.name if tree.species.genus else 'Unknown',
-                    'location': tree.location.name,
-                    'population': tree.population,
-                    'year': tree.year,
-                    'health_status': tree.health_status,
-                    'healthy_count': tree.healthy_count,
-                    'good_count': tree.good_count,
-                    'bad_count': tree.bad_count,
-                    'deceased_count': tree.deceased_count,
-                    'hectares': tree.hectares,
-                    'notes': tree.notes or '',
-                    'image_url': image_url,
-                    'user': tree.user.username if tree.user else 'Unknown'
-                }
-            }
-            features.append(feature)
+        if wants_columnar(request):
+            return columnar_tree_response(request, trees, **members)
 
-        return JsonResponse({
-            'type': 'FeatureCollection',
-            'features': features
-        })
+        return streaming_feature_collection(iter_tree_features(request, trees, fields), **members)
 
     except Exception as e:
         return JsonResponse({
@@ -409,12 +335,37 @@ def tree_data(request):
 
 
 @login_required(login_url='head:login')
+@versioned_feed(all_users=True)
 def seed_data(request):
     """
     API endpoint for seed data in GeoJSON format - ALL USERS DATA
+
+    Accepts the same bbox, zoom, cluster and since parameters as tree_data.
     """
     try:
-        seeds = TreeSeed.objects.select_related('species', 'location').all()
+        bbox, zoom = viewport_from_request(request)
+        since = since_from_request(request)
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
+
+    try:
+        token = sync_token()
+        if since is not None and resync_required(since):
+            return JsonResponse(resync_collection(token))
+        if since is None and wants_clusters(request, zoom):
+            return JsonResponse(cluster_feature_collection(
+                TreeSeed.objects.all(), 'seeds', DatasetVersion.GLOBAL_SCOPE, zoom, bbox
+            ))
+
+        seeds = TreeSeed.objects.select_related('species', 'location', 'user').defer('species__image').all()
+        if since is not None:
+            seeds = changed_since(seeds, since)
+        else:
+            seeds = filter_bbox(seeds, bbox)
 
         features = []
         for seed in seeds:
@@ -437,12 +388,134 @@ def seed_data(request):
             }
             features.append(feature)
 
+        geojson = {
+            'type': 'FeatureCollection',
+            'features': features,
+            'sync_token': token
+        }
+        if since is not None:
+            geojson['since'] = since.isoformat()
+            geojson['deleted'] = deleted_since('seed', since)
+
+        return JsonResponse(geojson)
+
+    except Exception as e:
         return JsonResponse({
             'type': 'FeatureCollection',
-            'features': features
-        })
+            'features': [],
+            'error': str(e)
+        }, status=500)
+
+
+@login_required(login_url='head:login')
+@versioned_feed(all_users=True)
+def tree_density(request):
+    """
+    API endpoint returning the population density grid of the trees of ALL USERS
+    for the heatmap layer.
+
+    Query parameters:
+        bbox - west,south,east,north viewport (required)
+        zoom - map zoom level (required)
+        resolution - grid cells per 256px tile edge: 8, 16, 32 (default) or 64
+        species_id - only count trees of this species
+    """
+    return density_response(request, EndemicTree.objects.all(), DatasetVersion.GLOBAL_SCOPE)
+
+
+@login_required(login_url='head:login')
+def area_stats(request):
+    """
+    API endpoint aggregating ALL USERS' trees and seeds inside a shape drawn on
+    the map.
+
+    POST body: a GeoJSON Polygon (or Feature) for polygons and rectangles, or
+    ``{"type": "Circle", "coordinates": [lng, lat], "radius": metres}``.
+    """
+    return area_stats_response(
+        request,
+        EndemicTree.objects.all(),
+        TreeSeed.objects.all()
+    )
+
+
+@login_required(login_url='head:login')
+@versioned_feed(all_users=True)
+def nearby_records(request):
+    """
+    API endpoint returning ALL USERS' trees and seeds nearest to a coordinate,
+    with great-circle distances in metres.
+
+    Query parameters:
+        lat, lng - the coordinate (required)
+        k - number of nearest records per kind (default 10, at most 100)
+        radius - return every record within this many metres instead of k
+        kind - trees or seeds (default both)
+    """
+    return nearby_response(request, None)
+
+
+@login_required(login_url='head:login')
+def vector_tile(request, kind, z, x, y):
+    """
+    API endpoint serving trees or seeds of ALL USERS as a Mapbox Vector Tile.
+
+    ``kind`` is ``trees`` or ``seeds``; each point carries species_id,
+    population/quantity, health/germination status and year.
+    """
+    if kind not in tiles.TILE_KINDS or not tiles.valid_tile(z, x, y):
+        return JsonResponse({'error': 'Tile out of range'}, status=404)
+
+    if kind == 'trees':
+        queryset = EndemicTree.objects.all()
+    else:
+        queryset = TreeSeed.objects.all()
+
+    try:
+        data = tiles.get_tile(queryset, kind, tiles.tile_scope(), z, x, y)
+    except Exception as e:
+        print(f"Error in vector_tile API: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    response = HttpResponse(data, content_type=tiles.CONTENT_TYPE)
+    patch_cache_control(response, private=True, max_age=tiles.BROWSER_MAX_AGE)
+    return response
+
+
+@login_required(login_url='head:login')
+@versioned_feed(all_users=True)
+def query_trees(request):
+    """
+    API endpoint returning ALL USERS' trees that match a combination of filters,
+    as GeoJSON.
+
+    Query parameters (all optional, lists are comma separated):
+        species, location - IDs
+        family, genus - IDs or names
+        health_status - e.g. "good,excellent"
+        bbox - "west,south,east,north"
+        year_min/year_max, population_min/population_max,
+        hectares_min/hectares_max - inclusive ranges
+        fields - comma separated feature properties to return (see tree_data)
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+        query = tree_filter_q(request.GET)
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
 
+    try:
+        trees = EndemicTree.objects.filter(query)
+        return streaming_feature_collection(
+            iter_tree_features(request, trees, fields),
+            filters=active_filters(request.GET)
+        )
     except Exception as e:
+        print(f"Error in query_trees API: {str(e)}")
         return JsonResponse({
             'type': 'FeatureCollection',
             'features': [],
@@ -451,13 +524,28 @@ def seed_data(request):
 
 
 @login_required(login_url='head:login')
+@versioned_feed(all_users=True)
 def filter_trees(request, species_id):
     """
     API endpoint for filtered tree data - ALL USERS DATA
+
+    Kept for existing clients; query_trees (?species=) covers this and more.
+
+    Optional query parameters:
+        fields - comma separated feature properties to return (see tree_data)
     """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({
+            'type': 'FeatureCollection',
+            'features': [],
+            'error': str(e)
+        }, status=400)
+
     try:
         # Get trees for this species from all users
-        trees = EndemicTree.objects.filter(species_id=species_id).select_related('species', 'species__genus', 'species__genus__family', 'location')
+        trees = EndemicTree.objects.filter(species_id=species_id)
 
         # Get pin style
         try:
@@ -469,40 +557,7 @@ def filter_trees(request, species_id):
                 pin_style = None
 
         # Convert to GeoJSON format
-        features = []
-        for tree in trees:
-            # Get image URL from species (shared by all trees with same common_name and scientific_name)
-            image_url = None
-            if tree.species.image:
-                image_url = request.build_absolute_uri(reverse('app:species_image', args=[tree.species.id]))
-            
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [tree.location.longitude, tree.location.latitude]
-                },
-                'properties': {
-                    'id': str(tree.id),
-                    'common_name': tree.species.common_name,
-                    'scientific_name': tree.species.scientific_name,
-                    'family': tree.species.genus.family.name if tree.species.genus and tree.species.genus.family else 'Unknown',
-                    'genus': tree.species.genus.name if tree.species.genus else 'Unknown',
-                    'location': tree.location.name,
-                    'population': tree.population,
-                    'year': tree.year,
-                    'health_status': tree.health_status,
-                    'healthy_count': tree.healthy_count,
-                    'good_count': tree.good_count,
-                    'bad_count': tree.bad_count,
-                    'deceased_count': tree.deceased_count,
-                    'hectares': tree.hectares,
-                    'notes': tree.notes or '',
-                    'image_url': image_url,
-                    'user': tree.user.username if tree.user else 'Unknown'
-                }
-            }
-            features.append(feature)
+        features = list(iter_tree_features(request, trees, fields))
 
         return JsonResponse({
             'type': 'FeatureCollection',
@@ -518,25 +573,80 @@ def filter_trees(request, species_id):
 
 
 @login_required(login_url='head:login')
+@versioned_feed(all_users=True)
 def analytics_data(request):
     """
     API endpoint for analytics data - ALL USERS DATA
     """
     try:
-        # Get aggregated data from all users
+        # Aggregated data from all users, cached until any data changes
+        stats = tree_statistics()
         data = {
-            'total_trees': EndemicTree.objects.count(),
-            'total_species': TreeSpecies.objects.count(),
-            'total_locations': Location.objects.count(),
-            'total_population': EndemicTree.objects.aggregate(total=Sum('population'))['total'] or 0
+            'total_trees': stats['total_trees'],
+            'total_species': stats['total_species'],
+            'total_locations': stats['total_locations'],
+            'total_population': stats['total_population']
         }
         return JsonResponse(data)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@login_required(login_url='head:login')
+@versioned_feed(all_users=True)
+def growth_rates(request):
+    """
+    API endpoint for population growth per species, location, family or in
+    total - ALL USERS DATA (same parameters as the app endpoint)
+    """
+    try:
+        dimension, window, trend, filters = parse_growth_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(growth(None, dimension, window, trend, filters))
+
+
+@login_required(login_url='head:login')
+@versioned_feed(all_users=True)
+def population_forecast(request):
+    """
+    API endpoint projecting the population of every species, and of all
+    trees - ALL USERS DATA (same parameters as the app endpoint)
+    """
+    try:
+        model, horizon, filters = parse_forecast_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(forecast(None, model, horizon, filters))
+
+
+@login_required(login_url='head:login')
+@versioned_feed(all_users=True)
+def seed_cohorts_data(request):
+    """
+    API endpoint for cohort analytics of seed plantings - ALL USERS DATA
+    (same parameters as the app endpoint)
+    """
+    try:
+        filters = parse_cohort_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(seed_cohorts(None, filters))
+
+
+@login_required(login_url='head:login')
+@require_user_type('head_user')
+def analytics_cache_stats(request):
+    """
+    API endpoint reporting the analytics cache backend and its hit/miss
+    counts per payload kind
+    """
+    return JsonResponse(cache_statistics())
+
+
 @login_required(login_url='head:login')
 @require_user_type('head_user')
+@versioned_feed(all_users=True)
 def api_layers(request):
     """
     API endpoint for layers - Head can view all and create/edit layers
@@ -633,6 +743,7 @@ def api_layers(request):
 
 
 @login_required(login_url='head:login')
+@versioned_feed(all_users=True)
 def api_species_list(request):
     """API endpoint to get current list of species for dropdown updates - ALL USERS DATA"""
     try:
@@ -650,15 +761,12 @@ def api_species_list(request):
             for species in species_list
         ]
         
-        # Add timestamp to prevent caching
+        # Revalidation is handled by the dataset version ETag (versioned_feed)
         response = JsonResponse({
             'success': True,
             'species': species_data,
             'timestamp': timezone.now().isoformat()
         })
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
         return response
     except Exception as e:
         return JsonResponse({
@@ -668,6 +776,7 @@ def api_species_list(request):
 
 
 @login_required(login_url='head:login')
+@versioned_feed(all_users=True)
 def api_locations_list(request):
     """API endpoint to get current list of locations for dropdown updates - ALL USERS DATA"""
     try:
@@ -686,15 +795,12 @@ def api_locations_list(request):
             for location in location_list
         ]
         
-        # Add timestamp to prevent caching
+        # Revalidation is handled by the dataset version ETag (versioned_feed)
         response = JsonResponse({
             'success': True,
             'locations': location_data,
             'timestamp': timezone.now().isoformat()
         })
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
         return response
     except Exception as e:
         return JsonResponse({
@@ -791,466 +897,484 @@ def api_layers_detail(request, layer_id):
 @login_required(login_url='head:login')
 @csrf_protect
 def generate_report(request):
-    """View for generating reports based on form data - ALL USERS DATA."""
+    """
+    Queue a report of all users' data for the submitted form; the client
+    polls the returned job for the report HTML and chart data
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST method is allowed'}, status=405)
 
+    job = enqueue('head_report', user=request.user, params=request.POST.dict())
+    return job_accepted(job)
+
+
+def generate_report_job(job):
+    """Job handler for ``head_report``"""
+    return build_report(job.params)
+
+
+def build_report(form):
+    """Report HTML and chart data for the submitted report ``form`` of all users"""
+    # Get form data
+    report_type = form.get('report_type')
+    time_range = form.get('time_range')
+    species_filter = form.get('species_filter')
+    location_filter = form.get('location_filter')
+    include_charts = form.get('include_charts') == 'on'
+    include_map = form.get('include_map') == 'on'
+    include_table = form.get('include_table') == 'on'
+
+    # Get the current date and time
+    now = timezone.now()
+    date_str = now.strftime('%B %d, %Y')
+    time_str = now.strftime('%I:%M %p')
+
+    # Get report title based on type
+    report_titles = {
+        'species_distribution': 'Species Distribution Report',
+        'population_trends': 'Population Trends Report',
+        'health_analysis': 'Health Status Analysis Report',
+        'conservation_status': 'Conservation Status Report',
+        'spatial_density': 'Spatial Density Report'
+    }
+    report_title = report_titles.get(report_type, 'Endemic Trees Report')
+
+    # Get actual data statistics (ALL USERS DATA). The unfiltered report
+    # reads the global analytics snapshot; a filtered one aggregates the
+    # matching rollup rows (tree records when filtered by location).
+    stats_as_of = None
     try:
-        # Get form data
-        report_type = request.POST.get('report_type')
-        time_range = request.POST.get('time_range')
-        species_filter = request.POST.get('species_filter')
-        location_filter = request.POST.get('location_filter')
-        include_charts = request.POST.get('include_charts') == 'on'
-        include_map = request.POST.get('include_map') == 'on'
-        include_table = request.POST.get('include_table') == 'on'
-
-        # Get the current date and time
-        now = timezone.now()
-        date_str = now.strftime('%B %d, %Y')
-        time_str = now.strftime('%I:%M %p')
-
-        # Get report title based on type
-        report_titles = {
-            'species_distribution': 'Species Distribution Report',
-            'population_trends': 'Population Trends Report',
-            'health_analysis': 'Health Status Analysis Report',
-            'conservation_status': 'Conservation Status Report',
-            'spatial_density': 'Spatial Density Report'
-        }
-        report_title = report_titles.get(report_type, 'Endemic Trees Report')
+        rollups = TreeRollup.objects.all()
+        trees = EndemicTree.objects.all()
+        filtered = False
+        by_location = False
 
-        # Get actual data statistics (ALL USERS DATA)
-        try:
-            trees_query = EndemicTree.objects.all().select_related('species', 'location', 'user')
-            
-            # Apply filters for statistics
-            if species_filter and species_filter != 'all':
-                try:
-                    trees_query = trees_query.filter(species_id=int(species_filter))
-                except (ValueError, TypeError):
-                    pass
-            if location_filter and location_filter != 'all':
-                try:
-                    trees_query = trees_query.filter(location_id=int(location_filter))
-                except (ValueError, TypeError):
-                    pass
-            
-            # Calculate actual statistics with error handling
-            total_trees = trees_query.count()
-            total_population = trees_query.aggregate(total=Sum('population'))['total'] or 0
-            
-            # Get unique counts safely
-            try:
-                unique_species = trees_query.exclude(species__isnull=True).values('species').distinct().count()
-            except:
-                unique_species = 0
-            
-            try:
-                unique_locations = trees_query.exclude(location__isnull=True).values('location').distinct().count()
-            except:
-                unique_locations = 0
-            
-            try:
-                unique_users = trees_query.exclude(user__isnull=True).values('user').distinct().count()
-            except:
-                unique_users = 0
-            
-            # Health status distribution
-            try:
-                health_distribution = list(trees_query.exclude(health_status__isnull=True).values('health_status').annotate(
-                    count=Count('id'),
-                    population=Sum('population')
-                ).order_by('health_status'))
-            except:
-                health_distribution = []
-            
-            # Species distribution
-            try:
-                species_dist = list(trees_query.exclude(species__isnull=True).values('species__common_name', 'species__scientific_name').annotate(
-                    count=Count('id'),
-                    total_population=Sum('population')
-                ).order_by('-total_population')[:10])
-            except:
-                species_dist = []
-            
-            # Year distribution
+        # Apply filters for statistics
+        if species_filter and species_filter != 'all':
             try:
-                year_dist = list(trees_query.exclude(year__isnull=True).values('year').annotate(
-                    count=Count('id'),
-                    population=Sum('population')
-                ).order_by('year'))
-            except:
-                year_dist = []
-            
-            # User contribution
+                rollups = rollups.filter(species_id=int(species_filter))
+                trees = trees.filter(species_id=int(species_filter))
+                filtered = True
+            except (ValueError, TypeError):
+                pass
+        if location_filter and location_filter != 'all':
             try:
-                user_contrib = list(trees_query.exclude(user__isnull=True).values('user__username').annotate(
-                    count=Count('id'),
-                    population=Sum('population')
-                ).order_by('-population')[:10])
-            except:
-                user_contrib = []
-        except Exception as e:
-            # If statistics fail, use defaults
-            import traceback
-            traceback.print_exc()
-            total_trees = 0
-            total_population = 0
-            unique_species = 0
-            unique_locations = 0
-            unique_users = 0
-            health_distribution = []
-            species_dist = []
-            year_dist = []
-            user_contrib = []
-
-        # Build the report HTML - ensure all values are safe for f-string
-        total_trees = int(total_trees) if total_trees else 0
-        total_population = int(total_population) if total_population else 0
-        unique_species = int(unique_species) if unique_species else 0
-        unique_locations = int(unique_locations) if unique_locations else 0
-        unique_users = int(unique_users) if unique_users else 0
-        
-        html = f'''
-        <div class="report-document">
-            <div class="report-header">
-                <h1 class="report-title">{report_title}</h1>
-                <p class="report-subtitle">Endemic Trees Monitoring System - Head Portal</p>
-                <p class="report-date">Generated on {date_str} at {time_str}</p>
-                <p class="report-note"><strong>Note:</strong> This report includes data from all users ({unique_users} active users).</p>
-            </div>
+                # The rollups are not kept per location
+                trees = trees.filter(location_id=int(location_filter))
+                filtered = by_location = True
+            except (ValueError, TypeError):
+                pass
+
+        if filtered:
+            stats = report_statistics(trees if by_location else rollups, trees)
+        else:
+            snapshot = current_snapshot()
+            stats = snapshot.data['report']
+            stats_as_of = timezone.localtime(snapshot.built_at)
+
+        total_trees = stats['total_trees']
+        total_population = stats['total_population']
+        unique_species = stats['unique_species']
+        unique_locations = stats['unique_locations']
+        unique_users = stats['unique_users']
+        health_distribution = stats['health_distribution']
+        species_dist = stats['species_dist']
+        year_dist = stats['year_dist']
+        user_contrib = stats['user_contrib']
+    except Exception as e:
+        # If statistics fail, use defaults
+        import traceback
+        traceback.print_exc()
+        total_trees = 0
+        total_population = 0
+        unique_species = 0
+        unique_locations = 0
+        unique_users = 0
+        health_distribution = []
+        species_dist = []
+        year_dist = []
+        user_contrib = []
+
+    # Build the report HTML - ensure all values are safe for f-string
+    total_trees = int(total_trees) if total_trees else 0
+    total_population = int(total_population) if total_population else 0
+    unique_species = int(unique_species) if unique_species else 0
+    unique_locations = int(unique_locations) if unique_locations else 0
+    unique_users = int(unique_users) if unique_users else 0
+    stats_note = ''
+    if stats_as_of:
+        stats_note = f'<p class="report-note">Statistics as of {stats_as_of.strftime("%B %d, %Y %I:%M %p")}.</p>'
+
+    html = f'''
+    <div class="report-document">
+        <div class="report-header">
+            <h1 class="report-title">{report_title}</h1>
+            <p class="report-subtitle">Endemic Trees Monitoring System - Head Portal</p>
+            <p class="report-date">Generated on {date_str} at {time_str}</p>
+            <p class="report-note"><strong>Note:</strong> This report includes data from all users ({unique_users} active users).</p>
+            {stats_note}
+        </div>
 
-            <div class="report-section">
-                <h2 class="report-section-title">Executive Summary</h2>
-                <div class="report-stats-grid" style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem; margin: 1rem 0;">
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Tree Records</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #007bff;">{total_trees}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Population</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #28a745;">{total_population:,}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Species</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #ffc107;">{unique_species}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Locations</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #dc3545;">{unique_locations}</p>
-                    </div>
-                    <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
-                        <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Active Users</h3>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #6f42c1;">{unique_users}</p>
-                    </div>
+        <div class="report-section">
+            <h2 class="report-section-title">Executive Summary</h2>
+            <div class="report-stats-grid" style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem; margin: 1rem 0;">
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Tree Records</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #007bff;">{total_trees}</p>
                 </div>
-                <p style="margin-top: 1.5rem;">This comprehensive report provides an analysis of endemic tree data collected by all users of the Endemic Trees Monitoring System. 
-                   The data includes {total_trees} tree records with a total population of {total_population:,} trees across {unique_species} unique species, 
-                   {unique_locations} locations, and contributions from {unique_users} active users.</p>
-            </div>
-        '''
-
-        # Add charts section if included
-        if include_charts:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Data Visualization</h2>
-                <div class="report-chart-container">
-                    <canvas id="reportChart1"></canvas>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Total Population</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #28a745;">{total_population:,}</p>
+                </div>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Species</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #ffc107;">{unique_species}</p>
+                </div>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Unique Locations</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #dc3545;">{unique_locations}</p>
                 </div>
-                <div class="report-chart-container">
-                    <canvas id="reportChart2"></canvas>
+                <div class="stat-card" style="background: #f8f9fa; padding: 1rem; border-radius: 8px; border: 1px solid #dee2e6;">
+                    <h3 style="margin: 0; color: #495057; font-size: 0.9rem;">Active Users</h3>
+                    <p style="margin: 0.5rem 0 0 0; font-size: 2rem; font-weight: bold; color: #6f42c1;">{unique_users}</p>
                 </div>
             </div>
-            '''
+            <p style="margin-top: 1.5rem;">This comprehensive report provides an analysis of endemic tree data collected by all users of the Endemic Trees Monitoring System. 
+               The data includes {total_trees} tree records with a total population of {total_population:,} trees across {unique_species} unique species, 
+               {unique_locations} locations, and contributions from {unique_users} active users.</p>
+        </div>
+    '''
 
-        # Add map section if included
-        if include_map:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Spatial Distribution</h2>
-                <div class="report-map-container" id="reportMap"></div>
+    # Add charts section if included
+    if include_charts:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Data Visualization</h2>
+            <div class="report-chart-container">
+                <canvas id="reportChart1"></canvas>
             </div>
-            '''
+            <div class="report-chart-container">
+                <canvas id="reportChart2"></canvas>
+            </div>
+        </div>
+        '''
 
-        # Add data analysis sections
-        if health_distribution:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Health Status Distribution</h2>
-                <table class="report-table" style="width: 100%; border-collapse: collapse;">
-                    <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Health Status</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Number of Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
-                        </tr>
-                    </thead>
-                    <tbody>
+    # Add map section if included
+    if include_map:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Spatial Distribution</h2>
+            <div class="report-map-container" id="reportMap"></div>
+        </div>
+        '''
+
+    # Add data analysis sections
+    if health_distribution:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Health Status Distribution</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Health Status</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Number of Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for health in health_distribution:
+            status_display = health['health_status'].replace('_', ' ').title() if health['health_status'] else 'Unknown'
+            html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{status_display}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{health['count']}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{health['population']:,}</td>
+                    </tr>
             '''
-            for health in health_distribution:
-                status_display = health['health_status'].replace('_', ' ').title() if health['health_status'] else 'Unknown'
+        html += '''
+                </tbody>
+            </table>
+        </div>
+        '''
+
+    if species_dist:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Top Species by Population</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Common Name</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Scientific Name</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for species in species_dist:
+            try:
+                common_name = species.get('species__common_name') or 'Unknown'
+                scientific_name = species.get('species__scientific_name') or 'Unknown'
+                count = species.get('count', 0) or 0
+                total_pop = species.get('total_population', 0) or 0
                 html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{status_display}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{health['count']}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{health['population']:,}</td>
-                        </tr>
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{common_name}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;"><em>{scientific_name}</em></td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{total_pop:,}</td>
+                    </tr>
                 '''
-            html += '''
-                    </tbody>
-                </table>
-            </div>
-            '''
-        
-        if species_dist:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Top Species by Population</h2>
-                <table class="report-table" style="width: 100%; border-collapse: collapse;">
-                    <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Common Name</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Scientific Name</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            '''
-            for species in species_dist:
-                try:
-                    common_name = species.get('species__common_name') or 'Unknown'
-                    scientific_name = species.get('species__scientific_name') or 'Unknown'
-                    count = species.get('count', 0) or 0
-                    total_pop = species.get('total_population', 0) or 0
-                    html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{common_name}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;"><em>{scientific_name}</em></td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{total_pop:,}</td>
-                        </tr>
-                    '''
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            html += '''
-                    </tbody>
-                </table>
-            </div>
-            '''
-        
-        if year_dist:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Population Trends by Year</h2>
-                <table class="report-table" style="width: 100%; border-collapse: collapse;">
-                    <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Year</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            '''
-            for year_data in year_dist:
-                try:
-                    year = year_data.get('year', 'Unknown') or 'Unknown'
-                    count = year_data.get('count', 0) or 0
-                    population = year_data.get('population', 0) or 0
-                    html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{year}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
-                        </tr>
-                    '''
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            html += '''
-                    </tbody>
-                </table>
-            </div>
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
+        html += '''
+                </tbody>
+            </table>
+        </div>
+        '''
+
+    if year_dist:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Population Trends by Year</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Year</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for year_data in year_dist:
+            try:
+                year = year_data.get('year', 'Unknown') or 'Unknown'
+                count = year_data.get('count', 0) or 0
+                population = year_data.get('population', 0) or 0
+                html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{year}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
+                    </tr>
+                '''
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
+        html += '''
+                </tbody>
+            </table>
+        </div>
+        '''
+
+    # Projected population for trend reports, fitted for every species
+    # in one batch
+    projection = None
+    if report_type == 'population_trends':
+        try:
+            forecast_filters = {
+                name: value for name, value in (('species', species_filter), ('location', location_filter))
+                if value and value != 'all' and str(value).isdigit()
+            }
+            projection = forecast(None, filters=forecast_filters)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+
+    if projection and projection['total']:
+        html += f'''
+        <div class="report-section">
+            <h2 class="report-section-title">Population Forecast</h2>
+            <p>Linear trend of the recorded yearly population ({projection['total']['observations']} years of data), with 95% prediction bounds.</p>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Year</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Projected Population</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">95% Range</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for row in projection['total']['forecast']:
+            lower = f"{row['lower']:,.0f}" if row['lower'] is not None else '-'
+            upper = f"{row['upper']:,.0f}" if row['upper'] is not None else '-'
+            html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{row['year']}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{row['population']:,.0f}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{lower} - {upper}</td>
+                    </tr>
             '''
-        
-        if user_contrib:
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Top Contributors by Population</h2>
+        html += '''
+                </tbody>
+            </table>
+        '''
+        declining = [item for item in projection['species'] if (item['projected_change'] or 0) < 0][:5]
+        if declining:
+            from django.utils.html import escape
+            html += '<p style="margin-top: 1rem;"><strong>Species projected to decline:</strong></p><ul>'
+            for item in declining:
+                html += f"<li>{escape(item['common_name'])} (<em>{escape(item['scientific_name'])}</em>): {item['projected_change']}% by {item['forecast'][-1]['year']}</li>"
+            html += '</ul>'
+        html += '''
+        </div>
+        '''
+
+    if user_contrib:
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Top Contributors by Population</h2>
+            <table class="report-table" style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f8f9fa;">
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">User</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
+                        <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
+                    </tr>
+                </thead>
+                <tbody>
+        '''
+        for user in user_contrib:
+            try:
+                username = user.get('user__username') or 'Unknown'
+                count = user.get('count', 0) or 0
+                population = user.get('population', 0) or 0
+                html += f'''
+                    <tr>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{username}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
+                    </tr>
+                '''
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
+        html += '''
+                </tbody>
+            </table>
+        </div>
+        '''
+
+    # Add data table if included
+    if include_table:
+        # Query the database for tree data - ALL USERS
+        trees = trees_query.select_related('species', 'location', 'user').defer('species__image')
+
+        # Generate table HTML
+        html += '''
+        <div class="report-section">
+            <h2 class="report-section-title">Data Table</h2>
+            <div class="report-table-container">
                 <table class="report-table" style="width: 100%; border-collapse: collapse;">
                     <thead>
                         <tr style="background: #f8f9fa;">
+                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Species</th>
+                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Location</th>
+                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Population</th>
+                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Health Status</th>
                             <th style="padding: 0.75rem; border: 1px solid #dee2e6;">User</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Records</th>
-                            <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Total Population</th>
                         </tr>
                     </thead>
                     <tbody>
-            '''
-            for user in user_contrib:
-                try:
-                    username = user.get('user__username') or 'Unknown'
-                    count = user.get('count', 0) or 0
-                    population = user.get('population', 0) or 0
-                    html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{username}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{count}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population:,}</td>
-                        </tr>
-                    '''
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            html += '''
-                    </tbody>
-                </table>
-            </div>
-            '''
+        '''
 
-        # Add data table if included
-        if include_table:
-            # Query the database for tree data - ALL USERS
-            trees = trees_query.select_related('species', 'location', 'user')
-            
-            # Generate table HTML
-            html += '''
-            <div class="report-section">
-                <h2 class="report-section-title">Data Table</h2>
-                <div class="report-table-container">
-                    <table class="report-table" style="width: 100%; border-collapse: collapse;">
-                        <thead>
-                            <tr style="background: #f8f9fa;">
-                                <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Species</th>
-                                <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Location</th>
-                                <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Population</th>
-                                <th style="padding: 0.75rem; border: 1px solid #dee2e6;">Health Status</th>
-                                <th style="padding: 0.75rem; border: 1px solid #dee2e6;">User</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-            '''
-            
-            # Add table rows with proper error handling
-            tree_count = 0
-            for tree in trees[:100]:  # Limit to 100 rows for performance
-                try:
-                    common_name = tree.species.common_name if tree.species else 'Unknown'
-                    scientific_name = tree.species.scientific_name if tree.species else 'Unknown'
-                    location_name = tree.location.name if tree.location else 'Unknown'
-                    health_status = tree.health_status or 'Unknown'
-                    population = tree.population or 0
-                    user_name = tree.user.username if tree.user else 'Unknown'
-                    
-                    html += f'''
-                        <tr>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{common_name} ({scientific_name})</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{location_name}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{health_status.replace('_', ' ').title()}</td>
-                            <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{user_name}</td>
-                        </tr>
-                    '''
-                    tree_count += 1
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    continue
-            
-            if tree_count == 0:
-                html += '''
+        # Add table rows with proper error handling
+        tree_count = 0
+        for tree in trees[:100]:  # Limit to 100 rows for performance
+            try:
+                common_name = tree.species.common_name if tree.species else 'Unknown'
+                scientific_name = tree.species.scientific_name if tree.species else 'Unknown'
+                location_name = tree.location.name if tree.location else 'Unknown'
+                health_status = tree.health_status or 'Unknown'
+                population = tree.population or 0
+                user_name = tree.user.username if tree.user else 'Unknown'
+
+                html += f'''
                     <tr>
-                        <td colspan="5" style="text-align: center; padding: 20px;">No tree data available for the selected filters.</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{common_name} ({scientific_name})</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{location_name}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{population}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{health_status.replace('_', ' ').title()}</td>
+                        <td style="padding: 0.75rem; border: 1px solid #dee2e6;">{user_name}</td>
                     </tr>
                 '''
-            
+                tree_count += 1
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                continue
+
+        if tree_count == 0:
             html += '''
-                        </tbody>
-                    </table>
-                </div>
-            </div>
+                <tr>
+                    <td colspan="5" style="text-align: center; padding: 20px;">No tree data available for the selected filters.</td>
+                </tr>
             '''
 
-        # Add conclusions based on actual data
-        conclusions = []
-        if total_trees == 0:
-            conclusions.append("No tree data is available in the system. Encourage users to add tree records.")
-        else:
-            if unique_users > 0:
-                conclusions.append(f"Data is contributed by {unique_users} active users, demonstrating collaborative data collection efforts.")
-            if unique_species > 0:
-                conclusions.append(f"The system contains data for {unique_species} unique species, indicating good species diversity across all contributions.")
-            if unique_locations > 0:
-                conclusions.append(f"Trees are distributed across {unique_locations} different locations, showing comprehensive geographic coverage.")
-            if health_distribution:
-                try:
-                    excellent_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') == 'excellent'), 0)
-                    poor_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') in ['poor', 'very_poor']), 0)
-                    if excellent_count > poor_count:
-                        conclusions.append("The majority of trees across all users are in good to excellent health, indicating successful collaborative conservation efforts.")
-                    elif poor_count > excellent_count:
-                        conclusions.append("A significant number of trees require attention due to poor health status. Coordinate conservation efforts across users.")
-                except:
-                    pass
-        
-        html += f'''
-            <div class="report-section">
-                <h2 class="report-section-title">Conclusions and Recommendations</h2>
-                <p>Based on the comprehensive data analysis from all users, the following conclusions can be drawn:</p>
-                <ul>
-        '''
-        for conclusion in conclusions:
-            # Escape HTML to prevent issues
-            from django.utils.html import escape
-            escaped_conclusion = escape(str(conclusion))
-            html += f'<li>{escaped_conclusion}</li>'
-        
-        if not conclusions:
-            html += '<li>Continue encouraging collaborative data collection to build a comprehensive dataset.</li>'
-        
         html += '''
-                    <li>Regular monitoring and assessment of tree health status is essential across all user contributions.</li>
-                    <li>Collaborative data collection provides a more comprehensive view of endemic tree distribution.</li>
-                </ul>
+                    </tbody>
+                </table>
             </div>
         </div>
         '''
 
-        try:
-            return JsonResponse({
-                'reportContent': html,
-                'success': True,
-                'yearData': year_dist,  # Include year distribution data for charts
-                'healthData': health_distribution,  # Include health distribution data
-                'speciesData': species_dist  # Include species distribution data
-            })
-        except Exception as json_error:
-            # If JSON encoding fails, try to return a simpler error
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Error encoding JSON response: {error_trace}")
-            print(f"HTML length: {len(html)}")
-            return JsonResponse({
-                'error': f'Error encoding report: {str(json_error)}. Report HTML length: {len(html)} characters.',
-                'success': False
-            }, status=500)
-
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error generating report (head): {error_trace}")
-        # Return more detailed error in development, generic message in production
-        error_message = str(e)
-        if hasattr(request, 'user') and request.user.is_superuser:
-            error_message = f"{str(e)}\n\nTraceback:\n{error_trace}"
-        return JsonResponse({
-            'error': error_message,
-            'success': False
-        }, status=500)
+    # Add conclusions based on actual data
+    conclusions = []
+    if total_trees == 0:
+        conclusions.append("No tree data is available in the system. Encourage users to add tree records.")
+    else:
+        if unique_users > 0:
+            conclusions.append(f"Data is contributed by {unique_users} active users, demonstrating collaborative data collection efforts.")
+        if unique_species > 0:
+            conclusions.append(f"The system contains data for {unique_species} unique species, indicating good species diversity across all contributions.")
+        if unique_locations > 0:
+            conclusions.append(f"Trees are distributed across {unique_locations} different locations, showing comprehensive geographic coverage.")
+        if health_distribution:
+            try:
+                excellent_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') == 'excellent'), 0)
+                poor_count = next((h.get('count', 0) for h in health_distribution if h.get('health_status') in ['poor', 'very_poor']), 0)
+                if excellent_count > poor_count:
+                    conclusions.append("The majority of trees across all users are in good to excellent health, indicating successful collaborative conservation efforts.")
+                elif poor_count > excellent_count:
+                    conclusions.append("A significant number of trees require attention due to poor health status. Coordinate conservation efforts across users.")
+            except:
+                pass
+
+    html += f'''
+        <div class="report-section">
+            <h2 class="report-section-title">Conclusions and Recommendations</h2>
+            <p>Based on the comprehensive data analysis from all users, the following conclusions can be drawn:</p>
+            <ul>
+    '''
+    for conclusion in conclusions:
+        # Escape HTML to prevent issues
+        from django.utils.html import escape
+        escaped_conclusion = escape(str(conclusion))
+        html += f'<li>{escaped_conclusion}</li>'
+
+    if not conclusions:
+        html += '<li>Continue encouraging collaborative data collection to build a comprehensive dataset.</li>'
+
+    html += '''
+                <li>Regular monitoring and assessment of tree health status is essential across all user contributions.</li>
+                <li>Collaborative data collection provides a more comprehensive view of endemic tree distribution.</li>
+            </ul>
+        </div>
+    </div>
+    '''
+
+    return {
+        'reportContent': html,
+        'success': True,
+        'yearData': year_dist,  # Include year distribution data for charts
+        'healthData': health_distribution,  # Include health distribution data
+        'speciesData': species_dist  # Include species distribution data
+    }
@@ -483,6 +483,92 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
+  // Population Forecast Chart: recorded totals, the projection and its 95% band
+  const forecastChartCtx = document.getElementById("populationForecastChart")
+  if (forecastChartCtx) {
+    try {
+      const forecastData = JSON.parse(forecastChartCtx.getAttribute("data-forecast") || "null")
+      if (forecastData && forecastData.forecast && forecastData.forecast.length > 0) {
+        const history = forecastData.history
+        const projected = forecastData.forecast
+        const padding = history.map(() => null)
+        const last = history[history.length - 1]
+        new Chart(forecastChartCtx.getContext("2d"), {
+          type: "line",
+          data: {
+            labels: history.map((item) => item.year).concat(projected.map((item) => item.year)),
+            datasets: [
+              {
+                label: "Recorded Population",
+                data: history.map((item) => item.population),
+                borderColor: "rgba(46, 204, 113, 1)",
+                backgroundColor: "rgba(46, 204, 113, 0.2)",
+                borderWidth: 2,
+                tension: 0.3,
+              },
+              {
+                label: "Projected Population",
+                data: padding.slice(1).concat([last.population], projected.map((item) => item.population)),
+                borderColor: "rgba(52, 152, 219, 1)",
+                borderDash: [6, 4],
+                borderWidth: 2,
+                tension: 0.3,
+              },
+              {
+                label: "95% Upper Bound",
+                data: padding.concat(projected.map((item) => item.upper)),
+                borderColor: "rgba(52, 152, 219, 0.3)",
+                backgroundColor: "rgba(52, 152, 219, 0.15)",
+                borderWidth: 1,
+                pointRadius: 0,
+                fill: "+1",
+              },
+              {
+                label: "95% Lower Bound",
+                data: padding.concat(projected.map((item) => item.lower)),
+                borderColor: "rgba(52, 152, 219, 0.3)",
+                borderWidth: 1,
+                pointRadius: 0,
+                fill: false,
+              },
+            ],
+          },
+          options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            scales: {
+              y: {
+                beginAtZero: true,
+                grid: {
+                  color: "rgba(255, 255, 255, 0.1)",
+                },
+              },
+              x: {
+                grid: {
+                  color: "rgba(255, 255, 255, 0.1)",
+                },
+              },
+            },
+            plugins: {
+              legend: {
+                labels: {
+                  color: "rgba(255, 255, 255, 0.7)",
+                },
+              },
+            },
+          },
+        })
+      } else {
+        forecastChartCtx.style.display = "none"
+        forecastChartCtx.nextElementSibling.style.display = "block"
+      }
+    } catch (error) {
+      console.error("Error creating Population Forecast Chart:", error)
+      forecastChartCtx.style.display = "none"
+      forecastChartCtx.nextElementSibling.style.display = "block"
+    }
+  }
+
   // Initialize the distribution map if Leaflet is available
   const distributionMapDiv = document.getElementById("distributionMap")
   if (distributionMapDiv && window.L) {
@@ -135,7 +135,9 @@ document.addEventListener("DOMContentLoaded", () => {
                         const data = await response.json();
                         
                         if (response.ok && data.success) {
-                            alert(`Successfully deleted all ${data.deleted_count} record(s).`);
+                            // The deletion runs as a background job
+                            const result = await waitForJob(data.status_url);
+                            alert(`Successfully deleted all ${result.deleted_count} record(s).`);
                             // Reload page to refresh the table
                             window.location.reload();
                         } else {
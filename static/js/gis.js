@@ -192,6 +192,9 @@ document.addEventListener("DOMContentLoaded", () => {
   // Heatmap layer (will be populated with actual data)
   const heatmapLayer = L.layerGroup()
   additionalLayers.heatmap = heatmapLayer
+  // Species the heatmap density grid is restricted to, or null for all trees
+  let heatmapSpeciesId = null
+  let heatmapController = null
 
   // Populate layer controls
   const layerControlsList = document.getElementById("layerControlsList")
@@ -205,7 +208,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   // Load custom layers from database
   fetch('/api/layers/', {
-    cache: 'no-store', // Prevent caching to always get latest layer settings
+    cache: 'no-cache', // Always revalidate; unchanged layers come back as 304 Not Modified
     credentials: 'same-origin' // Include session cookies for authentication
   })
     .then(response => {
@@ -343,18 +346,8 @@ document.addEventListener("DOMContentLoaded", () => {
         }
         // Handle predefined layers  
         else if (layer.id === 'heatmap') {
-          // Load tree data and create heatmap
-          fetch("/api/tree-data/", {
-            credentials: 'same-origin' // Include session cookies for authentication
-          })
-            .then((response) => response.json())
-            .then((data) => {
-              updateHeatmap(data)
-              additionalLayers[layer.id].addTo(map)
-            })
-            .catch((error) => {
-              console.error("Error loading data for heatmap:", error)
-            })
+          // Load the density grid for the viewport and show the heatmap
+          loadHeatmap().then(() => additionalLayers[layer.id].addTo(map))
         } else {
           additionalLayers[layer.id].addTo(map)
         }
@@ -375,18 +368,8 @@ document.addEventListener("DOMContentLoaded", () => {
       console.log('Processing active predefined layer:', layer.name);
 
       if (layer.id === 'heatmap') {
-        // Load tree data and create heatmap for initially active heatmap
-        fetch("/api/tree-data/", {
-          credentials: 'same-origin' // Include session cookies for authentication
-        })
-          .then((response) => response.json())
-          .then((data) => {
-            updateHeatmap(data)
-            additionalLayers[layer.id].addTo(map)
-          })
-          .catch((error) => {
-            console.error("Error loading initial data for heatmap:", error)
-          })
+        // Load the density grid for an initially active heatmap
+        loadHeatmap().then(() => additionalLayers[layer.id].addTo(map))
       } else if (additionalLayers[layer.id]) {
         // Handle other predefined layers
         console.log('Adding active predefined layer to map:', layer.name);
@@ -481,7 +464,7 @@ document.addEventListener("DOMContentLoaded", () => {
   refreshButton.style.cursor = "pointer"
 
   refreshButton.addEventListener("click", () => {
-    Promise.all([loadTrees(), loadSeeds()])
+    Promise.all([syncTrees(), syncSeeds()])
       .then(() => {
         // Hide the filtered data container when refreshing all data
         filteredDataContainer.style.display = "none"
@@ -512,6 +495,17 @@ document.addEventListener("DOMContentLoaded", () => {
 
   document.querySelector(".gis-container").appendChild(refreshButton)
 
+  // Pick up edits made in other tabs (data entry, uploads) when returning
+  document.addEventListener("visibilitychange", () => {
+    const selectedFilter = document.querySelector('input[name="treeFilter"]:checked')
+    if (document.hidden || (selectedFilter && selectedFilter.value !== "all")) {
+      return
+    }
+    Promise.all([syncTrees(), syncSeeds()]).catch((error) => {
+      console.error("Error syncing data:", error)
+    })
+  })
+
 
   // Map type control change event
   document.querySelectorAll('input[name="mapType"]').forEach((radio) => {
@@ -525,6 +519,26 @@ document.addEventListener("DOMContentLoaded", () => {
     })
   })
 
+  // Reload the viewport-bounded tree feed after the user pans or zooms
+  let viewportReloadTimer = null
+  let heatmapReloadTimer = null
+  map.on("moveend", () => {
+    // The density grid covers the viewport, filtered or not
+    if (map.hasLayer(additionalLayers.heatmap)) {
+      clearTimeout(heatmapReloadTimer)
+      heatmapReloadTimer = setTimeout(loadHeatmap, 300)
+    }
+    const selectedFilter = document.querySelector('input[name="treeFilter"]:checked')
+    if (selectedFilter && selectedFilter.value !== "all") {
+      return
+    }
+    clearTimeout(viewportReloadTimer)
+    viewportReloadTimer = setTimeout(() => {
+      loadTrees()
+      loadSeeds()
+    }, 300)
+  })
+
   // Tree filter change event
   document.querySelectorAll('input[name="treeFilter"]').forEach((radio) => {
     radio.addEventListener("change", function () {
@@ -532,6 +546,10 @@ document.addEventListener("DOMContentLoaded", () => {
       treeLayer.clearLayers()
 
       if (filterValue === "all") {
+        heatmapSpeciesId = null
+        if (map.hasLayer(additionalLayers.heatmap)) {
+          loadHeatmap()
+        }
         loadTrees()
         // Hide the filtered data container
         filteredDataContainer.style.display = "none"
@@ -615,22 +633,89 @@ document.addEventListener("DOMContentLoaded", () => {
         },
         draw: {
           polygon: true,
-          polyline: true,
+          polyline: false,
           rectangle: true,
           circle: true,
-          marker: true,
+          circlemarker: false,
+          marker: false,
         },
       })
       map.addControl(drawControl)
       this.classList.add("active")
 
+      // Replace the handler of an earlier activation so each shape is queried once
+      map.off(L.Draw.Event.CREATED)
       map.on(L.Draw.Event.CREATED, (event) => {
         const layer = event.layer
         drawnItems.addLayer(layer)
+        const shape = drawnShape(event.layerType, layer)
+        if (shape) {
+          showAreaStats(layer, shape)
+        }
       })
     }
   })
 
+  // Body for /api/area-stats/ describing a drawn polygon, rectangle or circle
+  function drawnShape(layerType, layer) {
+    if (layerType === "circle") {
+      const center = layer.getLatLng()
+      return { type: "Circle", coordinates: [center.lng, center.lat], radius: layer.getRadius() }
+    }
+    if (layerType === "polygon" || layerType === "rectangle") {
+      return layer.toGeoJSON().geometry
+    }
+    return null
+  }
+
+  // Aggregate the records inside a drawn shape on the server and show them in a popup
+  function showAreaStats(layer, shape) {
+    const csrfInput = document.querySelector("[name=csrfmiddlewaretoken]")
+    layer.bindPopup("Calculating area statistics...").openPopup()
+
+    fetch("/api/area-stats/", {
+      method: "POST",
+      credentials: 'same-origin', // Include session cookies for authentication
+      headers: {
+        "Content-Type": "application/json",
+        "X-CSRFToken": csrfInput ? csrfInput.value : "",
+      },
+      body: JSON.stringify(shape),
+    })
+      .then((response) => response.json())
+      .then((stats) => {
+        if (stats.error) {
+          throw new Error(stats.error)
+        }
+        const trees = stats.trees
+        const seeds = stats.seeds
+        const listItems = (counts) =>
+          Object.entries(counts)
+            .map(([name, value]) => `<li>${name.replace(/_/g, " ")}: ${value.toLocaleString()}</li>`)
+            .join("")
+        const topSpecies = trees.top_species
+          .map((species) => `<li>${species.common_name}: ${species.population.toLocaleString()}</li>`)
+          .join("")
+
+        layer.setPopupContent(`
+          <div class="area-stats-popup">
+            <h4>Area Statistics</h4>
+            <p><strong>Area:</strong> ${stats.area_hectares.toLocaleString()} ha</p>
+            <p><strong>Trees:</strong> ${trees.population.toLocaleString()} in ${trees.records} records
+              (${trees.species_richness} species, ${trees.hectares.toLocaleString()} ha recorded)</p>
+            ${topSpecies ? `<p><strong>Top species:</strong></p><ul>${topSpecies}</ul>` : ""}
+            ${trees.records ? `<p><strong>Health:</strong></p><ul>${listItems(trees.health_distribution)}</ul>` : ""}
+            <p><strong>Seeds:</strong> ${seeds.quantity.toLocaleString()} in ${seeds.records} plantings</p>
+            ${seeds.records ? `<ul>${listItems(seeds.germination_status)}</ul>` : ""}
+          </div>
+        `)
+      })
+      .catch((error) => {
+        console.error("Error loading area statistics:", error)
+        layer.setPopupContent(`Could not load area statistics: ${error.message}`)
+      })
+  }
+
   // Export data tool
   document.getElementById("exportDataBtn").addEventListener("click", () => {
     // Get visible trees
@@ -661,17 +746,185 @@ document.addEventListener("DOMContentLoaded", () => {
       .catch((error) => console.error("Error exporting data:", error))
   })
 
-  // Function to load all trees
+  // Query string restricting the tree feed to the current map viewport
+  function viewportQuery() {
+    const params = new URLSearchParams({
+      bbox: map.getBounds().toBBoxString(),
+      zoom: map.getZoom(),
+    })
+    return params.toString()
+  }
+
+  // Delta-sync state per feed: the sync_token and viewport of the last full
+  // load, and the markers drawn since, keyed by record id
+  const syncState = {
+    trees: { token: null, query: null, markers: new Map() },
+    seeds: { token: null, query: null, markers: new Map() },
+  }
+
+  function resetSyncState(state, data, query) {
+    state.markers.clear()
+    // Clustered responses have no per-record markers to patch
+    state.token = data.clustered ? null : data.sync_token || null
+    state.query = query
+  }
+
+  // Remove the markers of records that were deleted or are about to be redrawn
+  function removeSyncedMarkers(state, ids) {
+    ids.forEach((id) => {
+      const entry = state.markers.get(id)
+      if (entry) {
+        entry.group.removeLayer(entry.layer)
+        state.markers.delete(id)
+      }
+    })
+  }
+
+  // Fetch only what changed since the last load and patch the markers;
+  // falls back to a full load when there is nothing to diff against
+  function syncFeed(kind, url, fullLoad, addToMap) {
+    const state = syncState[kind]
+    const query = viewportQuery()
+    if (!state.token || state.query !== query) {
+      return fullLoad()
+    }
+
+    const params = new URLSearchParams(query)
+    params.set("since", state.token)
+    return fetch(`${url}?${params.toString()}`, {
+      credentials: 'same-origin',
+      cache: 'no-cache',
+    })
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! Status: ${response.status}`)
+        }
+        return response.json()
+      })
+      .then((data) => {
+        if (data.error) {
+          throw new Error(data.error)
+        }
+        if (data.resync) {
+          // Too old to diff: tombstones since the token may be gone
+          state.token = null
+          return fullLoad()
+        }
+        const deleted = data.deleted || []
+        const changed = data.features.map((feature) => feature.properties.id)
+        removeSyncedMarkers(state, deleted.concat(changed))
+        if (data.features.length > 0) {
+          addToMap(data, { fitBounds: false })
+        }
+        state.token = data.sync_token
+        console.log(`Synced ${kind}: ${changed.length} changed, ${deleted.length} deleted`)
+      })
+  }
+
+  function syncTrees() {
+    if (map.hasLayer(additionalLayers.heatmap)) {
+      loadHeatmap()
+    }
+    return syncFeed("trees", "/api/tree-data/", loadTrees, addTreesToMap)
+  }
+
+  function syncSeeds() {
+    return syncFeed("seeds", "/api/seed-data/", loadSeeds, addSeedsToMap)
+  }
+
+  // Decode the columnar tree feed (format=columnar, layout documented in
+  // app/columnar.py) into the GeoJSON shape used by the rest of the map code.
+  // Typed arrays use the platform byte order, which is little-endian on every
+  // browser platform we support.
+  function decodeColumnarTrees(buffer) {
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4))
+    if (magic !== "ETMC") {
+      throw new Error("Unexpected tree feed body")
+    }
+    const headerLength = new DataView(buffer).getUint32(8, true)
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)))
+    const dataStart = 12 + headerLength
+
+    const arrayTypes = {
+      float64: Float64Array,
+      int32: Int32Array,
+      uint32: Uint32Array,
+      uint16: Uint16Array,
+      uint8: Uint8Array,
+    }
+    const columns = {}
+    Object.entries(header.columns).forEach(([name, column]) => {
+      if (column.type === "uuid") {
+        columns[name] = new Uint8Array(buffer, dataStart + column.offset, column.length * 16)
+      } else {
+        columns[name] = new arrayTypes[column.type](buffer, dataStart + column.offset, column.length)
+      }
+    })
+
+    const uuidAt = (index) => {
+      const hex = Array.from(columns.id.subarray(index * 16, index * 16 + 16), (b) => b.toString(16).padStart(2, "0")).join("")
+      return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`
+    }
+
+    const dictionaries = header.dictionaries
+    const features = new Array(header.count)
+    for (let i = 0; i < header.count; i++) {
+      const species = dictionaries.species[columns.species[i]]
+      const genus = dictionaries.genus[species.genus]
+      const location = dictionaries.location[columns.location[i]]
+      const hectares = columns.hectares[i]
+      features[i] = {
+        type: "Feature",
+        geometry: { type: "Point", coordinates: [columns.longitude[i], columns.latitude[i]] },
+        properties: {
+          id: uuidAt(i),
+          species_id: species.id,
+          location_id: location.id,
+          common_name: species.common_name,
+          scientific_name: species.scientific_name,
+          family: dictionaries.family[genus.family],
+          genus: genus.name,
+          location: location.name,
+          population: columns.population[i],
+          year: columns.year[i],
+          health_status: dictionaries.health_status[columns.health_status[i]],
+          healthy_count: columns.healthy_count[i],
+          good_count: columns.good_count[i],
+          bad_count: columns.bad_count[i],
+          deceased_count: columns.deceased_count[i],
+          hectares: Number.isNaN(hectares) ? null : hectares,
+          notes: dictionaries.notes[columns.notes[i]],
+          image_url: species.image_url,
+          user: dictionaries.user[columns.user[i]],
+          data_source: header.data_source,
+        },
+      }
+    }
+
+    const { columns: _columns, dictionaries: _dictionaries, count: _count, ...members } = header
+    return { type: "FeatureCollection", features, ...members }
+  }
+
+  // Abort controller for the in-flight viewport request (panning fires many)
+  let treeRequest = null
+
+  // Function to load all trees inside the current viewport
   function loadTrees() {
-    // Clear existing tree markers
-    treeLayer.clearLayers()
+    if (treeRequest) {
+      treeRequest.abort()
+    }
+    treeRequest = new AbortController()
 
     // Add a console log to debug
-    console.log("Loading all trees...")
+    console.log("Loading trees in viewport...")
 
     // Use the correct API endpoint
-    fetch("/api/tree-data/", {
-      credentials: 'same-origin' // Include session cookies for authentication
+    // Full loads use the compact columnar body; clustered zoom levels still
+    // answer with GeoJSON
+    const query = viewportQuery()
+    return fetch(`/api/tree-data/?${query}&format=columnar`, {
+      credentials: 'same-origin', // Include session cookies for authentication
+      signal: treeRequest.signal,
     })
       .then(async (response) => {
         // Check if redirected (likely to login page)
@@ -699,6 +952,10 @@ document.addEventListener("DOMContentLoaded", () => {
           throw new Error(errorMessage)
         }
         
+        const contentType = response.headers.get('content-type') || ''
+        if (contentType.includes('application/vnd.etm.columnar')) {
+          return decodeColumnarTrees(await response.arrayBuffer())
+        }
         return response.json()
       })
       .then((data) => {
@@ -710,14 +967,15 @@ document.addEventListener("DOMContentLoaded", () => {
           throw new Error(data.error)
         }
         
-        addTreesToMap(data)
-
-        // Also update heatmap if active
-        if (map.hasLayer(additionalLayers.heatmap)) {
-          updateHeatmap(data)
-        }
+        // Replace markers only once the new viewport data has arrived
+        treeLayer.clearLayers()
+        resetSyncState(syncState.trees, data, query)
+        addTreesToMap(data, { fitBounds: false })
       })
       .catch((error) => {
+        if (error.name === "AbortError") {
+          return
+        }
         console.error("Error loading trees:", error)
         console.error("Error details:", {
           message: error.message,
@@ -728,17 +986,24 @@ document.addEventListener("DOMContentLoaded", () => {
       })
   }
 
-  // Function to load all seeds
+  // Abort controller for the in-flight seed viewport request
+  let seedRequest = null
+
+  // Function to load all seeds inside the current viewport
   function loadSeeds() {
-    // Clear existing seed markers
-    seedLayer.clearLayers()
+    if (seedRequest) {
+      seedRequest.abort()
+    }
+    seedRequest = new AbortController()
 
     // Add a console log to debug
-    console.log("Loading all seeds...")
+    console.log("Loading seeds in viewport...")
 
     // Use the correct API endpoint
-    fetch("/api/seed-data/", {
-      credentials: 'same-origin' // Include session cookies for authentication
+    const query = viewportQuery()
+    return fetch(`/api/seed-data/?${query}`, {
+      credentials: 'same-origin', // Include session cookies for authentication
+      signal: seedRequest.signal,
     })
       .then((response) => {
         if (!response.ok) {
@@ -748,6 +1013,8 @@ document.addEventListener("DOMContentLoaded", () => {
       })
       .then((data) => {
         console.log("Seed data received:", data)
+        seedLayer.clearLayers()
+        resetSyncState(syncState.seeds, data, query)
         if (data.features && data.features.length > 0) {
           console.log("Seed features found:", data.features.length)
           // Log first few seed coordinates for debugging
@@ -758,13 +1025,16 @@ document.addEventListener("DOMContentLoaded", () => {
               status: feature.properties.germination_status
             })
           })
-          addSeedsToMap(data)
+          addSeedsToMap(data, { fitBounds: false })
           console.log(`Added ${data.features.length} seed markers to the map`)
         } else {
           console.log("No seed data found")
         }
       })
       .catch((error) => {
+        if (error.name === "AbortError") {
+          return
+        }
         console.error("Error loading seeds:", error)
         alert("Error loading seed data. Please check the console for details.")
       })
@@ -782,8 +1052,40 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
+  // Marker for a server-side cluster; clicking it zooms in towards the records
+  function clusterMarker(feature, latlng) {
+    const p = feature.properties
+    const isSeed = p.entity_type === "seed"
+    const size = Math.min(60, 26 + Math.round(Math.log10(p.point_count + 1) * 12))
+    const marker = L.marker(latlng, {
+      icon: L.divIcon({
+        html: `<div class="map-cluster${isSeed ? " map-cluster-seed" : ""}" style="width:${size}px;height:${size}px;line-height:${size}px">${p.point_count}</div>`,
+        className: "map-cluster-icon",
+        iconSize: [size, size],
+        iconAnchor: [size / 2, size / 2],
+      }),
+    })
+
+    let summary
+    if (isSeed) {
+      summary = `<strong>${p.point_count} seed plantings</strong><br>${p.quantity} seeds planted<br>` +
+        `Germinated: ${p.fully_germinated + p.partially_germinated} &middot; Germinating: ${p.germinating}<br>` +
+        `Not germinated: ${p.not_germinated} &middot; Failed: ${p.failed}`
+    } else {
+      summary = `<strong>${p.point_count} tree records</strong><br>Population: ${p.population}<br>` +
+        `Healthy: ${p.healthy_count} &middot; Good: ${p.good_count}<br>` +
+        `Bad: ${p.bad_count} &middot; Deceased: ${p.deceased_count}`
+    }
+    marker.bindTooltip(summary, { direction: "top" })
+    marker.on("click", () => {
+      map.setView(latlng, Math.min(map.getZoom() + 2, map.getMaxZoom()))
+    })
+    return marker
+  }
+
   // Function to add seed markers to the map
-  function addSeedsToMap(geojson) {
+  function addSeedsToMap(geojson, options = {}) {
+    const { fitBounds = true } = options
     console.log("🔄 Using NEW seed marker creation method")
     try {
       // Check if we have features
@@ -810,6 +1112,11 @@ document.addEventListener("DOMContentLoaded", () => {
         const properties = feature.properties
         const coords = feature.geometry.coordinates
         const latlng = [coords[1], coords[0]] // GeoJSON uses [lng, lat], Leaflet uses [lat, lng]
+
+        if (properties.cluster) {
+          clusterMarker(feature, L.latLng(latlng)).addTo(seedLayer)
+          return
+        }
         
         // Get color based on germination status
         const status = properties.germination_status
@@ -877,6 +1184,7 @@ document.addEventListener("DOMContentLoaded", () => {
         
         // Add marker to seed layer
         marker.addTo(seedLayer)
+        syncState.seeds.markers.set(properties.id, { layer: marker, group: seedLayer })
         
         console.log(`Added seed marker for ${properties.common_name} at [${latlng[0]}, ${latlng[1]}]`)
         
@@ -893,7 +1201,7 @@ document.addEventListener("DOMContentLoaded", () => {
       console.log("Look for diamond-shaped markers with pulsing animation")
       
       // Fit map to show all seed markers
-      if (geojson.features.length > 0) {
+      if (fitBounds && geojson.features.length > 0) {
         try {
           const latlngs = geojson.features.map(feature => {
             const coords = feature.geometry.coordinates
@@ -916,12 +1224,19 @@ document.addEventListener("DOMContentLoaded", () => {
   function loadFilteredTrees(speciesId) {
     // Clear existing tree markers
     treeLayer.clearLayers()
+    // The next refresh must reload the full feed rather than patch this view
+    syncState.trees.token = null
+
+    // Restrict the heatmap to the selected species as well
+    heatmapSpeciesId = speciesId
+    if (map.hasLayer(additionalLayers.heatmap)) {
+      loadHeatmap()
+    }
 
     // Add a console log to debug
     console.log(`Loading filtered trees for species ID: ${speciesId}`)
 
-    // Use the correct API endpoint
-    fetch(`/api/filter-trees/${speciesId}/`, {
+    fetch(`/api/tree-query/?species=${encodeURIComponent(speciesId)}`, {
       credentials: 'same-origin' // Include session cookies for authentication
     })
       .then((response) => {
@@ -934,11 +1249,6 @@ document.addEventListener("DOMContentLoaded", () => {
         console.log("Filtered tree data received:", data)
         addTreesToMap(data)
 
-        // Also update heatmap if active
-        if (map.hasLayer(additionalLayers.heatmap)) {
-          updateHeatmap(data)
-        }
-
         // Display filtered data in the glass card
         if (data.features && data.features.length > 0) {
           displayFilteredData(data)
@@ -1135,7 +1445,9 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   // Function to add tree markers to the map
-  function addTreesToMap(geojson) {
+  function addTreesToMap(geojson, options = {}) {
+    const { fitBounds = true } = options
+
     if (!geojson.features || geojson.features.length === 0) {
       console.log("No tree data found in the response")
       return
@@ -1143,6 +1455,9 @@ document.addEventListener("DOMContentLoaded", () => {
 
     const geoJsonLayer = L.geoJSON(geojson, {
       pointToLayer: (feature, latlng) => {
+        if (feature.properties.cluster) {
+          return clusterMarker(feature, latlng)
+        }
         const commonName = feature.properties.common_name || 'Unknown';
         const color = getColorForSpecies(commonName)
         return L.circleMarker(latlng, {
@@ -1156,6 +1471,9 @@ document.addEventListener("DOMContentLoaded", () => {
       },
       onEachFeature: (feature, layer) => {
         const p = feature.properties
+        if (p.cluster) {
+          return
+        }
         const __pos = typeof layer.getLatLng === 'function' ? layer.getLatLng() : { lat: feature.geometry.coordinates[1], lng: feature.geometry.coordinates[0] }
 
         // Handle undefined values safely - get values before using them
@@ -1205,49 +1523,68 @@ document.addEventListener("DOMContentLoaded", () => {
       },
     }).addTo(treeLayer)
 
-    try { map.fitBounds(geoJsonLayer.getBounds()) } catch (e) { console.error('Error fitting bounds:', e) }
+    geoJsonLayer.eachLayer((layer) => {
+      const p = layer.feature.properties
+      if (!p.cluster) {
+        syncState.trees.markers.set(p.id, { layer, group: geoJsonLayer })
+      }
+    })
+
+    if (fitBounds) {
+      try { map.fitBounds(geoJsonLayer.getBounds()) } catch (e) { console.error('Error fitting bounds:', e) }
+    }
     updateLegend()
   }
 
-  // Function to update heatmap
-  function updateHeatmap(geojson) {
-    console.log("🔥 Updating heatmap with data:", geojson)
-    
-    // Clear existing heatmap
+  // Fetch the server-side density grid for the current viewport
+  function loadHeatmap() {
+    if (heatmapController) {
+      heatmapController.abort()
+    }
+    heatmapController = new AbortController()
+
+    const params = new URLSearchParams(viewportQuery())
+    if (heatmapSpeciesId) {
+      params.set("species_id", heatmapSpeciesId)
+    }
+    return fetch(`/api/density/?${params.toString()}`, {
+      credentials: 'same-origin', // Include session cookies for authentication
+      signal: heatmapController.signal,
+    })
+      .then((response) => response.json())
+      .then((grid) => {
+        if (grid.error) {
+          throw new Error(grid.error)
+        }
+        updateHeatmap(grid)
+      })
+      .catch((error) => {
+        if (error.name !== "AbortError") {
+          console.error("Error loading density grid for heatmap:", error)
+        }
+      })
+  }
+
+  // Draw a density grid (cells of [lat, lng, value], see app/density.py)
+  function updateHeatmap(grid) {
     additionalLayers.heatmap.clearLayers()
 
-    // Check if we have valid data
-    if (!geojson || !geojson.features || geojson.features.length === 0) {
+    if (!grid || !grid.cells || grid.cells.length === 0 || !grid.max) {
       console.log("No data available for heatmap")
       return
     }
 
-    // Extract points for heatmap
-    const heatPoints = []
-    geojson.features.forEach((feature) => {
-      if (feature.geometry && feature.geometry.coordinates && feature.properties) {
-        const coords = feature.geometry.coordinates
-        const intensity = feature.properties.population || 1
-        heatPoints.push([coords[1], coords[0], intensity / 10]) // lat, lng, intensity
-      }
-    })
-
-    console.log(`Creating heatmap with ${heatPoints.length} points`)
+    const heatPoints = grid.cells.map(([lat, lng, value]) => [lat, lng, value / grid.max])
+    console.log(`Creating heatmap from ${heatPoints.length} density cells`)
 
-    // Create heatmap layer
-    if (heatPoints.length > 0) {
-      const heat = L.heatLayer(heatPoints, {
-        radius: 25,
-        blur: 15,
-        maxZoom: 17,
-        max: 1.0,
-        gradient: { 0.4: "blue", 0.65: "lime", 1: "red" },
-      })
-      additionalLayers.heatmap.addLayer(heat)
-      console.log("✅ Heatmap layer created and added successfully")
-    } else {
-      console.log("❌ No valid points found for heatmap")
-    }
+    const heat = L.heatLayer(heatPoints, {
+      radius: 25,
+      blur: 15,
+      maxZoom: 17,
+      max: 1.0,
+      gradient: { 0.4: "blue", 0.65: "lime", 1: "red" },
+    })
+    additionalLayers.heatmap.addLayer(heat)
   }
 
   // Create a legend for tree species
@@ -0,0 +1,37 @@
+// Polling of background jobs queued by the server (see app/jobs.py).
+// Views that queue work answer 202 with {job, status_url}; waitForJob polls
+// the status URL until the job has finished.
+(function () {
+  const POLL_INTERVAL_MS = 1500;
+
+  function sleep(ms) {
+    return new Promise((resolve) => setTimeout(resolve, ms));
+  }
+
+  // Resolves with the job's result once it has succeeded and rejects with
+  // its error once it has failed. onProgress(job) is called after each poll.
+  async function waitForJob(statusUrl, onProgress) {
+    for (;;) {
+      const response = await fetch(statusUrl, {
+        headers: { 'Accept': 'application/json' },
+        credentials: 'same-origin'
+      });
+      if (!response.ok) {
+        throw new Error(`Could not check the job status (${response.status})`);
+      }
+      const job = await response.json();
+      if (onProgress) {
+        onProgress(job);
+      }
+      if (job.status === 'succeeded') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || job.message || 'The job failed');
+      }
+      await sleep(POLL_INTERVAL_MS);
+    }
+  }
+
+  window.waitForJob = waitForJob;
+})();
@@ -231,6 +231,9 @@ document.addEventListener("DOMContentLoaded", () => {
             // Show image preview
             showImportImagePreview(currentRecord.image_url);
             
+            // Show existing trees and seeds close to the submission
+            showNearbyRecords(currentRecord.latitude, currentRecord.longitude);
+            
             importModal.show();
         });
     });
@@ -390,6 +393,54 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
     
+    // List the user's existing records nearest to the submission's coordinates
+    function showNearbyRecords(latitude, longitude) {
+        const section = document.getElementById('importNearbySection');
+        const list = document.getElementById('importNearbyList');
+        if (!section || !list) return;
+        
+        section.style.display = 'none';
+        list.innerHTML = '';
+        if (!latitude || !longitude || isNaN(Number(latitude)) || isNaN(Number(longitude))) return;
+        
+        const params = new URLSearchParams({ lat: latitude, lng: longitude, k: 5 });
+        fetch(`/api/nearby/?${params.toString()}`, { credentials: 'same-origin' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) throw new Error(data.error);
+                
+                const formatDistance = (metres) => metres < 1000
+                    ? `${Math.round(metres)} m`
+                    : `${(metres / 1000).toFixed(2)} km`;
+                const items = [
+                    ...data.trees.map(tree => ({
+                        distance: tree.distance_m,
+                        text: `Tree: ${tree.common_name} (${tree.population} trees, ${tree.year}) at ${tree.location}`
+                    })),
+                    ...data.seeds.map(seed => ({
+                        distance: seed.distance_m,
+                        text: `Seed: ${seed.common_name} (${seed.quantity} seeds) at ${seed.location}`
+                    }))
+                ].sort((a, b) => a.distance - b.distance).slice(0, 5);
+                
+                if (items.length === 0) {
+                    list.innerHTML = '<li class="list-group-item text-muted">No existing records yet</li>';
+                }
+                items.forEach(item => {
+                    const li = document.createElement('li');
+                    li.className = 'list-group-item d-flex justify-content-between align-items-center';
+                    li.textContent = item.text;
+                    const badge = document.createElement('span');
+                    badge.className = 'badge bg-secondary';
+                    badge.textContent = formatDistance(item.distance);
+                    li.appendChild(badge);
+                    list.appendChild(li);
+                });
+                section.style.display = 'block';
+            })
+            .catch(error => console.error('Error loading nearby records:', error));
+    }
+    
     // Show image preview in import modal
     function showImportImagePreview(imageUrl) {
         const imagePreviewSection = document.getElementById('importImagePreviewSection');
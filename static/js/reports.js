@@ -124,17 +124,14 @@ document.addEventListener("DOMContentLoaded", () => {
     
     try {
       console.log('Fetching species list from API...');
-      // Add timestamp to URL to prevent caching
-      const timestamp = new Date().getTime();
-      const response = await fetch(`/api/species-list/?t=${timestamp}`, {
+      // Always revalidate; the server answers 304 while the data is unchanged
+      const response = await fetch('/api/species-list/', {
         method: 'GET',
         headers: {
           'X-CSRFToken': csrfToken,
-          'Accept': 'application/json',
-          'Cache-Control': 'no-cache, no-store, must-revalidate',
-          'Pragma': 'no-cache'
+          'Accept': 'application/json'
         },
-        cache: 'no-store'
+        cache: 'no-cache'
       });
       
       if (!response.ok) {
@@ -215,17 +212,14 @@ document.addEventListener("DOMContentLoaded", () => {
     
     try {
       console.log('Fetching locations list from API...');
-      // Add timestamp to URL to prevent caching
-      const timestamp = new Date().getTime();
-      const response = await fetch(`/api/locations-list/?t=${timestamp}`, {
+      // Always revalidate; the server answers 304 while the data is unchanged
+      const response = await fetch('/api/locations-list/', {
         method: 'GET',
         headers: {
           'X-CSRFToken': csrfToken,
-          'Accept': 'application/json',
-          'Cache-Control': 'no-cache, no-store, must-revalidate',
-          'Pragma': 'no-cache'
+          'Accept': 'application/json'
         },
-        cache: 'no-store'
+        cache: 'no-cache'
       });
       
       if (!response.ok) {
@@ -510,6 +504,11 @@ document.addEventListener("DOMContentLoaded", () => {
           throw new Error(`Error reading response: ${parseError.message}`);
         }
         
+        // The report is built by a background job; wait for its result
+        if (response.status === 202 && data.status_url) {
+          data = await waitForJob(data.status_url);
+        }
+
         if (!data.success) {
           console.error('Report generation failed:', data.error);
           throw new Error(data.error || 'Failed to generate report');
@@ -893,39 +892,28 @@ document.addEventListener("DOMContentLoaded", () => {
     }, 100);
 
     try {
-      // Fetch tree data from API
-      const response = await fetch('/api/tree-data/');
-      if (!response.ok) {
-        throw new Error(`HTTP error! Status: ${response.status}`);
-      }
-
-      const geojson = await response.json();
-      
-      if (!geojson.features || geojson.features.length === 0) {
-        mapContainer.innerHTML = '<div class="alert alert-info">No tree data available to display on the map.</div>';
-        return;
-      }
-
-      // Filter features based on form filters
-      let filteredFeatures = geojson.features;
-      
+      // Fetch only the properties the report map filters on and shows in popups
+      const fields = [
+        'species_id', 'location_id', 'common_name', 'scientific_name', 'family', 'genus',
+        'location', 'population', 'hectares', 'health_status', 'year', 'image_url',
+      ];
+      // The form filters are applied by the server
+      const params = new URLSearchParams({ fields: fields.join(',') });
       if (speciesFilter && speciesFilter !== 'all') {
-        filteredFeatures = filteredFeatures.filter(feature => 
-          feature.properties.species_id === speciesFilter
-        );
+        params.set('species', speciesFilter);
       }
-      
       if (locationFilter && locationFilter !== 'all') {
-        filteredFeatures = filteredFeatures.filter(feature => 
-          feature.properties.location_id === locationFilter
-        );
+        params.set('location', locationFilter);
+      }
+      const response = await fetch(`/api/tree-query/?${params.toString()}`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! Status: ${response.status}`);
       }
 
-      // Create filtered GeoJSON
-      const filteredGeoJson = {
-        type: 'FeatureCollection',
-        features: filteredFeatures
-      };
+      const filteredGeoJson = await response.json();
+      if (filteredGeoJson.error) {
+        throw new Error(filteredGeoJson.error);
+      }
 
       // Add markers to map
       const bounds = [];
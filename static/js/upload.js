@@ -21,6 +21,23 @@ document.addEventListener("DOMContentLoaded", () => {
   }
   
   
+  // Follow the CSV imports still running in the background
+  document.querySelectorAll(".import-job[data-status-url]").forEach((row) => {
+    const status = row.querySelector(".import-job-status")
+    const message = row.querySelector(".import-job-message")
+    waitForJob(row.dataset.statusUrl, (job) => {
+      status.textContent = job.status.charAt(0).toUpperCase() + job.status.slice(1)
+      message.textContent = job.message ? `${job.message} (${job.progress}%)` : `${job.progress}%`
+    })
+      .then((result) => {
+        message.textContent = `Imported ${result.imported} of ${result.rows} rows` +
+          (result.errors ? `, ${result.errors} failed` : "")
+      })
+      .catch((error) => {
+        message.textContent = error.message
+      })
+  })
+
   // Tab switching functionality
   const tabButtons = document.querySelectorAll(".tab-button")
   const tabContents = document.querySelectorAll(".tab-content")
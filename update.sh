@@ -17,6 +17,7 @@ NC='\033[0m'
 # Configuration
 PROJECT_DIR="/var/www/ETM_GIS2-v2.0.0"
 SERVICE_NAME="endemic_trees"
+WORKER_SERVICE_NAME="endemic_trees_worker"
 BRANCH="main"  # Change to your default branch if different
 
 # Check if project directory exists
@@ -107,6 +108,16 @@ else
     echo "You may need to start it manually: systemctl start $SERVICE_NAME"
 fi
 
+# Restart the job worker so queued imports and reports run the new code
+echo -e "${GREEN}Restarting job worker...${NC}"
+if systemctl is-active --quiet "$WORKER_SERVICE_NAME"; then
+    systemctl restart "$WORKER_SERVICE_NAME"
+    echo -e "${GREEN}✓ Worker restarted${NC}"
+else
+    echo -e "${YELLOW}Warning: Service $WORKER_SERVICE_NAME is not running.${NC}"
+    echo "Uploads, reports and bulk deletes stay queued until it runs: systemctl start $WORKER_SERVICE_NAME"
+fi
+
 # Reload Nginx (if needed)
 if systemctl is-active --quiet nginx; then
     echo -e "${GREEN}Reloading Nginx...${NC}"
@@ -122,11 +133,11 @@ echo "  - Latest code pulled from GitHub"
 echo "  - Dependencies updated"
 echo "  - Database migrations applied"
 echo "  - Static files collected"
-echo "  - Application service restarted"
+echo "  - Application and worker services restarted"
 echo ""
 echo -e "${YELLOW}Next steps:${NC}"
 echo "  1. Check application status: systemctl status $SERVICE_NAME"
-echo "  2. View logs: journalctl -u $SERVICE_NAME -n 50"
+echo "  2. View logs: journalctl -u $SERVICE_NAME -n 50 (worker: journalctl -u $WORKER_SERVICE_NAME -n 50)"
 echo "  3. Test your application in browser"
 echo ""
 